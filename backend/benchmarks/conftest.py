@@ -0,0 +1,126 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fixtures of the micro-benchmarks, run with pytest-benchmark.
+
+Besides timings, each benchmark counts the SQL statements and commits of a
+call, compared to the counts stored in `statements_baseline.json`. Counts do
+not depend on the machine, so a benchmark fails as soon as a change sends
+more statements, typically an N+1 query pattern.
+"""
+
+import dataclasses
+import json
+import os
+from typing import Any, Callable, Optional
+from unittest import mock
+
+import flask
+import pytest
+
+from benchmarks import statements
+from common import crmint_logging
+from common import task
+from controller import database
+from controller import extensions
+
+_BASELINE_PATH = os.path.join(
+    os.path.dirname(__file__), 'statements_baseline.json')
+
+# Writes the measured counts to the baseline file instead of comparing them.
+_UPDATE_BASELINE = bool(int(os.getenv('UPDATE_STATEMENTS_BASELINE', '0')))
+
+
+@pytest.fixture(scope='session')
+def statements_baseline():
+  """Yields the baseline counts and the counts measured, by benchmark."""
+  try:
+    with open(_BASELINE_PATH, 'r') as f:
+      baseline = json.load(f)
+  except FileNotFoundError:
+    baseline = {}
+  measured = {}
+  yield baseline, measured
+  if _UPDATE_BASELINE and measured:
+    with open(_BASELINE_PATH, 'w') as f:
+      json.dump({**baseline, **measured}, f, indent=2, sort_keys=True)
+      f.write('\n')
+
+
+@pytest.fixture
+def app_context():
+  """Pushes the context of an app using an in-memory SQLite database."""
+  app = flask.Flask(__name__)
+  app.config['TESTING'] = True
+  app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+  app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+  extensions.db.init_app(app)
+  with app.app_context(), \
+      mock.patch.object(crmint_logging, 'log_message', autospec=True), \
+      mock.patch.object(crmint_logging, 'log_pipeline_status', autospec=True), \
+      mock.patch.object(task.Task, 'enqueue', autospec=True), \
+      mock.patch.object(task.Task, 'enqueue_many', autospec=True):
+    extensions.db.create_all()
+    database.load_fixtures()
+    yield app
+    extensions.db.session.remove()
+    extensions.db.drop_all()
+
+
+@pytest.fixture
+def counted_benchmark(benchmark, request, statements_baseline, app_context):
+  """Returns a function benchmarking a callable and counting its statements.
+
+  The returned function takes the callable, an optional setup function
+  returning its `(args, kwargs)` before each round, and the number of rounds.
+  """
+  del app_context  # Unused argument
+  baseline, measured = statements_baseline
+
+  def run(target: Callable[..., Any],
+          setup: Optional[Callable[[], tuple[tuple[Any, ...],
+                                             dict[str, Any]]]] = None,
+          rounds: int = 10) -> Any:
+    counter = statements.StatementCounter(extensions.db.engine)
+    rounds_counts = []
+
+    def counted_target(*args, **kwargs):
+      with counter.measure() as counts:
+        result = target(*args, **kwargs)
+      rounds_counts.append(counts)
+      return result
+
+    try:
+      result = benchmark.pedantic(
+          counted_target, setup=setup, rounds=rounds, iterations=1)
+    finally:
+      counter.close()
+    worst_counts = statements.StatementCounts(
+        queries=max(counts.queries for counts in rounds_counts),
+        commits=max(counts.commits for counts in rounds_counts))
+    benchmark.extra_info.update(dataclasses.asdict(worst_counts))
+    measured[request.node.name] = dataclasses.asdict(worst_counts)
+    if not _UPDATE_BASELINE:
+      expected = baseline.get(request.node.name)
+      if expected is None:
+        pytest.fail(f'No statements baseline for {request.node.name}, run '
+                    f'with UPDATE_STATEMENTS_BASELINE=1 to store it.')
+      assert worst_counts.queries <= expected['queries'], (
+          f'{worst_counts.queries} SQL statements, '
+          f'baseline is {expected["queries"]}')
+      assert worst_counts.commits <= expected['commits'], (
+          f'{worst_counts.commits} commits, baseline is {expected["commits"]}')
+    return result
+
+  return run
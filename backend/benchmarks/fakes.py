@@ -0,0 +1,242 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake Google services used by the benchmarks, working offline.
+
+Fakes replay recorded API responses from `benchmarks/data` and `tests/data`,
+so that the controller and jobs code run unchanged up to the HTTP layer of
+the Google clients.
+"""
+
+import collections
+from concurrent import futures
+import copy
+import dataclasses
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from google.auth import credentials
+from google.cloud import bigquery
+from googleapiclient import http
+import requests
+
+from jobs.workers.ga import ga_utils
+
+_BENCHMARKS_DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+_TESTS_DATA_DIR = os.path.join(os.path.dirname(__file__), '../tests/data')
+
+# Kept before the harness replaces `ga_utils.get_client` with fake clients.
+_build_ga_client = ga_utils.get_client
+
+
+def _read_json(path: str) -> Any:
+  with open(path, 'r') as f:
+    return json.load(f)
+
+
+@dataclasses.dataclass
+class PublishedMessage:
+  """Message published to the in-memory transport."""
+  topic: str
+  data: bytes
+  attributes: dict[str, str]
+  published_at: float
+  attempts: int = 0
+
+
+class FakePublisher:
+  """In-memory replacement of `pubsub_v1.PublisherClient`.
+
+  Messages are queued in publishing order and delivered by the harness.
+  """
+
+  def __init__(self):
+    self.messages = collections.deque()
+    self._message_ids = itertools.count(1)
+    self._lock = threading.Lock()
+
+  def publish(self, topic_path: str, data: bytes,
+              **attributes: str) -> futures.Future:
+    topic = topic_path.rsplit('/', 1)[-1]
+    with self._lock:
+      message_id = next(self._message_ids)
+    self.messages.append(
+        PublishedMessage(topic, data, attributes, time.perf_counter()))
+    future = futures.Future()
+    future.set_result(str(message_id))
+    return future
+
+  def stop(self) -> None:
+    pass
+
+
+class FakeLogger:
+  """Replacement of the Cloud Logging logger, counting entries."""
+
+  def __init__(self):
+    self.entries_count = 0
+    self._lock = threading.Lock()
+
+  def _log(self) -> None:
+    with self._lock:
+      self.entries_count += 1
+
+  def log_struct(self, info: dict[str, Any], **unused_kwargs) -> None:
+    json.dumps(info, default=str)  # Payloads are serialized by the client.
+    self._log()
+
+  def log_text(self, text: str, **unused_kwargs) -> None:
+    del text  # Unused argument
+    self._log()
+
+
+class FakeBigQueryConnection:
+  """Serves a synthetic table from recorded BigQuery API responses.
+
+  Rows of the recorded `tabledata.list` response are repeated up to the
+  requested number of rows, and returned in pages of `rows_per_page` rows.
+  """
+
+  def __init__(self, num_rows: int, rows_per_page: int):
+    self.num_rows = num_rows
+    self.rows_per_page = rows_per_page
+    self.requests_count = 0
+    self._table = _read_json(
+        os.path.join(_BENCHMARKS_DATA_DIR, 'bigquery.tables.get.json'))
+    self._table['numRows'] = str(num_rows)
+    self._recorded_rows = _read_json(
+        os.path.join(_BENCHMARKS_DATA_DIR,
+                     'bigquery.tabledata.list.json'))['rows']
+    self._lock = threading.Lock()
+
+  def _get_dataset(self, project_id: str, dataset_id: str) -> dict[str, Any]:
+    return {
+        'kind': 'bigquery#dataset',
+        'id': f'{project_id}:{dataset_id}',
+        'datasetReference': {
+            'projectId': project_id,
+            'datasetId': dataset_id,
+        },
+        'location': self._table['location'],
+    }
+
+  def _get_table(self, project_id: str, dataset_id: str,
+                 table_id: str) -> dict[str, Any]:
+    table = copy.deepcopy(self._table)
+    table['id'] = f'{project_id}:{dataset_id}.{table_id}'
+    table['tableReference'] = {
+        'projectId': project_id,
+        'datasetId': dataset_id,
+        'tableId': table_id,
+    }
+    return table
+
+  def _list_rows(self, query_params: dict[str, Any]) -> dict[str, Any]:
+    start = int(query_params.get('pageToken') or 0)
+    page_size = min(
+        int(query_params.get('maxResults', self.rows_per_page)),
+        self.rows_per_page)
+    end = min(start + page_size, self.num_rows)
+    response = {
+        'kind': 'bigquery#tableDataList',
+        'totalRows': str(self.num_rows),
+        'rows': [
+            self._recorded_rows[i % len(self._recorded_rows)]
+            for i in range(start, end)
+        ],
+    }
+    if end < self.num_rows:
+      response['pageToken'] = str(end)
+    return response
+
+  def api_request(self,
+                  method: str,
+                  path: str,
+                  query_params: Optional[dict[str, Any]] = None,
+                  **unused_kwargs) -> dict[str, Any]:
+    """Returns the response of a BigQuery API request."""
+    with self._lock:
+      self.requests_count += 1
+    parts = path.strip('/').split('/')
+    if method == 'GET' and len(parts) == 4:
+      return self._get_dataset(parts[1], parts[3])
+    if method == 'GET' and len(parts) == 6:
+      return self._get_table(parts[1], parts[3], parts[5])
+    if method == 'GET' and len(parts) == 7 and parts[6] == 'data':
+      return self._list_rows(query_params or {})
+    raise NotImplementedError(f'Unsupported BigQuery request: {method} {path}')
+
+
+def create_bigquery_client(
+    connection: FakeBigQueryConnection) -> bigquery.Client:
+  """Returns a BigQuery client sending its requests to the fake connection."""
+  client = bigquery.Client(
+      project='benchmark', credentials=credentials.AnonymousCredentials())
+  client._connection = connection  # pylint: disable=protected-access
+  return client
+
+
+class FakeMeasurementProtocol:
+  """Accepts Measurement Protocol hits, like the production endpoint."""
+
+  def __init__(self):
+    self.hits_count = 0
+    self._lock = threading.Lock()
+
+  def post(self, url: str, data: str, **unused_kwargs) -> requests.Response:
+    del url  # Unused argument
+    json.loads(data)
+    with self._lock:
+      self.hits_count += 1
+    response = requests.Response()
+    response.status_code = requests.codes.no_content
+    return response
+
+
+class FakeGoogleAnalytics:
+  """Builds Google Analytics clients replaying recorded API responses.
+
+  Clients are built from the discovery documents of `tests/data`, once per
+  service and version, and answer `create` requests with an empty resource.
+  """
+
+  _DISCOVERY_FILES = {
+      ('analyticsadmin', 'v1alpha'): 'google_analytics_admin_v1alpha.json',
+      ('analytics', 'v3'): 'google_analytics_v3.json',
+  }
+
+  _RESPONSES = {
+      'analyticsadmin.properties.conversionEvents.create': (None, b'{}'),
+      'analyticsadmin.properties.customDimensions.create': (None, b'{}'),
+  }
+
+  def __init__(self):
+    self._clients = {}
+    self._lock = threading.Lock()
+
+  def get_client(self, service: str, version: str, **unused_kwargs):
+    with self._lock:
+      if (service, version) not in self._clients:
+        discovery_file = os.path.join(
+            _TESTS_DATA_DIR, self._DISCOVERY_FILES[(service, version)])
+        self._clients[(service, version)] = _build_ga_client(
+            service,
+            version,
+            http=http.HttpMock(discovery_file, headers={'status': '200'}),
+            request_builder=http.RequestMockBuilder(self._RESPONSES))
+      return self._clients[(service, version)]
@@ -0,0 +1,318 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs pipelines end to end through the controller and jobs apps.
+
+Both Flask apps run in the same process. Messages published by either app
+are kept in memory and pushed to the other app, as Pub/Sub push subscriptions
+would do, until no message is left. Google services are replaced by the fakes
+of `benchmarks.fakes`, so that runs work offline.
+
+Delays of messages are not honored, tasks are delivered as soon as published.
+"""
+
+import base64
+import contextlib
+import dataclasses
+import json
+import statistics
+import time
+from typing import Any, Iterator, Optional
+from unittest import mock
+
+import flask
+
+from benchmarks import fakes
+from benchmarks import statements
+from common import crmint_logging
+from common import insight
+from common import message
+from controller import app as controller_app
+from controller import database
+from controller import extensions
+from controller import models
+from jobs.workers.bigquery import bq_to_measurement_protocol_ga4
+from jobs.workers.bigquery import bq_worker
+from jobs.workers.ga import ga_utils
+
+# Push endpoints of the topics, by app.
+_CONTROLLER_ENDPOINTS = {
+    'crmint-3-task-finished': '/push/task-finished',
+    'crmint-3-start-pipeline': '/push/start-pipeline',
+}
+_JOBS_ENDPOINTS = {
+    'crmint-3-start-task-high': '/push/start-task',
+    'crmint-3-start-task': '/push/start-task',
+    'crmint-3-start-task-low': '/push/start-task',
+}
+
+# Deliveries of a message before the run is aborted, rejected tasks are
+# delivered again like Pub/Sub would do.
+_MAX_DELIVERY_ATTEMPTS = 20
+
+
+class BenchmarkError(Exception):
+  """Exception raised if a pipeline run cannot complete."""
+
+
+@dataclasses.dataclass
+class RunReport:
+  """Measurements of a pipeline run."""
+  scenario: str
+  pipeline_status: str
+  tasks: int
+  wall_seconds: float
+  task_latencies: list[float]
+  queries: int
+  commits: int
+  messages: int
+  log_entries: int
+  mp_hits: int
+
+  @property
+  def tasks_per_second(self) -> float:
+    return self.tasks / self.wall_seconds if self.wall_seconds else 0.0
+
+  def _latency_percentile(self, percentile: int) -> float:
+    if len(self.task_latencies) < 2:
+      return sum(self.task_latencies)
+    return statistics.quantiles(
+        self.task_latencies, n=100, method='inclusive')[percentile - 1]
+
+  def summary(self) -> dict[str, Any]:
+    """Returns the report as a JSON serializable dictionary."""
+    tasks = max(self.tasks, 1)
+    return {
+        'scenario': self.scenario,
+        'pipeline_status': self.pipeline_status,
+        'tasks': self.tasks,
+        'wall_seconds': round(self.wall_seconds, 3),
+        'tasks_per_second': round(self.tasks_per_second, 1),
+        'p50_task_latency_ms': round(self._latency_percentile(50) * 1000, 2),
+        'p99_task_latency_ms': round(self._latency_percentile(99) * 1000, 2),
+        'queries_per_task': round(self.queries / tasks, 2),
+        'commits_per_task': round(self.commits / tasks, 2),
+        'messages_per_task': round(self.messages / tasks, 2),
+        'log_entries_per_task': round(self.log_entries / tasks, 2),
+        'mp_hits': self.mp_hits,
+    }
+
+
+def _encode_envelope(published: fakes.PublishedMessage) -> dict[str, Any]:
+  return {
+      'message': {
+          'data': base64.b64encode(published.data).decode('utf-8'),
+          # Delays are skipped, tasks are due as soon as published.
+          'attributes': {**published.attributes, 'start_time': '0'},
+      },
+  }
+
+
+class Harness:
+  """Controller and jobs apps connected by an in-memory transport.
+
+  Use as a context manager, which sets up the apps and the fakes:
+
+    with harness.Harness() as h:
+      report = h.run('chain', pipeline)
+  """
+
+  def __init__(self, database_uri: str = 'sqlite://'):
+    self._database_uri = database_uri
+    self._exit_stack = contextlib.ExitStack()
+    self.publisher = fakes.FakePublisher()
+    self.logger = fakes.FakeLogger()
+    self.measurement_protocol = fakes.FakeMeasurementProtocol()
+    self.google_analytics = fakes.FakeGoogleAnalytics()
+    self.bigquery_connection = fakes.FakeBigQueryConnection(
+        num_rows=0, rows_per_page=1)
+    self._controller_client = None
+    self._jobs_client = None
+    self._counter = None
+
+  def __enter__(self) -> 'Harness':
+    stack = self._exit_stack
+    stack.enter_context(mock.patch.object(
+        message, '_get_publisher_client', return_value=self.publisher))
+    stack.enter_context(mock.patch.object(
+        crmint_logging, 'get_logger', return_value=self.logger))
+    stack.enter_context(mock.patch.object(insight.GAProvider, 'track_event'))
+    stack.enter_context(mock.patch.object(
+        bq_worker.BQWorker, '_get_client',
+        side_effect=lambda: fakes.create_bigquery_client(
+            self.bigquery_connection)))
+    stack.enter_context(mock.patch.object(
+        bq_to_measurement_protocol_ga4.requests, 'post',
+        side_effect=self.measurement_protocol.post))
+    stack.enter_context(mock.patch.object(
+        ga_utils, 'get_client', side_effect=self.google_analytics.get_client))
+    # Imported once the logger is replaced, since it starts a task executor.
+    import jobs_app  # pylint: disable=import-outside-toplevel
+    app = controller_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': self._database_uri,
+        'TESTING': True,
+    })
+    stack.enter_context(app.app_context())
+    extensions.db.create_all()
+    database.load_fixtures()
+    self._counter = statements.StatementCounter(extensions.db.engine)
+    self._controller_client = app.test_client()
+    # Ports 8080/8081 skip the authentication of push requests.
+    self._jobs_client = jobs_app.app.test_client()
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self._counter.close()
+    extensions.db.session.remove()
+    # Leaves a persistent database empty for the next scenario.
+    extensions.db.drop_all()
+    self._exit_stack.close()
+
+  def use_bigquery_table(self, num_rows: int, rows_per_page: int) -> None:
+    """Serves a table of the given size to BigQuery workers."""
+    self.bigquery_connection = fakes.FakeBigQueryConnection(
+        num_rows, rows_per_page)
+
+  def _push(self, published: fakes.PublishedMessage) -> flask.Response:
+    envelope = _encode_envelope(published)
+    if published.topic in _CONTROLLER_ENDPOINTS:
+      return self._controller_client.post(
+          _CONTROLLER_ENDPOINTS[published.topic],
+          json=envelope,
+          base_url='http://localhost:8080')
+    return self._jobs_client.post(
+        _JOBS_ENDPOINTS[published.topic],
+        json=envelope,
+        base_url='http://localhost:8081')
+
+  @contextlib.contextmanager
+  def _measure(self) -> Iterator[dict[str, int]]:
+    start = {
+        'queries': self._counter.queries,
+        'commits': self._counter.commits,
+        'log_entries': self.logger.entries_count,
+        'mp_hits': self.measurement_protocol.hits_count,
+    }
+    deltas = {}
+    yield deltas
+    deltas.update({
+        'queries': self._counter.queries - start['queries'],
+        'commits': self._counter.commits - start['commits'],
+        'log_entries': self.logger.entries_count - start['log_entries'],
+        'mp_hits': self.measurement_protocol.hits_count - start['mp_hits'],
+    })
+
+  def run(self, scenario: str, pipeline: models.Pipeline) -> RunReport:
+    """Starts a pipeline and delivers messages until none is left.
+
+    Args:
+      scenario: Name of the scenario, reported with the measurements.
+      pipeline: Pipeline to start manually.
+
+    Returns:
+      Measurements of the run.
+
+    Raises:
+      BenchmarkError: if the pipeline cannot be started or if a message is
+        rejected too many times.
+    """
+    published_at = {}
+    task_latencies = []
+    messages_count = 0
+    with self._measure() as deltas:
+      start_time = time.perf_counter()
+      response = self._controller_client.post(
+          f'/api/pipelines/{pipeline.id}/start')
+      if response.status_code != 200:
+        raise BenchmarkError(f'Failed starting pipeline: {response.data}')
+      while self.publisher.messages:
+        published = self.publisher.messages.popleft()
+        if (published.topic not in _CONTROLLER_ENDPOINTS and
+            published.topic not in _JOBS_ENDPOINTS):
+          continue  # Topic without push subscription.
+        data = json.loads(published.data)
+        if published.topic in _JOBS_ENDPOINTS and not published.attempts:
+          published_at[data['task_name']] = published.published_at
+        published.attempts += 1
+        response = self._push(published)
+        messages_count += 1
+        if response.status_code >= 300:
+          if published.attempts >= _MAX_DELIVERY_ATTEMPTS:
+            raise BenchmarkError(
+                f'Message rejected {published.attempts} times by '
+                f'{published.topic}: {response.data}')
+          self.publisher.messages.append(published)
+          continue
+        if published.topic == 'crmint-3-task-finished':
+          task_latencies.append(
+              time.perf_counter() - published_at.pop(data['task_name']))
+      wall_seconds = time.perf_counter() - start_time
+    extensions.db.session.refresh(pipeline)
+    return RunReport(
+        scenario=scenario,
+        pipeline_status=pipeline.status,
+        tasks=len(task_latencies),
+        wall_seconds=wall_seconds,
+        task_latencies=task_latencies,
+        queries=deltas['queries'],
+        commits=deltas['commits'],
+        messages=messages_count,
+        log_entries=deltas['log_entries'],
+        mp_hits=deltas['mp_hits'])
+
+
+def create_pipeline(name: str,
+                    jobs: list[tuple[str, dict[str, Any]]],
+                    chained: bool = False,
+                    max_concurrent_tasks: Optional[int] = None
+                    ) -> models.Pipeline:
+  """Creates a pipeline with jobs of the given worker classes and params.
+
+  Args:
+    name: Name of the pipeline.
+    jobs: List of (worker_class, worker_params) tuples, one per job.
+    chained: Whether each job starts once the previous one succeeded,
+      otherwise all jobs start together.
+    max_concurrent_tasks: Budget of tasks in flight for the pipeline.
+
+  Returns:
+    The new pipeline.
+  """
+  pipeline = models.Pipeline.create(
+      name=name, max_concurrent_tasks=max_concurrent_tasks)
+  previous_job = None
+  for i, (worker_class, worker_params) in enumerate(jobs):
+    job = models.Job.create(
+        name=f'{name} #{i}',
+        worker_class=worker_class,
+        pipeline_id=pipeline.id)
+    job.assign_params([
+        {'name': key, 'type': _param_type(value), 'value': value}
+        for key, value in worker_params.items()
+    ])
+    if chained and previous_job is not None:
+      models.StartCondition.create(
+          job_id=job.id,
+          preceding_job_id=previous_job.id,
+          condition=models.StartCondition.CONDITION.SUCCESS)
+    previous_job = job
+  return pipeline
+
+
+def _param_type(value: Any) -> str:
+  if isinstance(value, bool):
+    return 'boolean'
+  if isinstance(value, (int, float)):
+    return 'number'
+  return 'string'
@@ -0,0 +1,196 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmarks of the state machine of the controller models.
+
+Run from the backend directory with:
+
+  pytest benchmarks/models_benchmarks.py
+
+Starting a pipeline of 1000 jobs takes minutes on SQLite, so this benchmark
+only runs with BENCHMARK_LARGE_PIPELINES=1.
+"""
+
+import os
+
+import pytest
+
+from controller import extensions
+from controller import models
+from controller.starter import views as starter_views
+
+# Cron schedule never matching, so that scheduled pipelines are only looked
+# up and never started.
+_NEVER_MATCHING_CRON = '0 0 31 2 *'
+
+_LARGE_PIPELINE = pytest.mark.skipif(
+    not int(os.getenv('BENCHMARK_LARGE_PIPELINES', '0')),
+    reason='Large pipelines are only run with BENCHMARK_LARGE_PIPELINES=1.')
+
+
+def _create_pipeline(num_jobs: int,
+                     chained: bool = False,
+                     num_job_params: int = 1,
+                     **pipeline_attributes) -> models.Pipeline:
+  """Creates a pipeline of Commenter jobs in a single transaction."""
+  session = extensions.db.session
+  pipeline = models.Pipeline(name=f'{num_jobs} jobs')
+  for key, value in pipeline_attributes.items():
+    setattr(pipeline, key, value)
+  session.add(pipeline)
+  session.flush()
+  jobs = []
+  for i in range(num_jobs):
+    job = models.Job(
+        name=f'job #{i}', worker_class='Commenter', pipeline_id=pipeline.id)
+    session.add(job)
+    session.flush()
+    for j in range(num_job_params):
+      param = models.Param(name=f'comment_{j}', param_type='text')
+      param.job_id = job.id
+      param.value = f'comment {j} of job #{i}'
+      session.add(param)
+    if chained and jobs:
+      session.add(models.StartCondition(
+          job_id=job.id,
+          preceding_job_id=jobs[-1].id,
+          condition=models.StartCondition.CONDITION.SUCCESS))
+    jobs.append(job)
+  session.commit()
+  return pipeline
+
+
+def _reset_statuses(pipeline_id: int,
+                    pipeline_status: str = models.Pipeline.STATUS.IDLE,
+                    job_status: str = models.Job.STATUS.IDLE) -> None:
+  """Sets the statuses of a pipeline run and forgets its tasks."""
+  models.HeldTask.query.delete()
+  models.TaskEnqueued.query.delete()
+  models.Job.query.filter_by(pipeline_id=pipeline_id).update(
+      {'status': job_status})
+  models.Pipeline.query.filter_by(id=pipeline_id).update(
+      {'status': pipeline_status})
+  extensions.db.session.commit()
+  # Objects are loaded again by each round, like in a new request.
+  extensions.db.session.expire_all()
+
+
+@pytest.mark.parametrize(
+    'num_jobs', [10, 100, pytest.param(1000, marks=_LARGE_PIPELINE)])
+def test_pipeline_start(counted_benchmark, num_jobs):
+  pipeline_id = _create_pipeline(num_jobs).id
+
+  def setup():
+    _reset_statuses(pipeline_id)
+    return (models.Pipeline.find(pipeline_id),), {}
+
+  started = counted_benchmark(
+      lambda pipeline: pipeline.start(),
+      setup=setup,
+      rounds=min(10, 1000 // num_jobs))
+  assert started
+
+
+@pytest.mark.parametrize('num_tasks', [10, 100])
+def test_job_task_finished(counted_benchmark, num_tasks):
+  # Tasks of a job finishing one after the other, like the sub-tasks of a
+  # fan-out reported at the same time.
+  pipeline_id = _create_pipeline(1).id
+  task_names = [f'task-{i}' for i in range(num_tasks)]
+
+  def setup():
+    _reset_statuses(pipeline_id,
+                    pipeline_status=models.Pipeline.STATUS.RUNNING,
+                    job_status=models.Job.STATUS.RUNNING)
+    job = models.Job.where(pipeline_id=pipeline_id).one()
+    # pylint: disable=protected-access
+    task_namespace = job._get_task_namespace()
+    # pylint: enable=protected-access
+    extensions.db.session.add_all([
+        models.TaskEnqueued(
+            task_namespace=task_namespace,
+            task_name=task_name,
+            pipeline_id=pipeline_id,
+            worker_class='Commenter')
+        for task_name in task_names
+    ])
+    extensions.db.session.commit()
+    extensions.db.session.expire_all()
+    return (job,), {}
+
+  def finish_tasks(job):
+    for task_name in task_names:
+      job.task_succeeded(task_name)
+    return job.pipeline.status
+
+  pipeline_status = counted_benchmark(finish_tasks, setup=setup)
+  assert pipeline_status == models.Pipeline.STATUS.SUCCEEDED
+
+
+@pytest.mark.parametrize('num_jobs', [10, 100])
+def test_pipeline_leaf_job_finished(counted_benchmark, num_jobs):
+  pipeline_id = _create_pipeline(num_jobs, chained=True).id
+
+  def setup():
+    _reset_statuses(pipeline_id,
+                    pipeline_status=models.Pipeline.STATUS.RUNNING,
+                    job_status=models.Job.STATUS.SUCCEEDED)
+    return (models.Pipeline.find(pipeline_id),), {}
+
+  def finish(pipeline):
+    pipeline.leaf_job_finished()
+    return pipeline.status
+
+  pipeline_status = counted_benchmark(finish, setup=setup)
+  assert pipeline_status == models.Pipeline.STATUS.SUCCEEDED
+
+
+def test_pipeline_populate_params_runtime_values(counted_benchmark):
+  models.Param.update_list([
+      {'name': f'global_{i}', 'type': 'text', 'value': '{{ today("%Y") }}'}
+      for i in range(50)
+  ])
+  pipeline = _create_pipeline(20, num_job_params=10)
+  pipeline.assign_params([
+      {'name': f'pipeline_{i}', 'type': 'text',
+       'value': f'{{{{ global_{i} }}}}'}
+      for i in range(50)
+  ])
+  pipeline_id = pipeline.id
+
+  def setup():
+    extensions.db.session.expire_all()
+    return (models.Pipeline.find(pipeline_id),), {}
+
+  populated = counted_benchmark(
+      lambda pipeline: pipeline.populate_params_runtime_values(),
+      setup=setup)
+  assert populated
+
+
+def test_start_scheduled_pipelines(counted_benchmark):
+  for _ in range(100):
+    pipeline = _create_pipeline(1, run_on_schedule=True)
+    pipeline.assign_schedules([{'cron': _NEVER_MATCHING_CRON}] * 3)
+
+  def setup():
+    extensions.db.session.expire_all()
+    return (starter_views.StarterResource(),), {}
+
+  # pylint: disable=protected-access
+  counted_benchmark(
+      lambda resource: resource._start_scheduled_pipelines(), setup=setup)
+  # pylint: enable=protected-access
+  idle_pipelines = models.Pipeline.where(status=models.Pipeline.STATUS.IDLE)
+  assert idle_pipelines.count() == 100
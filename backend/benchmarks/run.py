@@ -0,0 +1,147 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the pipeline benchmarks and compares them to a baseline.
+
+Usage, from the backend directory:
+
+  python -m benchmarks.run --scenarios=deep_chain,mp_rows --scale=0.5
+  python -m benchmarks.run --baseline=benchmarks/baseline.json
+
+Timings depend on the machine, so only the counts of database queries,
+commits, messages and tasks are compared to the baseline. A run exits with
+an error if a count exceeds its baseline by more than the tolerance, or if a
+pipeline does not succeed.
+"""
+
+import json
+import os
+import sys
+from typing import Any
+
+from absl import app
+from absl import flags
+
+# Scenarios run against in-memory fakes, never against Google Cloud.
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'benchmark')
+
+# pylint: disable=wrong-import-position
+from benchmarks import harness
+from benchmarks import scenarios
+from controller import models
+# pylint: enable=wrong-import-position
+
+_SCENARIOS = flags.DEFINE_list(
+    'scenarios', list(scenarios.SCENARIOS), 'Scenarios to run.')
+_SCALE = flags.DEFINE_float(
+    'scale', 1.0, 'Factor applied to the size of the pipelines.')
+_DATABASE_URI = flags.DEFINE_string(
+    'database_uri', 'sqlite://',
+    'Database of the controller, e.g. a local MySQL server.')
+_BASELINE = flags.DEFINE_string(
+    'baseline', None, 'JSON file of the reports to compare with.')
+_UPDATE_BASELINE = flags.DEFINE_bool(
+    'update_baseline', False, 'Writes the reports to the baseline file.')
+_TOLERANCE = flags.DEFINE_float(
+    'tolerance', 0.1, 'Relative increase of a count reported as regression.')
+_JSON_OUTPUT = flags.DEFINE_string(
+    'json_output', None, 'JSON file to write the reports to.')
+
+# Counts compared to the baseline, deterministic for a given scale.
+_GATED_METRICS = (
+    'tasks',
+    'queries_per_task',
+    'commits_per_task',
+    'messages_per_task',
+    'log_entries_per_task',
+    'mp_hits',
+)
+
+
+def _run_scenario(name: str, scale: float,
+                  database_uri: str) -> dict[str, Any]:
+  # Each scenario gets a fresh database and fresh fakes.
+  with harness.Harness(database_uri=database_uri) as h:
+    pipeline = scenarios.SCENARIOS[name](h, scale)
+    return h.run(name, pipeline).summary()
+
+
+def _print_reports(reports: list[dict[str, Any]]) -> None:
+  columns = list(reports[0])
+  print('\t'.join(columns))
+  for report in reports:
+    print('\t'.join(str(report[column]) for column in columns))
+
+
+def find_regressions(reports: list[dict[str, Any]],
+                     baseline: dict[str, Any],
+                     tolerance: float) -> list[str]:
+  """Returns the regressions of the reports compared to a baseline.
+
+  Args:
+    reports: Summaries of the runs.
+    baseline: Summaries of reference runs, by scenario.
+    tolerance: Relative increase of a count reported as regression.
+
+  Returns:
+    Messages describing each regression.
+  """
+  regressions = []
+  for report in reports:
+    scenario = report['scenario']
+    if report['pipeline_status'] != models.Pipeline.STATUS.SUCCEEDED:
+      regressions.append(
+          f'{scenario}: pipeline {report["pipeline_status"]}')
+    if scenario not in baseline:
+      continue
+    for metric in _GATED_METRICS:
+      expected = baseline[scenario][metric]
+      if report[metric] > expected * (1 + tolerance):
+        regressions.append(
+            f'{scenario}: {metric} {report[metric]} > baseline {expected}')
+  return regressions
+
+
+def main(argv: list[str]) -> int:
+  del argv  # Unused argument
+  reports = []
+  for name in _SCENARIOS.value:
+    if name not in scenarios.SCENARIOS:
+      raise app.UsageError(f'Unknown scenario: {name}')
+    reports.append(
+        _run_scenario(name, _SCALE.value, _DATABASE_URI.value))
+  _print_reports(reports)
+  if _JSON_OUTPUT.value:
+    with open(_JSON_OUTPUT.value, 'w') as f:
+      json.dump(reports, f, indent=2)
+  if not _BASELINE.value:
+    return 0
+  if _UPDATE_BASELINE.value:
+    with open(_BASELINE.value, 'w') as f:
+      json.dump({
+          report['scenario']: {m: report[m] for m in _GATED_METRICS}
+          for report in reports
+      }, f, indent=2, sort_keys=True)
+      f.write('\n')
+    return 0
+  with open(_BASELINE.value, 'r') as f:
+    baseline = json.load(f)
+  regressions = find_regressions(reports, baseline, _TOLERANCE.value)
+  for regression in regressions:
+    print(f'REGRESSION {regression}', file=sys.stderr)
+  return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+  app.run(main)
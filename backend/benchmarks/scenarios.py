@@ -0,0 +1,89 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic pipelines run by the benchmarks.
+
+Each scenario sets up the harness and its pipeline, sized by a scale factor
+so that CI can run smaller pipelines than local investigations.
+"""
+
+from typing import Callable
+
+from benchmarks import harness
+from controller import models
+
+_MP_TEMPLATE = """{
+  "client_id": "$client_id",
+  "timestamp_micros": "$event_timestamp",
+  "events": [{
+    "name": "predicted_score",
+    "params": {"value": "$score", "model_type": "$model_type"}
+  }]
+}"""
+
+
+def _mp_params() -> dict[str, object]:
+  return {
+      'bq_project_id': 'benchmark',
+      'bq_dataset_id': 'crmint',
+      'bq_table_id': 'mp_events',
+      'bq_dataset_location': 'EU',
+      'measurement_id': 'G-BENCHMARK0',
+      'api_secret': 'benchmark-secret',
+      'template': _MP_TEMPLATE,
+      'mp_batch_size': 20,
+      'debug': False,
+  }
+
+
+def deep_chain(h: harness.Harness, scale: float) -> models.Pipeline:
+  """Jobs started one after the other, each running a single task."""
+  del h  # Unused argument
+  return harness.create_pipeline(
+      'deep_chain',
+      [('Commenter', {'comment': 'benchmark', 'success': True})] *
+      max(int(50 * scale), 1),
+      chained=True)
+
+
+def wide_fan_out(h: harness.Harness, scale: float) -> models.Pipeline:
+  """A table read in many small pages, each sent by its own sub-task."""
+  h.use_bigquery_table(num_rows=max(int(1000 * scale), 1), rows_per_page=5)
+  return harness.create_pipeline(
+      'wide_fan_out', [('BQToMeasurementProtocolGA4', _mp_params())])
+
+
+def mp_rows(h: harness.Harness, scale: float) -> models.Pipeline:
+  """Thousands of Measurement Protocol hits sent by a few sub-tasks."""
+  h.use_bigquery_table(num_rows=max(int(5000 * scale), 1), rows_per_page=1000)
+  return harness.create_pipeline(
+      'mp_rows', [('BQToMeasurementProtocolGA4', _mp_params())])
+
+
+def ga_admin(h: harness.Harness, scale: float) -> models.Pipeline:
+  """Parallel jobs calling the Google Analytics Admin API."""
+  del h  # Unused argument
+  return harness.create_pipeline(
+      'ga_admin',
+      [('GA4ConversionEventCreator',
+        {'ga_property_id': '12345', 'event_name': f'benchmark_{i}'})
+       for i in range(max(int(20 * scale), 1))])
+
+
+SCENARIOS: dict[str, Callable[[harness.Harness, float], models.Pipeline]] = {
+    'deep_chain': deep_chain,
+    'wide_fan_out': wide_fan_out,
+    'mp_rows': mp_rows,
+    'ga_admin': ga_admin,
+}
@@ -0,0 +1,61 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Counts the SQL statements and commits sent to a database."""
+
+import contextlib
+import dataclasses
+from typing import Iterator
+
+import sqlalchemy
+
+
+@dataclasses.dataclass
+class StatementCounts:
+  """Numbers of SQL statements and commits."""
+  queries: int = 0
+  commits: int = 0
+
+
+class StatementCounter:
+  """Counts SQL statements and commits using SQLAlchemy engine events."""
+
+  def __init__(self, engine: sqlalchemy.engine.Engine):
+    self._engine = engine
+    self.queries = 0
+    self.commits = 0
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', self._count_query)
+    sqlalchemy.event.listen(engine, 'commit', self._count_commit)
+
+  def _count_query(self, *unused_args) -> None:
+    self.queries += 1
+
+  def _count_commit(self, *unused_args) -> None:
+    self.commits += 1
+
+  def close(self) -> None:
+    """Stops counting statements."""
+    sqlalchemy.event.remove(
+        self._engine, 'before_cursor_execute', self._count_query)
+    sqlalchemy.event.remove(self._engine, 'commit', self._count_commit)
+
+  @contextlib.contextmanager
+  def measure(self) -> Iterator[StatementCounts]:
+    """Yields the counts of statements, set once the block exits."""
+    queries = self.queries
+    commits = self.commits
+    counts = StatementCounts()
+    yield counts
+    counts.queries = self.queries - queries
+    counts.commits = self.commits - commits
@@ -16,12 +16,13 @@
 
 import functools
 import os
-from typing import Optional
+from typing import Any, Optional
 
 from google.auth import credentials as auth_credentials
 from google.cloud import logging
 from google.cloud.logging import Logger
 
+from common import startup_profiler
 from controller import shared
 
 _PROJECT = os.getenv('GOOGLE_CLOUD_PROJECT')
@@ -41,7 +42,8 @@ def get_logger(
   Returns:
     Configured `google.cloud.logging.logger.Logger` instance.
   """
-  client = logging.Client(project=project, credentials=credentials)
+  with startup_profiler.phase('logging_client'):
+    client = logging.Client(project=project, credentials=credentials)
   return client.logger('crmint-logger')
 
 
@@ -64,7 +66,8 @@ def log_message(
     pipeline_id: int,
     job_id: int,
     logger_project: Optional[str] = None,
-    logger_credentials: Optional[auth_credentials.Credentials] = None) -> None:
+    logger_credentials: Optional[auth_credentials.Credentials] = None,
+    extra_fields: Optional[dict[str, Any]] = None) -> None:
   """Logs a structured message attached to a given worker, pipeline and job.
 
   Args:
@@ -76,6 +79,8 @@ def log_message(
     logger_project: GCP Project ID string or None.
     logger_credentials: Instance of `google.auth.credentials.Credentials`
       or None.
+    extra_fields: Optional dictionary of fields to add to the structured
+      payload (e.g. `log_type` and values to build log-based metrics from).
   """
   logger = get_logger(project=logger_project, credentials=logger_credentials)
   logger.log_struct({
@@ -86,6 +91,7 @@ def log_message(
       },
       'log_level': log_level,
       'message': message,
+      **(extra_fields or {}),
   })
 
 
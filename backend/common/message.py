@@ -15,20 +15,29 @@
 """Helpers for communicating with Pub/Sub."""
 
 import base64
+from concurrent import futures
 import datetime
 import functools
 import json
 import os
-from typing import Any
+from typing import Any, Mapping, Sequence
 
 import flask
 from google.cloud import pubsub_v1
 
 from common import crmint_logging
+from common import startup_profiler
 
 _PROJECT = os.getenv('GOOGLE_CLOUD_PROJECT')
 _PUBSUB_TIMEOUT = 10  # Unit in seconds.
 
+# Messages published together, e.g. tasks of sub-workers, are sent in batches.
+_BATCH_SETTINGS = pubsub_v1.types.BatchSettings(
+    max_messages=100,
+    max_bytes=1024 * 1024,
+    max_latency=0.01,  # Unit in seconds.
+)
+
 
 class _Error(Exception):
   """Generic message module error."""
@@ -54,9 +63,32 @@ class BadRequestError(_Error):
     super().__init__('There is no valid PubSub message in the request', 400)
 
 
+class PublishError(Exception):
+  """Exception raised if some messages sent together were not published."""
+
+  def __init__(self, errors: dict[int, Exception]):
+    first_index = min(errors)
+    super().__init__(
+        f'Failed to publish {len(errors)} message(s), first error for message '
+        f'#{first_index}: {errors[first_index]!r}')
+    self.errors = errors
+
+
 @functools.cache
 def _get_publisher_client() -> pubsub_v1.PublisherClient:
-  return pubsub_v1.PublisherClient()
+  with startup_profiler.phase('pubsub_client'):
+    return pubsub_v1.PublisherClient(batch_settings=_BATCH_SETTINGS)
+
+
+def _publish(data: dict[str, Any], topic: str, delay: int) -> futures.Future:
+  topic_path = f'projects/{_PROJECT}/topics/{topic}'
+  binary_data = json.dumps(data).encode('utf-8')
+  delay_delta = datetime.timedelta(seconds=delay)
+  start_time = int((datetime.datetime.utcnow() + delay_delta).timestamp())
+  client = _get_publisher_client()
+  return client.publish(topic_path,
+                        binary_data,
+                        start_time=str(start_time))
 
 
 def send(data: dict[str, Any], topic: str, delay: int = 0) -> None:
@@ -72,17 +104,52 @@ def send(data: dict[str, Any], topic: str, delay: int = 0) -> None:
     pubsub_v1.exceptions.TimeoutError: if the message to Pub/Sub times out.
     Exception: for undefined exceptions in the underlying pubsub call execution.
   """
-  topic_path = f'projects/{_PROJECT}/topics/{topic}'
-  binary_data = json.dumps(data).encode('utf-8')
-  delay_delta = datetime.timedelta(seconds=delay)
-  start_time = int((datetime.datetime.utcnow() + delay_delta).timestamp())
-  client = _get_publisher_client()
-  future = client.publish(topic_path,
-                          binary_data,
-                          start_time=str(start_time))
+  future = _publish(data, topic, delay)
   future.result(timeout=_PUBSUB_TIMEOUT)
 
 
+def send_many(messages: Sequence[tuple[dict[str, Any], str, int]]) -> None:
+  """Sends messages to PubSub topics in batches, waits for all of them.
+
+  Messages are published concurrently, their delivery is not ordered.
+
+  Args:
+    messages: Sequence of (data, topic, delay) tuples, see `send`.
+
+  Raises:
+    PublishError: if some messages were not published, with the errors by
+      index of message. Other messages were published.
+  """
+  publish_futures = [_publish(*m) for m in messages]
+  futures.wait(publish_futures, timeout=_PUBSUB_TIMEOUT)
+  errors = {}
+  for i, future in enumerate(publish_futures):
+    if not future.done():
+      errors[i] = TimeoutError(
+          f'Message not published after {_PUBSUB_TIMEOUT} seconds')
+    elif future.exception() is not None:
+      errors[i] = future.exception()
+  if errors:
+    raise PublishError(errors)
+
+
+def _check_start_time(attributes: Mapping[str, str]) -> None:
+  try:
+    start_time = datetime.datetime.fromtimestamp(
+        int(attributes['start_time']))
+    if datetime.datetime.utcnow() <= start_time:
+      raise TooEarlyError(start_time)
+  except KeyError as e:
+    raise BadRequestError() from e
+
+
+def _decode(binary_data: bytes) -> dict[str, Any]:
+  try:
+    return json.loads(binary_data.decode('utf-8'))
+  except (UnicodeDecodeError, json.decoder.JSONDecodeError) as e:
+    raise BadRequestError() from e
+
+
 def extract_data(request: flask.Request) -> dict[str, Any]:
   """Returns a PubSub message data from an incoming Flask request.
 
@@ -95,21 +162,22 @@ def extract_data(request: flask.Request) -> dict[str, Any]:
   except (TypeError, KeyError) as e:
     raise BadRequestError() from e
   try:
-    start_time = datetime.datetime.fromtimestamp(
-        int(message['attributes']['start_time']))
-    if datetime.datetime.utcnow() <= start_time:
-      raise TooEarlyError(start_time)
-  except KeyError as e:
-    raise BadRequestError() from e
-  try:
-    data = json.loads(base64.b64decode(message['data']).decode('utf-8'))
-  except (
-      KeyError,
-      base64.binascii.Error,
-      UnicodeDecodeError,
-      json.decoder.JSONDecodeError) as e:
+    _check_start_time(message['attributes'])
+    binary_data = base64.b64decode(message['data'])
+  except (KeyError, base64.binascii.Error) as e:
     raise BadRequestError() from e
-  return data
+  return _decode(binary_data)
+
+
+def extract_pulled_data(
+    pulled_message: pubsub_v1.subscriber.message.Message) -> dict[str, Any]:
+  """Returns the data of a PubSub message received by a pull subscriber.
+
+  Args:
+    pulled_message: Message received by a streaming pull subscriber.
+  """
+  _check_start_time(pulled_message.attributes)
+  return _decode(pulled_message.data)
 
 
 def shutdown() -> None:
@@ -0,0 +1,191 @@
+# Copyright 2023 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed store of the payloads shared by Pub/Sub messages.
+
+Large fields repeated across messages, such as the templates copied into each
+sub-worker, are stored once in Cloud Storage, compressed, and replaced in
+messages by a reference to their hash. Worker parameters are offloaded field
+by field, so that parameters differing by a small field, e.g. the page token of
+each page of a table, still share their large fields. The store is enabled by
+setting PAYLOAD_BUCKET, otherwise fields are inlined.
+
+General settings hold credentials and are never stored, since payloads are
+kept for days in a bucket shared by the services.
+"""
+
+import collections
+import datetime
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any
+import zlib
+
+from google.api_core import exceptions
+from google.cloud import storage
+
+_BUCKET = os.getenv('PAYLOAD_BUCKET')
+
+# Encoded size above which a field is offloaded to the store, in bytes.
+INLINE_LIMIT_BYTES = int(os.getenv('PAYLOAD_INLINE_LIMIT_BYTES', '1024'))
+
+# Key of the reference replacing an offloaded field.
+REF_KEY = '$payload'
+
+_PREFIX = 'payloads'
+
+# Stored payloads have their custom time refreshed at most once per interval
+# by each instance, the bucket deletes payloads not referenced for days.
+_REFRESH_INTERVAL = 3600  # Unit in seconds.
+
+# Maximum number of decoded payloads kept in memory.
+_MAX_CACHED_PAYLOADS = 256
+
+# Maximum number of refresh times kept in memory, the least recently refreshed
+# payloads are forgotten first and refreshed again on their next store.
+_MAX_REFRESHED_PAYLOADS = 4096
+
+
+class CorruptedPayloadError(Exception):
+  """Exception raised if a stored payload does not match its hash."""
+
+
+def is_enabled() -> bool:
+  return bool(_BUCKET)
+
+
+@functools.cache
+def _get_bucket() -> storage.Bucket:
+  return storage.Client().bucket(_BUCKET)
+
+
+def _encode(value: Any) -> bytes:
+  return json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+
+
+# Maps payload hashes to their last refresh time, from the least to the most
+# recently refreshed. Refresh times older than the interval are pruned.
+_refreshed_at: collections.OrderedDict[str, float] = collections.OrderedDict()
+_refreshed_at_lock = threading.Lock()
+
+
+def _store(digest: str, data: bytes) -> None:
+  """Uploads the payload unless present, or refreshes its custom time."""
+  now = time.monotonic()
+  with _refreshed_at_lock:
+    if now - _refreshed_at.get(digest, -_REFRESH_INTERVAL) < _REFRESH_INTERVAL:
+      return
+  blob = _get_bucket().blob(f'{_PREFIX}/{digest}')
+  blob.custom_time = datetime.datetime.now(datetime.timezone.utc)
+  try:
+    blob.upload_from_string(
+        zlib.compress(data),
+        content_type='application/octet-stream',
+        if_generation_match=0)
+  except exceptions.PreconditionFailed:
+    blob.patch()
+  with _refreshed_at_lock:
+    _refreshed_at[digest] = now
+    _refreshed_at.move_to_end(digest)
+    while _refreshed_at and (
+        len(_refreshed_at) > _MAX_REFRESHED_PAYLOADS
+        or now - next(iter(_refreshed_at.values())) >= _REFRESH_INTERVAL):
+      _refreshed_at.popitem(last=False)
+
+
+def put(value: Any) -> dict[str, str]:
+  """Stores a JSON serializable value, returns a reference to it.
+
+  Args:
+    value: Value to store.
+
+  Returns:
+    A reference to the value, to be passed to `get`.
+  """
+  return _put_data(_encode(value))
+
+
+def _put_data(data: bytes) -> dict[str, str]:
+  digest = hashlib.sha256(data).hexdigest()
+  _store(digest, data)
+  return {REF_KEY: digest}
+
+
+@functools.lru_cache(maxsize=_MAX_CACHED_PAYLOADS)
+def _load(digest: str) -> bytes:
+  blob = _get_bucket().blob(f'{_PREFIX}/{digest}')
+  data = zlib.decompress(blob.download_as_bytes())
+  if hashlib.sha256(data).hexdigest() != digest:
+    raise CorruptedPayloadError(f'Payload does not match its hash: {digest}')
+  return data
+
+
+def is_ref(value: Any) -> bool:
+  return isinstance(value, dict) and list(value) == [REF_KEY]
+
+
+def get(ref: dict[str, str]) -> Any:
+  """Returns the value referenced, decoded anew on each call.
+
+  Args:
+    ref: Reference returned by `put`.
+  """
+  return json.loads(_load(ref[REF_KEY]))
+
+
+def offload(value: Any) -> Any:
+  """Returns a reference to the stored value if large, otherwise the value.
+
+  Args:
+    value: JSON serializable value of a message field.
+  """
+  if not is_enabled():
+    return value
+  data = _encode(value)
+  if len(data) <= INLINE_LIMIT_BYTES:
+    return value
+  return _put_data(data)
+
+
+def resolve(value: Any) -> Any:
+  """Returns the value referenced if it is a reference, otherwise the value.
+
+  Args:
+    value: Value of a message field, offloaded or not.
+  """
+  if is_ref(value):
+    return get(value)
+  return value
+
+
+def offload_fields(params: dict[str, Any]) -> dict[str, Any]:
+  """Returns the parameters with their large fields offloaded one by one.
+
+  Args:
+    params: JSON serializable parameters, e.g. of a worker.
+  """
+  return {key: offload(value) for key, value in params.items()}
+
+
+def resolve_fields(params: Any) -> dict[str, Any]:
+  """Returns the parameters with their offloaded fields resolved.
+
+  Args:
+    params: Parameters returned by `offload_fields`, or offloaded as a whole.
+  """
+  return {key: resolve(value) for key, value in resolve(params).items()}
@@ -15,6 +15,7 @@
 """Result class definition."""
 
 from common import message
+from common import payload_store
 
 
 class Result:
@@ -22,6 +23,9 @@ class Result:
 
   _TOPIC = 'crmint-3-task-finished'
 
+  # Workers to enqueue are (worker_class, worker_params, delay) tuples, with
+  # an optional fourth element for their priority, None to use the one of
+  # their pipeline.
   def __init__(self, task_name, job_id, success, workers_to_enqueue=None):
     self.task_name = task_name
     self.job_id = job_id
@@ -36,7 +40,14 @@ class Result:
         'task_name': self.task_name,
         'job_id': self.job_id,
         'success': self.success,
-        'workers_to_enqueue': self.workers_to_enqueue,
+        # Sub-workers often share large parameters, e.g. templates, which
+        # are stored once while fields specific to each one stay inline.
+        'workers_to_enqueue': [
+            (worker_class, payload_store.offload_fields(worker_params),
+             *other_args)
+            for worker_class, worker_params, *other_args
+            in self.workers_to_enqueue
+        ],
     }
     message.send(data, self._TOPIC)
 
@@ -48,4 +59,7 @@ class Result:
         data['task_name'],
         data['job_id'],
         data['success'],
-        data['workers_to_enqueue'])
+        [(worker_class, payload_store.resolve_fields(worker_params),
+          *other_args)
+         for worker_class, worker_params, *other_args
+         in data['workers_to_enqueue']])
@@ -0,0 +1,235 @@
+# Copyright 2023 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup instrumentation of the services, enabled with STARTUP_PROFILE=1.
+
+Records the import time of each module, the duration of startup phases (e.g.
+app factory steps, first client creations) and the time of startup events
+(e.g. first database connection). The report is served on `/debug/startup`
+and written as JSON to STARTUP_PROFILE_PATH.
+
+This module is imported before any other by the apps, so it only depends on
+the standard library.
+"""
+
+import contextlib
+import functools
+import importlib.abc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+_ENABLED = bool(int(os.getenv('STARTUP_PROFILE', '0')))
+_REPORT_PATH = os.getenv('STARTUP_PROFILE_PATH')
+
+# Number of slowest imports listed in the report.
+_MAX_REPORTED_IMPORTS = 100
+
+
+def _elapsed_ms(start: float, end: Optional[float] = None) -> float:
+  if end is None:
+    end = time.perf_counter()
+  return round((end - start) * 1000, 3)
+
+
+class StartupProfile:
+  """Startup timings of a service."""
+
+  def __init__(self, service: str, report_path: Optional[str] = None):
+    self.service = service
+    self.report_path = report_path or os.path.join(
+        tempfile.gettempdir(), f'{service}_startup_profile.json')
+    self.start_time = time.perf_counter()
+    self.ready_ms = None
+    self.imports = []
+    self.phases = {}
+    self.marks = {}
+    self._lock = threading.Lock()
+
+  def record_import(self, module_name: str, cumulative_ms: float,
+                    self_ms: float) -> None:
+    with self._lock:
+      self.imports.append({
+          'module': module_name,
+          'cumulative_ms': cumulative_ms,
+          'self_ms': self_ms,
+      })
+
+  @contextlib.contextmanager
+  def phase(self, name: str) -> Iterator[None]:
+    """Records the duration of the first occurrence of a phase."""
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      end = time.perf_counter()
+      with self._lock:
+        self.phases.setdefault(name, {
+            'start_ms': _elapsed_ms(self.start_time, start),
+            'duration_ms': _elapsed_ms(start, end),
+        })
+      self._write_if_ready()
+
+  def mark(self, name: str) -> None:
+    """Records the time of the first occurrence of an event."""
+    with self._lock:
+      self.marks.setdefault(name, _elapsed_ms(self.start_time))
+    self._write_if_ready()
+
+  def finish(self) -> None:
+    """Records the time at which the service is ready, writes the report."""
+    self.ready_ms = _elapsed_ms(self.start_time)
+    self._write_if_ready()
+
+  def report(self) -> dict[str, Any]:
+    """Returns the startup timings as a JSON serializable dictionary."""
+    with self._lock:
+      imports = sorted(
+          self.imports, key=lambda x: x['self_ms'], reverse=True)
+      return {
+          'service': self.service,
+          'ready_ms': self.ready_ms,
+          'imports_ms': round(sum(x['self_ms'] for x in imports), 3),
+          'imports_count': len(imports),
+          'slowest_imports': imports[:_MAX_REPORTED_IMPORTS],
+          'phases': dict(self.phases),
+          'marks': dict(self.marks),
+      }
+
+  def _write_if_ready(self) -> None:
+    # Events happening after startup, such as the first database connection
+    # on the first request, update the report.
+    if self.ready_ms is None:
+      return
+    with open(self.report_path, 'w') as f:
+      json.dump(self.report(), f, indent=2)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+  """Meta path finder timing the execution of imported modules.
+
+  Specs are found by the other finders, their loaders are instrumented to
+  record the cumulative and self time of executing each module.
+  """
+
+  def __init__(self, profile: StartupProfile):
+    self._profile = profile
+    self._local = threading.local()
+
+  def _children_times(self) -> list[float]:
+    if not hasattr(self._local, 'children_times'):
+      self._local.children_times = []
+    return self._local.children_times
+
+  def find_spec(self, fullname, path, target=None):
+    for finder in list(sys.meta_path):
+      if finder is self or not hasattr(finder, 'find_spec'):
+        continue
+      spec = finder.find_spec(fullname, path, target)
+      if spec is not None:
+        break
+    else:
+      return None
+    loader = spec.loader
+    # Only instruments loader instances, builtin and frozen modules are loaded
+    # by classes, and leaves loaders shared by modules being imported alone.
+    loader_attributes = getattr(loader, '__dict__', None)
+    if (loader_attributes is None or 'exec_module' in loader_attributes
+        or not hasattr(loader, 'exec_module')):
+      return spec
+    exec_module = loader.exec_module
+
+    @functools.wraps(exec_module)
+    def timed_exec_module(module):
+      del loader.exec_module
+      children_times = self._children_times()
+      children_times.append(0.0)
+      start = time.perf_counter()
+      try:
+        exec_module(module)
+      finally:
+        elapsed = time.perf_counter() - start
+        self_time = elapsed - children_times.pop()
+        if children_times:
+          children_times[-1] += elapsed
+        self._profile.record_import(
+            fullname, round(elapsed * 1000, 3), round(self_time * 1000, 3))
+
+    loader.exec_module = timed_exec_module
+    return spec
+
+
+_profile: Optional[StartupProfile] = None
+
+
+def start(service: str) -> None:
+  """Starts profiling the service startup if STARTUP_PROFILE is set.
+
+  Args:
+    service: Name of the service, e.g. `jobs` or `controller`.
+  """
+  global _profile
+  if not _ENABLED or _profile is not None:
+    return
+  _profile = StartupProfile(service, _REPORT_PATH)
+  sys.meta_path.insert(0, _ImportTimer(_profile))
+
+
+def finish() -> None:
+  """Marks the service as ready and stops timing imports."""
+  if _profile is None:
+    return
+  sys.meta_path[:] = [
+      finder for finder in sys.meta_path
+      if not isinstance(finder, _ImportTimer)
+  ]
+  _profile.finish()
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+  """Records the duration of a startup phase, if profiling.
+
+  Args:
+    name: Name of the phase, only its first occurrence is recorded.
+  """
+  if _profile is None:
+    yield
+    return
+  with _profile.phase(name):
+    yield
+
+
+def mark(name: str) -> None:
+  """Records the time of a startup event, if profiling.
+
+  Args:
+    name: Name of the event, only its first occurrence is recorded.
+  """
+  if _profile is not None:
+    _profile.mark(name)
+
+
+def add(app) -> None:
+  """Serves the startup report on `/debug/startup`, if profiling."""
+  if _profile is None:
+    return
+
+  @app.route('/debug/startup', methods=['GET'])
+  def startup_report():  # pylint: disable=unused-variable
+    return _profile.report()
@@ -13,16 +13,29 @@
 # limitations under the License.
 
 from common import message
+from common import payload_store
+
+
+class Priority:
+  """Lanes of task delivery, each with its own topic and subscription."""
+  HIGH = 'high'
+  NORMAL = 'normal'
+  LOW = 'low'
 
 
 class Task:
   """Async task to be completed by a CRMint worker."""
 
-  _TOPIC = 'crmint-3-start-task'
+  _TOPICS = {
+      Priority.HIGH: 'crmint-3-start-task-high',
+      Priority.NORMAL: 'crmint-3-start-task',
+      Priority.LOW: 'crmint-3-start-task-low',
+  }
 
   # pylint: disable=too-many-arguments
   def __init__(self, name, pipeline_id, job_id,
-               worker_class, worker_params, general_settings, attempts=1):
+               worker_class, worker_params, general_settings, attempts=1,
+               priority=Priority.NORMAL):
     self.name = name
     self.pipeline_id = pipeline_id
     self.job_id = job_id
@@ -30,19 +43,40 @@ class Task:
     self.worker_params = worker_params
     self.general_settings = general_settings
     self.attempts = attempts
+    self.priority = priority
   # pylint: enable=too-many-arguments
 
-  def enqueue(self, delay=0):
+  def _to_message(self, delay=0):
     data = {
         'task_name': self.name,
         'pipeline_id': self.pipeline_id,
         'job_id': self.job_id,
         'worker_class': self.worker_class,
-        'worker_params': self.worker_params,
+        'worker_params': payload_store.offload_fields(self.worker_params),
+        # Holding credentials, never offloaded.
         'general_settings': self.general_settings,
         'attempts': self.attempts,
+        'priority': self.priority,
     }
-    message.send(data, self._TOPIC, delay=delay)
+    return data, self._TOPICS[self.priority], delay
+
+  def enqueue(self, delay=0):
+    message.send(*self._to_message(delay))
+
+  @classmethod
+  def enqueue_many(cls, tasks_with_delays):
+    """Enqueues tasks in batches, waits for all of them to be published.
+
+    Args:
+      tasks_with_delays: Sequence of (task, delay) tuples.
+
+    Raises:
+      message.PublishError: if some tasks were not enqueued, with the errors
+        by index of task.
+    """
+    message.send_many(
+        [task_inst._to_message(delay)
+         for task_inst, delay in tasks_with_delays])
 
   def reenqueue(self):
     self.attempts += 1
@@ -51,12 +85,21 @@ class Task:
   @classmethod
   def from_request(cls, request):
     """Creates a task using data form an incoming Flask HTTP request."""
-    data = message.extract_data(request)
+    return cls._from_data(message.extract_data(request))
+
+  @classmethod
+  def from_pulled_message(cls, pulled_message):
+    """Creates a task using data from a message pulled from Pub/Sub."""
+    return cls._from_data(message.extract_pulled_data(pulled_message))
+
+  @classmethod
+  def _from_data(cls, data):
     return cls(
         data['task_name'],
         data['pipeline_id'],
         data['job_id'],
         data['worker_class'],
-        data['worker_params'],
-        data['general_settings'],
-        attempts=data['attempts'])
+        payload_store.resolve_fields(data['worker_params']),
+        payload_store.resolve(data['general_settings']),
+        attempts=data['attempts'],
+        priority=data.get('priority', Priority.NORMAL))
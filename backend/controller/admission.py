@@ -0,0 +1,178 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sends the tasks held back by the admission control of the controller.
+
+Each pipeline has a budget of tasks sent to the jobs service at once, and
+worker classes can have one across pipelines. Tasks enqueued above these
+budgets are stored as `HeldTask` rows, then released as in-flight tasks
+finish, on task results and on every heartbeat. Pipelines take turns, so
+that a pipeline with a large backlog of tasks cannot delay the others.
+"""
+
+import collections
+import datetime
+from typing import Optional
+
+from sqlalchemy import func
+
+from common import crmint_logging
+from common import message
+from common import task
+from controller import models
+
+# Maximum number of held tasks sent in a single release.
+_RELEASE_BATCH_SIZE = 500
+
+
+def _drop_tasks_of_inactive_jobs() -> None:
+  """Finishes the held tasks of jobs stopped or failed in the meantime.
+
+  Held tasks of stopping jobs are cancelled, so that their jobs become idle
+  rather than failed, like tasks of stopped jobs that never run.
+  """
+  held_tasks = [
+      (held_task.id, held_task.task_name, held_task.job)
+      for held_task in (models.HeldTask.query
+                        .join(models.Job)
+                        .filter(models.Job.status != models.Job.STATUS.RUNNING)
+                        .all())
+  ]
+  for held_task_id, task_name, job in held_tasks:
+    if models.HeldTask.claim(held_task_id):
+      crmint_logging.log_message(
+          f'Dropped held task for name: {task_name}',
+          log_level='WARNING',
+          worker_class=job.worker_class,
+          pipeline_id=job.pipeline_id,
+          job_id=job.id)
+      if job.status == models.Job.STATUS.STOPPING:
+        job.cancel_task(task_name)
+      else:
+        job.task_failed(task_name)
+
+
+def _select(batch_size: int) -> list[models.HeldTask]:
+  """Returns held tasks within budgets, one pipeline after the other."""
+  # Pipelines holding the oldest tasks get the first turns.
+  pipeline_ids = [
+      pipeline_id for pipeline_id, _ in (
+          models.HeldTask.session
+          .query(models.HeldTask.pipeline_id,
+                 func.min(models.HeldTask.id))
+          .group_by(models.HeldTask.pipeline_id)
+          .order_by(func.min(models.HeldTask.id))
+          .all())
+  ]
+  queues = collections.OrderedDict()
+  for pipeline_id in pipeline_ids:
+    queues[pipeline_id] = collections.deque(
+        models.HeldTask.where(pipeline_id=pipeline_id)
+        .order_by(models.HeldTask.id)
+        .limit(batch_size)
+        .all())
+  budget = models.AdmissionBudget()
+  selected = []
+  while queues and len(selected) < batch_size:
+    for pipeline_id in list(queues):
+      queue = queues[pipeline_id]
+      held_task = queue[0]
+      # Tasks of a pipeline are sent in order, its turn ends at the first
+      # task above budget.
+      if not budget.admit(held_task.job.pipeline, held_task.worker_class):
+        del queues[pipeline_id]
+        continue
+      selected.append(queue.popleft())
+      if not queue:
+        del queues[pipeline_id]
+      if len(selected) >= batch_size:
+        break
+  return selected
+
+
+def release(now: Optional[datetime.datetime] = None,
+            batch_size: int = _RELEASE_BATCH_SIZE) -> int:
+  """Sends the held tasks within budgets, taking turns between pipelines.
+
+  Args:
+    now: Datetime of the release, defaults to the current UTC time.
+    batch_size: Maximum number of tasks to send.
+
+  Returns:
+    Number of tasks sent.
+
+  Raises:
+    message.PublishError: if some tasks were not published, after holding
+      them again.
+  """
+  if now is None:
+    now = datetime.datetime.utcnow()
+  _drop_tasks_of_inactive_jobs()
+  selected = _select(batch_size)
+  if not selected:
+    return 0
+  general_settings = {
+      gs.name: gs.value for gs in models.GeneralSetting.all()}
+  tasks_with_delays = [
+      (held_task.to_task(general_settings), held_task.get_delay(now))
+      for held_task in selected
+  ]
+  held_fields = [
+      {column: getattr(held_task, column)
+       for column in ('id', 'job_id', 'pipeline_id', 'task_name',
+                      'worker_class', 'worker_params', 'priority',
+                      'not_before')}
+      for held_task in selected
+  ]
+  # Another request could release the same tasks concurrently, only the one
+  # deleting a held task sends it.
+  claimed = []
+  for task_with_delay, fields in zip(tasks_with_delays, held_fields):
+    if models.HeldTask.claim(fields.pop('id')):
+      claimed.append((task_with_delay, fields))
+  if not claimed:
+    return 0
+  publish_error = None
+  try:
+    task.Task.enqueue_many([task_with_delay for task_with_delay, _ in claimed])
+  except message.PublishError as e:
+    publish_error = e
+  for i, ((task_inst, _), fields) in enumerate(claimed):
+    if publish_error and i in publish_error.errors:
+      models.HeldTask.create(**fields)
+      continue
+    crmint_logging.log_message(
+        f'Released held task for (worker_class, name): '
+        f'({task_inst.worker_class}, {task_inst.name})',
+        log_level='DEBUG',
+        worker_class=task_inst.worker_class,
+        pipeline_id=task_inst.pipeline_id,
+        job_id=task_inst.job_id)
+  if publish_error:
+    raise publish_error
+  return len(claimed)
+
+
+def release_and_log() -> None:
+  """Sends the held tasks within budgets, logging tasks failing to publish.
+
+  Tasks failing to publish are held again and released on a later task result
+  or heartbeat, so that callers can carry on.
+  """
+  try:
+    release()
+  except message.PublishError as e:
+    crmint_logging.log_global_message(
+        f'Failed releasing {len(e.errors)} held tasks',
+        log_level='WARNING')
@@ -19,6 +19,7 @@ from typing import Any, Optional
 
 from flask import Flask
 
+from common import startup_profiler
 from controller import extensions
 from controller import job
 from controller import ml_model
@@ -46,8 +47,10 @@ def create_app(config: Optional[dict[str, Any]] = None) -> Flask:
       'mysql+mysqlconnector://crmint:crmint@db:3306/crmint_development')
   if config:
     app.config.update(**config)
-  register_extensions(app)
-  register_blueprints(app)
+  with startup_profiler.phase('register_extensions'):
+    register_extensions(app)
+  with startup_profiler.phase('register_blueprints'):
+    register_blueprints(app)
   return app
 
 
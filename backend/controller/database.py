@@ -52,6 +52,7 @@ def load_fixtures(logger_func: Optional[Callable[[str], None]] = None) -> None:
 
 def reset_jobs_and_pipelines_statuses_to_idle() -> None:
   models.TaskEnqueued.query.delete()
+  models.TrackedOperation.query.delete()
   for pipeline in models.Pipeline.all():
     for job in pipeline.jobs:
       job.update(status='idle')
@@ -21,7 +21,10 @@ from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_sqlalchemy import model
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy import pool
 
+from common import startup_profiler
 from controller import mixins
 
 
@@ -44,3 +47,9 @@ db = SQLAlchemy(
 db.Model.set_session(db.session)  # Binds the scoped session to our models.
 cors = CORS()
 migrate = Migrate()
+
+
+@event.listens_for(pool.Pool, 'first_connect')
+def _mark_first_db_connection(dbapi_connection, connection_record):
+  del dbapi_connection, connection_record  # Unused arguments
+  startup_profiler.mark('first_db_connection')
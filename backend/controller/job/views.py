@@ -23,6 +23,7 @@ from flask_restful import reqparse
 from flask_restful import Resource
 
 from common import insight
+from common import task
 from controller import models
 
 blueprint = Blueprint('job', __name__)
@@ -146,7 +147,7 @@ class JobStart(Resource):
   @marshal_with(job_fields)
   def post(self, job_id):
     job = models.Job.find(job_id)
-    job.pipeline.start_single_job(job)
+    job.pipeline.start_single_job(job, priority=task.Priority.HIGH)
     tracker = insight.GAProvider()
     tracker.track_event(
         category='jobs',
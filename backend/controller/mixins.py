@@ -224,6 +224,7 @@ class SmartQueryMixin:
   # Supported operators using the Django-like syntax "<attr_name>__<op_name>".
   _operators = {
       "in": sql.operators.in_op,
+      "le": sql.operators.le,
   }
 
   @classproperty
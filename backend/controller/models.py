@@ -16,9 +16,12 @@
 
 import datetime
 import enum
+import json
 import numbers
+import os
+import random
 import re
-from typing import Optional, Union, Any
+from typing import Any, Iterable, Optional, Union
 import uuid
 
 import jinja2
@@ -33,6 +36,7 @@ from sqlalchemy import String
 from sqlalchemy import Text
 
 from common import crmint_logging
+from common import message
 from common import task
 from controller import cron_utils
 from controller import extensions
@@ -82,6 +86,13 @@ class Pipeline(extensions.db.Model):
       backref='pipeline',
       lazy='joined')
   run_on_schedule = Column(Boolean, nullable=False, default=False)
+  # Delivery lane of the tasks of the pipeline, see `task.Priority`.
+  priority = Column(String(10), nullable=False, default=task.Priority.NORMAL)
+  # Lane of the current run, manual runs use the high priority lane.
+  run_priority = Column(String(10))
+  # Maximum number of tasks of the pipeline sent to the jobs service at once,
+  # None for the default budget and zero for no limit, see `HeldTask`.
+  max_concurrent_tasks = Column(Integer)
   schedules = orm.relationship(
       'Schedule',
       lazy='joined',
@@ -103,6 +114,11 @@ class Pipeline(extensions.db.Model):
       shared.PipelineStatus.FAILED,
       shared.PipelineStatus.SUCCEEDED,
   ]
+  PRIORITIES = [
+      task.Priority.HIGH,
+      task.Priority.NORMAL,
+      task.Priority.LOW,
+  ]
 
   def __init__(self, name=None):
     super().__init__()
@@ -119,6 +135,16 @@ class Pipeline(extensions.db.Model):
       if key == 'run_on_schedule':
         self.__setattr__(key, value == 'True')
         continue
+      if key == 'priority':
+        if value is None:
+          continue
+        if value not in Pipeline.PRIORITIES:
+          raise ValueError(f'Invalid priority: {value}')
+      if key == 'max_concurrent_tasks':
+        if value is None:
+          continue
+        if value < 0:
+          raise ValueError(f'Invalid maximum concurrent tasks: {value}')
       self.__setattr__(key, value)
 
   def save_relations(self, relations):
@@ -178,13 +204,13 @@ class Pipeline(extensions.db.Model):
       if param.job_id is not None:
         job_id = param.job_id
         worker_class = param.job.worker_class
-        message = 'Invalid job parameter "%s": %s' % (param.label, e)
+        error_message = 'Invalid job parameter "%s": %s' % (param.label, e)
       elif param.pipeline_id is not None:
-        message = 'Invalid pipeline variable "%s": %s' % (param.label, e)
+        error_message = 'Invalid pipeline variable "%s": %s' % (param.label, e)
       else:
-        message = 'Invalid global variable "%s": %s' % (param.label, e)
+        error_message = 'Invalid global variable "%s": %s' % (param.label, e)
       crmint_logging.log_message(
-          message,
+          error_message,
           log_level='ERROR',
           pipeline_id=self.id,
           job_id=job_id,
@@ -220,8 +246,17 @@ class Pipeline(extensions.db.Model):
         return PipelineReadyStatus.JOBS_NOT_READY
     return PipelineReadyStatus.READY
 
-  def _start(self) -> None:
+  def get_task_budget(self) -> Optional[int]:
+    """Returns the maximum number of tasks in flight, None for no limit."""
+    if self.max_concurrent_tasks is None:
+      budget = HeldTask.get_default_pipeline_budget()
+    else:
+      budget = self.max_concurrent_tasks
+    return budget or None
+
+  def _start(self, priority: Optional[str]) -> None:
     # Updates statuses of pipeline and jobs, before starting any task.
+    self.update(run_priority=priority or self.priority)
     self.set_status(Pipeline.STATUS.RUNNING)
     for job in self.jobs:
       job.set_status(Job.STATUS.WAITING)
@@ -229,11 +264,16 @@ class Pipeline(extensions.db.Model):
     for job in self.jobs:
       job.start()
 
-  def start(self) -> bool:
-    """Returns True if all jobs have been started."""
+  def start(self, priority: Optional[str] = None) -> bool:
+    """Returns True if all jobs have been started.
+
+    Args:
+      priority: Delivery lane of the tasks of this run, defaults to the
+        priority of the pipeline.
+    """
     ready_status = self.get_ready()
     if ready_status == PipelineReadyStatus.READY:
-      self._start()
+      self._start(priority)
       return True
 
     # Invites the user to look at logs by setting all jobs as failed,
@@ -258,17 +298,29 @@ class Pipeline(extensions.db.Model):
       job.stop()
     return True
 
-  def _start_as_single(self, job: 'Job') -> Union['TaskEnqueued', None]:
+  def _start_as_single(self,
+                       job: 'Job',
+                       priority: Optional[str]) -> Union['TaskEnqueued', None]:
     # Updates statuses of pipeline and jobs, before starting any task.
+    self.update(run_priority=priority or self.priority)
     self.set_status(Pipeline.STATUS.RUNNING)
     job.set_status(Job.STATUS.WAITING)
     # Starts jobs now that all statuses are up-to-date.
     return job.start_as_single()
 
-  def start_single_job(self, job: 'Job') -> Union['TaskEnqueued', None]:
-    """Returns True if the job has been started."""
+  def start_single_job(
+      self,
+      job: 'Job',
+      priority: Optional[str] = None) -> Union['TaskEnqueued', None]:
+    """Returns True if the job has been started.
+
+    Args:
+      job: Job to start.
+      priority: Delivery lane of the tasks of this run, defaults to the
+        priority of the pipeline.
+    """
     if self.get_ready([job]) == PipelineReadyStatus.READY:
-      return self._start_as_single(job)
+      return self._start_as_single(job, priority)
 
     # Invites the user to look at logs by setting the job as failed.
     self.set_status(Pipeline.STATUS.FAILED)
@@ -330,6 +382,11 @@ class Pipeline(extensions.db.Model):
           pipeline_id=self.id)
 
   def import_data(self, data):
+    self.assign_attributes({
+        key: data[key]
+        for key in ('priority', 'max_concurrent_tasks') if key in data
+    })
+    self.save()
     self.assign_params(data['params'])
     self.assign_schedules(data['schedules'])
     job_mapping = {}
@@ -674,6 +731,9 @@ class TaskEnqueued(extensions.db.Model):
   id = Column(Integer, primary_key=True, autoincrement=True)
   task_namespace = Column(String(60), index=True)
   task_name = Column(String(100), index=True, unique=True)
+  # Only set for tasks sent to the jobs service, held ones included.
+  pipeline_id = Column(Integer, index=True)
+  worker_class = Column(String(255), index=True)
 
   @classmethod
   def count_in_namespace(cls, task_namespace: str) -> int:
@@ -681,12 +741,216 @@ class TaskEnqueued(extensions.db.Model):
     count_query = cls.where(task_namespace=task_namespace)
     return count_query.count()
 
+  @classmethod
+  def count_in_flight(cls, **filters) -> int:
+    """Returns the number of tasks sent to the jobs service and not done.
+
+    Args:
+      **filters: Filters on `pipeline_id` or `worker_class`.
+    """
+    return cls.where(**filters).count() - HeldTask.where(**filters).count()
+
   @property
   def name(self):
     """TODO(dulacp): remove this helper, used to avoid too much refactoring."""
     return self.task_name
 
 
+class TrackedOperation(extensions.db.Model):
+  """Model for an external operation polled on behalf of an enqueued task.
+
+  Waiter tasks (e.g. `BQWaiter`) are not sent to the jobs service when
+  operations tracking is enabled. Their parameters are stored here instead and
+  the operation tracker polls all of them in one sweep per heartbeat, then
+  finishes the owning task once the external operation is done.
+  """
+  __tablename__ = 'tracked_operations'
+  __repr_attrs__ = ['worker_class', 'task_name']
+
+  id = Column(Integer, primary_key=True, autoincrement=True)
+  job_id = Column(Integer, ForeignKey('jobs.id'), index=True)
+  task_name = Column(String(100), index=True, unique=True)
+  worker_class = Column(String(255))
+  worker_params = Column(Text())
+  attempts = Column(Integer, nullable=False, default=0)
+  next_check_at = Column(DateTime, index=True)
+
+  job = orm.relationship('Job', foreign_keys=[job_id])
+
+  # Waiter workers handled by the operation tracker.
+  WORKER_CLASSES = frozenset(['BQWaiter', 'VertexAIWaiter'])
+
+  # Polling intervals in seconds, doubled after each unfinished check.
+  BASE_INTERVAL = 60
+  MAX_INTERVAL = 600
+
+  # Checks before failing the task, about a week at the maximum interval.
+  MAX_ATTEMPTS = 1000
+
+  @classmethod
+  def is_enabled(cls) -> bool:
+    """Returns True if waiters should be tracked instead of enqueued."""
+    return bool(int(os.getenv('TRACK_EXTERNAL_OPERATIONS', '0')))
+
+  @property
+  def params(self) -> dict[str, Any]:
+    return json.loads(self.worker_params)
+
+  def has_exhausted_attempts(self) -> bool:
+    return self.attempts + 1 >= self.MAX_ATTEMPTS
+
+  def to_task(self, general_settings: dict[str, str]) -> task.Task:
+    """Returns the waiter task, to run its completion logic in the jobs."""
+    return task.Task(
+        self.task_name,
+        self.job.pipeline_id,
+        self.job_id,
+        self.worker_class,
+        self.params,
+        general_settings,
+        priority=task.Priority.HIGH)
+
+  def schedule_next_check(self, now: datetime.datetime) -> None:
+    """Postpones the next check with a jittered exponential interval.
+
+    Args:
+      now: Datetime of the current sweep.
+    """
+    interval = min(self.BASE_INTERVAL * 2**self.attempts, self.MAX_INTERVAL)
+    interval *= random.uniform(0.8, 1.2)
+    self.update(
+        attempts=self.attempts + 1,
+        next_check_at=now + datetime.timedelta(seconds=interval))
+
+
+class HeldTask(extensions.db.Model):
+  """Model for a task held back by the admission control of the controller.
+
+  A task enqueued while its pipeline, or its worker class, already has as many
+  tasks in flight as its budget allows is recorded as enqueued, so that its job
+  keeps running, but it is stored here instead of being sent to the jobs
+  service. `admission.release` sends held tasks as in-flight tasks finish,
+  taking turns between pipelines.
+  """
+  __tablename__ = 'held_tasks'
+  __repr_attrs__ = ['worker_class', 'task_name']
+
+  id = Column(Integer, primary_key=True, autoincrement=True)
+  job_id = Column(Integer, ForeignKey('jobs.id'), index=True)
+  pipeline_id = Column(Integer, index=True)
+  task_name = Column(String(100), index=True, unique=True)
+  worker_class = Column(String(255), index=True)
+  worker_params = Column(Text())
+  priority = Column(String(10))
+  # Datetime before which the task should not run, from its enqueue delay.
+  not_before = Column(DateTime)
+
+  job = orm.relationship('Job', foreign_keys=[job_id])
+
+  @classmethod
+  def get_default_pipeline_budget(cls) -> int:
+    """Returns the budget of pipelines without their own, zero for no limit.
+
+    Pipelines have no budget by default, one is set for all of them with the
+    PIPELINE_MAX_CONCURRENT_TASKS environment variable.
+    """
+    return int(os.getenv('PIPELINE_MAX_CONCURRENT_TASKS', '0'))
+
+  @classmethod
+  def get_worker_class_budget(cls, worker_class: str) -> Optional[int]:
+    """Returns the budget of a worker class across pipelines, if any.
+
+    Budgets are set as comma-separated `<worker_class>=<budget>` pairs in the
+    WORKER_CLASS_MAX_CONCURRENT_TASKS environment variable.
+
+    Args:
+      worker_class: Name of the worker class.
+    """
+    for item in os.getenv('WORKER_CLASS_MAX_CONCURRENT_TASKS', '').split(','):
+      name, _, budget = item.partition('=')
+      if name.strip() == worker_class:
+        return int(budget)
+    return None
+
+  @property
+  def params(self) -> dict[str, Any]:
+    return json.loads(self.worker_params)
+
+  def get_delay(self, now: datetime.datetime) -> int:
+    """Returns the delay left before running the task, in seconds."""
+    if self.not_before is None or self.not_before <= now:
+      return 0
+    return int((self.not_before - now).total_seconds())
+
+  def to_task(self, general_settings: dict[str, str]) -> task.Task:
+    return task.Task(
+        self.task_name,
+        self.pipeline_id,
+        self.job_id,
+        self.worker_class,
+        self.params,
+        general_settings,
+        priority=self.priority)
+
+  @classmethod
+  def claim(cls, held_task_id: int) -> bool:
+    """Deletes a held task, returns False if another request did first.
+
+    Args:
+      held_task_id: ID of the held task.
+    """
+    deleted_count = cls.where(id=held_task_id).delete()
+    cls.session.commit()
+    return deleted_count == 1
+
+
+class AdmissionBudget:
+  """Number of tasks that can still be sent to the jobs service.
+
+  Remaining budgets are counted once per pipeline and per worker class, then
+  decremented as tasks are admitted.
+  """
+
+  def __init__(self):
+    self._pipelines = {}
+    self._worker_classes = {}
+
+  def _get_pipeline_remaining(self, pipeline: Pipeline) -> Optional[int]:
+    if pipeline.id not in self._pipelines:
+      budget = pipeline.get_task_budget()
+      if budget is not None:
+        budget -= TaskEnqueued.count_in_flight(pipeline_id=pipeline.id)
+      self._pipelines[pipeline.id] = budget
+    return self._pipelines[pipeline.id]
+
+  def _get_worker_class_remaining(self, worker_class: str) -> Optional[int]:
+    if worker_class not in self._worker_classes:
+      budget = HeldTask.get_worker_class_budget(worker_class)
+      if budget is not None:
+        budget -= TaskEnqueued.count_in_flight(worker_class=worker_class)
+      self._worker_classes[worker_class] = budget
+    return self._worker_classes[worker_class]
+
+  def admit(self, pipeline: Pipeline, worker_class: str) -> bool:
+    """Returns True and takes a slot if the task can be sent.
+
+    Args:
+      pipeline: Pipeline of the task.
+      worker_class: Worker class of the task.
+    """
+    pipeline_remaining = self._get_pipeline_remaining(pipeline)
+    worker_class_remaining = self._get_worker_class_remaining(worker_class)
+    if pipeline_remaining is not None and pipeline_remaining <= 0:
+      return False
+    if worker_class_remaining is not None and worker_class_remaining <= 0:
+      return False
+    if pipeline_remaining is not None:
+      self._pipelines[pipeline.id] -= 1
+    if worker_class_remaining is not None:
+      self._worker_classes[worker_class] -= 1
+    return True
+
+
 class StartCondition(extensions.db.Model):
   """Model for a starting condition between two jobs."""
   __tablename__ = 'start_conditions'
@@ -922,10 +1186,24 @@ class Job(extensions.db.Model):
   def _get_task_namespace(self):
     return f'pipeline={self.pipeline_id}_job={self.id}'
 
-  def _add_task_with_name(self, task_name) -> TaskEnqueued:
-    """Keeps track of running tasks."""
+  def _add_task_with_name(self,
+                          task_name: str,
+                          worker_class: Optional[str] = None) -> TaskEnqueued:
+    """Keeps track of running tasks.
+
+    Args:
+      task_name: Name of the task.
+      worker_class: Worker class of a task sent to the jobs service, counted in
+        the budgets of the admission control.
+    """
     namespace = self._get_task_namespace()
-    return TaskEnqueued.create(task_namespace=namespace, task_name=task_name)
+    if worker_class is None:
+      return TaskEnqueued.create(task_namespace=namespace, task_name=task_name)
+    return TaskEnqueued.create(
+        task_namespace=namespace,
+        task_name=task_name,
+        pipeline_id=self.pipeline_id,
+        worker_class=worker_class)
 
   def _get_tasks_with_name(self, task_name: str) -> list[TaskEnqueued]:
     """Returns list of tasks attached to a given name."""
@@ -937,13 +1215,46 @@ class Job(extensions.db.Model):
     task_namespace = self._get_task_namespace()
     return TaskEnqueued.count_in_namespace(task_namespace)
 
+  def _task_priority(self, worker_priority: Optional[str]) -> str:
+    """Returns the lane of a task, the one of its worker if any."""
+    return (worker_priority or self.pipeline.run_priority or
+            self.pipeline.priority or task.Priority.NORMAL)
+
+  def _has_held_tasks(self) -> bool:
+    """Returns True if tasks of the pipeline are waiting for budget."""
+    return HeldTask.where(pipeline_id=self.pipeline_id).first() is not None
+
+  def _hold(self, task_inst: task.Task, delay: int) -> TaskEnqueued:
+    """Holds a task above budget, sent later by `admission.release`."""
+    HeldTask.create(
+        job_id=self.id,
+        pipeline_id=self.pipeline_id,
+        task_name=task_inst.name,
+        worker_class=task_inst.worker_class,
+        worker_params=json.dumps(task_inst.worker_params),
+        priority=task_inst.priority,
+        not_before=(datetime.datetime.utcnow() +
+                    datetime.timedelta(seconds=delay)))
+    crmint_logging.log_message(
+        f'Held task for (worker_class, name): '
+        f'({task_inst.worker_class}, {task_inst.name})',
+        log_level='DEBUG',
+        worker_class=self.worker_class,
+        pipeline_id=self.pipeline_id,
+        job_id=self.id)
+    return self._add_task_with_name(task_inst.name, task_inst.worker_class)
+
   def enqueue(self,
               worker_class: str,
               worker_params: dict[str, Any],
-              delay: int = 0) -> Union[TaskEnqueued, None]:
+              delay: int = 0,
+              priority: Optional[str] = None) -> Union[TaskEnqueued, None]:
     if self.status != Job.STATUS.RUNNING:
       return None
     name = str(uuid.uuid4())
+    if (worker_class in TrackedOperation.WORKER_CLASSES and
+        TrackedOperation.is_enabled()):
+      return self._track_operation(name, worker_class, worker_params, delay)
     general_settings = {gs.name: gs.value for gs in GeneralSetting.all()}
     task_inst = task.Task(
         name,
@@ -951,7 +1262,11 @@ class Job(extensions.db.Model):
         self.id,
         worker_class,
         worker_params,
-        general_settings)
+        general_settings,
+        priority=self._task_priority(priority))
+    if (self._has_held_tasks() or
+        not AdmissionBudget().admit(self.pipeline, worker_class)):
+      return self._hold(task_inst, delay)
     task_inst.enqueue(delay)
     crmint_logging.log_message(
         f'Enqueued task for (worker_class, name): ({worker_class}, {name})',
@@ -959,6 +1274,130 @@ class Job(extensions.db.Model):
         worker_class=self.worker_class,
         pipeline_id=self.pipeline_id,
         job_id=self.id)
+    return self._add_task_with_name(name, worker_class)
+
+  def enqueue_many(
+      self,
+      workers: Iterable[tuple[Any, ...]],
+      parent_task_name: Optional[str] = None
+  ) -> list[TaskEnqueued]:
+    """Enqueues tasks for the given workers, published in batches.
+
+    Tasks above the budget of the pipeline, or of their worker class, are held
+    until in-flight tasks finish. Once a task is held, the following ones are
+    held too, so that tasks are sent in order. Tasks failing to publish are
+    held as well, to be sent again by `admission.release`.
+
+    Tasks enqueued by a finished task are named after it, so that enqueuing
+    them again on a redelivery of its result skips the tasks already enqueued,
+    and skips all of them once the finished task has been processed.
+
+    Args:
+      workers: Iterable of (worker_class, worker_params, delay) tuples,
+        optionally followed by the priority of the worker.
+      parent_task_name: Name of the task enqueuing the workers, if any.
+
+    Returns:
+      List of enqueued tasks, held ones included.
+    """
+    workers = list(workers)
+    if self.status != Job.STATUS.RUNNING or not workers:
+      return []
+    already_enqueued_names = set()
+    if parent_task_name is None:
+      names = [str(uuid.uuid4()) for _ in workers]
+    else:
+      names = [
+          str(uuid.uuid5(uuid.NAMESPACE_OID, f'{parent_task_name}/{i}'))
+          for i in range(len(workers))
+      ]
+      already_enqueued_names = {
+          task_inst.task_name for task_inst in TaskEnqueued.query.filter(
+              TaskEnqueued.task_name.in_([parent_task_name, *names]))
+      }
+      if parent_task_name not in already_enqueued_names:
+        # The result of the parent task was already processed.
+        return []
+    enqueued_tasks = []
+    tasks_with_delays = []
+    general_settings = None
+    budget = AdmissionBudget()
+    held_back = None
+    for name, (worker_class, worker_params, delay, *priority) in zip(
+        names, workers):
+      if name in already_enqueued_names:
+        continue
+      if (worker_class in TrackedOperation.WORKER_CLASSES and
+          TrackedOperation.is_enabled()):
+        enqueued_tasks.append(
+            self._track_operation(name, worker_class, worker_params, delay))
+        continue
+      if general_settings is None:
+        general_settings = {gs.name: gs.value for gs in GeneralSetting.all()}
+        held_back = self._has_held_tasks()
+      task_inst = task.Task(
+          name,
+          self.pipeline_id,
+          self.id,
+          worker_class,
+          worker_params,
+          general_settings,
+          priority=self._task_priority(priority[0] if priority else None))
+      if held_back or not budget.admit(self.pipeline, worker_class):
+        held_back = True
+        enqueued_tasks.append(self._hold(task_inst, delay))
+        continue
+      tasks_with_delays.append((task_inst, delay))
+    if not tasks_with_delays:
+      return enqueued_tasks
+    publish_error = None
+    try:
+      task.Task.enqueue_many(tasks_with_delays)
+    except message.PublishError as e:
+      publish_error = e
+    for i, (task_inst, delay) in enumerate(tasks_with_delays):
+      if publish_error and i in publish_error.errors:
+        enqueued_tasks.append(self._hold(task_inst, delay))
+        continue
+      crmint_logging.log_message(
+          f'Enqueued task for (worker_class, name): '
+          f'({task_inst.worker_class}, {task_inst.name})',
+          log_level='DEBUG',
+          worker_class=self.worker_class,
+          pipeline_id=self.pipeline_id,
+          job_id=self.id)
+      enqueued_tasks.append(
+          self._add_task_with_name(task_inst.name, task_inst.worker_class))
+    if publish_error:
+      crmint_logging.log_message(
+          f'Held {len(publish_error.errors)} tasks which failed to publish',
+          log_level='WARNING',
+          worker_class=self.worker_class,
+          pipeline_id=self.pipeline_id,
+          job_id=self.id)
+    return enqueued_tasks
+
+  def _track_operation(self,
+                       name: str,
+                       worker_class: str,
+                       worker_params: dict[str, Any],
+                       delay: int) -> TaskEnqueued:
+    """Hands a waiter over to the operation tracker instead of enqueuing it."""
+    next_check_at = (datetime.datetime.utcnow() +
+                     datetime.timedelta(seconds=delay))
+    TrackedOperation.create(
+        job_id=self.id,
+        task_name=name,
+        worker_class=worker_class,
+        worker_params=json.dumps(worker_params),
+        next_check_at=next_check_at)
+    crmint_logging.log_message(
+        f'Tracking operation for (worker_class, name): '
+        f'({worker_class}, {name})',
+        log_level='DEBUG',
+        worker_class=self.worker_class,
+        pipeline_id=self.pipeline_id,
+        job_id=self.id)
     return self._add_task_with_name(name)
 
   def _task_finished(self,
@@ -1048,9 +1487,30 @@ class Job(extensions.db.Model):
     if self.status == Job.STATUS.RUNNING:
       # Sets the status as stopping, waiting for the task to complete.
       self.set_status(Job.STATUS.STOPPING)
+      # Tracked operations are not polled anymore, their tasks never finish.
+      for operation in TrackedOperation.where(job_id=self.id).all():
+        task_name = operation.task_name
+        operation.delete()
+        self.cancel_task(task_name)
       return True
     return False
 
+  def cancel_task(self, task_name: str) -> None:
+    """Forgets a task that will not run, since its job is stopping.
+
+    The job becomes idle once it has no more tasks running.
+
+    Args:
+      task_name: Name of the task.
+    """
+    for task_inst in self._get_tasks_with_name(task_name):
+      task_inst.delete()
+    if self.status != Job.STATUS.STOPPING or self._enqueued_task_count():
+      return
+    self.set_status(Job.STATUS.IDLE)
+    if self.pipeline.has_finished():
+      self.pipeline.leaf_job_finished()
+
 
 def _update_legacy_syntaxes(template: str) -> str:
   """Returns an updated template, using correct jinj2 engine syntax.
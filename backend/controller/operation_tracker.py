@@ -0,0 +1,233 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Polls long-running external operations tracked by the controller.
+
+Workers relay long-running operations to waiter workers (`BQWaiter`,
+`VertexAIWaiter`). When tracking is enabled, the controller stores these
+waiters as `TrackedOperation` rows and polls all the due ones in a single
+sweep on every heartbeat, instead of running a respawning waiter task. Checks
+run concurrently and the sweep returns after `_SWEEP_TIMEOUT` seconds, leaving
+operations not checked in time due for the next sweep, so that a large backlog
+does not hold the heartbeat request.
+
+Once all the operations of a waiter succeeded, the waiter task is sent to the
+jobs service, so that its own completion logic runs (e.g. writing manifests
+or merging sharded outputs) and reports the task result.
+"""
+
+from concurrent import futures
+import datetime
+import enum
+import threading
+import traceback
+from typing import Any, Callable, Optional
+
+import google.auth
+from google.auth.transport import requests as auth_requests
+from google.cloud import bigquery
+
+from common import crmint_logging
+from controller import models
+
+# Maximum number of operations polled in a single sweep.
+_SWEEP_BATCH_SIZE = 500
+
+# Maximum number of operations checked at the same time.
+_MAX_CONCURRENT_CHECKS = 16
+
+# Seconds a sweep waits for the checks of its operations.
+_SWEEP_TIMEOUT = 20
+
+_VERTEXAI_SUCCEEDED_STATES = frozenset([
+    'PIPELINE_STATE_SUCCEEDED',
+    'JOB_STATE_SUCCEEDED',
+])
+
+_VERTEXAI_FAILED_STATES = frozenset([
+    'PIPELINE_STATE_FAILED',
+    'PIPELINE_STATE_CANCELLED',
+    'JOB_STATE_FAILED',
+    'JOB_STATE_CANCELLED',
+    'JOB_STATE_EXPIRED',
+])
+
+
+@enum.unique
+class OperationStatus(enum.Enum):
+  """Statuses of an external operation."""
+  RUNNING = enum.auto()
+  SUCCEEDED = enum.auto()
+  FAILED = enum.auto()
+
+
+class _Poller:
+  """Checks external operations, sharing API clients within a sweep."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._bigquery_client = None
+    self._authorized_session = None
+
+  def _get_bigquery_client(self) -> bigquery.Client:
+    with self._lock:
+      if self._bigquery_client is None:
+        self._bigquery_client = bigquery.Client()
+      return self._bigquery_client
+
+  def _get_authorized_session(self) -> auth_requests.AuthorizedSession:
+    with self._lock:
+      if self._authorized_session is None:
+        creds, _ = google.auth.default(
+            scopes=['https://www.googleapis.com/auth/cloud-platform'])
+        self._authorized_session = auth_requests.AuthorizedSession(creds)
+      return self._authorized_session
+
+  def check_bigquery_job(
+      self, params: dict[str, Any]) -> tuple[OperationStatus, Optional[str]]:
+    client = self._get_bigquery_client()
+    status = OperationStatus.SUCCEEDED
+    # Same parameters as `BQWaiter`, waiting for all the jobs if many.
+    for job_id in params.get('job_ids') or [params['job_id']]:
+      job = client.get_job(job_id, location=params['location'])
+      if job.error_result:
+        return OperationStatus.FAILED, job.error_result['message']
+      if job.state != 'DONE':
+        status = OperationStatus.RUNNING
+    return status, None
+
+  def check_vertexai_resource(
+      self, params: dict[str, Any]) -> tuple[OperationStatus, Optional[str]]:
+    status = OperationStatus.SUCCEEDED
+    # Same parameters as `VertexAIWaiter`, waiting for all the jobs if many.
+    for resource_name in params.get('ids') or [params['id']]:
+      location = resource_name.split('/')[3]
+      url = (f'https://{location}-aiplatform.googleapis.com/v1/'
+             f'{resource_name}')
+      response = self._get_authorized_session().get(url)
+      response.raise_for_status()
+      state = response.json().get('state')
+      if state in _VERTEXAI_FAILED_STATES:
+        return OperationStatus.FAILED, f'{resource_name} ended with {state}.'
+      if state not in _VERTEXAI_SUCCEEDED_STATES:
+        status = OperationStatus.RUNNING
+    return status, None
+
+  def get_check_method(
+      self, worker_class: str
+  ) -> Callable[[dict[str, Any]], tuple[OperationStatus, Optional[str]]]:
+    if worker_class == 'BQWaiter':
+      return self.check_bigquery_job
+    if worker_class == 'VertexAIWaiter':
+      return self.check_vertexai_resource
+    raise ValueError(f'Unsupported tracked worker class: {worker_class}')
+
+  def check(self, worker_class: str,
+            params: dict[str, Any]) -> tuple[OperationStatus, Optional[str]]:
+    return self.get_check_method(worker_class)(params)
+
+
+def _log(operation: models.TrackedOperation, message: str,
+         log_level: str) -> None:
+  crmint_logging.log_message(
+      message,
+      log_level=log_level,
+      worker_class=operation.worker_class,
+      pipeline_id=operation.job.pipeline_id,
+      job_id=operation.job_id)
+
+
+def _fail(operation: models.TrackedOperation, error_message: str) -> None:
+  """Removes the tracked operation and fails its owning task."""
+  _log(operation, f'Execution failed: {error_message}', 'ERROR')
+  job = operation.job
+  task_name = operation.task_name
+  operation.delete()
+  job.task_failed(task_name)
+
+
+def _hand_over(operation: models.TrackedOperation,
+               general_settings: dict[str, str]) -> None:
+  """Sends the waiter task to the jobs service, which finishes the task."""
+  operation.to_task(general_settings).enqueue(0)
+  _log(operation, 'Operations done, completing in the jobs service.', 'DEBUG')
+  operation.delete()
+
+
+def _postpone(operation: models.TrackedOperation,
+              now: datetime.datetime) -> None:
+  if operation.has_exhausted_attempts():
+    _fail(operation, f'Gave up after {operation.MAX_ATTEMPTS} checks.')
+  else:
+    operation.schedule_next_check(now)
+
+
+def sweep(now: Optional[datetime.datetime] = None,
+          batch_size: int = _SWEEP_BATCH_SIZE,
+          timeout: float = _SWEEP_TIMEOUT) -> int:
+  """Polls all the due operations and completes the tasks of finished ones.
+
+  Operations are checked concurrently, while database updates and task
+  hand-overs stay on the calling thread. Operations whose check did not finish
+  within the timeout are left untouched, to be checked by the next sweep.
+
+  Args:
+    now: Datetime of the sweep, defaults to the current UTC time.
+    batch_size: Maximum number of operations to poll.
+    timeout: Seconds to wait for the checks of the operations.
+
+  Returns:
+    Number of operations that completed during this sweep.
+  """
+  if now is None:
+    now = datetime.datetime.utcnow()
+  operations = (models.TrackedOperation
+                .where(next_check_at__le=now)
+                .order_by(models.TrackedOperation.next_check_at)
+                .limit(batch_size)
+                .all())
+  if not operations:
+    return 0
+  general_settings = {
+      gs.name: gs.value for gs in models.GeneralSetting.all()}
+  poller = _Poller()
+  executor = futures.ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_CHECKS)
+  checks = [
+      executor.submit(poller.check, operation.worker_class, operation.params)
+      for operation in operations
+  ]
+  done_checks, _ = futures.wait(checks, timeout=timeout)
+  # Checks still running are dropped, their operations stay due.
+  executor.shutdown(wait=False, cancel_futures=True)
+  completed_count = 0
+  for operation, check in zip(operations, checks):
+    if check not in done_checks:
+      continue
+    try:
+      status, error_message = check.result()
+      if status == OperationStatus.SUCCEEDED:
+        _hand_over(operation, general_settings)
+    except Exception:  # pylint: disable=broad-except
+      _log(operation,
+           f'Failed checking operation: {traceback.format_exc()}',
+           'WARNING')
+      _postpone(operation, now)
+      continue
+    if status == OperationStatus.RUNNING:
+      _postpone(operation, now)
+      continue
+    if status == OperationStatus.FAILED:
+      _fail(operation, error_message)
+    completed_count += 1
+  return completed_count
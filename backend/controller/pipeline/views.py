@@ -34,6 +34,7 @@ import werkzeug
 
 from common import crmint_logging
 from common import insight
+from common import task
 from controller import models
 
 _LOGS_PAGE_SIZE = 20
@@ -44,6 +45,8 @@ api = Api(blueprint)
 parser = reqparse.RequestParser()
 parser.add_argument('name')
 parser.add_argument('run_on_schedule')
+parser.add_argument('priority')
+parser.add_argument('max_concurrent_tasks', type=int)
 parser.add_argument('schedules', type=list, location='json')
 parser.add_argument('params', type=list, location='json')
 
@@ -65,6 +68,8 @@ pipeline_fields = {
     'status': fields.String,
     'updated_at': fields.String,
     'run_on_schedule': fields.Boolean,
+    'priority': fields.String,
+    'max_concurrent_tasks': fields.Integer,
     'schedules': fields.List(fields.Nested(schedule_fields)),
     'params': fields.List(fields.Nested(param_fields)),
     'message': fields.String,
@@ -153,7 +158,8 @@ class PipelineStart(Resource):
   @marshal_with(pipeline_fields)
   def post(self, pipeline_id):
     pipeline = models.Pipeline.find(pipeline_id)
-    pipeline.start()
+    # Manual runs are delivered ahead of scheduled ones.
+    pipeline.start(priority=task.Priority.HIGH)
     tracker = insight.GAProvider()
     tracker.track_event(category='pipelines', action='manual_run')
     return pipeline
@@ -196,6 +202,8 @@ class PipelineExport(Resource):
 
     data = {
         'name': pipeline.name,
+        'priority': pipeline.priority,
+        'max_concurrent_tasks': pipeline.max_concurrent_tasks,
         'jobs': jobs,
         'params': pipeline_params,
         'schedules': pipeline_schedules
@@ -20,6 +20,7 @@ from flask_restful import Resource
 
 from common import message
 from common import result
+from controller import admission
 from controller import models
 
 blueprint = flask.Blueprint('result', __name__)
@@ -36,12 +37,14 @@ class ResultResource(Resource):
       return e.message, e.code
     if res.success:
       job = models.Job.find(res.job_id)
-      for worker_enqueue_agrs in res.workers_to_enqueue:
-        job.enqueue(*worker_enqueue_agrs)
+      # Redelivered results only enqueue the tasks not enqueued yet, if any.
+      job.enqueue_many(res.workers_to_enqueue, parent_task_name=res.task_name)
       job.task_succeeded(res.task_name)
     else:
       job = models.Job.find(res.job_id)
       job.task_failed(res.task_name)
+    # The finished task leaves room in the budgets of held tasks.
+    admission.release_and_log()
     return 'OK', 200
 
 
@@ -24,8 +24,10 @@ from flask_restful import Resource
 from common import crmint_logging
 from common import insight
 from common import message
+from controller import admission
 from controller import cron_utils
 from controller import models
+from controller import operation_tracker
 
 blueprint = Blueprint('starter', __name__)
 api = Api(blueprint)
@@ -71,6 +73,8 @@ class StarterResource(Resource):
         raise message.BadRequestError() from e
       if pipeline_ids == 'scheduled':
         self._start_scheduled_pipelines()
+        operation_tracker.sweep()
+        admission.release_and_log()
       elif isinstance(pipeline_ids, list):
         self._start_pipelines(pipeline_ids)
       else:
@@ -14,6 +14,11 @@
 
 """Create a controller instance."""
 
+# Starts profiling first, to time the imports of the app.
+from common import startup_profiler
+startup_profiler.start('controller')
+
+# pylint: disable=wrong-import-position
 import signal
 import sys
 import types
@@ -25,10 +30,13 @@ from common import message
 from controller import app as app_factory
 from controller import database
 from controller import extensions
+# pylint: enable=wrong-import-position
 
-app = app_factory.create_app()
+with startup_profiler.phase('create_app'):
+  app = app_factory.create_app()
 flask_tasks.add(app)
 auth_filter.add(app)
+startup_profiler.add(app)
 
 
 @app.route('/liveness_check', methods=['GET'])
@@ -65,6 +73,8 @@ def shutdown_handler(sig: int, frame: types.FrameType) -> None:
   sys.exit(0)
 
 
+startup_profiler.finish()
+
 if __name__ == '__main__':
   signal.signal(signal.SIGINT, shutdown_handler)  # Handles Ctrl-C locally.
   app.run(host='0.0.0.0', port=8080, debug=True)
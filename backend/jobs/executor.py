@@ -0,0 +1,167 @@
+# Copyright 2023 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Executes tasks on a thread pool with per worker class admission control.
+
+Most workers are I/O-bound, so an instance of the jobs service runs many tasks
+concurrently. Tasks are only admitted if their worker class is below its
+concurrency limit and if their estimated memory fits in the instance budget,
+otherwise they are rejected and Pub/Sub delivers them again later.
+
+The push endpoint of the jobs app blocks its request thread until the task is
+done, so there the executor only provides admission control. The pull runner
+does not block on tasks and relies on the thread pool for concurrency.
+"""
+
+import collections
+from concurrent import futures
+import os
+import threading
+from typing import Any, Callable
+
+from common import task
+from jobs.workers import worker
+
+# Maximum number of tasks running concurrently on an instance.
+MAX_CONCURRENT_TASKS = int(os.getenv('JOBS_MAX_CONCURRENT_TASKS', '16'))
+
+# Memory available to running tasks, in megabytes.
+MEMORY_BUDGET_MB = int(os.getenv('JOBS_MEMORY_BUDGET_MB', '256'))
+
+# Share of the task slots usable by low priority tasks, the other slots are
+# kept for tasks of higher priority, e.g. waiters or manual runs.
+LOW_PRIORITY_SHARE = float(os.getenv('JOBS_LOW_PRIORITY_SHARE', '0.75'))
+
+
+class RejectedTaskError(Exception):
+  """Exception raised if a task cannot run now and should be retried later."""
+
+  def __init__(self, message: str, code: int = 429):
+    super().__init__(message, code)
+    self.message = message
+    self.code = code
+
+
+class TaskExecutor:
+  """Runs tasks on a thread pool, with per worker class concurrency limits."""
+
+  def __init__(self,
+               max_concurrent_tasks: int = MAX_CONCURRENT_TASKS,
+               memory_budget_mb: int = MEMORY_BUDGET_MB,
+               low_priority_share: float = LOW_PRIORITY_SHARE):
+    self._max_concurrent_tasks = max_concurrent_tasks
+    self._memory_budget_mb = memory_budget_mb
+    self._max_low_priority_tasks = max(
+        1, int(max_concurrent_tasks * low_priority_share))
+    self._pool = futures.ThreadPoolExecutor(
+        max_workers=max_concurrent_tasks, thread_name_prefix='task')
+    self._lock = threading.Lock()
+    self._running_tasks = collections.Counter()
+    self._reserved_memory_mb = 0
+    self._in_flight = set()
+    self._draining = False
+
+  @property
+  def running_tasks(self) -> dict[str, int]:
+    """Number of running tasks by worker class name."""
+    with self._lock:
+      return {k: v for k, v in self._running_tasks.items() if v}
+
+  @property
+  def reserved_memory_mb(self) -> int:
+    """Estimated memory used by running tasks, in megabytes."""
+    with self._lock:
+      return self._reserved_memory_mb
+
+  def _admit(self, worker_class: type[worker.Worker], priority: str) -> None:
+    """Reserves a slot and memory for a task of the given worker class.
+
+    Raises:
+      RejectedTaskError: if the instance is draining or at capacity.
+    """
+    name = worker_class.__name__
+    max_tasks = worker_class.MAX_CONCURRENT_TASKS
+    memory_mb = worker_class.MEMORY_MB
+    if self._draining:
+      raise RejectedTaskError('Instance is shutting down', code=503)
+    running_tasks = sum(self._running_tasks.values())
+    if running_tasks >= self._max_concurrent_tasks:
+      raise RejectedTaskError(
+          f'Already running {self._max_concurrent_tasks} tasks')
+    if (priority == task.Priority.LOW
+        and running_tasks >= self._max_low_priority_tasks):
+      raise RejectedTaskError(
+          f'Already running {running_tasks} tasks, other slots are kept for '
+          f'tasks of higher priority')
+    if max_tasks and self._running_tasks[name] >= max_tasks:
+      raise RejectedTaskError(f'Already running {max_tasks} {name} tasks')
+    # A single task is always admitted, even if above the memory budget.
+    if (self._reserved_memory_mb
+        and self._reserved_memory_mb + memory_mb > self._memory_budget_mb):
+      raise RejectedTaskError(
+          f'Not enough memory to run {name}, {self._reserved_memory_mb} MB '
+          f'out of {self._memory_budget_mb} MB already reserved')
+    self._running_tasks[name] += 1
+    self._reserved_memory_mb += memory_mb
+
+  def _release(self,
+               worker_class: type[worker.Worker],
+               future: futures.Future) -> None:
+    with self._lock:
+      self._running_tasks[worker_class.__name__] -= 1
+      self._reserved_memory_mb -= worker_class.MEMORY_MB
+      self._in_flight.discard(future)
+
+  def submit(self,
+             worker_class: type[worker.Worker],
+             fn: Callable[..., Any],
+             *args: Any,
+             priority: str = task.Priority.NORMAL) -> futures.Future:
+    """Schedules a task of the given worker class to run on the thread pool.
+
+    Args:
+      worker_class: Class of the worker run by the task, defining its
+        concurrency limit and estimated memory usage.
+      fn: Callable running the task.
+      *args: Arguments passed to the callable.
+      priority: Priority of the task, low priority tasks cannot take all the
+        slots of the instance.
+
+    Returns:
+      A future resolved with the result of the callable.
+
+    Raises:
+      RejectedTaskError: if the task cannot be admitted now.
+    """
+    with self._lock:
+      self._admit(worker_class, priority)
+      future = self._pool.submit(fn, *args)
+      self._in_flight.add(future)
+    future.add_done_callback(lambda f: self._release(worker_class, f))
+    return future
+
+  def drain(self, timeout: float) -> bool:
+    """Stops admitting tasks and waits for running ones to finish.
+
+    Args:
+      timeout: Maximum number of seconds to wait for running tasks.
+
+    Returns:
+      True if all running tasks finished before the timeout.
+    """
+    with self._lock:
+      self._draining = True
+      in_flight = list(self._in_flight)
+    _, not_done = futures.wait(in_flight, timeout=timeout)
+    return not not_done
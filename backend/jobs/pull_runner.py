@@ -0,0 +1,249 @@
+# Copyright 2023 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs tasks pulled from Pub/Sub, an alternative to the jobs push endpoint.
+
+A streaming pull subscriber receives tasks as fast as the runner executes
+them, without HTTP ingress. Flow control bounds the messages held by the
+runner, their leases are extended while tasks run, and tasks are executed
+as if they were pushed to the jobs service.
+
+The start task subscriptions, one per priority lane, must be pull
+subscriptions, created or converted by `setup_pubsub.py` with
+START_TASK_DELIVERY=pull.
+Run locally against the Pub/Sub emulator, with PUBSUB_EMULATOR_HOST set:
+
+  python -m jobs.pull_runner
+"""
+
+from concurrent import futures
+import functools
+import os
+import signal
+import threading
+import types
+
+from google.cloud import pubsub_v1
+
+from common import crmint_logging
+from common import message
+from common import task
+from jobs import executor
+from jobs import task_runner
+
+_PROJECT = os.getenv('GOOGLE_CLOUD_PROJECT')
+# Subscriptions of the priority lanes, from the highest priority to the lowest,
+# pulled concurrently.
+_SUBSCRIPTIONS = os.getenv(
+    'JOBS_PULL_SUBSCRIPTIONS',
+    'crmint-3-start-task-high-subscription,'
+    'crmint-3-start-task-subscription,'
+    'crmint-3-start-task-low-subscription').split(',')
+
+# Messages held by the runner, either running or waiting, shared by the
+# subscriptions of all the priority lanes.
+_MAX_OUTSTANDING_MESSAGES = int(os.getenv(
+    'JOBS_PULL_MAX_MESSAGES', str(executor.MAX_CONCURRENT_TASKS)))
+_MAX_OUTSTANDING_BYTES = int(os.getenv(
+    'JOBS_PULL_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Leases of running tasks are extended up to this duration, tasks still
+# running after it are delivered again.
+_MAX_LEASE_DURATION = int(os.getenv('JOBS_PULL_MAX_LEASE_SECONDS', '7200'))
+
+# Seconds to wait for running tasks on shutdown.
+_DRAIN_TIMEOUT = float(os.getenv('JOBS_DRAIN_TIMEOUT', '25'))
+
+
+def _split_budget(budget: int, lane_count: int) -> list[int]:
+  """Splits a flow control budget across lanes ordered by priority.
+
+  Lanes get shares decreasing with their priority, e.g. 1/2, 1/3 and 1/6 of
+  the budget for three lanes, each lane getting at least one unit.
+
+  Args:
+    budget: Total budget, e.g. a number of messages or bytes.
+    lane_count: Number of lanes, from the highest priority to the lowest.
+  """
+  weights = range(lane_count, 0, -1)
+  total_weight = sum(weights)
+  shares = [max(1, budget * weight // total_weight) for weight in weights]
+  # Rounding leftovers go to the highest priority lane.
+  shares[0] += max(0, budget - sum(shares))
+  return shares
+
+
+def _settle(pulled_message: pubsub_v1.subscriber.message.Message,
+            future: futures.Future) -> None:
+  if future.exception() is None:
+    pulled_message.ack()
+  else:
+    pulled_message.nack()
+
+
+class PullRunner:
+  """Executes tasks pulled from a subscription on a task executor."""
+
+  def __init__(self, task_executor: executor.TaskExecutor):
+    self._executor = task_executor
+    self._lock = threading.Lock()
+    self._streaming_pull_futures = []
+    self._stop_requested = False
+    self._stopped = threading.Event()
+
+  def handle_message(
+      self, pulled_message: pubsub_v1.subscriber.message.Message) -> None:
+    """Submits the task of a pulled message to the executor.
+
+    The message is acknowledged once the task is done. Messages of tasks
+    rejected by the executor or scheduled later are not acknowledged, so that
+    Pub/Sub delivers them again after the subscription backoff.
+
+    Args:
+      pulled_message: Message received by the subscriber.
+    """
+    try:
+      task_inst = task.Task.from_pulled_message(pulled_message)
+    except message.TooEarlyError:
+      pulled_message.nack()
+      return
+    except message.BadRequestError:
+      # Invalid messages would be delivered again forever.
+      crmint_logging.log_global_message(
+          f'Dropped invalid task message: {pulled_message.message_id}',
+          log_level='ERROR')
+      pulled_message.ack()
+      return
+
+    try:
+      worker_inst = task_runner.create_worker(task_inst)
+      future = self._executor.submit(
+          type(worker_inst),
+          task_runner.execute_task,
+          task_inst,
+          worker_inst,
+          priority=task_inst.priority)
+    except executor.RejectedTaskError as e:
+      crmint_logging.log_message(
+          f'Rejected task for name: {task_inst.name}: {e.message}',
+          log_level='DEBUG',
+          worker_class=task_inst.worker_class,
+          pipeline_id=task_inst.pipeline_id,
+          job_id=task_inst.job_id)
+      pulled_message.nack()
+      return
+    except Exception:  # pylint: disable=broad-except
+      pulled_message.nack()
+      raise
+
+    crmint_logging.log_message(
+        f'Starting task for name: {task_inst.name}',
+        log_level='DEBUG',
+        worker_class=task_inst.worker_class,
+        pipeline_id=task_inst.pipeline_id,
+        job_id=task_inst.job_id)
+    future.add_done_callback(functools.partial(_settle, pulled_message))
+
+  def run(self,
+          subscriber: pubsub_v1.SubscriberClient,
+          subscription_paths: list[str]) -> None:
+    """Pulls and executes tasks until stopped.
+
+    The messages held by the runner are split across the subscriptions, so
+    that all lanes together stay within the flow control budget while higher
+    priority lanes hold more messages.
+
+    Args:
+      subscriber: Client of the subscriptions.
+      subscription_paths: Paths of the subscriptions to pull tasks from, from
+        the highest priority lane to the lowest.
+    """
+    lane_count = len(subscription_paths)
+    flow_controls = [
+        pubsub_v1.types.FlowControl(
+            max_messages=max_messages,
+            max_bytes=max_bytes,
+            max_lease_duration=_MAX_LEASE_DURATION)
+        for max_messages, max_bytes in zip(
+            _split_budget(_MAX_OUTSTANDING_MESSAGES, lane_count),
+            _split_budget(_MAX_OUTSTANDING_BYTES, lane_count))
+    ]
+    with self._lock:
+      if self._stop_requested:
+        return
+      for subscription_path, flow_control in zip(
+          subscription_paths, flow_controls):
+        self._streaming_pull_futures.append(subscriber.subscribe(
+            subscription_path,
+            callback=self.handle_message,
+            flow_control=flow_control))
+        crmint_logging.log_global_message(
+            f'Pulling tasks from {subscription_path}', log_level='INFO')
+    try:
+      for streaming_pull_future in self._streaming_pull_futures:
+        try:
+          streaming_pull_future.result()
+        except futures.CancelledError:
+          pass
+    finally:
+      self._stopped.set()
+
+  def stop(self, timeout: float) -> None:
+    """Waits for running tasks to be done, then stops pulling tasks.
+
+    Messages are still received while draining, but rejected by the executor.
+    Tasks running after the timeout are delivered again once their lease
+    expires.
+
+    Args:
+      timeout: Maximum number of seconds to wait for running tasks.
+    """
+    if not self._executor.drain(timeout):
+      crmint_logging.log_global_message(
+          f'Tasks still running after {timeout} seconds',
+          log_level='WARNING')
+    with self._lock:
+      self._stop_requested = True
+      streaming_pull_futures = list(self._streaming_pull_futures)
+    for streaming_pull_future in streaming_pull_futures:
+      streaming_pull_future.cancel()
+    if streaming_pull_futures:
+      self._stopped.wait()
+
+
+def main() -> None:
+  runner = PullRunner(executor.TaskExecutor())
+
+  def shutdown_handler(sig: int, frame: types.FrameType) -> None:
+    del sig, frame  # Unused argument
+    crmint_logging.log_global_message(
+        'Signal received, safely shutting down.',
+        log_level='WARNING')
+    # Stops from another thread, the main thread waits for the subscriber.
+    threading.Thread(
+        target=runner.stop, args=(_DRAIN_TIMEOUT,), daemon=True).start()
+
+  signal.signal(signal.SIGINT, shutdown_handler)
+  signal.signal(signal.SIGTERM, shutdown_handler)
+  subscriber = pubsub_v1.SubscriberClient()
+  with subscriber:
+    runner.run(subscriber, [
+        subscriber.subscription_path(_PROJECT, subscription)
+        for subscription in _SUBSCRIPTIONS
+    ])
+  message.shutdown()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,107 @@
+# Copyright 2023 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Executes tasks received by the jobs service, pushed or pulled."""
+
+import traceback
+from typing import Any
+
+from common import crmint_logging
+from common import result
+from common import task
+from jobs.workers import finder
+from jobs.workers import metrics
+from jobs.workers import worker
+
+
+def create_worker(task_inst: task.Task) -> worker.Worker:
+  """Returns the worker running a task, with its global settings."""
+  worker_class = finder.get_worker_class(task_inst.worker_class)
+  worker_params = task_inst.worker_params.copy()
+  for setting in worker_class.GLOBAL_SETTINGS:
+    worker_params[setting] = task_inst.general_settings[setting]
+  return worker_class(worker_params, task_inst.pipeline_id, task_inst.job_id)
+
+
+def _strip_global_settings(worker_inst: worker.Worker,
+                           worker_class: str,
+                           worker_params: dict[str, Any]) -> dict[str, Any]:
+  """Returns sub-worker parameters without the global settings.
+
+  Workers often enqueue sub-workers with a copy of their own parameters, which
+  hold the global settings they were given. These credentials are filled in
+  again when the sub-worker runs, so they are not sent with the task results.
+  """
+  global_settings = set(worker_inst.GLOBAL_SETTINGS)
+  global_settings.update(finder.get_worker_class(worker_class).GLOBAL_SETTINGS)
+  return {
+      key: value for key, value in worker_params.items()
+      if key not in global_settings
+  }
+
+
+def execute_task(task_inst: task.Task, worker_inst: worker.Worker) -> None:
+  """Executes a task and reports its result.
+
+  Execution metrics are aggregated in `metrics.registry` and logged as a
+  structured `TASK_METRICS` entry, whether the execution succeeds or not. The
+  entry is logged at the DEBUG level, so it is left out of the pipeline logs
+  shown in the UI.
+  """
+  task_metrics = metrics.TaskMetrics(
+      task_inst.worker_class, task_inst.pipeline_id, task_inst.job_id)
+  try:
+    with metrics.record_task(task_metrics):
+      workers_to_enqueue = worker_inst.execute()
+      task_metrics.success = True
+    crmint_logging.log_message(
+        f'Executed task for name: {task_inst.name}',
+        log_level='DEBUG',
+        worker_class=task_inst.worker_class,
+        pipeline_id=task_inst.pipeline_id,
+        job_id=task_inst.job_id)
+  except worker.WorkerException as e:
+    class_name = e.__class__.__name__
+    worker_inst.log_error(f'Execution failed: {class_name}: {e}')
+    result_inst = result.Result(task_inst.name, task_inst.job_id, False)
+    result_inst.report()
+  except Exception as e:  # pylint: disable=broad-except
+    formatted_exception = traceback.format_exc()
+    worker_inst.log_error(f'Unexpected error {formatted_exception}')
+    if task_inst.attempts < worker_inst.MAX_ATTEMPTS:
+      task_inst.reenqueue()
+    else:
+      worker_inst.log_error(f'Giving up after {task_inst.attempts} attempt(s)')
+      result_inst = result.Result(task_inst.name, task_inst.job_id, False)
+      result_inst.report()
+  else:
+    workers_to_enqueue = [
+        (worker_class,
+         _strip_global_settings(worker_inst, worker_class, worker_params),
+         delay,
+         finder.get_worker_class(worker_class).PRIORITY)
+        for worker_class, worker_params, delay in workers_to_enqueue
+    ]
+    result_inst = result.Result(
+        task_inst.name, task_inst.job_id, True, workers_to_enqueue)
+    result_inst.report()
+  finally:
+    crmint_logging.log_message(
+        f'Executed in {task_metrics.wall_seconds:.2f}s using '
+        f'{task_metrics.cpu_seconds:.2f}s of CPU time',
+        log_level='DEBUG',
+        worker_class=task_inst.worker_class,
+        pipeline_id=task_inst.pipeline_id,
+        job_id=task_inst.job_id,
+        extra_fields=task_metrics.summary())
@@ -19,6 +19,7 @@ from typing import Tuple
 
 from google.api_core import page_iterator
 
+from common import task
 from jobs.workers.bigquery import bq_worker
 
 
@@ -118,6 +119,9 @@ class TablePageResultsProcessorWorker(bq_worker.BQWorker, abc.ABC):
   function, since that function will be called by the processing
   _execute function.
   """
+
+  PRIORITY = task.Priority.LOW
+
   def _extract_parameters(self) -> Tuple[str, str, int]:
     page_token = self._params.get(BQ_PAGE_TOKEN_PARAM, None)
     batch_size = self._params.get(BQ_BATCH_SIZE_PARAM, None)
@@ -21,6 +21,7 @@ update their jobs with the new `bq_script_executor.BQScriptExecutor` worker.
 from google.cloud import bigquery
 
 from jobs.workers.bigquery import bq_script_executor
+from jobs.workers.bigquery import bq_worker
 
 
 class BQQueryLauncher(bq_script_executor.BQScriptExecutor):
@@ -36,6 +37,10 @@ class BQQueryLauncher(bq_script_executor.BQScriptExecutor):
       ('bq_table_id', 'string', True, '', 'BQ Table ID'),
       ('bq_dataset_location', 'string', True, '', 'BQ Dataset Location'),
       ('overwrite', 'boolean', True, False, 'Overwrite table'),
+      ('maximum_bytes_billed', 'number', False, 0,
+       'Maximum bytes billed (optional, 0 for no limit)'),
+      (bq_worker.USE_CACHE_PARAM_NAME, 'boolean', False, False,
+       'Skip if the query already ran on unchanged source tables'),
   ]
 
   def _execute(self) -> None:
@@ -53,9 +58,24 @@ class BQQueryLauncher(bq_script_executor.BQScriptExecutor):
         destination=table_ref,
         write_disposition=write_disposition)
     client = self._get_client()
-    job = client.query(
-        self._params['query'].strip(),
-        job_id_prefix=self._get_prefix(),
-        location=self._params['bq_dataset_location'],
-        job_config=job_config)
+    if self._params[bq_worker.USE_CACHE_PARAM_NAME]:
+      destination_table = '.'.join(filter(None, [
+          self._params['bq_project_id'],
+          self._params['bq_dataset_id'],
+          self._params['bq_table_id'],
+      ]))
+      job = self._cached_query(
+          client,
+          self._params['query'].strip(),
+          location=self._params['bq_dataset_location'],
+          job_config=job_config,
+          destination_tables=[destination_table])
+      if job is None:
+        return
+    else:
+      job = self._query(
+          client,
+          self._params['query'].strip(),
+          location=self._params['bq_dataset_location'],
+          job_config=job_config)
     self._wait(job)
@@ -14,11 +14,19 @@
 
 """CRMint's worker executing Standard SQL scripts in BigQuery."""
 
-from typing import Optional
+from typing import Any, Optional
 
+from common import task
+from jobs.workers import worker
 from jobs.workers.bigquery import bq_utils
 from jobs.workers.bigquery import bq_worker
 
+# Maximum number of statements running concurrently in parallel mode.
+_MAX_CONCURRENT_STATEMENTS = 10
+
+# Number of seconds between two checks of the statements by the waiter.
+_POLLING_DELAY = 30
+
 
 class BQScriptExecutor(bq_worker.BQWorker):
   """Worker to run SQL scripts in BigQuery.
@@ -41,18 +49,27 @@ class BQScriptExecutor(bq_worker.BQWorker):
       ('bq_dataset_location', 'string', False, None, ('BQ Dataset Location '
                                                       '(optional)')),
       ('dry_run', 'boolean', False, False, 'Dry Run'),
+      ('parallel', 'boolean', False, False,
+       'Run independent statements in parallel'),
+      ('maximum_bytes_billed', 'number', False, 0,
+       'Maximum bytes billed per query (optional, 0 for no limit)'),
+      (bq_worker.USE_CACHE_PARAM_NAME, 'boolean', False, False,
+       'Skip if the script already ran on unchanged source tables'),
   ]
 
   def execute_script(self,
                      script: str,
                      location: Optional[str] = None,
-                     dry_run: Optional[bool] = False) -> None:
+                     dry_run: Optional[bool] = False,
+                     use_cache: Optional[bool] = False) -> None:
     """Runs a SQL script.
 
     Args:
       script: String containing the SQL script in the standard SQL dialect.
       location: Optional string representing the location where to run the job.
       dry_run: Boolean Whether to test the total bytes processed only.
+      use_cache: Boolean Whether to skip the script if it already ran on
+        unchanged source tables.
     """
     client = self._get_client()
     if dry_run:
@@ -66,14 +83,126 @@ class BQScriptExecutor(bq_worker.BQWorker):
       self.log_info(
           f'This query will process '
           f'{processed_units} when run.')
+    elif use_cache:
+      job = self._cached_query(client, script, location)
+      if job is not None:
+        self._wait(job)
     else:
-      job = client.query(
-          script,
-          location=location,
-          job_id_prefix=self._get_prefix())
+      job = self._query(client, script, location)
       self._wait(job)
 
+  def _advance_statements(self, state: dict[str, Any]) -> bool:
+    """Checks running statements and starts the ones ready to run.
+
+    Args:
+      state: Dictionary with the `statements` to run, their `dependencies`,
+        the `jobs` started so far (None for statements not started yet), a
+        `done` flag per statement, the `location` to run the jobs in,
+        whether to `use_cache` and the `maximum_bytes_billed` per statement.
+        Updated in place.
+
+    Returns:
+      True if all the statements are done.
+
+    Raises:
+      WorkerException: if one of the statements failed.
+    """
+    client = self._get_client()
+    jobs = state['jobs']
+    done = state['done']
+    for i, job_ref in enumerate(jobs):
+      if job_ref is None or done[i]:
+        continue
+      job = client.get_job(job_ref['job_id'], location=job_ref['location'])
+      if job.error_result:
+        raise worker.WorkerException(
+            f'Statement #{i + 1} failed: {job.error_result["message"]}')
+      done[i] = job.state == 'DONE'
+    running_count = sum(
+        1 for i, job_ref in enumerate(jobs) if job_ref and not done[i])
+    for i, statement in enumerate(state['statements']):
+      if running_count >= _MAX_CONCURRENT_STATEMENTS:
+        break
+      if jobs[i] is not None:
+        continue
+      if all(done[d] for d in state['dependencies'][i]):
+        if state.get(bq_worker.USE_CACHE_PARAM_NAME):
+          job = self._cached_query(client, statement, state['location'])
+          if job is None:
+            jobs[i] = {'job_id': None, 'location': state['location']}
+            done[i] = True
+            continue
+        else:
+          job = self._query(client, statement, state['location'])
+        jobs[i] = {'job_id': job.job_id, 'location': job.location}
+        running_count += 1
+        self.log_info(f'Started statement #{i + 1} in job {job.job_id}')
+    return all(done)
+
+  def execute_statements_in_parallel(self,
+                                     statements: list[str],
+                                     dependencies: list[list[int]],
+                                     location: Optional[str] = None,
+                                     use_cache: Optional[bool] = False
+                                     ) -> None:
+    """Runs independent statements concurrently, in dependency order.
+
+    Statements ready to run are started, then waiting is relayed to a
+    single `BQScriptWaiter` tracking all the statements.
+
+    Args:
+      statements: List of SQL statements in the standard SQL dialect.
+      dependencies: For each statement, indices of the statements it
+        depends on.
+      location: Optional string representing the location where to run jobs.
+      use_cache: Boolean Whether to skip statements which already ran on
+        unchanged source tables.
+    """
+    state = {
+        'statements': statements,
+        'dependencies': dependencies,
+        'jobs': [None] * len(statements),
+        'done': [False] * len(statements),
+        'location': location,
+        bq_worker.USE_CACHE_PARAM_NAME: use_cache,
+        # Carried over to the waiter, which starts the remaining statements.
+        bq_worker.MAXIMUM_BYTES_BILLED_PARAM_NAME: self._params.get(
+            bq_worker.MAXIMUM_BYTES_BILLED_PARAM_NAME),
+    }
+    self._advance_or_finish(state)
+
+  def _advance_or_finish(self, state: dict[str, Any]) -> None:
+    """Relays waiting to a `BQScriptWaiter` unless all statements are done."""
+    if self._advance_statements(state):
+      self.log_info(
+          f'Finished running {len(state["statements"])} statements.')
+    else:
+      self._enqueue('BQScriptWaiter', state, _POLLING_DELAY)
+
   def _execute(self) -> None:
+    if self._params['parallel'] and not self._params['dry_run']:
+      graph = bq_utils.build_statements_graph(self._params['script'])
+      if graph is not None:
+        statements, dependencies = graph
+        self.execute_statements_in_parallel(
+            statements,
+            dependencies,
+            self._params['bq_dataset_location'],
+            self._params[bq_worker.USE_CACHE_PARAM_NAME])
+        return
+      self.log_info('Script cannot be split into standalone statements, '
+                    'running it as a single job.')
     self.execute_script(self._params['script'],
                         self._params['bq_dataset_location'],
-                        self._params['dry_run'])
+                        self._params['dry_run'],
+                        self._params[bq_worker.USE_CACHE_PARAM_NAME])
+
+
+class BQScriptWaiter(BQScriptExecutor):
+  """Worker polling statements run in parallel by `BQScriptExecutor`."""
+
+  PARAMS = []
+  PRIORITY = task.Priority.HIGH
+
+  def _execute(self) -> None:
+    self._advance_or_finish(self._params)
@@ -22,6 +22,7 @@ from typing import Any, List
 from google.ads.googleads import client
 from google.api_core import page_iterator
 
+from jobs.workers import metrics
 from jobs.workers.bigquery import bq_batch_worker, bq_worker
 
 
@@ -215,6 +216,8 @@ class AdsOfflineClickPageResultsWorker(bq_batch_worker.TablePageResultsProcessor
     conversion_upload_response = (
       conversion_upload_service.upload_click_conversions(request=request)
     )
+    metrics.increment(metrics.API_CALLS)
+    metrics.increment(metrics.ROWS_PROCESSED, len(payload))
 
     upload_status = conversion_upload_response.status
     self.log_info(
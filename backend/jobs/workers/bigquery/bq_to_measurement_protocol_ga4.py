@@ -27,6 +27,8 @@ import urllib
 from google.api_core import page_iterator
 import requests
 
+from common import task
+from jobs.workers import metrics
 from jobs.workers import worker
 from jobs.workers.bigquery import bq_worker
 from jobs.workers.ga import ga_utils
@@ -108,6 +110,8 @@ class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
   content to the Measurement Protocol API for GA4 Properties.
   """
 
+  PRIORITY = task.Priority.LOW
+
   def _send_payload(self, payload, url_param) -> None:
     if self._params['debug']:
       domain = 'https://www.google-analytics.com/debug/mp/collect'
@@ -118,9 +122,12 @@ class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
         url_param: self._params['measurement_id'],
         'api_secret': self._params['api_secret'],
     })
+    data = json.dumps(payload)
     response = requests.post(f'{domain}?{querystring}',
-                             data=json.dumps(payload),
+                             data=data,
                              headers={'content-type': 'application/json'})
+    metrics.increment(metrics.API_CALLS)
+    metrics.increment(metrics.BYTES_OUT, len(data))
     if self._params['debug']:
       for msg in response.json()['validationMessages']:
         self.log_warn(f'Validation Message: {msg["description"]}, '
@@ -146,6 +153,7 @@ class BQToMeasurementProtocolProcessorGA4(bq_worker.BQWorker):
     for idx, row in enumerate(page):
       payload = template.substitute(dict(row.items()))
       self._send_payload(json.loads(payload), url_param)
+      metrics.increment(metrics.ROWS_PROCESSED)
       if idx % (math.ceil(num_rows / 10)) == 0:
         progress = idx / num_rows
         self.log_info(f'Completed {progress:.2%} of the measurement '
@@ -12,44 +12,171 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Worker to export a BigQuery table to a CSV or JSON file."""
+"""Worker to export a BigQuery table to files on Cloud Storage."""
 
+from typing import Any
 
 from google.cloud import bigquery
 
+from jobs.workers import worker
 from jobs.workers.bigquery import bq_worker
 
+# Compressions supported by BigQuery for each export format.
+_SUPPORTED_COMPRESSIONS = {
+    'CSV': ('NONE', 'GZIP'),
+    'NEWLINE_DELIMITED_JSON': ('NONE', 'GZIP'),
+    'AVRO': ('NONE', 'DEFLATE', 'SNAPPY'),
+    'PARQUET': ('NONE', 'GZIP', 'SNAPPY', 'ZSTD'),
+}
+
+# Partitions holding rows in the streaming buffer cannot be extracted.
+_UNPARTITIONED_PARTITION_ID = '__UNPARTITIONED__'
+
 
 class BQToStorageExporter(bq_worker.BQWorker):
-  """Worker to export a BigQuery table to a CSV or JSON file."""
+  """Worker to export a BigQuery table to files on Cloud Storage.
+
+  Partitioned tables can be exported with one extract job per partition,
+  running in parallel up to `bq_worker.MAX_RUNNING_EXTRACT_JOBS` jobs at once.
+  A manifest listing the exported files and their row counts can be written
+  once all the extract jobs are done, for downstream workers to process the
+  files in parallel.
+
+  Tables which are not partitioned are exported in a single job, BigQuery
+  sharding large exports into multiple files already. Splitting them by a
+  hash of a column is not supported, since extracting each split would first
+  need a query scanning the whole table.
+  """
 
   PARAMS = [
       ('bq_project_id', 'string', False, '', 'BQ Project ID'),
       ('bq_dataset_id', 'string', True, '', 'BQ Dataset ID'),
       ('bq_table_id', 'string', True, '', 'BQ Table ID'),
       ('destination_uri', 'string', True, '',
-       'Destination CSV or JSON file URI (e.g. gs://bucket/data.csv)'),
+       ('Destination file URI, with a wildcard to shard large exports '
+        '(e.g. gs://bucket/data.csv or gs://bucket/data-*.avro)')),
       ('print_header', 'boolean', True, False, 'Include a header row'),
       ('export_json', 'boolean', False, False, 'Export in JSON format'),
       ('export_gzip', 'boolean', False, False, 'Export GZIP-compressed'),
+      ('export_format', 'string', False, '',
+       ('Export format among CSV, NEWLINE_DELIMITED_JSON, AVRO or PARQUET '
+        '(overrides the JSON format option)')),
+      ('compression', 'string', False, '',
+       ('Compression among NONE, GZIP, DEFLATE, SNAPPY or ZSTD '
+        '(overrides the GZIP option)')),
+      ('split_by_partition', 'boolean', False, False,
+       'Export each partition in a parallel job (partitioned tables only)'),
+      ('manifest_uri', 'string', False, '',
+       ('Manifest file URI listing exported files and row counts '
+        '(e.g. gs://bucket/manifest.json, leave empty to skip)')),
   ]
 
+  def _get_format_and_compression(self) -> tuple[str, str]:
+    """Returns the destination format and compression of exported files.
+
+    Raises:
+      WorkerException: if the format or the compression is not supported.
+    """
+    destination_format = self._params['export_format'].upper()
+    if not destination_format:
+      destination_format = (
+          'NEWLINE_DELIMITED_JSON' if self._params['export_json'] else 'CSV')
+    compression = self._params['compression'].upper()
+    if not compression:
+      compression = 'GZIP' if self._params['export_gzip'] else 'NONE'
+    if destination_format not in _SUPPORTED_COMPRESSIONS:
+      raise worker.WorkerException(
+          f'Unsupported export format: {destination_format}')
+    if compression not in _SUPPORTED_COMPRESSIONS[destination_format]:
+      raise worker.WorkerException(
+          f'Unsupported compression for {destination_format} format: '
+          f'{compression}')
+    return destination_format, compression
+
+  def _get_partition_shards(self,
+                            client: bigquery.Client,
+                            table: bigquery.Table) -> list[dict[str, Any]]:
+    """Returns the non-empty partitions of a table to export as shards.
+
+    Raises:
+      WorkerException: if the destination URI has no wildcard to add the
+        partition IDs to.
+    """
+    destination_uri = self._params['destination_uri']
+    if '*' not in destination_uri:
+      raise worker.WorkerException(
+          f'Destination URI needs a wildcard to export partitions in '
+          f'parallel: {destination_uri}')
+    query = (
+        f'SELECT partition_id, total_rows '
+        f'FROM `{table.project}.{table.dataset_id}.INFORMATION_SCHEMA.'
+        f'PARTITIONS` '
+        f'WHERE table_name = @table_name AND total_rows > 0 '
+        f'ORDER BY partition_id')
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter('table_name', 'STRING', table.table_id),
+    ])
+    rows = self._query(
+        client, query, location=table.location, job_config=job_config).result()
+    return [
+        {
+            'partition_id': row['partition_id'],
+            'uri': destination_uri.replace(
+                '*', f'{row["partition_id"]}-*', 1),
+            'row_count': row['total_rows'],
+        }
+        for row in rows
+        if row['partition_id'] != _UNPARTITIONED_PARTITION_ID
+    ]
+
   def _execute(self):
-    """Starts an data export job and waits fot its completion."""
-    if self._params['export_json']:
-      destination_format = 'NEWLINE_DELIMITED_JSON'
-    else:
-      destination_format = 'CSV'
+    """Starts data export jobs and waits for their completion."""
+    destination_format, compression = self._get_format_and_compression()
     job_config = bigquery.ExtractJobConfig(
-        print_header=self._params['print_header'],
         destination_format=destination_format,
-        compression='GZIP' if self._params['export_gzip'] else 'NONE')
+        compression=compression)
+    if destination_format in ('CSV', 'NEWLINE_DELIMITED_JSON'):
+      job_config.print_header = self._params['print_header']
     dataset_ref = bigquery.DatasetReference(
         self._params['bq_project_id'], self._params['bq_dataset_id'])
+    table_ref = bigquery.TableReference(
+        dataset_ref, self._params['bq_table_id'])
     client = self._get_client()
-    job = client.extract_table(
-        bigquery.TableReference(dataset_ref, self._params['bq_table_id']),
-        destination_uris=self._params['destination_uri'],
-        job_id_prefix=self._get_prefix(),
-        job_config=job_config)
-    self._wait(job)
+    shards = [{'uri': self._params['destination_uri']}]
+    if self._params['split_by_partition'] or self._params['manifest_uri']:
+      table = client.get_table(table_ref)
+      shards[0]['row_count'] = table.num_rows
+    if self._params['split_by_partition']:
+      if table.time_partitioning or table.range_partitioning:
+        shards = self._get_partition_shards(client, table)
+        self.log_info(f'Exporting #{len(shards)} partitions in parallel')
+      else:
+        self.log_info('Table is not partitioned, exporting it in a single job')
+
+    max_jobs = bq_worker.MAX_RUNNING_EXTRACT_JOBS
+    jobs = self._start_extract_jobs(
+        client, table_ref, shards[:max_jobs], job_config)
+    if len(shards) == 1 and not self._params['manifest_uri']:
+      self._wait(jobs[0])
+    elif jobs:
+      params = {
+          'job_ids': [job.job_id for job in jobs],
+          'location': jobs[0].location,
+          'manifest_uri': self._params['manifest_uri'],
+          'manifest_shards': shards,
+          'manifest_fields': {
+              'source_table': str(table.reference),
+              'destination_format': destination_format,
+              'compression': compression,
+          },
+      }
+      if len(shards) > max_jobs:
+        # Started by the waiter once the running jobs are done.
+        params.update({
+            'extract_shards': shards[max_jobs:],
+            'extract_source': str(table_ref),
+            'extract_job_config': job_config.to_api_repr(),
+        })
+      self._enqueue('BQWaiter', params, 30)
+    else:
+      self.log_info('No data to export, all partitions are empty')
@@ -1,7 +1,9 @@
 """Utilities for bigquery workers."""
 
+import functools
 import json
-from typing import Any, Dict, Iterable
+import re
+from typing import Any, Dict, Iterable, Optional
 
 from google.cloud import bigquery
 from google.cloud.bigquery.schema import SchemaField
@@ -29,15 +31,23 @@ def get_schema_field(field_config: Dict[str, Any]) -> SchemaField:
 def parse_bigquery_json_schema(schema: str) -> Iterable[SchemaField]:
   """Parses a JSON encoded BigQuery schema.
 
+  Parsed schemas are cached, since pipelines parse the same schema on every
+  run.
+
   Args:
     schema: String containing the JSON encoded schema.
 
   Returns:
     A list of parsed field schemas representing the table schema.
   """
+  return list(_parse_bigquery_json_schema(schema))
+
+
+@functools.cache
+def _parse_bigquery_json_schema(schema: str) -> tuple[SchemaField, ...]:
+  """Parses a JSON encoded BigQuery schema, cached by schema text."""
   decoded_schema = json.loads(schema)
-  table_schema = [get_schema_field(f) for f in decoded_schema]
-  return table_schema
+  return tuple(get_schema_field(f) for f in decoded_schema)
 
 
 def bytes_converter(total_bytes_processed: int) -> str:
@@ -61,3 +71,151 @@ def bytes_converter(total_bytes_processed: int) -> str:
   else:
     terabytes = round(total_bytes_processed / (1000 * 1000 * 1000 * 1000), 2)
     return f'{terabytes} TB'
+
+
+# Statements writing to a table, the written table is captured in group 1.
+_WRITE_STATEMENT_REGEX = re.compile(
+    r'^\s*(?:'
+    r'CREATE\s+(?:OR\s+REPLACE\s+)?'
+    r'(?:TABLE|VIEW|MATERIALIZED\s+VIEW|MODEL)\s+(?:IF\s+NOT\s+EXISTS\s+)?'
+    r'|INSERT\s+(?:INTO\s+)?'
+    r'|DELETE\s+(?:FROM\s+)?'
+    r'|UPDATE\s+'
+    r'|MERGE\s+(?:INTO\s+)?'
+    r'|DROP\s+(?:TABLE|VIEW|MATERIALIZED\s+VIEW|MODEL)\s+(?:IF\s+EXISTS\s+)?'
+    r'|TRUNCATE\s+TABLE\s+'
+    r')(`[^`]+`|[\w.-]+)',
+    re.IGNORECASE)
+
+
+def _scan_sql_script(script: str) -> list[tuple[str, str]]:
+  """Splits a SQL script on semicolons outside of literals and comments.
+
+  Args:
+    script: String containing the SQL script.
+
+  Returns:
+    A list of `(statement, code)` tuples, where `code` is the statement
+    stripped from its comments. Statements without any code are skipped.
+  """
+  statements = []
+  statement_start = 0
+  code_chars = []
+  i = 0
+  length = len(script)
+  while i < length:
+    char = script[i]
+    if char == ';':
+      statements.append((script[statement_start:i], ''.join(code_chars)))
+      statement_start = i + 1
+      code_chars = []
+      i += 1
+    elif script.startswith('--', i) or char == '#':
+      end = script.find('\n', i)
+      i = length if end == -1 else end
+    elif script.startswith('/*', i):
+      end = script.find('*/', i + 2)
+      i = length if end == -1 else end + 2
+      code_chars.append(' ')
+    elif char in ('\'', '"', '`'):
+      quote = script[i:i + 3] if script.startswith(char * 3, i) else char
+      end = i + len(quote)
+      while end < length and not script.startswith(quote, end):
+        end += 2 if script[end] == '\\' else 1
+      end = min(end + len(quote), length)
+      code_chars.append(script[i:end])
+      i = end
+    else:
+      code_chars.append(char)
+      i += 1
+  statements.append((script[statement_start:], ''.join(code_chars)))
+  return [(stmt.strip(), code) for stmt, code in statements if code.strip()]
+
+
+# Tables read by a statement, the table name is captured in group 1.
+_READ_TABLE_REGEX = re.compile(
+    r'\b(?:FROM|JOIN|USING)\s+(`[^`]+`|[A-Za-z_][\w-]*(?:\.[\w-]+)+)',
+    re.IGNORECASE)
+
+
+def table_name_key(table_name: str) -> str:
+  """Returns a key comparing table names with or without their project."""
+  return '.'.join(table_name.strip('`').lower().split('.')[-2:])
+
+
+def get_table_references(script: str) -> tuple[list[str], list[str]]:
+  """Returns the tables read and written by a SQL script.
+
+  Reads are matched in `FROM`, `JOIN` and `USING` clauses, writes at the start
+  of DML and DDL statements. Only qualified names (e.g. `dataset.table`) are
+  returned, which leaves out CTEs, unnested arrays and temporary tables.
+  Tables written by the script are not listed as read tables.
+
+  Args:
+    script: String containing the SQL script in the standard SQL dialect.
+
+  Returns:
+    A tuple of the sorted lists of read table names and written table names.
+  """
+  read_tables = set()
+  written_tables = set()
+  for _, code in _scan_sql_script(script):
+    match = _WRITE_STATEMENT_REGEX.match(code)
+    if match:
+      written_tables.add(match.group(1).strip('`'))
+    for table_name in _READ_TABLE_REGEX.findall(code):
+      read_tables.add(table_name.strip('`'))
+  written_keys = {table_name_key(name) for name in written_tables}
+  read_tables = [
+      name for name in read_tables
+      if '.' in name and table_name_key(name) not in written_keys
+  ]
+  written_tables = [name for name in written_tables if '.' in name]
+  return sorted(read_tables), sorted(written_tables)
+
+
+def _mentions_table(code: str, table_name: str) -> bool:
+  """Returns True if the code could reference the given table."""
+  short_name = table_name.split('.')[-1]
+  pattern = r'(?<![\w-])' + re.escape(short_name) + r'(?![\w-])'
+  return re.search(pattern, code, re.IGNORECASE) is not None
+
+
+def build_statements_graph(
+    script: str) -> Optional[tuple[list[str], list[list[int]]]]:
+  """Splits a SQL script into statements and their dependencies.
+
+  Each statement must write to a single table (e.g. `CREATE OR REPLACE TABLE`,
+  `INSERT INTO`, `MERGE`). A statement depends on a preceding one if it
+  mentions the table written by the preceding statement, or if the preceding
+  statement mentions the table it writes to. Table mentions are matched on the
+  table name only, which can only add dependencies and keeps ordering safe.
+
+  Args:
+    script: String containing the SQL script in the standard SQL dialect.
+
+  Returns:
+    A tuple of the list of statements and, for each statement, the list of
+    indices of the statements it depends on. None if the script contains
+    statements that cannot run as standalone queries (e.g. `DECLARE`,
+    procedural language, temporary tables or a trailing `SELECT`).
+  """
+  statements = []
+  codes = []
+  written_tables = []
+  for statement, code in _scan_sql_script(script):
+    match = _WRITE_STATEMENT_REGEX.match(code)
+    if not match or re.match(r'^\s*CREATE\s+(OR\s+REPLACE\s+)?TEMP',
+                             code, re.IGNORECASE):
+      return None
+    statements.append(statement)
+    codes.append(code)
+    written_tables.append(match.group(1).strip('`').lower())
+  dependencies = []
+  for j, code in enumerate(codes):
+    dependencies.append([
+        i for i in range(j)
+        if (_mentions_table(code, written_tables[i]) or
+            _mentions_table(codes[i], written_tables[j]))
+    ])
+  return statements, dependencies
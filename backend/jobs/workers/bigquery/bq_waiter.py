@@ -15,22 +15,95 @@
 """CRMint's worker that waits for a BigQuery job completion."""
 
 
+from google.cloud import bigquery
+from google.cloud import storage
+
+from common import task
 from jobs.workers import worker
 from jobs.workers.bigquery import bq_worker
+from jobs.workers.storage import storage_utils
 
 
 class BQWaiter(bq_worker.BQWorker):
-  """Worker that polls job status and respawns itself if the job is not done."""
+  """Worker that polls job status and respawns itself if the job is not done.
+
+  Waits for all the jobs listed in `job_ids` if given, otherwise for the job
+  `job_id`. Once done, starts the extract jobs of the next `extract_shards`
+  of `extract_source` with the `extract_job_config` if given, or the load jobs
+  of `append_uri_batches` into `destination_table` with the `load_job_config`
+  if given, and waits for them too. Then writes the manifest described by
+  `manifest_uri`, `manifest_shards` and `manifest_fields`, deletes the
+  `tables_to_delete` and enqueues the `next_worker_class` with the
+  `next_worker_params`, if given.
+  """
+
+  PRIORITY = task.Priority.HIGH
 
   def _execute(self):
     client = self._get_client()
-    job = client.get_job(
-      job_id=self._params['job_id'],
-      location=self._params['location'])
-    if job.error_result:
-      raise worker.WorkerException(job.error_result['message'])
-    if not job.done():
-      self.log_info(f'Current BigQuery job state: {job.state}')
-      self._enqueue('BQWaiter', {'job_id': job.job_id, 'location': job.location}, 60)
+    job_ids = self._params.get('job_ids') or [self._params['job_id']]
+    pending_jobs = []
+    for job in self._get_jobs(client, job_ids, self._params['location']):
+      if job.error_result:
+        raise worker.WorkerException(job.error_result['message'])
+      if not job.done():
+        pending_jobs.append(job)
+    if pending_jobs:
+      self.log_info(f'Current BigQuery job state: {pending_jobs[0].state}')
+      params = self._params.copy()
+      if 'job_ids' in self._params:
+        params['job_ids'] = [job.job_id for job in pending_jobs]
+      self._enqueue('BQWaiter', params, 60)
+    elif self._params.get('extract_shards'):
+      self._start_next_extracts(client)
+    elif self._params.get('append_uri_batches'):
+      self._start_appending_loads(client)
     else:
+      if self._params.get('manifest_uri'):
+        storage_utils.write_manifest(
+            storage.Client(),
+            self._params['manifest_uri'],
+            self._params.get('manifest_shards'),
+            **self._params.get('manifest_fields', {}))
+        self.log_info(f'Wrote manifest to {self._params["manifest_uri"]}')
+      for table_name in self._params.get('tables_to_delete', []):
+        client.delete_table(table_name, not_found_ok=True)
+      if self._params.get('next_worker_class'):
+        self._enqueue(self._params['next_worker_class'],
+                      self._params['next_worker_params'])
       self.log_info('Finished successfully!')
+
+  def _start_next_extracts(self, client: bigquery.Client) -> None:
+    """Starts the extract jobs of the next shards, then waits for them."""
+    max_jobs = bq_worker.MAX_RUNNING_EXTRACT_JOBS
+    shards = self._params['extract_shards']
+    jobs = self._start_extract_jobs(
+        client,
+        bigquery.TableReference.from_string(self._params['extract_source']),
+        shards[:max_jobs],
+        bigquery.ExtractJobConfig.from_api_repr(
+            self._params['extract_job_config']))
+    self.log_info(f'Extracting {len(jobs)} more shards, '
+                  f'{len(shards) - len(jobs)} left')
+    params = self._params.copy()
+    params['job_ids'] = [job.job_id for job in jobs]
+    params['extract_shards'] = shards[max_jobs:]
+    self._enqueue('BQWaiter', params, 60)
+
+  def _start_appending_loads(self, client: bigquery.Client) -> None:
+    """Starts the load jobs appending to a table, then waits for them."""
+    uri_batches = self._params['append_uri_batches']
+    jobs = self._start_load_jobs(
+        client,
+        uri_batches,
+        self._params['destination_table'],
+        bigquery.LoadJobConfig.from_api_repr(self._params['load_job_config']))
+    self.log_info(f'Appending #{len(uri_batches)} batches of files to '
+                  f'{self._params["destination_table"]}')
+    params = {
+        key: value for key, value in self._params.items()
+        if key not in ('append_uri_batches', 'destination_table',
+                       'load_job_config')
+    }
+    params['job_ids'] = [job.job_id for job in jobs]
+    self._enqueue('BQWaiter', params, 60)
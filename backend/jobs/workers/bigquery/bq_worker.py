@@ -14,12 +14,21 @@
 
 """CRMint's abstract worker dealing with BigQuery."""
 
+import collections
+from concurrent import futures
+import datetime
+import hashlib
+import json
 import os
 import time
+from typing import Any, Mapping, Optional, Sequence
 
+from google.api_core import exceptions
 from google.api_core.client_info import ClientInfo
 from google.cloud import bigquery
+from jobs.workers import metrics
 from jobs.workers import worker
+from jobs.workers.bigquery import bq_utils
 
 
 # Param name used to specify a BQ project ID
@@ -31,6 +40,38 @@ BQ_DATASET_NAME_PARAM_NAME = 'bq_dataset_id'
 # Param name used to specify a BQ table name
 BQ_TABLE_NAME_PARAM_NAME = 'bq_table_id'
 
+# Param name used to specify the maximum number of bytes a query can bill
+MAXIMUM_BYTES_BILLED_PARAM_NAME = 'maximum_bytes_billed'
+
+# Param name used to skip queries already run on unchanged source tables
+USE_CACHE_PARAM_NAME = 'use_cache'
+
+# Maximum number of load or extract jobs inserted concurrently.
+_MAX_CONCURRENT_JOB_INSERTS = 8
+
+# Maximum number of extract jobs running at once for an export, further shards
+# are extracted once these jobs are done.
+MAX_RUNNING_EXTRACT_JOBS = 20
+
+# Number of seconds a dry run estimate is reused for an identical query.
+_DRY_RUN_CACHE_TTL = 900
+
+# Maximum number of dry run estimates kept, the least recently used ones are
+# evicted first.
+_DRY_RUN_CACHE_MAX_SIZE = 1024
+
+# Maps query hashes to tuples of (estimation timestamp, bytes processed,
+# referenced tables), from the least to the most recently used.
+_dry_run_cache: collections.OrderedDict[str, tuple[float, int, list[str]]] = (
+    collections.OrderedDict())
+
+
+def _budget_estimate_error(
+    error: exceptions.GoogleAPICallError) -> worker.WorkerException:
+  return worker.WorkerException(
+      f'Cannot check the query against its maximum_bytes_billed budget, its '
+      f'dry run failed: {error}')
+
 
 class BQWorker(worker.Worker):
   """Abstract BigQuery worker."""
@@ -55,8 +96,330 @@ class BQWorker(worker.Worker):
   def _get_prefix(self):
     return f'{self._pipeline_id}_{self._job_id}_{self.__class__.__name__}'
 
-  def _get_dry_run_job_config(self):
-    return bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+  def _start_load_jobs(self,
+                       client: bigquery.Client,
+                       uri_batches: Sequence[Sequence[str]],
+                       destination: str,
+                       job_config: bigquery.LoadJobConfig
+                       ) -> list[bigquery.LoadJob]:
+    """Starts concurrent load jobs, one per batch of source URIs.
+
+    Args:
+      client: BigQuery client.
+      uri_batches: Batches of Cloud Storage URIs to load.
+      destination: Table to load the files into, as a string or reference.
+      job_config: Configuration of all the load jobs.
+    """
+    def _load_batch(uris: Sequence[str]) -> bigquery.LoadJob:
+      return client.load_table_from_uri(
+          uris,
+          destination,
+          job_id_prefix=self._get_prefix(),
+          job_config=job_config)
+
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_JOB_INSERTS) as executor:
+      return list(executor.map(_load_batch, uri_batches))
+
+  def _start_extract_jobs(self,
+                          client: bigquery.Client,
+                          source: bigquery.TableReference,
+                          shards: Sequence[Mapping[str, Any]],
+                          job_config: bigquery.ExtractJobConfig
+                          ) -> list[bigquery.ExtractJob]:
+    """Starts concurrent extract jobs, one per shard.
+
+    Args:
+      client: BigQuery client.
+      source: Table to extract.
+      shards: Shards to extract, each with a destination `uri` pattern and
+        the `partition_id` to extract if not the whole table.
+      job_config: Configuration of all the extract jobs.
+    """
+    def _extract_shard(shard: Mapping[str, Any]) -> bigquery.ExtractJob:
+      shard_source = source
+      if 'partition_id' in shard:
+        shard_source = bigquery.TableReference(
+            bigquery.DatasetReference(source.project, source.dataset_id),
+            f'{source.table_id}${shard["partition_id"]}')
+      return client.extract_table(
+          shard_source,
+          destination_uris=shard['uri'],
+          job_id_prefix=self._get_prefix(),
+          job_config=job_config)
+
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_JOB_INSERTS) as executor:
+      return list(executor.map(_extract_shard, shards))
+
+  def _get_jobs(self,
+                client: bigquery.Client,
+                job_ids: Sequence[str],
+                location: Optional[str] = None) -> list[bigquery.job._AsyncJob]:
+    """Returns the jobs of the given IDs, fetched concurrently."""
+    def _get_job(job_id: str) -> bigquery.job._AsyncJob:
+      return client.get_job(job_id=job_id, location=location)
+
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_JOB_INSERTS) as executor:
+      return list(executor.map(_get_job, job_ids))
+
+  def _get_dry_run_job_config(
+      self,
+      job_config: Optional[bigquery.QueryJobConfig] = None
+  ) -> bigquery.QueryJobConfig:
+    """Returns the config of a dry run of a query run with the given config.
+
+    Query parameters and the default dataset are kept, since the query cannot
+    be parsed without them.
+
+    Args:
+      job_config: Optional configuration of the query job.
+    """
+    dry_run_config = bigquery.QueryJobConfig(
+        dry_run=True, use_query_cache=False)
+    if job_config is not None:
+      if job_config.query_parameters:
+        dry_run_config.query_parameters = job_config.query_parameters
+      if job_config.default_dataset is not None:
+        dry_run_config.default_dataset = job_config.default_dataset
+    return dry_run_config
+
+  def _dry_run_query(self,
+                     client: bigquery.Client,
+                     query: str,
+                     location: Optional[str] = None,
+                     job_config: Optional[bigquery.QueryJobConfig] = None
+                     ) -> tuple[int, list[str]]:
+    """Returns the bytes processed and tables referenced by a query.
+
+    Dry run results are cached by hash of the query and its dry run config for
+    a few minutes, so retried tasks and repeated statements do not issue the
+    same dry run again. The cache keeps the most recently used estimates only.
+
+    Args:
+      client: BigQuery client.
+      query: String containing the query in the standard SQL dialect.
+      location: Optional string representing the location to run the query.
+      job_config: Optional configuration of the query job.
+    """
+    dry_run_config = self._get_dry_run_job_config(job_config)
+    serialized_config = json.dumps(dry_run_config.to_api_repr(), sort_keys=True)
+    key = hashlib.sha256(
+        f'{location}\n{serialized_config}\n{query}'.encode('utf-8')
+    ).hexdigest()
+    now = time.time()
+    cached = _dry_run_cache.get(key)
+    if cached and now - cached[0] < _DRY_RUN_CACHE_TTL:
+      _dry_run_cache.move_to_end(key)
+      return cached[1], cached[2]
+    job = client.query(
+        query,
+        location=location,
+        job_id_prefix=self._get_prefix(),
+        job_config=dry_run_config)
+    estimated_bytes = job.total_bytes_processed or 0
+    referenced_tables = [
+        f'{ref.project}.{ref.dataset_id}.{ref.table_id}'
+        for ref in job.referenced_tables or []
+    ]
+    metrics.increment(metrics.API_CALLS)
+    _dry_run_cache[key] = (now, estimated_bytes, referenced_tables)
+    _dry_run_cache.move_to_end(key)
+    while len(_dry_run_cache) > _DRY_RUN_CACHE_MAX_SIZE:
+      _dry_run_cache.popitem(last=False)
+    return estimated_bytes, referenced_tables
+
+  def _estimate_query_bytes(
+      self,
+      client: bigquery.Client,
+      query: str,
+      location: Optional[str] = None,
+      job_config: Optional[bigquery.QueryJobConfig] = None) -> int:
+    """Returns the number of bytes a query will process, using a dry run."""
+    estimated_bytes, _ = self._dry_run_query(
+        client, query, location, job_config)
+    return estimated_bytes
+
+  def _query(self,
+             client: bigquery.Client,
+             query: str,
+             location: Optional[str] = None,
+             job_config: Optional[bigquery.QueryJobConfig] = None,
+             job_id: Optional[str] = None) -> bigquery.QueryJob:
+    """Starts a query job once its estimated cost has been checked.
+
+    The query is dry-run first and its estimated bytes are logged as a
+    structured `BIGQUERY_ESTIMATE` entry for the job. If the worker has a
+    `maximum_bytes_billed` parameter, queries estimated above this budget are
+    rejected before running, and BigQuery enforces the same budget on the
+    actual job. Without budget, a failed dry run is logged and the query runs
+    anyway, e.g. for queries reading tables created by a previous statement of
+    the same script.
+
+    Args:
+      client: BigQuery client.
+      query: String containing the query in the standard SQL dialect.
+      location: Optional string representing the location to run the query.
+      job_config: Optional query job configuration.
+      job_id: Optional ID of the job, defaults to a random ID.
+
+    Raises:
+      WorkerException: if the query is estimated to exceed the budget, or if
+        its cost cannot be estimated while a budget is set.
+    """
+    maximum_bytes_billed = self._params.get(MAXIMUM_BYTES_BILLED_PARAM_NAME)
+    try:
+      estimated_bytes = self._estimate_query_bytes(
+          client, query, location, job_config)
+    except exceptions.GoogleAPICallError as e:
+      if maximum_bytes_billed:
+        raise _budget_estimate_error(e) from e
+      self.log_warn(f'Failed estimating the bytes processed by the query: {e}')
+      estimated_bytes = None
+    if estimated_bytes is not None:
+      processed_units = bq_utils.bytes_converter(estimated_bytes)
+      self.log_info(
+          f'Query is estimated to process {processed_units}.',
+          extra_fields={
+              'log_type': 'BIGQUERY_ESTIMATE',
+              'estimated_bytes': estimated_bytes,
+          })
+    if maximum_bytes_billed:
+      maximum_bytes_billed = int(maximum_bytes_billed)
+      if estimated_bytes > maximum_bytes_billed:
+        budget_units = bq_utils.bytes_converter(maximum_bytes_billed)
+        raise worker.WorkerException(
+            f'Query would process {processed_units}, above the budget of '
+            f'{budget_units}.')
+      if job_config is None:
+        job_config = bigquery.QueryJobConfig()
+      job_config.maximum_bytes_billed = maximum_bytes_billed
+    metrics.increment(metrics.API_CALLS)
+    if estimated_bytes is not None:
+      metrics.increment(metrics.BYTES_IN, estimated_bytes)
+    return client.query(
+        query,
+        location=location,
+        job_id=job_id,
+        job_id_prefix=self._get_prefix(),
+        job_config=job_config)
+
+  def _get_query_fingerprint(self,
+                             client: bigquery.Client,
+                             query: str,
+                             source_tables: list[str],
+                             job_config: Optional[bigquery.QueryJobConfig]
+                             ) -> str:
+    """Returns a hash of the query, its config and its source tables state."""
+    parts = [query]
+    if job_config is not None:
+      parts.append(json.dumps(job_config.to_api_repr(), sort_keys=True))
+    for table_name in source_tables:
+      try:
+        table = client.get_table(table_name)
+      except exceptions.NotFound:
+        parts.append(f'{table_name}@missing')
+        continue
+      parts.append(f'{table.full_table_id}@{table.modified.isoformat()}')
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+  def _outputs_unchanged_since(self,
+                               client: bigquery.Client,
+                               table_names: list[str],
+                               timestamp: datetime.datetime) -> bool:
+    """Returns True if all the tables or models exist, unchanged since then."""
+    for table_name in table_names:
+      try:
+        resource = client.get_table(table_name)
+      except exceptions.NotFound:
+        try:
+          resource = client.get_model(table_name)
+        except exceptions.NotFound:
+          return False
+      if resource.modified is None or resource.modified > timestamp:
+        return False
+    return True
+
+  def _cached_query(self,
+                    client: bigquery.Client,
+                    query: str,
+                    location: Optional[str] = None,
+                    job_config: Optional[bigquery.QueryJobConfig] = None,
+                    destination_tables: Optional[list[str]] = None
+                    ) -> Optional[bigquery.QueryJob]:
+    """Starts a query job, unless the same query already ran on the same data.
+
+    The query is fingerprinted with its config and the last modification time
+    of every table it reads. The job then gets an ID derived from the worker
+    prefix and this fingerprint, so a later run finding a successful job with
+    the same ID knows the query already ran on the same data. This job is
+    reused if none of the tables written by the query changed since it ended.
+    Hits and misses are logged as structured `BIGQUERY_CACHE` entries.
+
+    Queries without written tables are always run.
+
+    Args:
+      client: BigQuery client.
+      query: String containing the query in the standard SQL dialect.
+      location: Optional string representing the location to run the query.
+      job_config: Optional query job configuration.
+      destination_tables: Optional list of tables written by the job config.
+
+    Returns:
+      The started query job, or None if the previous job is reused.
+    """
+    source_tables, written_tables = bq_utils.get_table_references(query)
+    written_tables += destination_tables or []
+    if not written_tables:
+      return self._query(client, query, location, job_config)
+    try:
+      _, referenced_tables = self._dry_run_query(
+          client, query, location, job_config)
+    except exceptions.GoogleAPICallError as e:
+      if self._params.get(MAXIMUM_BYTES_BILLED_PARAM_NAME):
+        raise _budget_estimate_error(e) from e
+      # Only the tables named in the query are fingerprinted then.
+      self.log_warn(f'Failed listing the tables read by the query: {e}')
+      referenced_tables = []
+    written_keys = {bq_utils.table_name_key(name) for name in written_tables}
+    source_tables = sorted(set(source_tables).union(
+        name for name in referenced_tables
+        if bq_utils.table_name_key(name) not in written_keys))
+    fingerprint = self._get_query_fingerprint(
+        client, query, source_tables, job_config)
+    job_id = f'{self._get_prefix()}_{fingerprint}'
+    try:
+      previous_job = client.get_job(job_id, location=location)
+    except exceptions.NotFound:
+      previous_job = None
+    cache_hit = (
+        previous_job is not None
+        and previous_job.state == 'DONE'
+        and not previous_job.error_result
+        and self._outputs_unchanged_since(
+            client, written_tables, previous_job.ended))
+    if cache_hit:
+      message = f'Cache hit, reusing results of job {job_id}.'
+    else:
+      message = 'Cache miss, running the query.'
+    self.log_info(
+        message,
+        extra_fields={
+            'log_type': 'BIGQUERY_CACHE',
+            'cache_hit': cache_hit,
+            'fingerprint': fingerprint,
+        })
+    if cache_hit:
+      return None
+    # Job IDs are unique, a query rerun after a failed or stale job gets a
+    # random ID and will not be reused until its source tables change.
+    if previous_job is not None:
+      self.log_info(
+          f'Cannot reuse job {job_id}, it did not succeed or its outputs '
+          f'changed since. Running the query in a job with a random ID.')
+      job_id = None
+    return self._query(client, query, location, job_config, job_id=job_id)
 
   def _generate_qualified_bq_table_name(self):
     return '.'.join([
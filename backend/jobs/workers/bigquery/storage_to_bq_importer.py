@@ -14,16 +14,31 @@
 
 """Worker to import a CSV file into a BigQuery table."""
 
+import copy
+import datetime
+from typing import Any, Sequence
+
 from google.cloud import bigquery
 from google.cloud import storage
 
+from jobs.workers import worker
 from jobs.workers.bigquery import bq_utils
 from jobs.workers.bigquery import bq_worker
 from jobs.workers.storage import storage_utils
 
+# Maximum number of source URIs in a single load job.
+_MAX_URIS_PER_LOAD_JOB = 10000
+
 
 class StorageToBQImporter(bq_worker.BQWorker):
-  """Worker to import a CSV file into a BigQuery table."""
+  """Worker to import a CSV file into a BigQuery table.
+
+  Files are loaded in batches of at most 10,000 files, in concurrent load
+  jobs. When overwriting the table, the first batch is loaded alone and the
+  waiter then appends the other batches. With a manifest URI, only the files
+  updated since the last successful run are loaded, which suits append-only
+  imports of new daily files.
+  """
 
   PARAMS = [
       ('source_uris', 'string_list', True, '',
@@ -41,8 +56,33 @@ class StorageToBQImporter(bq_worker.BQWorker):
       ('import_json', 'boolean', False, False, 'Source is in JSON format'),
       ('csv_null_marker', 'string', False, '', 'CSV Null marker'),
       ('schema', 'text', False, '', 'Table Schema in JSON'),
+      ('manifest_uri', 'string', False, '',
+       ('Manifest file URI tracking loaded files, to only load files updated '
+        'since the last successful run (e.g. gs://bucket/manifest.json, '
+        'leave empty to load all files)')),
   ]
 
+  def _get_new_blobs(
+      self,
+      gcs_client: storage.Client,
+      blobs: Sequence[storage.Blob]
+  ) -> tuple[list[storage.Blob], dict[str, Any]]:
+    """Returns the blobs updated since the last run, and the next manifest."""
+    manifest = storage_utils.read_manifest(
+        gcs_client, self._params['manifest_uri']) or {}
+    last_updated = manifest.get('last_updated')
+    if last_updated:
+      last_updated = datetime.datetime.fromisoformat(last_updated)
+      blobs = [blob for blob in blobs if blob.updated > last_updated]
+    else:
+      blobs = list(blobs)
+    if blobs:
+      last_updated = max(blob.updated for blob in blobs)
+    next_manifest = {
+        'last_updated': last_updated.isoformat() if last_updated else None,
+    }
+    return blobs, next_manifest
+
   def _execute(self):
     job_config = bigquery.LoadJobConfig()
 
@@ -78,15 +118,60 @@ class StorageToBQImporter(bq_worker.BQWorker):
     else:
       job_config.create_disposition = 'CREATE_IF_NEEDED'
 
+    if self._params['manifest_uri'] and self._params['overwrite']:
+      raise worker.WorkerException(
+          'Cannot overwrite the table when loading new files only, since the '
+          'files loaded by previous runs would be lost')
+
     gcs_client = storage.Client()
-    matched_uris = storage_utils.get_matched_uris(gcs_client,
-                                                  self._params['source_uris'])
+    blobs = storage_utils.get_matching_blobs(
+        gcs_client, self._params['source_uris'])
+    manifest_fields = {}
+    if self._params['manifest_uri']:
+      blobs, manifest_fields = self._get_new_blobs(gcs_client, blobs)
+      if not blobs:
+        self.log_info('No file updated since the last run, nothing to load')
+        return
+    matched_uris = [f'gs://{b.bucket.name}/{b.name}' for b in blobs]
     dataset_ref = bigquery.DatasetReference(
         self._params['bq_project_id'], self._params['bq_dataset_id'])
+    table_ref = bigquery.TableReference(
+        dataset_ref, self._params['bq_table_id'])
     bq_client = self._get_client()
-    job = bq_client.load_table_from_uri(
-        matched_uris,
-        bigquery.TableReference(dataset_ref, self._params['bq_table_id']),
-        job_id_prefix=self._get_prefix(),
-        job_config=job_config)
-    self._wait(job)
+    batches = [
+        matched_uris[i:i + _MAX_URIS_PER_LOAD_JOB]
+        for i in range(0, len(matched_uris) or 1, _MAX_URIS_PER_LOAD_JOB)
+    ]
+    if len(batches) > 1:
+      self.log_info(f'Loading #{len(matched_uris)} files in '
+                    f'#{len(batches)} load jobs')
+    waiter_params = {
+        'manifest_uri': self._params['manifest_uri'],
+        'manifest_fields': manifest_fields,
+    }
+    if job_config.write_disposition == 'WRITE_TRUNCATE' and len(batches) > 1:
+      # Other batches are appended by the waiter once the table has been
+      # overwritten.
+      jobs = self._start_load_jobs(
+          bq_client, batches[:1], table_ref, job_config)
+      append_job_config = copy.deepcopy(job_config)
+      append_job_config.write_disposition = 'WRITE_APPEND'
+      waiter_params.update({
+          'append_uri_batches': batches[1:],
+          'destination_table': (f'{table_ref.project}.{table_ref.dataset_id}.'
+                                f'{table_ref.table_id}'),
+          'load_job_config': append_job_config.to_api_repr(),
+      })
+    else:
+      jobs = self._start_load_jobs(bq_client, batches, table_ref, job_config)
+    if len(batches) == 1 and not self._params['manifest_uri']:
+      self._wait(jobs[0])
+    else:
+      self._enqueue(
+          'BQWaiter',
+          {
+              'job_ids': [job.job_id for job in jobs],
+              'location': jobs[0].location,
+              **waiter_params,
+          },
+          30)
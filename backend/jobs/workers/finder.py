@@ -12,108 +12,166 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Listing available workers."""
+"""Listing available workers.
 
-from typing import Type, TypeVar
+Worker modules import heavy client libraries, so they are only imported when
+a worker class is first needed. Worker parameters are read from a static
+manifest instead, regenerated with `python -m jobs.workers.finder`.
+"""
+
+import functools
+import importlib
+import json
+import pathlib
+from typing import Any, Type, TypeVar
 
-from jobs.workers import commenter
 from jobs.workers import worker
-from jobs.workers.bigquery import bq_ml_trainer
-from jobs.workers.bigquery import bq_query_launcher
-from jobs.workers.bigquery import bq_script_executor
-from jobs.workers.bigquery import bq_to_ads_offline_click_conversion
-from jobs.workers.bigquery import bq_to_measurement_protocol_ga4
-from jobs.workers.bigquery import bq_to_storage_exporter
-from jobs.workers.bigquery import bq_to_vertexai_dataset
-from jobs.workers.bigquery import bq_waiter
-from jobs.workers.bigquery import storage_to_bq_importer
-from jobs.workers.ga import ga_audiences_updater
-from jobs.workers.ga import ga_audiences_updater_ga4
-from jobs.workers.ga import ga_conversion_event_creator_ga4
-from jobs.workers.ga import ga_custom_dimension_creator_ga4
-from jobs.workers.ga import ga_data_importer
-from jobs.workers.ga import ga_waiter
-from jobs.workers.storage import storage_cleaner
-from jobs.workers.vertexai import vertexai_batch_predictor_to_bq
-from jobs.workers.vertexai import vertexai_tabular_trainer
-from jobs.workers.vertexai import vertexai_waiter
-from jobs.workers.vertexai import vertexai_worker
 
 ConcreteWorker = TypeVar('ConcreteWorker', bound=worker.Worker)
 
-WORKERS_MAPPING = {
+# Maps worker class names to the modules defining them.
+WORKER_MODULES = {
     # 'AutoMLImporter',
     # 'AutoMLPredictor',
     # 'AutoMLTrainer',
     'BQMLTrainer':
-        bq_ml_trainer.BQMLTrainer,
+        'jobs.workers.bigquery.bq_ml_trainer',
     'BQQueryLauncher':
-        bq_query_launcher.BQQueryLauncher,
+        'jobs.workers.bigquery.bq_query_launcher',
     'BQScriptExecutor':
-        bq_script_executor.BQScriptExecutor,
+        'jobs.workers.bigquery.bq_script_executor',
     # 'BQToAppConversionAPI',
     # 'BQToCM',
     # 'BQToMeasurementProtocol',
     'BQToMeasurementProtocolGA4':
-        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolGA4,
+        'jobs.workers.bigquery.bq_to_measurement_protocol_ga4',
     'BQToAdsOfflineClickConversion':
-        bq_to_ads_offline_click_conversion.BQToAdsOfflineClickConversion,
+        'jobs.workers.bigquery.bq_to_ads_offline_click_conversion',
     'BQToStorageExporter':
-        bq_to_storage_exporter.BQToStorageExporter,
+        'jobs.workers.bigquery.bq_to_storage_exporter',
     'BQToVertexAIDataset':
-        bq_to_vertexai_dataset.BQToVertexAIDataset,
+        'jobs.workers.bigquery.bq_to_vertexai_dataset',
     'Commenter':
-        commenter.Commenter,
+        'jobs.workers.commenter',
     'GAAudiencesUpdater':
-        ga_audiences_updater.GAAudiencesUpdater,
+        'jobs.workers.ga.ga_audiences_updater',
     'GA4AudiencesUpdater':
-        ga_audiences_updater_ga4.GA4AudiencesUpdater,
+        'jobs.workers.ga.ga_audiences_updater_ga4',
     'GA4ConversionEventCreator':
-        ga_conversion_event_creator_ga4.GA4ConversionEventCreator,
+        'jobs.workers.ga.ga_conversion_event_creator_ga4',
     'GA4CustomDimensionCreator':
-        ga_custom_dimension_creator_ga4.GA4CustomDimensionCreator,
+        'jobs.workers.ga.ga_custom_dimension_creator_ga4',
     'GADataImporter':
-        ga_data_importer.GADataImporter,
+        'jobs.workers.ga.ga_data_importer',
     # 'GAToBQImporter',
     # 'MLPredictor',
     # 'MLTrainer',
     # 'MLVersionDeployer',
     # 'StorageChecker',
     'StorageCleaner':
-        storage_cleaner.StorageCleaner,
+        'jobs.workers.storage.storage_cleaner',
     'StorageToBQImporter':
-        storage_to_bq_importer.StorageToBQImporter,
+        'jobs.workers.bigquery.storage_to_bq_importer',
     'VertexAIBatchPredictorToBQ':
-        vertexai_batch_predictor_to_bq.VertexAIBatchPredictorToBQ,
+        'jobs.workers.vertexai.vertexai_batch_predictor_to_bq',
     'VertexAITabularTrainer':
-        vertexai_tabular_trainer.VertexAITabularTrainer,
+        'jobs.workers.vertexai.vertexai_tabular_trainer',
 }
 
-_PRIVATE_WORKERS_MAPPING = {
+_PRIVATE_WORKER_MODULES = {
     'BQToMeasurementProtocolProcessorGA4':
-        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4,
+        'jobs.workers.bigquery.bq_to_measurement_protocol_ga4',
     'AdsOfflineClickPageResultsWorker':
-        bq_to_ads_offline_click_conversion.AdsOfflineClickPageResultsWorker,
-    'BQWaiter': bq_waiter.BQWaiter,
-    'GADataImportUploadWaiter': ga_waiter.GADataImportUploadWaiter,
-    'VertexAIWaiter': vertexai_waiter.VertexAIWaiter,
-    'VertexAIWorker': vertexai_worker.VertexAIWorker,
+        'jobs.workers.bigquery.bq_to_ads_offline_click_conversion',
+    'BQScriptWaiter': 'jobs.workers.bigquery.bq_script_executor',
+    'BQWaiter': 'jobs.workers.bigquery.bq_waiter',
+    'GADataImportUploadWaiter': 'jobs.workers.ga.ga_waiter',
+    'VertexAIWaiter': 'jobs.workers.vertexai.vertexai_waiter',
+    'VertexAIWorker': 'jobs.workers.vertexai.vertexai_worker',
+}
+
+_MODULES_BY_LOWERCASE_NAME = {
+    name.lower(): (name, module_name)
+    for name, module_name in (
+        *WORKER_MODULES.items(), *_PRIVATE_WORKER_MODULES.items())
 }
 
+_PARAMS_MANIFEST_PATH = pathlib.Path(__file__).with_name(
+    'params_manifest.json')
+
+_PARAM_KEYS = ('name', 'type', 'required', 'default', 'label')
+
+
+def _find_worker(class_name: str) -> tuple[str, str]:
+  """Returns the exact name and module name of a worker class.
+
+  Args:
+    class_name: The name of the worker class, case insensitive.
+
+  Raises:
+    ModuleNotFoundError: if the class name cannot be found.
+  """
+  try:
+    return _MODULES_BY_LOWERCASE_NAME[class_name.lower()]
+  except KeyError as e:
+    raise ModuleNotFoundError(f'Unknown worker class: {class_name}') from e
+
+
+@functools.cache
+def _import_worker_class(name: str, module_name: str) -> Type[ConcreteWorker]:
+  return getattr(importlib.import_module(module_name), name)
+
 
 def get_worker_class(class_name: str) -> Type[ConcreteWorker]:
-  """Returns a worker class.
+  """Returns a worker class, importing its module on first use.
 
   Args:
-    class_name: The name of the worker class.
+    class_name: The name of the worker class, case insensitive.
 
   Raises:
     ModuleNotFoundError: if the class name cannot be found.
   """
-  for name in WORKERS_MAPPING:
-    if class_name.lower() == name.lower():
-      return WORKERS_MAPPING[name]
-  for name in _PRIVATE_WORKERS_MAPPING:
-    if class_name.lower() == name.lower():
-      return _PRIVATE_WORKERS_MAPPING[name]
-  raise ModuleNotFoundError
+  return _import_worker_class(*_find_worker(class_name))
+
+
+@functools.cache
+def _load_params_manifest() -> dict[str, list[dict[str, Any]]]:
+  with _PARAMS_MANIFEST_PATH.open() as f:
+    return json.load(f)
+
+
+def get_worker_params(class_name: str) -> list[dict[str, Any]]:
+  """Returns the parameters of a worker, without importing its module.
+
+  Args:
+    class_name: The name of the worker class, case insensitive.
+
+  Raises:
+    ModuleNotFoundError: if the class name cannot be found.
+  """
+  name, _ = _find_worker(class_name)
+  try:
+    return _load_params_manifest()[name]
+  except KeyError:
+    # Private workers are not listed in the manifest.
+    return build_worker_params(get_worker_class(name))
+
+
+def build_worker_params(
+    worker_class: Type[ConcreteWorker]) -> list[dict[str, Any]]:
+  """Returns the parameters of a worker class as a list of dictionaries."""
+  return [dict(zip(_PARAM_KEYS, param)) for param in worker_class.PARAMS]
+
+
+def build_params_manifest() -> dict[str, list[dict[str, Any]]]:
+  """Returns the parameters of public workers, importing all their modules."""
+  return {
+      name: build_worker_params(get_worker_class(name))
+      for name in WORKER_MODULES
+  }
+
+
+if __name__ == '__main__':
+  with _PARAMS_MANIFEST_PATH.open('w') as f:
+    json.dump(build_params_manifest(), f, indent=2)
+    f.write('\n')
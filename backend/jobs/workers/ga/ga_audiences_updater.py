@@ -36,6 +36,9 @@ class GAAudiencesUpdater(bq_worker.BQWorker):
       ('bq_table_id', 'string', True, '', 'BQ Table ID'),
       ('bq_dataset_location', 'string', False, '', 'BQ Dataset Location'),
       ('template', 'text', True, '', 'GA audience JSON template'),
+      ('snapshot_ttl_hours', 'number', False, 0,
+       ('Hours during which audience configs unchanged since the last run are '
+        'not compared with GA again (0 to always compare)')),
   ]
 
 
@@ -48,11 +51,22 @@ class GAAudiencesUpdater(bq_worker.BQWorker):
     patches = ga_utils.get_audience_patches(
         bq_client, table_ref, self._params['template'])
     self.log_info(f'Retrieved #{len(patches)} audience configs from BigQuery')
+    snapshot_key = (
+        f'{self._params["account_id"]}/{self._params["property_id"]}/'
+        f'{self._pipeline_id}')
+    max_age = self._params['snapshot_ttl_hours'] * 3600
+    changed_patches = ga_utils.get_changed_audience_patches(
+        snapshot_key, patches, 'name', max_age)
+    if len(changed_patches) < len(patches):
+      self.log_info(f'Skipped #{len(patches) - len(changed_patches)} audience '
+                    f'configs unchanged since the last run')
+    if not changed_patches:
+      return
     ga_client = ga_utils.get_client('analytics', 'v3')
     audiences = ga_utils.fetch_audiences(
         ga_client, self._params['account_id'], self._params['property_id'])
     self.log_info(f'Fetched #{len(audiences)} audiences from the GA Property')
-    operations = ga_utils.get_audience_operations(patches, audiences)
+    operations = ga_utils.get_audience_operations(changed_patches, audiences)
     self.log_info(f'Executing #{len(operations)} operations to update the '
                   f'state of GA with the audience configs from your BigQuery')
     ga_utils.run_audience_operations(
@@ -61,3 +75,5 @@ class GAAudiencesUpdater(bq_worker.BQWorker):
         self._params['property_id'],
         operations,
         progress_callback=self.log_info)
+    if max_age:
+      ga_utils.save_audience_snapshot(snapshot_key, patches, 'name')
@@ -32,6 +32,9 @@ class GA4AudiencesUpdater(bq_worker.BQWorker):
       ('bq_dataset_location', 'string', False, '', 'BQ Dataset Location'),
       ('template', 'text', True, '',
        'JSON template to create/update a GA4 audience'),
+      ('snapshot_ttl_hours', 'number', False, 0,
+       ('Hours during which audience configs unchanged since the last run are '
+        'not compared with GA4 again (0 to always compare)')),
   ]
 
   def _execute(self) -> None:
@@ -43,11 +46,22 @@ class GA4AudiencesUpdater(bq_worker.BQWorker):
     patches = ga_utils.get_audience_patches(
         bq_client, table_ref, self._params['template'])
     self.log_info(f'Retrieved #{len(patches)} audience configs from BigQuery')
+    snapshot_key = (
+        f'ga4/{self._params["ga_property_id"]}/{self._pipeline_id}')
+    max_age = self._params['snapshot_ttl_hours'] * 3600
+    changed_patches = ga_utils.get_changed_audience_patches(
+        snapshot_key, patches, 'displayName', max_age)
+    if len(changed_patches) < len(patches):
+      self.log_info(f'Skipped #{len(patches) - len(changed_patches)} audience '
+                    f'configs unchanged since the last run')
+    if not changed_patches:
+      return
     ga_client = ga_utils.get_client('analyticsadmin', 'v1alpha')
     audiences = ga_utils.fetch_audiences_ga4(
         ga_client, self._params['ga_property_id'])
     self.log_info(f'Fetched #{len(audiences)} audiences from the GA4 Property')
-    operations = ga_utils.get_audience_operations_ga4(patches, audiences)
+    operations = ga_utils.get_audience_operations_ga4(
+        changed_patches, audiences)
     self.log_info(f'Executing #{len(operations)} operations to update the '
                   f'state of GA4 with the audience configs from your BigQuery')
     ga_utils.run_audience_operations_ga4(
@@ -55,3 +69,5 @@ class GA4AudiencesUpdater(bq_worker.BQWorker):
         self._params['ga_property_id'],
         operations,
         progress_callback=self.log_info)
+    if max_age:
+      ga_utils.save_audience_snapshot(snapshot_key, patches, 'displayName')
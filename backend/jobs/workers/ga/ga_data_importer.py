@@ -14,22 +14,39 @@
 
 """CRMint's worker that push data into a Data Import on Google Analytics."""
 
-import os
-import tempfile
+from concurrent import futures
+from typing import Optional
 
 from google.cloud import storage
 
+from jobs.workers import metrics
 from jobs.workers import worker
 from jobs.workers.ga import ga_utils
 from jobs.workers.storage import storage_utils
 
+# Resumable uploads expect chunk sizes in multiples of 256KB.
+_CHUNK_SIZE_UNIT = 256 * 1024
+
+# Maximum size of uploaded chunks, reached on fast uploads.
+_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Maximum number of files uploaded concurrently.
+_MAX_CONCURRENT_UPLOADS = 4
+
 
 class GADataImporter(worker.Worker):
-  """Uploads CSV data from Cloud Storage to a Google Analytics Data Import."""
+  """Uploads CSV data from Cloud Storage to a Google Analytics Data Import.
+
+  The URI can match multiple CSV files sharing the same header, such as the
+  shards of a BigQuery export. Each file is uploaded separately, concurrently
+  with the others, and a single waiter then waits for Google Analytics to
+  process all the uploads.
+  """
 
   PARAMS = [
       ('csv_uri', 'string', True, '',
-       'CSV data file URI (e.g. gs://bucket/data.csv)'),
+       ('CSV data file URI or URI pattern (e.g. gs://bucket/data.csv or '
+        'gs://bucket/data-*.csv)')),
       ('account_id', 'string', True, '',
        'GA Account ID (e.g. 12345)'),
       ('property_id', 'string', True, '',
@@ -38,38 +55,133 @@ class GADataImporter(worker.Worker):
        'GA Dataset ID (e.g. sLj2CuBTDFy6CedBJw)'),
       ('max_uploads', 'number', False, None,
        'Maximum uploads to keep in GA Dataset (leave empty to keep all)'),
+      ('chunk_size_mb', 'number', False, 1,
+       'Initial size of uploaded chunks in MB, grows with throughput'),
   ]
 
+  # Each task buffers chunks of up to _MAX_CHUNK_SIZE per concurrent upload.
+  MAX_CONCURRENT_TASKS = 2
+  MEMORY_MB = 128
+
   def _log_upload_progress(self, progress: float):
     self.log_info(f'Uploaded {progress:.0%}')
 
+  def _read_header(self, blob: storage.Blob) -> bytes:
+    with blob.open('rb', chunk_size=_CHUNK_SIZE_UNIT) as reader:
+      return reader.readline()
+
+  def _get_shards(self, gcs_client: storage.Client) -> list[storage.Blob]:
+    """Returns the CSV files with data to upload, sorted by name.
+
+    Raises:
+      WorkerException: if no file matches the URI or if files have different
+        headers.
+    """
+    blobs = storage_utils.get_matching_blobs(
+        gcs_client, [self._params['csv_uri']])
+    if not blobs:
+      raise worker.WorkerException(
+          f'No file found for uri: {self._params["csv_uri"]}')
+    blobs = sorted(blobs, key=lambda blob: blob.name)
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_UPLOADS) as executor:
+      headers = list(executor.map(self._read_header, blobs))
+    for blob, header in zip(blobs[1:], headers[1:]):
+      if header != headers[0]:
+        raise worker.WorkerException(
+            f'Header of gs://{blob.bucket.name}/{blob.name} differs from the '
+            f'header of gs://{blobs[0].bucket.name}/{blobs[0].name}')
+    # Shards exported from empty partitions only contain the header.
+    return [
+        blob for blob, header in zip(blobs, headers) if blob.size > len(header)
+    ]
+
+  def _upload_shard(self,
+                    dataimport_ref: ga_utils.DataImportReference,
+                    blob: storage.Blob,
+                    chunksize: int,
+                    log_shard_name: bool) -> Optional[str]:
+    """Streams a CSV file to the Data Import, returns the upload ID."""
+    # Each upload gets its own client, since HTTP clients are not thread-safe.
+    client = ga_utils.get_client('analytics', 'v3')
+    uri = f'gs://{blob.bucket.name}/{blob.name}'
+    if log_shard_name:
+      progress_callback = lambda p: self.log_info(f'Uploaded {p:.0%} of {uri}')
+    else:
+      progress_callback = self._log_upload_progress
+    with blob.open('rb', chunk_size=_CHUNK_SIZE_UNIT) as reader:
+      upload = ga_utils.upload_dataimport_stream(
+          client,
+          dataimport_ref,
+          reader,
+          blob.size,
+          chunksize=chunksize,
+          max_chunksize=max(chunksize, _MAX_CHUNK_SIZE),
+          progress_callback=progress_callback)
+    metrics.increment(metrics.BYTES_IN, blob.size)
+    return upload.get('id')
+
   def _execute(self) -> None:
+    shards = self._get_shards(storage.Client())
+    if not shards:
+      self.log_info('No data to upload, all files only contain a header')
+      return
     client = ga_utils.get_client('analytics', 'v3')
     dataimport_ref = ga_utils.DataImportReference(
         account_id=self._params['account_id'],
         property_id=self._params['property_id'],
         dataset_id=self._params['dataset_id'])
-    if self._params['max_uploads'] == 1:
+    # Each shard is a separate upload, counting towards the maximum uploads.
+    max_uploads = self._params['max_uploads']
+    if max_uploads and max_uploads < len(shards):
+      raise worker.WorkerException(
+          f'Cannot upload {len(shards)} files to a Data Import keeping at '
+          f'most {max_uploads} uploads')
+    if max_uploads and max_uploads == len(shards):
       deleted_ids = ga_utils.delete_oldest_uploads(
           client, dataimport_ref, max_to_keep=None)
       self.log_info(f'Deleted all existing uploads for ids: {deleted_ids}')
-    elif self._params['max_uploads']:
+    elif max_uploads:
       deleted_ids = ga_utils.delete_oldest_uploads(
-          client, dataimport_ref, max_to_keep=self._params['max_uploads'] - 1)
+          client, dataimport_ref, max_to_keep=max_uploads - len(shards))
       self.log_info(f'Deleted oldest upload(s) for ids: {deleted_ids}')
     else:
       self.log_info('Kept all uploads')
-    with tempfile.NamedTemporaryFile(delete=False) as temp:
-      temp_filepath = temp.name
-    storage_utils.download_file(storage.Client(),
-                                uri_path=self._params['csv_uri'],
-                                destination_path=temp_filepath)
-    self.log_info('Downloaded file from Cloud Storage to App Engine')
-    ga_utils.upload_dataimport(client,
-                               dataimport_ref,
-                               temp_filepath,
-                               progress_callback=self._log_upload_progress)
+    chunk_size_bytes = self._params['chunk_size_mb'] * 1024 * 1024
+    chunksize = _CHUNK_SIZE_UNIT * max(
+        1, round(chunk_size_bytes / _CHUNK_SIZE_UNIT))
+    if len(shards) == 1:
+      self.log_info('Streaming file from Cloud Storage to Google Analytics')
+    else:
+      self.log_info(f'Streaming {len(shards)} files from Cloud Storage to '
+                    f'Google Analytics')
+    # Streams the files since they could be large (e.g. 1GB is common).
+    upload_shard = metrics.propagate(lambda blob: self._upload_shard(
+        dataimport_ref, blob, chunksize, len(shards) > 1))
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_UPLOADS) as executor:
+      upload_futures = [executor.submit(upload_shard, blob) for blob in shards]
+    upload_ids = [
+        future.result() for future in upload_futures
+        if not future.exception() and future.result()
+    ]
+    errors = [
+        future.exception() for future in upload_futures if future.exception()
+    ]
+    if errors:
+      # Uploaded shards are deleted, so that a retry does not duplicate them.
+      ga_utils.delete_uploads(client, dataimport_ref, upload_ids)
+      if upload_ids:
+        self.log_info(f'Deleted uploaded shard(s) for ids: {upload_ids}')
+      raise errors[0]
     self.log_info('Successfully uploaded data import to Google Analytics')
-    # Deletes the temporary file since it could be large (e.g. 1GB is common).
-    os.remove(temp_filepath)
-    self.log_info('Cleaned up the downloaded file')
+    if upload_ids:
+      self._enqueue(
+          'GADataImportUploadWaiter',
+          {
+              'account_id': self._params['account_id'],
+              'property_id': self._params['property_id'],
+              'dataset_id': self._params['dataset_id'],
+              'upload_ids': upload_ids,
+          },
+          60)
@@ -1,15 +1,23 @@
 """Utilities for Google Analytics workers."""
 
+from concurrent import futures
 import dataclasses
+import datetime
 import enum
+import hashlib
+import io
 import json
+import os
 import re
 import string
 import time
-from typing import Callable, Mapping, NewType, Optional, Type, TypeVar, Union
+from typing import (Any, Callable, Mapping, NewType, Optional, Sequence, Type,
+                    TypeVar, Union)
 
+from google.api_core import exceptions
 from google.api_core import retry
 from google.cloud import bigquery
+from google.cloud import storage
 from googleapiclient import discovery
 from googleapiclient import errors
 from googleapiclient import http as api_httplib
@@ -17,10 +25,36 @@ import httplib2
 
 from common import crmint_logging
 from common import utils
+from jobs.workers import metrics
 
 _MAX_RESULTS_PER_CALL = 100
 _NUMBER_OF_RETRIES = 3
 
+# Chunks uploaded faster than this number of seconds double the chunk size.
+_FAST_CHUNK_UPLOAD_SECONDS = 2
+
+# Maximum number of requests sent in a single batch request.
+_MAX_BATCH_SIZE = 50
+
+# HTTP statuses of failed requests worth retrying.
+_RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Maximum rate of audience operations sent to the Analytics Admin API, which
+# quotas the number of requests, batched or not. Batch requests are paced so
+# that their operations do not exceed this rate on average, the default staying
+# within the per-minute quota of a project. Set the environment variable to
+# match the quota of your project.
+# https://developers.google.com/analytics/devguides/config/admin/v1/quotas
+_GA4_ADMIN_MAX_REQUESTS_PER_SECOND = float(
+    os.getenv('GA4_ADMIN_MAX_REQUESTS_PER_SECOND', '10'))
+
+# Bucket where audience snapshots are saved between runs, next to the task
+# payloads. Its lifecycle deletes snapshots which are not saved again for days.
+# Audiences are always compared with Google Analytics if not set.
+_SNAPSHOTS_BUCKET = os.getenv('PAYLOAD_BUCKET')
+
+_SNAPSHOTS_PREFIX = 'audience-snapshots'
+
 # NB: Required fields should be ommitted from patch requests if also immutable.
 _GA4_AUDIENCE_REQUIRED_FIELDS = [
     'displayName',
@@ -90,25 +124,37 @@ class DataImportReference:
 class UploadStatus(enum.Enum):
   PENDING = enum.auto()
   COMPLETED = enum.auto()
+  FAILED = enum.auto()
 
 
 def get_dataimport_upload_status(
     client: discovery.Resource,
-    dataimport_ref: DataImportReference) -> UploadStatus:
+    dataimport_ref: DataImportReference,
+    upload_ids: Optional[Sequence[str]] = None) -> UploadStatus:
   """Returns the status of a Data Import upload.
 
   Args:
     client: Google Analytics API client of type
       `googleapiclient.discovery.Resource`.
     dataimport_ref: Instance representing a Data Import reference
+    upload_ids: Optional IDs of the uploads to check, which are completed
+      once all of them are. If None, checks for any upload in the Data Import.
   """
   request = client.management().uploads().list(
       accountId=dataimport_ref.account_id,
       webPropertyId=dataimport_ref.property_id,
       customDataSourceId=dataimport_ref.dataset_id)
   response = request.execute()
-  if response['items']:
-    # Considers an upload as completed when the list of items is not empty.
+  if upload_ids is None:
+    if response['items']:
+      # Considers an upload as completed when the list of items is not empty.
+      return UploadStatus.COMPLETED
+    return UploadStatus.PENDING
+  statuses = {item['id']: item['status'] for item in response['items']}
+  # Uploads missing from the list have been deleted in the meantime.
+  if any(statuses.get(x, 'FAILED') == 'FAILED' for x in upload_ids):
+    return UploadStatus.FAILED
+  if all(statuses[x] == 'COMPLETED' for x in upload_ids):
     return UploadStatus.COMPLETED
   return UploadStatus.PENDING
 
@@ -145,16 +191,57 @@ def delete_oldest_uploads(client: discovery.Resource,
   else:
     uploads_to_delete = sorted_uploads
   ids_to_delete = [x['id'] for x in uploads_to_delete]
-  if ids_to_delete:
-    request = client.management().uploads().deleteUploadData(
-        accountId=dataimport_ref.account_id,
-        webPropertyId=dataimport_ref.property_id,
-        customDataSourceId=dataimport_ref.dataset_id,
-        body={'customDataImportUids': ids_to_delete})
-    request.execute()
+  delete_uploads(client, dataimport_ref, ids_to_delete)
   return ids_to_delete
 
 
+def delete_uploads(client: discovery.Resource,
+                   dataimport_ref: DataImportReference,
+                   upload_ids: list[str]) -> None:
+  """Deletes the given uploads from the referenced Data Import.
+
+  Args:
+    client: Google Analytics API client.
+    dataimport_ref: References a single Data Import in Google Analytics.
+    upload_ids: IDs of the uploads to delete.
+  """
+  if not upload_ids:
+    return
+  request = client.management().uploads().deleteUploadData(
+      accountId=dataimport_ref.account_id,
+      webPropertyId=dataimport_ref.property_id,
+      customDataSourceId=dataimport_ref.dataset_id,
+      body={'customDataImportUids': upload_ids})
+  request.execute()
+
+
+def _upload_dataimport_media(
+    client: discovery.Resource,
+    dataimport_ref: DataImportReference,
+    media: api_httplib.MediaUpload,
+    progress_callback: Optional[Callable[[float], None]] = None
+) -> dict[str, Any]:
+  """Uploads media chunk by chunk to the referenced Data Import."""
+  request = client.management().uploads().uploadData(
+      accountId=dataimport_ref.account_id,
+      webPropertyId=dataimport_ref.property_id,
+      customDataSourceId=dataimport_ref.dataset_id,
+      media_body=media)
+  response = None
+  while response is None:
+    status, response = request.next_chunk(num_retries=_NUMBER_OF_RETRIES)
+    metrics.increment(metrics.API_CALLS)
+    if status and progress_callback:
+      # Rounds progress up to 4 digits, since we don't need more precision
+      # for this percentage.
+      progress_callback(round(status.progress(), 4))
+  metrics.increment(metrics.BYTES_OUT, media.size())
+  # Sends a completion signal once the upload has finished.
+  if progress_callback:
+    progress_callback(1.0)
+  return response
+
+
 def upload_dataimport(
     client: discovery.Resource,
     dataimport_ref: DataImportReference,
@@ -177,21 +264,111 @@ def upload_dataimport(
       mimetype='application/octet-stream',
       chunksize=chunksize,
       resumable=True)
-  request = client.management().uploads().uploadData(
-      accountId=dataimport_ref.account_id,
-      webPropertyId=dataimport_ref.property_id,
-      customDataSourceId=dataimport_ref.dataset_id,
-      media_body=media)
-  response = None
-  while response is None:
-    status, response = request.next_chunk(num_retries=_NUMBER_OF_RETRIES)
-    if status and progress_callback:
-      # Rounds progress up to 4 digits, since we don't need more precision
-      # for this percentage.
-      progress_callback(round(status.progress(), 4))
-  # Sends a completion signal once the upload has finished.
-  if progress_callback:
-    progress_callback(1.0)
+  _upload_dataimport_media(client, dataimport_ref, media, progress_callback)
+
+
+class _ReadAheadMediaUpload(api_httplib.MediaUpload):
+  """Resumable upload reading its next chunk while the current one is sent.
+
+  The chunk size doubles every time a chunk is uploaded in less than
+  `_FAST_CHUNK_UPLOAD_SECONDS`, up to a maximum size. At most two chunks are
+  held in memory: the one being uploaded and the one read ahead.
+  """
+
+  def __init__(self,
+               stream: io.IOBase,
+               size: int,
+               chunksize: int,
+               max_chunksize: int,
+               executor: futures.Executor):
+    super().__init__()
+    self._stream = stream
+    self._size = size
+    self._chunksize = chunksize
+    self._max_chunksize = max(chunksize, max_chunksize)
+    self._executor = executor
+    self._read_ahead = None
+    self._last_read_time = None
+
+  def chunksize(self) -> int:
+    return self._chunksize
+
+  def mimetype(self) -> str:
+    return 'application/octet-stream'
+
+  def size(self) -> int:
+    return self._size
+
+  def resumable(self) -> bool:
+    return True
+
+  def _read(self, begin: int, length: int) -> bytes:
+    self._stream.seek(begin)
+    return self._stream.read(length)
+
+  def getbytes(self, begin: int, length: int) -> bytes:
+    now = time.monotonic()
+    data = None
+    if self._read_ahead is not None:
+      read_ahead_range, read_ahead_future = self._read_ahead
+      self._read_ahead = None
+      # Waits for the pending read in any case, before using the stream again.
+      read_ahead_data = read_ahead_future.result()
+      if read_ahead_range == (begin, length):
+        data = read_ahead_data
+    if data is None:
+      data = self._read(begin, length)
+    if (self._last_read_time is not None and
+        now - self._last_read_time < _FAST_CHUNK_UPLOAD_SECONDS):
+      self._chunksize = min(2 * self._chunksize, self._max_chunksize)
+    self._last_read_time = time.monotonic()
+    next_begin = begin + len(data)
+    if next_begin < self._size:
+      self._read_ahead = (
+          (next_begin, self._chunksize),
+          self._executor.submit(self._read, next_begin, self._chunksize))
+    return data
+
+  def has_stream(self) -> bool:
+    return False
+
+
+def upload_dataimport_stream(
+    client: discovery.Resource,
+    dataimport_ref: DataImportReference,
+    stream: io.IOBase,
+    size: int,
+    chunksize: int = 1024 * 1024,
+    max_chunksize: int = 8 * 1024 * 1024,
+    progress_callback: Optional[Callable[[float], None]] = None
+) -> dict[str, Any]:
+  """Uploads the content of a seekable stream to the referenced Data Import.
+
+  The next chunk is read from the stream while the current one is uploaded,
+  and the chunk size grows with the upload throughput. This keeps memory usage
+  bounded to two chunks, regardless of the stream size.
+
+  Args:
+    client: Google Analytics API client.
+    dataimport_ref: References a single Data Import in Google Analytics.
+    stream: Seekable binary stream to upload its content to GA (e.g. a blob
+      opened with `google.cloud.storage.Blob.open`).
+    size: Size in bytes of the stream content.
+    chunksize: Integer representing the initial size of chunks in bytes sent
+      to GA API, must be a multiple of 256KB. Defaults value is set to 1MB.
+    max_chunksize: Integer representing the maximum size of chunks in bytes.
+      Defaults value is set to 8MB.
+    progress_callback: f(float), The function to call to update the progress
+      bar or None for no progress bar.
+
+  Returns:
+    The created upload resource, with its `id`.
+  """
+  with futures.ThreadPoolExecutor(max_workers=1) as executor:
+    media = _ReadAheadMediaUpload(
+        stream, size, chunksize, max_chunksize, executor)
+    return _upload_dataimport_media(
+        client, dataimport_ref, media, progress_callback)
 
 
 class AudienceOperationBase:
@@ -214,6 +391,87 @@ class AudienceOperationUpdate(AudienceOperationBase):
   data: AudiencePatch
 
 
+class _TokenBucket:
+  """Paces operations at a maximum average rate, allowing bursts.
+
+  Operations beyond the available tokens are let through once the missing
+  tokens are refilled, so that waits only depend on the operations in excess
+  of the rate.
+  """
+
+  def __init__(self, rate: float, capacity: float) -> None:
+    """Initializes a full bucket.
+
+    Args:
+      rate: Number of tokens refilled per second.
+      capacity: Maximum number of tokens, the size of the largest burst.
+    """
+    self._rate = rate
+    self._capacity = capacity
+    self._tokens = capacity
+    self._updated_at = time.monotonic()
+
+  def consume(self, count: int) -> None:
+    """Consumes tokens, waiting for the bucket to refill if it runs short."""
+    now = time.monotonic()
+    self._tokens = min(
+        self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+    self._updated_at = now
+    self._tokens -= count
+    if self._tokens < 0:
+      time.sleep(-self._tokens / self._rate)
+
+
+def _execute_in_batches(
+    ga_client: discovery.Resource,
+    requests: list[api_httplib.HttpRequest],
+    max_requests_per_second: Optional[float] = None) -> None:
+  """Executes API requests in batch requests, retrying failed requests only.
+
+  Args:
+    ga_client: Google Analytics API client.
+    requests: List of requests to execute.
+    max_requests_per_second: Optional maximum rate of requests, to stay within
+      API quotas counting each request of a batch. Batch requests wait for
+      their requests to fit in a token bucket refilled at this rate.
+
+  Raises:
+    errors.HttpError: if a request fails with a non-retryable error, or still
+      fails after all retries.
+  """
+  failures = {}
+
+  def _record_failure(request_id, unused_response, exception):
+    if exception is not None:
+      failures[int(request_id)] = exception
+
+  bucket = None
+  if max_requests_per_second:
+    bucket = _TokenBucket(max_requests_per_second, capacity=_MAX_BATCH_SIZE)
+  pending_ids = list(range(len(requests)))
+  for attempt in range(_NUMBER_OF_RETRIES + 1):
+    failures.clear()
+    for i in range(0, len(pending_ids), _MAX_BATCH_SIZE):
+      batch = ga_client.new_batch_http_request(callback=_record_failure)
+      batch_ids = pending_ids[i:i + _MAX_BATCH_SIZE]
+      if bucket is not None:
+        bucket.consume(len(batch_ids))
+      for request_id in batch_ids:
+        batch.add(requests[request_id], request_id=str(request_id))
+      batch.execute()
+      metrics.increment(metrics.API_CALLS, len(batch_ids))
+    if not failures:
+      return
+    for exception in failures.values():
+      if (not isinstance(exception, errors.HttpError)
+          or exception.resp.status not in _RETRYABLE_STATUSES
+          or attempt == _NUMBER_OF_RETRIES):
+        raise exception
+    pending_ids = sorted(failures)
+    metrics.increment(metrics.RETRIES, len(pending_ids))
+    time.sleep(2**attempt)
+
+
 def get_audience_patches(
     bq_client: bigquery.Client,
     table_ref: bigquery.TableReference,
@@ -235,6 +493,91 @@ def get_audience_patches(
   return patches
 
 
+def _get_patch_digest(patch: AudiencePatch) -> str:
+  content = json.dumps(patch, sort_keys=True, separators=(',', ':'))
+  return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _get_snapshot_blob(snapshot_key: str) -> Optional[storage.Blob]:
+  if not _SNAPSHOTS_BUCKET:
+    return None
+  bucket = storage.Client().bucket(_SNAPSHOTS_BUCKET)
+  return bucket.blob(f'{_SNAPSHOTS_PREFIX}/{snapshot_key}.json')
+
+
+def _load_audience_snapshot(
+    blob: storage.Blob) -> Optional[tuple[float, dict[str, str]]]:
+  """Returns the snapshot timestamp and the digests of patches by audience."""
+  try:
+    snapshot = json.loads(blob.download_as_bytes())
+  except exceptions.NotFound:
+    return None
+  return snapshot['timestamp'], snapshot['digests']
+
+
+def get_changed_audience_patches(
+    snapshot_key: str,
+    patches: list[AudiencePatch],
+    name_field: str,
+    max_age: float) -> list[AudiencePatch]:
+  """Returns the patches which changed since the last snapshot was saved.
+
+  Patches identical to the ones applied by the last run are skipped, which
+  saves fetching and comparing audiences from the Google Analytics API when
+  the audience configs did not change. Snapshots are saved in Cloud Storage,
+  so that they are shared by all instances and survive restarts.
+
+  Args:
+    snapshot_key: Key identifying the audiences, e.g. the property ID and the
+      pipeline ID.
+    patches: List of audiences used as update patches.
+    name_field: Patch field identifying an audience.
+    max_age: Number of seconds after which the snapshot is ignored, since
+      audiences could have been edited in Google Analytics meanwhile.
+  """
+  blob = _get_snapshot_blob(snapshot_key) if max_age else None
+  snapshot = _load_audience_snapshot(blob) if blob else None
+  if snapshot and time.time() - snapshot[0] >= max_age:
+    try:
+      blob.delete()
+    except exceptions.NotFound:
+      pass
+    snapshot = None
+  if not snapshot:
+    return list(patches)
+  digests = snapshot[1]
+  return [
+      patch for patch in patches
+      if digests.get(patch[name_field]) != _get_patch_digest(patch)
+  ]
+
+
+def save_audience_snapshot(snapshot_key: str,
+                           patches: list[AudiencePatch],
+                           name_field: str) -> None:
+  """Saves the digests of patches successfully applied to the audiences.
+
+  An existing snapshot keeps its timestamp, so that audiences skipped as
+  unchanged are still compared with Google Analytics once it expires.
+
+  Args:
+    snapshot_key: Key identifying the audiences, e.g. the property ID and the
+      pipeline ID.
+    patches: List of audiences used as update patches.
+    name_field: Patch field identifying an audience.
+  """
+  blob = _get_snapshot_blob(snapshot_key)
+  if not blob:
+    return
+  snapshot = _load_audience_snapshot(blob)
+  timestamp = snapshot[0] if snapshot else time.time()
+  digests = {patch[name_field]: _get_patch_digest(patch) for patch in patches}
+  blob.custom_time = datetime.datetime.now(datetime.timezone.utc)
+  blob.upload_from_string(
+      json.dumps({'timestamp': timestamp, 'digests': digests}),
+      content_type='application/json')
+
+
 def fetch_audiences(ga_client: discovery.Resource,
                     account_id: str,
                     property_id: str) -> Mapping[str, Audience]:
@@ -274,10 +617,10 @@ def get_audience_operations(
   operations = []
   for patch in patches:
     target = audiences_map.get(patch['name'], None)
-    if target and utils.detect_patch_update(patch, target):
-      operations.append(AudienceOperationUpdate(id=target['id'], data=patch))
-    else:
+    if target is None:
       operations.append(AudienceOperationInsert(data=patch))
+    elif utils.detect_patch_update(patch, target):
+      operations.append(AudienceOperationUpdate(id=target['id'], data=patch))
   return operations
 
 
@@ -302,6 +645,7 @@ def run_audience_operations(
     ValueError: if the operation type is unsupported.
   """
   progress_callback = progress_callback or _null_progress_callback
+  requests = []
   for op in operations:
     if isinstance(op, AudienceOperationInsert):
       request = ga_client.management().remarketingAudience().insert(
@@ -318,7 +662,8 @@ def run_audience_operations(
       progress_callback(f'Updating existing audience for id: {op.id}')
     else:
       raise ValueError(f'Unsupported operation type: {op}')
-    retry.Retry()(request.execute)()
+    requests.append(request)
+  _execute_in_batches(ga_client, requests)
 
 
 def fetch_audiences_ga4(
@@ -378,11 +723,14 @@ def get_audience_operations_ga4(
                 f'delete the audience named '
                 f'"{target["displayName"]}" in GA4.',
                 log_level='WARNING')
-        # Removes immutable fields from the patch, since it's an update op.
-        update_patch = patch.copy()
-        for field in list(update_patch.keys()):
-          if field in _GA4_AUDIENCE_IMMUTABLE_FIELDS:
-            del update_patch[field]
+        # Only patches the changed fields, and keeps the display name which
+        # identifies the audience. Immutable fields cannot be updated.
+        update_patch = AudiencePatch({
+            field: value for field, value in patch.items()
+            if field not in _GA4_AUDIENCE_IMMUTABLE_FIELDS and (
+                field == 'displayName' or
+                utils.detect_patch_update(value, cleaned_target.get(field)))
+        })
         operations.append(AudienceOperationUpdate(
             id=target['name'], data=update_patch))
     else:
@@ -413,10 +761,8 @@ def run_audience_operations_ga4(
     ValueError: if the operation type is unsupported.
   """
   progress_callback = progress_callback or _null_progress_callback
+  requests = []
   for op in operations:
-    # Wait 1 second between operations to stay within Analytics Admin API quota.
-    # https://developers.google.com/analytics/devguides/config/admin/v1/quotas
-    time.sleep(1)
     if isinstance(op, AudienceOperationInsert):
       request = ga_client.properties().audiences().create(
           parent=f'properties/{ga_property_id}',
@@ -433,7 +779,11 @@ def run_audience_operations_ga4(
                         f'resource: {op.id}')
     else:
       raise ValueError(f'Unsupported operation type: {op}')
-    retry.Retry()(request.execute)()
+    requests.append(request)
+  _execute_in_batches(
+      ga_client,
+      requests,
+      max_requests_per_second=_GA4_ADMIN_MAX_REQUESTS_PER_SECOND)
 
 
 def create_custom_dimension_ga4(
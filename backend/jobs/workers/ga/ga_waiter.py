@@ -14,6 +14,7 @@
 
 """CRMint's worker that waits for various upload completions."""
 
+from common import task
 from jobs.workers import worker
 from jobs.workers.ga import ga_utils
 
@@ -28,12 +29,17 @@ class GADataImportUploadWaiter(worker.Worker):
        'GA Property Tracking ID (e.g. UA-12345-3)'),
       ('dataset_id', 'string', True, '',
        'GA Dataset ID (e.g. sLj2CuBTDFy6CedBJw)'),
+      ('upload_ids', 'string_list', False, '',
+       'IDs of the uploads to wait for (leave empty to wait for any)'),
   ]
 
+  PRIORITY = task.Priority.HIGH
+
   def _execute(self) -> None:
     """Executes worker's logic.
 
     Raises:
+      WorkerException: Raised when one of the uploads failed.
       ValueError: Raised when the upload status is unsupported.
     """
     client = ga_utils.get_client('analytics', 'v3')
@@ -41,10 +47,14 @@ class GADataImportUploadWaiter(worker.Worker):
         account_id=self._params['account_id'],
         property_id=self._params['property_id'],
         dataset_id=self._params['dataset_id'])
-    status = ga_utils.get_dataimport_upload_status(client, dataimport_ref)
+    status = ga_utils.get_dataimport_upload_status(
+        client, dataimport_ref, upload_ids=self._params['upload_ids'] or None)
     if status == ga_utils.UploadStatus.PENDING:
       self._enqueue('GADataImportUploadWaiter', self._params.copy(), 60)
     elif status == ga_utils.UploadStatus.COMPLETED:
       self.log_info('Finished successfully')
+    elif status == ga_utils.UploadStatus.FAILED:
+      raise worker.WorkerException(
+          f'Data Import upload failed for ids: {self._params["upload_ids"]}')
     else:
       raise ValueError(f'Unknown Data Import upload status: {status}')
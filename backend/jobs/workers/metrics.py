@@ -0,0 +1,232 @@
+# Copyright 2023 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Execution metrics of worker tasks.
+
+Metrics of the running task are recorded with `increment`, from the worker or
+from the helpers it calls, and aggregated by worker class and pipeline in a
+registry exported in the Prometheus text format. Metrics of each task, with
+its job, are logged as `TASK_METRICS` entries.
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import resource
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+# Counters recorded by workers and their helpers.
+ROWS_PROCESSED = 'rows_processed'
+API_CALLS = 'api_calls'
+BYTES_IN = 'bytes_in'
+BYTES_OUT = 'bytes_out'
+RETRIES = 'retries'
+ENQUEUED_WORKERS = 'enqueued_workers'
+
+_COUNTERS = (
+    ROWS_PROCESSED, API_CALLS, BYTES_IN, BYTES_OUT, RETRIES, ENQUEUED_WORKERS)
+
+_HELP = {
+    'tasks': 'Number of executed tasks.',
+    'wall_seconds': 'Wall time spent executing tasks.',
+    'cpu_seconds': 'CPU time spent by the threads executing tasks.',
+    'peak_rss_delta_bytes': (
+        'Largest growth of the instance peak memory during a task.'),
+    ROWS_PROCESSED: 'Number of rows processed by tasks.',
+    API_CALLS: 'Number of API calls made by tasks.',
+    BYTES_IN: 'Number of bytes read or downloaded by tasks.',
+    BYTES_OUT: 'Number of bytes written or uploaded by tasks.',
+    RETRIES: 'Number of retried API calls.',
+    ENQUEUED_WORKERS: 'Number of workers enqueued by tasks.',
+}
+
+
+def _get_peak_rss_bytes() -> int:
+  # Linux reports the maximum resident set size in kilobytes.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class TaskMetrics:
+  """Metrics of a single task execution."""
+
+  def __init__(self, worker_class: str, pipeline_id: int, job_id: int):
+    self.worker_class = worker_class
+    self.pipeline_id = pipeline_id
+    self.job_id = job_id
+    self.counters = collections.Counter({name: 0 for name in _COUNTERS})
+    self.wall_seconds = 0.0
+    self.cpu_seconds = 0.0
+    self.peak_rss_delta_bytes = 0
+    self.success = False
+    self._lock = threading.Lock()
+
+  def increment(self, counter: str, value: int = 1) -> None:
+    with self._lock:
+      self.counters[counter] += value
+
+  @contextlib.contextmanager
+  def measure(self) -> Iterator[None]:
+    """Measures the resources used by the task executed within the context.
+
+    CPU time only accounts for the calling thread, and the peak memory is the
+    one of the whole instance, shared with concurrent tasks.
+    """
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    start_peak_rss = _get_peak_rss_bytes()
+    try:
+      yield
+    finally:
+      self.wall_seconds = time.perf_counter() - start_wall
+      self.cpu_seconds = time.thread_time() - start_cpu
+      self.peak_rss_delta_bytes = _get_peak_rss_bytes() - start_peak_rss
+
+  def summary(self) -> dict[str, Any]:
+    """Returns the metrics as a structured log payload."""
+    with self._lock:
+      return {
+          'log_type': 'TASK_METRICS',
+          'success': self.success,
+          'wall_seconds': round(self.wall_seconds, 3),
+          'cpu_seconds': round(self.cpu_seconds, 3),
+          'peak_rss_delta_bytes': self.peak_rss_delta_bytes,
+          **self.counters,
+      }
+
+
+class Registry:
+  """Metrics aggregated by worker class and pipeline.
+
+  Jobs are not used as labels, since series are kept for the lifetime of the
+  instance and every new job would add series.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._totals = collections.defaultdict(collections.Counter)
+    self._tasks = collections.Counter()
+
+  def record(self, task_metrics: TaskMetrics) -> None:
+    labels = (task_metrics.worker_class, str(task_metrics.pipeline_id))
+    status = 'success' if task_metrics.success else 'failure'
+    with self._lock:
+      self._tasks[(*labels, status)] += 1
+      totals = self._totals[labels]
+      totals['wall_seconds'] += task_metrics.wall_seconds
+      totals['cpu_seconds'] += task_metrics.cpu_seconds
+      totals['peak_rss_delta_bytes'] = max(
+          totals['peak_rss_delta_bytes'], task_metrics.peak_rss_delta_bytes)
+      totals.update(task_metrics.counters)
+
+  def export(self) -> str:
+    """Returns the metrics in the Prometheus text exposition format."""
+    lines = []
+    with self._lock:
+      lines.extend(_format_family(
+          'crmint_tasks_total', 'tasks', 'counter',
+          {(('worker_class', w), ('pipeline_id', p), ('status', s)): count
+           for (w, p, s), count in sorted(self._tasks.items())}))
+      for name in ('wall_seconds', 'cpu_seconds', 'peak_rss_delta_bytes',
+                   *_COUNTERS):
+        if name == 'peak_rss_delta_bytes':
+          metric_name, metric_type = f'crmint_task_{name}', 'gauge'
+        else:
+          metric_name, metric_type = f'crmint_task_{name}_total', 'counter'
+        lines.extend(_format_family(
+            metric_name, name, metric_type,
+            {(('worker_class', w), ('pipeline_id', p)): totals[name]
+             for (w, p), totals in sorted(self._totals.items())}))
+    return '\n'.join(lines) + '\n'
+
+
+def _format_family(metric_name: str,
+                   name: str,
+                   metric_type: str,
+                   samples: dict[tuple[tuple[str, str], ...], float]
+                   ) -> list[str]:
+  lines = [
+      f'# HELP {metric_name} {_HELP[name]}',
+      f'# TYPE {metric_name} {metric_type}',
+  ]
+  for labels, value in samples.items():
+    formatted_labels = ','.join(
+        f'{k}="{_escape_label_value(v)}"' for k, v in labels)
+    lines.append(f'{metric_name}{{{formatted_labels}}} {value:g}')
+  return lines
+
+
+def _escape_label_value(value: str) -> str:
+  return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+_current_task: contextvars.ContextVar[Optional[TaskMetrics]] = (
+    contextvars.ContextVar('current_task', default=None))
+
+
+@contextlib.contextmanager
+def record_task(task_metrics: TaskMetrics) -> Iterator[TaskMetrics]:
+  """Makes the task metrics current within the context, then registers them.
+
+  Args:
+    task_metrics: Metrics of the task executed within the context.
+
+  Yields:
+    The task metrics.
+  """
+  token = _current_task.set(task_metrics)
+  try:
+    with task_metrics.measure():
+      yield task_metrics
+  finally:
+    _current_task.reset(token)
+    registry.record(task_metrics)
+
+
+def increment(counter: str, value: int = 1) -> None:
+  """Increments a counter of the current task, if any.
+
+  Args:
+    counter: Name of the counter, e.g. `metrics.API_CALLS`.
+    value: Value to add to the counter.
+  """
+  task_metrics = _current_task.get()
+  if task_metrics is not None:
+    task_metrics.increment(counter, value)
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+  """Returns a callable recording metrics for the current task.
+
+  Threads do not inherit the current task, callables submitted to thread
+  pools by workers are wrapped to attribute their metrics to the task.
+
+  Args:
+    fn: Callable to run in another thread.
+  """
+  task_metrics = _current_task.get()
+
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    token = _current_task.set(task_metrics)
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      _current_task.reset(token)
+
+  return wrapper
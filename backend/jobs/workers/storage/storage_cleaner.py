@@ -38,11 +38,14 @@ class StorageCleaner(worker.Worker):
     now_dt = datetime.datetime.now(tz=datetime.timezone.utc)
     client = storage.Client()
     blobs = storage_utils.get_matching_blobs(client, self._params['file_uris'])
+    expired_blobs = []
     for blob in blobs:
       # NB: `blob.updated` contains the datetime of last updates.
       last_update_dt = blob.updated
       if not last_update_dt.tzinfo:
         last_update_dt = last_update_dt.replace(tzinfo=datetime.timezone.utc)
       if (now_dt - last_update_dt) > max_delta:
-        blob.delete()
-        self.log_info(f'Deleted file at gs://{blob.bucket.name}/{blob.name}')
+        expired_blobs.append(blob)
+    storage_utils.delete_blobs(client, expired_blobs)
+    for blob in expired_blobs:
+      self.log_info(f'Deleted file at gs://{blob.bucket.name}/{blob.name}')
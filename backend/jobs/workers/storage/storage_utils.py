@@ -15,16 +15,51 @@
 """Utilities for storage workers."""
 
 import collections
+from concurrent import futures
 import fnmatch
-from typing import Iterable, Sequence
+import json
+import re
+from typing import Any, Iterable, Mapping, Optional, Sequence
 
+from google.api_core import exceptions
 from google.cloud import storage
 
+# Characters starting a wildcard in blob name patterns.
+_WILDCARD_CHARS = ('*', '?', '[')
+
+# Maximum number of calls in a batch request, as recommended by Cloud Storage.
+_DELETE_BATCH_SIZE = 100
+
+# Maximum number of batch requests sent concurrently.
+_MAX_CONCURRENT_BATCHES = 8
+
+
+def _get_pattern_prefix(pattern: str) -> str:
+  """Returns the literal start of a blob name pattern, before any wildcard."""
+  indices = [pattern.index(char) for char in _WILDCARD_CHARS if char in pattern]
+  return pattern[:min(indices)] if indices else pattern
+
+
+def _get_listing_prefixes(patterns: Iterable[str]) -> list[str]:
+  """Returns the fewest blob name prefixes covering all the given patterns."""
+  prefixes = []
+  for prefix in sorted(set(_get_pattern_prefix(p) for p in patterns)):
+    # Sorting puts prefixes right after the shorter prefixes they start with.
+    if not prefixes or not prefix.startswith(prefixes[-1]):
+      prefixes.append(prefix)
+  return prefixes
+
 
 def get_matching_blobs(client: storage.Client,
                        uri_patterns: Iterable[str]) -> Sequence[storage.Blob]:
   """Returns a list of Blob from matching uri patterns on GCS.
 
+  Blobs are listed server-side from the literal prefix of each pattern, then
+  matched against all the patterns of their bucket at once. Matching is not
+  delegated to the `match_glob` listing option, which needs
+  google-cloud-storage 2.10 and where `*` stops at `/` unlike in the fnmatch
+  patterns users already rely on.
+
   Args:
     client: An instance of `google.cloud.storage.Client`.
     uri_patterns: Iterable of strings representing GCS paths, can contain
@@ -37,16 +72,55 @@ def get_matching_blobs(client: storage.Client,
     bucket_to_pattern_map[bucket_name].append(blob_name_pattern)
 
   blobs = []
-  for bucket_name in bucket_to_pattern_map:
+  for bucket_name, patterns in bucket_to_pattern_map.items():
+    matcher = re.compile('|'.join(fnmatch.translate(p) for p in patterns))
     bucket = storage.Bucket(client, bucket_name)
-    for blob in client.list_blobs(bucket):
-      for blob_name_pattern in bucket_to_pattern_map[bucket_name]:
-        if fnmatch.fnmatch(blob.name, blob_name_pattern):
+    for prefix in _get_listing_prefixes(patterns):
+      for blob in client.list_blobs(bucket, prefix=prefix):
+        if matcher.match(blob.name):
           blobs.append(blob)
-          break
   return blobs
 
 
+def delete_blobs(client: storage.Client,
+                 blobs: Sequence[storage.Blob]) -> None:
+  """Deletes blobs on GCS using concurrent batch requests.
+
+  Blobs already deleted are ignored.
+
+  Args:
+    client: An instance of `google.cloud.storage.Client`.
+    blobs: Sequence of blobs to delete.
+  """
+  def _delete_blob(blob: storage.Blob) -> None:
+    try:
+      blob.delete(client=client)
+    except exceptions.NotFound:
+      pass
+
+  def _delete_batch(batch_blobs: Sequence[storage.Blob]) -> None:
+    # Batches are stacked per thread on the client, which makes it safe to
+    # share the client across threads.
+    try:
+      with client.batch():
+        for blob in batch_blobs:
+          blob.delete(client=client)
+    except exceptions.NotFound:
+      # A batch only raises the error of its first failed call, so blobs are
+      # deleted one by one to never hide another error behind a NotFound.
+      for blob in batch_blobs:
+        _delete_blob(blob)
+
+  batches = [
+      blobs[i:i + _DELETE_BATCH_SIZE]
+      for i in range(0, len(blobs), _DELETE_BATCH_SIZE)
+  ]
+  with futures.ThreadPoolExecutor(
+      max_workers=_MAX_CONCURRENT_BATCHES) as executor:
+    # Consumes results to raise the first exception met, if any.
+    list(executor.map(_delete_batch, batches))
+
+
 def get_matched_uris(client: storage.Client,
                      uri_patterns: Iterable[str]) -> Sequence[str]:
   """Matches blob uris from given GCS uri patterns.
@@ -63,6 +137,70 @@ def get_matched_uris(client: storage.Client,
   return [f'gs://{b.bucket.name}/{b.name}' for b in blobs]
 
 
+def write_manifest(client: storage.Client,
+                   manifest_uri: str,
+                   shards: Optional[Sequence[Mapping[str, Any]]] = None,
+                   **fields: Any) -> None:
+  """Writes a JSON manifest listing the files matching each shard's uri.
+
+  Args:
+    client: An instance of `google.cloud.storage.Client`.
+    manifest_uri: GCS path of the manifest file to write.
+    shards: Optional sequence of shard descriptions, each with a `uri`
+      pattern.
+    **fields: Additional fields to write at the top level of the manifest.
+  """
+  manifest = dict(fields)
+  if shards is not None:
+    uris = sorted(
+        get_matched_uris(client, [shard['uri'] for shard in shards]))
+    manifest['shards'] = []
+    for shard in shards:
+      matcher = re.compile(fnmatch.translate(shard['uri']))
+      manifest['shards'].append(
+          dict(shard, files=[uri for uri in uris if matcher.match(uri)]))
+  manifest_uri = manifest_uri.removeprefix('gs://')
+  bucket_name, blob_name = manifest_uri.split('/', 1)
+  blob = client.bucket(bucket_name).blob(blob_name)
+  blob.upload_from_string(
+      json.dumps(manifest, indent=2), content_type='application/json')
+
+
+def read_manifest(client: storage.Client,
+                  manifest_uri: str) -> Optional[dict[str, Any]]:
+  """Returns the content of a JSON manifest, or None if it does not exist.
+
+  Args:
+    client: An instance of `google.cloud.storage.Client`.
+    manifest_uri: GCS path of the manifest file to read.
+  """
+  manifest_uri = manifest_uri.removeprefix('gs://')
+  bucket_name, blob_name = manifest_uri.split('/', 1)
+  blob = client.bucket(bucket_name).get_blob(blob_name)
+  if blob is None:
+    return None
+  return json.loads(blob.download_as_bytes())
+
+
+def get_blob(client: storage.Client, uri_path: str) -> storage.Blob:
+  """Returns the blob at a given GCS uri, with its metadata loaded.
+
+  Args:
+    client: An instance of `google.cloud.storage.Client`.
+    uri_path: Path to the Google Cloud Storage file.
+
+  Raises:
+    ValueError: if the file cannot be found on GCS.
+  """
+  uri_path = uri_path.removeprefix('gs://')
+  bucket_name, blob_name = uri_path.split('/', 1)
+  bucket = client.bucket(bucket_name)
+  blob = bucket.get_blob(blob_name)
+  if blob is None:
+    raise ValueError(f'Blob not found for uri: {uri_path}')
+  return blob
+
+
 def download_file(client: storage.Client,
                   *,
                   uri_path: str,
@@ -77,10 +215,5 @@ def download_file(client: storage.Client,
   Raises:
     ValueError: if the file cannot be found on GCS.
   """
-  uri_path = uri_path.removeprefix('gs://')
-  bucket_name, blob_name = uri_path.split('/', 1)
-  bucket = client.bucket(bucket_name)
-  source_blob = bucket.get_blob(blob_name)
-  if source_blob is None:
-    raise ValueError(f'Blob not found for uri: {uri_path}')
+  source_blob = get_blob(client, uri_path)
   source_blob.download_to_filename(destination_path)
@@ -14,12 +14,43 @@
 
 """CRMint's worker executing Vertex AI batch predictions to BigQuery."""
 
+from concurrent import futures
+import datetime
+
 from google.cloud import aiplatform
+from google.cloud import bigquery
+
+from jobs.workers import worker
+from jobs.workers.bigquery import bq_worker
 from jobs.workers.vertexai import vertexai_worker
 
+# Column of the sharded input table holding the shard of each row.
+SHARD_COLUMN = 'crmint_shard'
+
+# Hidden parameter of the sharding step run by a task, set once the previous
+# step's BigQuery jobs are done.
+_SHARD_STEP_PARAM = 'shard_step'
+_COPY_SHARDS_STEP = 'copy_shards'
+_PREDICT_SHARDS_STEP = 'predict_shards'
+
+# Number of hours before intermediate shard tables expire, in case the
+# pipeline stops before deleting them.
+_SHARD_TABLES_TTL_HOURS = 24
 
-class VertexAIBatchPredictorToBQ(vertexai_worker.VertexAIWorker):
-  """Worker to train a Vertex AI AutoML model using a Vertex dataset."""
+# Maximum number of batch prediction jobs created concurrently.
+_MAX_CONCURRENT_JOB_CREATIONS = 8
+
+
+class VertexAIBatchPredictorToBQ(vertexai_worker.VertexAIWorker,
+                                 bq_worker.BQWorker):
+  """Worker to train a Vertex AI AutoML model using a Vertex dataset.
+
+  Large tables can be split in shards by hashing a unique ID column, each
+  shard being scored by a concurrent batch prediction job. Predictions of all
+  shards are then merged into a single destination table. BigQuery jobs of
+  each sharding step are waited for by a `BQWaiter`, which then enqueues the
+  next step.
+  """
 
   PARAMS = [
       ('vertexai_model_name', 'string', True, '', 'Vertex AI Model Name'),
@@ -30,48 +61,205 @@ class VertexAIBatchPredictorToBQ(vertexai_worker.VertexAIWorker):
       ('bq_dataset_id', 'string', True, '', 'BQ Dataset ID'),
       ('bq_table_id', 'string', True, '', 'BQ Table ID'),
       ('clean_up', 'boolean', True, True, 'Clean Up'),
+      ('shard_count', 'number', False, 1,
+       'Number of shards scored by concurrent batch prediction jobs'),
+      ('shard_id_column', 'string', False, '',
+       'Unique ID column hashed to split the table in shards'),
+      ('bq_destination_table_id', 'string', False, '',
+       ('BQ Table ID merging the predictions of all shards (defaults to the '
+        'BQ Table ID suffixed with _predictions)')),
+      ('machine_type', 'string', False, '',
+       ('Machine type of prediction jobs, required to set replica counts '
+        '(e.g. n1-standard-4, leave empty for the Vertex AI default)')),
+      ('starting_replica_count', 'number', False, 0,
+       'Starting number of machines per job (0 for the Vertex AI default)'),
+      ('max_replica_count', 'number', False, 0,
+       'Maximum number of machines per job (0 for the Vertex AI default)'),
   ]
 
   def _get_model(self, model_client, vertexai_region, vertexai_model_name):
-    parent_resource = self._get_parent_resource(vertexai_region)
-    models = model_client.list_models({
-        'parent': parent_resource,
-        'filter': f'display_name="{vertexai_model_name}"',
-        'order_by': 'create_time desc'})
-    for m in models:
-      return aiplatform.Model(model_name=m.name)
+    models = self._list_resources(
+        model_client.list_models,
+        self._get_parent_resource(vertexai_region),
+        vertexai_model_name,
+        order_by='create_time desc')
+    latest_model = next(iter(models), None)
+    if latest_model:
+      return aiplatform.Model(model_name=latest_model.name)
     return None
 
+  def _create_batch_prediction_job(self, job_client, model, display_name,
+                                   bigquery_source):
+    """Creates a batch prediction job, returns it right away.
+
+    The job is created with the Vertex AI API directly, since the SDK batch
+    prediction jobs keep a thread polling the job until it completes.
+    """
+    project_id = self._params['bq_project_id']
+    dataset_id = self._params['bq_dataset_id']
+    batch_prediction_job = {
+        'display_name': display_name,
+        'model': model.resource_name,
+        'input_config': {
+            'instances_format': 'bigquery',
+            'bigquery_source': {'input_uri': bigquery_source},
+        },
+        'output_config': {
+            'predictions_format': 'bigquery',
+            'bigquery_destination': {
+                'output_uri': f'bq://{project_id}:{dataset_id}',
+            },
+        },
+    }
+    if self._params['machine_type']:
+      dedicated_resources = {
+          'machine_spec': {'machine_type': self._params['machine_type']},
+      }
+      if self._params['starting_replica_count']:
+        dedicated_resources['starting_replica_count'] = int(
+            self._params['starting_replica_count'])
+      if self._params['max_replica_count']:
+        dedicated_resources['max_replica_count'] = int(
+            self._params['max_replica_count'])
+      batch_prediction_job['dedicated_resources'] = dedicated_resources
+    return job_client.create_batch_prediction_job(
+        parent=self._get_parent_resource(self._params['vertexai_region']),
+        batch_prediction_job=batch_prediction_job)
+
+  def _enqueue_next_step(self, jobs, step, tables_to_delete=None, **params):
+    """Waits for the jobs in a `BQWaiter`, then runs the next step."""
+    self._enqueue(
+        'BQWaiter', {
+            'job_ids': [job.job_id for job in jobs],
+            'location': jobs[0].location,
+            'tables_to_delete': tables_to_delete or [],
+            'next_worker_class': self.__class__.__name__,
+            'next_worker_params': {
+                **self._params, _SHARD_STEP_PARAM: step, **params},
+        }, 30)
+
+  def _get_table_name(self):
+    return (f'{self._params["bq_project_id"]}.{self._params["bq_dataset_id"]}.'
+            f'{self._params["bq_table_id"]}')
+
+  def _split_in_shards(self, bq_client):
+    """Starts reading the table into a table partitioned by shard."""
+    table_name = self._get_table_name()
+    shard_count = int(self._params['shard_count'])
+    id_column = self._params['shard_id_column']
+    query = (
+        f'CREATE OR REPLACE TABLE `{table_name}_{SHARD_COLUMN}s` '
+        f'PARTITION BY RANGE_BUCKET({SHARD_COLUMN}, '
+        f'GENERATE_ARRAY(0, {shard_count}, 1)) '
+        f'OPTIONS (expiration_timestamp = '
+        f'TIMESTAMP_ADD(CURRENT_TIMESTAMP(), '
+        f'INTERVAL {_SHARD_TABLES_TTL_HOURS} HOUR)) AS '
+        f'SELECT *, MOD(ABS(FARM_FINGERPRINT(CAST(`{id_column}` AS STRING))), '
+        f'{shard_count}) AS {SHARD_COLUMN} '
+        f'FROM `{table_name}`')
+    job = self._query(bq_client, query)
+    self.log_info(f'Splitting the table in #{shard_count} shards')
+    self._enqueue_next_step([job], _COPY_SHARDS_STEP)
+
+  def _copy_shards(self, bq_client):
+    """Starts copying each partition into its own table, free of charge."""
+    table_name = self._get_table_name()
+    sharded_table_name = f'{table_name}_{SHARD_COLUMN}s'
+    shard_table_names = [
+        f'{table_name}_shard_{i}'
+        for i in range(int(self._params['shard_count']))
+    ]
+    expiration_time = datetime.datetime.now(
+        datetime.timezone.utc) + datetime.timedelta(
+            hours=_SHARD_TABLES_TTL_HOURS)
+    copy_job_config = bigquery.CopyJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    copy_job_config.destination_expiration_time = expiration_time.isoformat()
+    copy_jobs = [
+        bq_client.copy_table(
+            f'{sharded_table_name}${i}',
+            shard_table_name,
+            job_id_prefix=self._get_prefix(),
+            job_config=copy_job_config)
+        for i, shard_table_name in enumerate(shard_table_names)
+    ]
+    self._enqueue_next_step(
+        copy_jobs,
+        _PREDICT_SHARDS_STEP,
+        tables_to_delete=[sharded_table_name],
+        shard_table_names=shard_table_names)
+
+  def _predict_shards(self, model, job_client, batch_prediction_name):
+    """Scores shards of the table with concurrent batch prediction jobs."""
+    project_id = self._params['bq_project_id']
+    dataset_id = self._params['bq_dataset_id']
+    table_id = self._params['bq_table_id']
+    vertexai_region = self._params['vertexai_region']
+    shard_table_names = self._params['shard_table_names']
+    self.log_info(f'Split the table in #{len(shard_table_names)} shards')
+
+    def _predict_shard(shard):
+      index, shard_table_name = shard
+      display_name = f'{batch_prediction_name}-shard-{index}'
+      if self._params['clean_up']:
+        self._clean_up_batch_predictions(
+            job_client, project_id, vertexai_region, display_name)
+      job = self._create_batch_prediction_job(
+          job_client, model, display_name, f'bq://{shard_table_name}')
+      return job.name
+
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_JOB_CREATIONS) as executor:
+      job_names = list(
+          executor.map(_predict_shard, enumerate(shard_table_names)))
+    destination_table_id = (
+        self._params['bq_destination_table_id'] or f'{table_id}_predictions')
+    self._enqueue(
+        'VertexAIWaiter', {
+            'ids': job_names,
+            'worker_class': 'VertexAIBatchPredictorToBQ',
+            'destination_table':
+                f'{project_id}.{dataset_id}.{destination_table_id}',
+            'tables_to_delete': shard_table_names,
+        }, 60)
+
   def _execute(self):
-    aiplatform.init(
-        project=self._get_project_id(),
-        location=self._params['vertexai_region'])
     project_id = self._params['bq_project_id']
     dataset_id = self._params['bq_dataset_id']
     table_id = self._params['bq_table_id']
     vertexai_region = self._params['vertexai_region']
+    sharded = int(self._params['shard_count']) > 1
+    shard_step = self._params.get(_SHARD_STEP_PARAM)
+    if sharded and not self._params['shard_id_column']:
+      raise worker.WorkerException(
+          'A unique ID column is needed to split the table in shards')
+    if shard_step == _COPY_SHARDS_STEP:
+      self._copy_shards(bigquery.Client(project=project_id))
+      return
+    aiplatform.init(
+        project=self._get_project_id(),
+        location=self._params['vertexai_region'])
     model_client = self._get_vertexai_model_client(vertexai_region)
     model = self._get_model(model_client, vertexai_region,
                             self._params['vertexai_model_name'])
     if model is None:
       self.log_info('No model found. Please try again.')
       return
+    if sharded and shard_step != _PREDICT_SHARDS_STEP:
+      self._split_in_shards(bigquery.Client(project=project_id))
+      return
     job_client = self._get_vertexai_job_client(vertexai_region)
     batch_prediction_name = self._params['vertexai_batch_prediction_name']
-    if batch_prediction_name is None:
+    if not batch_prediction_name:
       batch_prediction_name = f'{project_id}.{dataset_id}.{table_id}'
+    if sharded:
+      self._predict_shards(model, job_client, batch_prediction_name)
+      return
     if self._params['clean_up']:
       self._clean_up_batch_predictions(job_client, project_id, vertexai_region,
                                        batch_prediction_name)
-    job = model.batch_predict(
-        job_display_name=f'{batch_prediction_name}',
-        instances_format='bigquery',
-        predictions_format='bigquery',
-        bigquery_source=f'bq://{project_id}.{dataset_id}.{table_id}',
-        bigquery_destination_prefix=f'bq://{project_id}:{dataset_id}',
-        sync=False)
-    job.wait_for_resource_creation()
-    batch_prediction_name = job.resource_name
-    batch_prediction_job = self._get_batch_prediction_job(
-        job_client, batch_prediction_name)
-    self._wait_for_job(batch_prediction_job)
+    job = self._create_batch_prediction_job(
+        job_client, model, batch_prediction_name,
+        f'bq://{project_id}.{dataset_id}.{table_id}')
+    self.log_info(f'Created batch prediction: {job.name}')
+    self._wait_for_job(job)
@@ -14,6 +14,8 @@
 
 """CRMint's worker executing Vertex AI tabular training."""
 
+import itertools
+
 from google.cloud import aiplatform
 from jobs.workers.vertexai import vertexai_worker
 
@@ -34,52 +36,82 @@ class VertexAITabularTrainer(vertexai_worker.VertexAIWorker):
   ]
 
   def _get_vertexai_tabular_dataset(self, dataset_client, vertexai_region):
-    display_name = self._params['vertexai_dataset_name']
-    parent_resource = self._get_parent_resource(vertexai_region)
-    dataset = dataset_client.list_datasets({
-        'parent': parent_resource,
-        'filter': f'display_name="{display_name}"'})
-    if len(list(dataset)) > 1:
-      dataset = dataset_client.list_datasets({
-          'parent': parent_resource,
-          'filter': f'display_name="{display_name}"',
-          'order_by': 'create_time desc'})
-    if dataset:
-      first_dataset = list(dataset)[0]
-      return aiplatform.TabularDataset(dataset_name=first_dataset.name)
+    datasets = self._list_resources(
+        dataset_client.list_datasets,
+        self._get_parent_resource(vertexai_region),
+        self._params['vertexai_dataset_name'],
+        order_by='create_time desc')
+    latest_dataset = next(iter(datasets), None)
+    if latest_dataset:
+      return aiplatform.TabularDataset(dataset_name=latest_dataset.name)
     return None
 
   def _clean_up_models(self, model_client, vertexai_region,
                        vertexai_model_name):
-    parent_resource = self._get_parent_resource(vertexai_region)
     try:
-      models = model_client.list_models({
-          'parent': parent_resource,
-          'filter': f'display_name={vertexai_model_name}',
-          'order_by': 'create_time asc'})
-      if models:
-        for model in list(models)[:-1]:
-          model_client.delete_model({'name': model.name})
-          self.log_info(f'Deleted model: {model.name}')
+      models = self._list_resources(
+          model_client.list_models,
+          self._get_parent_resource(vertexai_region),
+          vertexai_model_name,
+          order_by='create_time desc')
+      # Keeps the latest model.
+      model_names = [model.name for model in itertools.islice(models, 1, None)]
     except Exception as e:
       self.log_info(f'Exception: {e}')
+      return
+
+    def _delete_model(model_name):
+      try:
+        model_client.delete_model({'name': model_name})
+        self.log_info(f'Deleted model: {model_name}')
+      except Exception as e:
+        self.log_info(f'Exception: {e}')
 
-  def _create_automl_tabular_training_job(
-      self, vertexai_model_name, prediction_type):
-    return aiplatform.AutoMLTabularTrainingJob(
-        display_name=f'{vertexai_model_name}',
-        optimization_prediction_type=f'{prediction_type}')
+    self._run_clean_ups(_delete_model, model_names)
+
+  def _create_training_pipeline(self, pipeline_client, vertexai_region,
+                                dataset):
+    """Creates an AutoML tabular training pipeline, returns it right away.
+
+    The pipeline is created with the Vertex AI API directly, since the SDK
+    training jobs keep a thread polling the pipeline until training ends.
+    """
+    target_column = self._params['target_column']
+    vertexai_model_name = self._params['vertexai_model_name']
+    transformations = [
+        {'auto': {'column_name': column_name}}
+        for column_name in dataset.column_names
+        if column_name != target_column
+    ]
+    return pipeline_client.create_training_pipeline(
+        parent=self._get_parent_resource(vertexai_region),
+        training_pipeline={
+            'display_name': vertexai_model_name,
+            'training_task_definition':
+                aiplatform.schema.training_job.definition.automl_tabular,
+            'training_task_inputs': {
+                'targetColumn': target_column,
+                'predictionType': self._params['prediction_type'],
+                'transformations': transformations,
+                'trainBudgetMilliNodeHours':
+                    self._params['budget_hours'] * 1000,
+                'disableEarlyStopping': False,
+            },
+            'input_data_config': {'dataset_id': dataset.name},
+            # Same alias as the SDK sets for `is_default_version=True`.
+            'model_to_upload': {
+                'display_name': vertexai_model_name,
+                'version_aliases': ['default'],
+            },
+        })
 
   def _execute(self):
     aiplatform.init(
         project=self._get_project_id(),
         location=self._params['vertexai_region'])
     project_id = self._params['project_id']
-    budget_hours = self._params['budget_hours']
-    target_column = self._params['target_column']
     vertexai_model_name = self._params['vertexai_model_name']
     vertexai_region = self._params['vertexai_region']
-    prediction_type = self._params['prediction_type']
     vertexai_dataset_name = self._params['vertexai_dataset_name']
     dataset_client = self._get_vertexai_dataset_client(vertexai_region)
     pipeline_client = self._get_vertexai_pipeline_client(vertexai_region)
@@ -93,18 +125,7 @@ class VertexAITabularTrainer(vertexai_worker.VertexAIWorker):
       self._clean_up_training_pipelines(
           pipeline_client, project_id, vertexai_region, vertexai_model_name)
       self._clean_up_models(model_client, vertexai_region, vertexai_model_name)
-    job = self._create_automl_tabular_training_job(
-        vertexai_model_name, prediction_type)
-    formatted_budget_hours = budget_hours * 1000
-    job.run(
-        dataset=dataset,
-        target_column=f'{target_column}',
-        budget_milli_node_hours=formatted_budget_hours,
-        model_display_name=f'{vertexai_model_name}',
-        is_default_version=True,
-        disable_early_stopping=False,
-        sync=False)
-    job.wait_for_resource_creation()
-    pipeline_name = job.resource_name
-    pipeline = self._get_training_pipeline(pipeline_client, pipeline_name)
+    pipeline = self._create_training_pipeline(
+        pipeline_client, vertexai_region, dataset)
+    self.log_info(f'Created training pipeline: {pipeline.name}')
     self._wait_for_pipeline(pipeline)
@@ -14,15 +14,25 @@
 
 """CRMint's worker that waits for a Vertex AI job completion."""
 
+from google.cloud import bigquery
 from google.cloud.aiplatform_v1.types import job_state as js
 from google.cloud.aiplatform_v1.types import pipeline_state as ps
 
+from common import task
 from jobs.workers import worker
+from jobs.workers.bigquery import bq_worker
+from jobs.workers.vertexai import vertexai_batch_predictor_to_bq
 from jobs.workers.vertexai import vertexai_worker
 
 
-class VertexAIWaiter(vertexai_worker.VertexAIWorker):
-  """Worker that polls job status and respawns itself if the job is not done."""
+class VertexAIWaiter(vertexai_worker.VertexAIWorker, bq_worker.BQWorker):
+  """Worker that polls job status and respawns itself if the job is not done.
+
+  Predictions of sharded batch prediction jobs are merged by a query, waited
+  for by a `BQWaiter` which then deletes the intermediate tables.
+  """
+
+  PRIORITY = task.Priority.HIGH
 
   def _execute_tabular_trainer(self):
     pipeline_name = self._params['id']
@@ -39,20 +49,56 @@ class VertexAIWaiter(vertexai_worker.VertexAIWorker):
     elif pipeline.state == ps.PipelineState.PIPELINE_STATE_SUCCEEDED:
       self.log_info('Finished successfully!')
 
+  def _merge_batch_predictions(self, jobs):
+    """Starts merging the output tables of sharded jobs into one table."""
+    output_tables = []
+    for job in jobs:
+      output_dataset = job.output_info.bigquery_output_dataset
+      output_tables.append(f'{output_dataset.removeprefix("bq://")}.'
+                           f'{job.output_info.bigquery_output_table}')
+    destination_table = self._params['destination_table']
+    shard_column = vertexai_batch_predictor_to_bq.SHARD_COLUMN
+    query = f'CREATE OR REPLACE TABLE `{destination_table}` AS ' + (
+        ' UNION ALL '.join(
+            f'SELECT * EXCEPT ({shard_column}) FROM `{table}`'
+            for table in output_tables))
+    client = bigquery.Client(project=destination_table.split('.')[0])
+    job = self._query(client, query)
+    self.log_info(f'Merging predictions of #{len(jobs)} shards into '
+                  f'{destination_table}')
+    self._enqueue(
+        'BQWaiter', {
+            'job_id': job.job_id,
+            'location': job.location,
+            'tables_to_delete':
+                output_tables + self._params.get('tables_to_delete', []),
+        }, 30)
+
   def _execute_batch_predictor(self):
-    job_name = self._params['id']
-    location = self._get_location_from_job_name(job_name)
+    job_names = self._params.get('ids') or [self._params['id']]
+    location = self._get_location_from_job_name(job_names[0])
     client = self._get_vertexai_job_client(location)
-    job = self._get_batch_prediction_job(client, job_name)
-    if job.state == js.JobState.JOB_STATE_FAILED:
-      raise worker.WorkerException(f'Job {job.name} failed.')
-    elif job.state != js.JobState.JOB_STATE_SUCCEEDED:
-      self._enqueue('VertexAIWaiter', {
-          'id': self._params['id'],
-          'worker_class': 'VertexAIBatchPredictorToBQ'
-      }, 60)
-    elif job.state == js.JobState.JOB_STATE_SUCCEEDED:
-      self.log_info('Finished successfully!')
+    jobs = [
+        self._get_batch_prediction_job(client, job_name)
+        for job_name in job_names
+    ]
+    for job in jobs:
+      if job.state == js.JobState.JOB_STATE_FAILED:
+        raise worker.WorkerException(f'Job {job.name} failed.')
+    if any(job.state != js.JobState.JOB_STATE_SUCCEEDED for job in jobs):
+      if 'ids' in self._params:
+        params = self._params.copy()
+      else:
+        params = {
+            'id': self._params['id'],
+            'worker_class': 'VertexAIBatchPredictorToBQ'
+        }
+      self._enqueue('VertexAIWaiter', params, 60)
+    else:
+      if self._params.get('destination_table'):
+        self._merge_batch_predictions(jobs)
+      else:
+        self.log_info('Finished successfully!')
 
   def _execute(self):
     if self._params['worker_class'] == 'VertexAIBatchPredictorToBQ':
@@ -14,7 +14,8 @@
 
 """CRMint's abstract worker dealing with Vertex AI."""
 
-import time
+from concurrent import futures
+import itertools
 
 import google.auth
 
@@ -38,10 +39,43 @@ _JOB_COMPLETE_STATES = frozenset([
     js.JobState.JOB_STATE_CANCELLED,
     js.JobState.JOB_STATE_PAUSED])
 
+# Maximum number of clean up requests sent concurrently.
+_MAX_CONCURRENT_CLEAN_UPS = 8
+
+# Number of resources per page of list requests, the maximum on Vertex AI.
+_LIST_PAGE_SIZE = 100
+
+
+class _LazyResourceList:
+  """Resources returned by a list request, with pages fetched once on demand.
+
+  Pages are only requested as resources are iterated over, so reading the
+  latest resource of a list ordered by creation time costs a single request.
+  """
+
+  def __init__(self, pager):
+    self._resources = iter(pager)
+    self._fetched = []
+
+  def __iter__(self):
+    index = 0
+    while True:
+      if index == len(self._fetched):
+        try:
+          self._fetched.append(next(self._resources))
+        except StopIteration:
+          return
+      yield self._fetched[index]
+      index += 1
+
 
 class VertexAIWorker(worker.Worker):
   """Worker that polls job status and respawns itself if the job is not done."""
 
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._listed_resources = {}
+
   def _get_vertexai_job_client(self, location):
     api_endpoint = f'{location}-aiplatform.googleapis.com'
     client_options = {'api_endpoint': api_endpoint}
@@ -82,104 +116,148 @@ class VertexAIWorker(worker.Worker):
     project_id = self._get_project_id()
     return f'projects/{project_id}/locations/{location}'
 
+  def _list_resources(self, list_method, parent, display_name, order_by=None):
+    """Lists resources by display name, memoized for the task.
+
+    A single filtered request is sent per resource type, parent and display
+    name, whichever the number of lookups during the task.
+
+    Args:
+      list_method: Client method listing resources, e.g.
+        `dataset_client.list_datasets`.
+      parent: Parent resource, e.g. `projects/my-project/locations/us-east1`.
+      display_name: Display name of the listed resources.
+      order_by: Optional ordering done by Vertex AI, e.g. `create_time desc`.
+        Training pipelines and batch prediction jobs cannot be ordered.
+
+    Returns:
+      An iterable over the listed resources, fetching pages lazily.
+    """
+    key = (list_method.__name__, parent, display_name, order_by)
+    if key not in self._listed_resources:
+      request = {
+          'parent': parent,
+          'filter': f'display_name="{display_name}"',
+          'page_size': _LIST_PAGE_SIZE,
+      }
+      if order_by:
+        request['order_by'] = order_by
+      self._listed_resources[key] = _LazyResourceList(list_method(request))
+    return self._listed_resources[key]
+
   def _wait_for_pipeline(self, pipeline):
-    """Waits for pipeline completion.
+    """Checks pipeline completion and relays to VertexAIWaiter if running.
 
-    It will relay to VertexAIWaiter if it takes too long.
+    Waiting is delegated right away instead of sleeping in the request, so the
+    jobs instance is freed while the training pipeline is running.
     """
-    delay = 5
-    waiting_time = 5
-    time.sleep(delay)
-    while pipeline.state not in _PIPELINE_COMPLETE_STATES:
-      if waiting_time > 300:  # Once 5 minute has passed, spawn VertexAIWaiter.
-        self._enqueue(
-            'VertexAIWaiter', {
-                'id': pipeline.name,
-                'worker_class': 'VertexAITabularTrainer'
-            }, 60)
-        return None
-      if delay < 30:
-        delay = [5, 10, 15, 20, 30][int(waiting_time / 60)]
-      time.sleep(delay)
-      waiting_time += delay
     if pipeline.state == ps.PipelineState.PIPELINE_STATE_FAILED:
       raise worker.WorkerException(f'Training pipeline {pipeline.name} failed.')
+    if pipeline.state not in _PIPELINE_COMPLETE_STATES:
+      self._enqueue(
+          'VertexAIWaiter', {
+              'id': pipeline.name,
+              'worker_class': 'VertexAITabularTrainer'
+          }, 60)
 
   def _wait_for_job(self, job):
-    """Waits for batch prediction job completion.
+    """Checks batch prediction job completion and relays to VertexAIWaiter.
 
-    It will relay to VertexAIWaiter if it takes too long.
+    Waiting is delegated right away instead of sleeping in the request, so the
+    jobs instance is freed while the batch prediction job is running.
     """
-    delay = 5
-    waiting_time = 5
-    time.sleep(delay)
-    while job.state not in _JOB_COMPLETE_STATES:
-      if waiting_time > 300:  # Once 5 minute has passed, spawn VertexAIWaiter.
-        self._enqueue(
-            'VertexAIWaiter', {
-                'id': job.name,
-                'worker_class': 'VertexAIBatchPredictorToBQ'},
-            60)
-        return None
-      if delay < 30:
-        delay = [5, 10, 15, 20, 30][int(waiting_time / 60)]
-      time.sleep(delay)
-      waiting_time += delay
     if job.state == js.JobState.JOB_STATE_FAILED:
       raise worker.WorkerException(f'Job {job.name} failed.')
+    if job.state not in _JOB_COMPLETE_STATES:
+      self._enqueue(
+          'VertexAIWaiter', {
+              'id': job.name,
+              'worker_class': 'VertexAIBatchPredictorToBQ'},
+          60)
+
+  def _run_clean_ups(self, clean_up, resource_names):
+    """Cleans up resources concurrently.
+
+    Deletions are long-running operations on Vertex AI, they are started but
+    not waited for, so the jobs instance is freed right away. Cancellations of
+    running resources are requests returning once the cancellation started,
+    bounded by their timeout.
+
+    Args:
+      clean_up: Callable cleaning up a resource given its name.
+      resource_names: Names of the resources to clean up.
+    """
+    with futures.ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_CLEAN_UPS) as executor:
+      # Consumes results to raise the first exception met, if any.
+      list(executor.map(clean_up, resource_names))
 
   def _clean_up_datasets(self, dataset_client, project, region, display_name):
     parent = f'projects/{project}/locations/{region}'
-    datasets = list(
-        dataset_client.list_datasets({
-            'parent': parent,
-            'filter': f'display_name="{display_name}"',
-            'order_by': 'create_time asc'}))
-    configs = map(lambda x: (x.create_time, {'name': x.name}), datasets)
-    sorted_configs = sorted(configs)
-    for _, config in sorted_configs[:-1]:
-      dataset_name = config['name']
-      dataset_client.delete_dataset({'name': dataset_name})
-      self.log_info(f'Deleted dataset: {dataset_name}')
+    try:
+      datasets = self._list_resources(
+          dataset_client.list_datasets, parent, display_name,
+          order_by='create_time desc')
+      # Keeps the latest dataset.
+      dataset_names = [
+          dataset.name for dataset in itertools.islice(datasets, 1, None)]
+    except Exception as e:
+      self.log_info(f'Exception: {e}')
+      return
+
+    def _delete_dataset(dataset_name):
+      try:
+        dataset_client.delete_dataset({'name': dataset_name})
+        self.log_info(f'Deleted dataset: {dataset_name}')
+      except Exception as e:
+        self.log_info(f'Exception: {e}')
+
+    self._run_clean_ups(_delete_dataset, dataset_names)
 
   def _clean_up_training_pipelines(self, pipeline_client, project, region,
                                    display_name):
     parent = f'projects/{project}/locations/{region}'
-    training_pipelines = list(
-        pipeline_client.list_training_pipelines({
-            'parent': parent,
-            'filter': f'display_name="{display_name}"'}))
-    configs = map(
-        lambda x: (x.create_time, {'state': x.state, 'name': x.name}),
-        training_pipelines)
-    sorted_configs = sorted(configs)
-    for _, config in sorted_configs[:-1]:
+    training_pipelines = sorted(
+        self._list_resources(
+            pipeline_client.list_training_pipelines, parent, display_name),
+        key=lambda x: x.create_time,
+        reverse=True)
+    configs = [{'state': x.state, 'name': x.name} for x in training_pipelines]
+
+    def _delete_training_pipeline(config):
       training_pipeline_name = config['name']
-      if config['state'] in _PIPELINE_COMPLETE_STATES:
-        pipeline_client.delete_training_pipeline(name=training_pipeline_name)
-      else:
-        pipeline_client.cancel_training_pipeline(
-            name=training_pipeline_name, timeout=300)
+      try:
+        if config['state'] not in _PIPELINE_COMPLETE_STATES:
+          pipeline_client.cancel_training_pipeline(
+              name=training_pipeline_name, timeout=300)
         pipeline_client.delete_training_pipeline(name=training_pipeline_name)
-      self.log_info(f'Deleted training pipeline: {training_pipeline_name}')
+        self.log_info(f'Deleted training pipeline: {training_pipeline_name}')
+      except Exception as e:
+        self.log_info(f'Exception: {e}')
+
+    # Keeps the latest training pipeline.
+    self._run_clean_ups(_delete_training_pipeline, configs[1:])
 
   def _clean_up_batch_predictions(self, job_client, project, region,
                                   display_name):
     parent = f'projects/{project}/locations/{region}'
-    batch_predictions = list(
-        job_client.list_batch_prediction_jobs({
-            'parent': parent,
-            'filter': f'display_name="{display_name}"'}))
-    configs = map(
-        lambda x: (x.create_time, {'state': x.state, 'name': x.name}),
-        batch_predictions)
-    sorted_configs = sorted(configs)
-    for _, config in sorted_configs[:-1]:
+    batch_predictions = sorted(
+        self._list_resources(
+            job_client.list_batch_prediction_jobs, parent, display_name),
+        key=lambda x: x.create_time,
+        reverse=True)
+    configs = [{'state': x.state, 'name': x.name} for x in batch_predictions]
+
+    def _delete_batch_prediction(config):
       batch_prediction_name = config['name']
-      if config['state'] in _JOB_COMPLETE_STATES:
-        job_client.delete_batch_prediction_job(name=batch_prediction_name)
-      else:
-        job_client.cancel_batch_prediction_job(
-            name=batch_prediction_name, timeout=300)
+      try:
+        if config['state'] not in _JOB_COMPLETE_STATES:
+          job_client.cancel_batch_prediction_job(
+              name=batch_prediction_name, timeout=300)
         job_client.delete_batch_prediction_job(name=batch_prediction_name)
-      self.log_info(f'Deleted batch prediction: {batch_prediction_name}')
+        self.log_info(f'Deleted batch prediction: {batch_prediction_name}')
+      except Exception as e:
+        self.log_info(f'Exception: {e}')
+
+    # Keeps the latest batch prediction.
+    self._run_clean_ups(_delete_batch_prediction, configs[1:])
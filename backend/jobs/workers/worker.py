@@ -22,6 +22,7 @@ from google.api_core.retry import Retry
 from google.auth import credentials
 
 from common import crmint_logging
+from jobs.workers import metrics
 
 _DEFAULT_MAX_RETRIES = 3
 
@@ -47,6 +48,18 @@ class Worker:
   # Maximum number of worker execution attempts.
   MAX_ATTEMPTS = 1
 
+  # Maximum number of tasks of this worker running concurrently on a jobs
+  # instance, None for no other limit than the instance one.
+  MAX_CONCURRENT_TASKS = None
+
+  # Estimated memory used by a task of this worker, in megabytes.
+  MEMORY_MB = 16
+
+  # Delivery lane of tasks of this worker (see `task.Priority`), None for the
+  # lane of its pipeline. Short checks run in the high lane and the pages of
+  # bulk fan-outs in the low lane.
+  PRIORITY = None
+
   def __init__(self,
                params: dict[str, Any],
                pipeline_id: int,
@@ -76,7 +89,10 @@ class Worker:
     self._logger_credentials = logger_credentials
 
   @Retry()
-  def _log(self, level: str, message: str) -> None:
+  def _log(self,
+           level: str,
+           message: str,
+           extra_fields: Optional[dict[str, Any]] = None) -> None:
     crmint_logging.log_message(
         message,
         log_level=level,
@@ -84,15 +100,19 @@ class Worker:
         job_id=self._job_id,
         worker_class=self.__class__.__name__,
         logger_project=self._logger_project,
-        logger_credentials=self._logger_credentials)
+        logger_credentials=self._logger_credentials,
+        extra_fields=extra_fields)
 
-  def log_info(self, message: str) -> None:
+  def log_info(self,
+               message: str,
+               extra_fields: Optional[dict[str, Any]] = None) -> None:
     """Logs a message at the INFO level.
 
     Args:
       message: String containg the message to log.
+      extra_fields: Optional dictionary of fields to add to the log payload.
     """
-    self._log('INFO', message)
+    self._log('INFO', message, extra_fields)
 
   def log_warn(self, message: str) -> None:
     """Logs a message at the WARNING level.
@@ -125,4 +145,5 @@ class Worker:
     raise NotImplementedError
 
   def _enqueue(self, worker_class, worker_params, delay=0):
+    metrics.increment(metrics.ENQUEUED_WORKERS)
     self._workers_to_enqueue.append((worker_class, worker_params, delay))
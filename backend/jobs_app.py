@@ -12,9 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Starts profiling first, to time the imports of the app.
+from common import startup_profiler
+startup_profiler.start('jobs')
+
+# pylint: disable=wrong-import-position
+import os
 import signal
 import sys
-import traceback
 import types
 
 from flask import json
@@ -24,13 +29,30 @@ from flask.globals import request
 from common import auth_filter
 from common import crmint_logging
 from common import message
-from common import result
 from common import task
+from jobs import executor
+from jobs import task_runner
 from jobs.workers import finder
-from jobs.workers import worker
+from jobs.workers import metrics
+# pylint: enable=wrong-import-position
+
+# Seconds between SIGTERM and SIGKILL on Cloud Run, see
+# https://cloud.google.com/run/docs/reference/container-contract#instance-shutdown
+_TERMINATION_WINDOW = 10
+
+# Seconds kept at the end of the termination window to stop the Pub/Sub
+# publisher, which sends the messages published by drained tasks.
+_PUBLISHER_STOP_TIMEOUT = 2
+
+# Seconds to wait for running tasks on shutdown, the rest of the window.
+_DRAIN_TIMEOUT = float(os.getenv(
+    'JOBS_DRAIN_TIMEOUT', str(_TERMINATION_WINDOW - _PUBLISHER_STOP_TIMEOUT)))
 
 app = Flask(__name__)
 auth_filter.add(app)
+startup_profiler.add(app)
+
+_executor = executor.TaskExecutor()
 
 
 @app.route('/liveness_check', methods=['GET'])
@@ -45,74 +67,78 @@ def readiness_check():
 
 @app.route('/api/workers', methods=['GET'])
 def workers_list():
-  return (json.jsonify(list(finder.WORKERS_MAPPING.keys())),
+  return (json.jsonify(list(finder.WORKER_MODULES.keys())),
           {'Access-Control-Allow-Origin': '*'})
 
 
 @app.route('/api/workers/<worker_class>/params', methods=['GET'])
 def worker_parameters(worker_class):
-  klass = finder.get_worker_class(worker_class)
-  keys = ['name', 'type', 'required', 'default', 'label']
-  return (json.jsonify([dict(zip(keys, param)) for param in klass.PARAMS]),
+  return (json.jsonify(finder.get_worker_params(worker_class)),
           {'Access-Control-Allow-Origin': '*'})
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_export():
+  """Exports task metrics in the Prometheus text format."""
+  return (metrics.registry.export(),
+          {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
 @app.route('/push/start-task', methods=['POST'])
 def start_task():
-  """Receives a task from Pub/Sub and executes it."""
+  """Receives a task from Pub/Sub and executes it.
+
+  The task runs on the executor thread pool, and the message is acknowledged
+  once the task is done. Tasks rejected by the executor are not acknowledged,
+  so that Pub/Sub delivers them again later, possibly to another instance.
+
+  The request thread blocks until the task is done, so the pool adds no
+  concurrency on top of the request threads of gunicorn: it is only used for
+  admission control, i.e. the per worker class, priority and memory limits.
+  Its size stays below the number of request threads, so that tasks beyond
+  these limits are rejected right away instead of queued.
+  """
   try:
     task_inst = task.Task.from_request(request)
   except (message.BadRequestError, message.TooEarlyError) as e:
     return e.message, e.code
 
-  crmint_logging.log_message(
-      f'Starting task for name: {task_inst.name}',
-      log_level='DEBUG',
-      worker_class=task_inst.worker_class,
-      pipeline_id=task_inst.pipeline_id,
-      job_id=task_inst.job_id)
-
-  worker_class = finder.get_worker_class(task_inst.worker_class)
-  worker_params = task_inst.worker_params.copy()
-  for setting in worker_class.GLOBAL_SETTINGS:
-    worker_params[setting] = task_inst.general_settings[setting]
-  worker_inst = worker_class(
-      worker_params, task_inst.pipeline_id, task_inst.job_id)
-
+  worker_inst = task_runner.create_worker(task_inst)
   try:
-    workers_to_enqueue = worker_inst.execute()
+    future = _executor.submit(
+        type(worker_inst),
+        task_runner.execute_task,
+        task_inst,
+        worker_inst,
+        priority=task_inst.priority)
+  except executor.RejectedTaskError as e:
     crmint_logging.log_message(
-        f'Executed task for name: {task_inst.name}',
+        f'Rejected task for name: {task_inst.name}: {e.message}',
         log_level='DEBUG',
         worker_class=task_inst.worker_class,
         pipeline_id=task_inst.pipeline_id,
         job_id=task_inst.job_id)
-  except worker.WorkerException as e:
-    class_name = e.__class__.__name__
-    worker_inst.log_error(f'Execution failed: {class_name}: {e}')
-    result_inst = result.Result(task_inst.name, task_inst.job_id, False)
-    result_inst.report()
-  except Exception as e:  # pylint: disable=broad-except
-    formatted_exception = traceback.format_exc()
-    worker_inst.log_error(f'Unexpected error {formatted_exception}')
-    if task_inst.attempts < worker_inst.MAX_ATTEMPTS:
-      task_inst.reenqueue()
-    else:
-      worker_inst.log_error(f'Giving up after {task_inst.attempts} attempt(s)')
-      result_inst = result.Result(task_inst.name, task_inst.job_id, False)
-      result_inst.report()
-  else:
-    result_inst = result.Result(
-        task_inst.name, task_inst.job_id, True, workers_to_enqueue)
-    result_inst.report()
+    return e.message, e.code
+
+  crmint_logging.log_message(
+      f'Starting task for name: {task_inst.name}',
+      log_level='DEBUG',
+      worker_class=task_inst.worker_class,
+      pipeline_id=task_inst.pipeline_id,
+      job_id=task_inst.job_id)
+  future.result()
   return 'OK', 200
 
 
 def shutdown_handler(sig: int, frame: types.FrameType) -> None:
   """Gracefully shuts down the instance.
 
-  Within the 3 seconds window, try to do as much as possible:
-    1. Commit all pending Pub/Sub messages (as much as possible).
+  Within the termination window, try to do as much as possible:
+    1. Stop accepting tasks and wait for the running ones to finish.
+    2. Commit all pending Pub/Sub messages (as much as possible).
+
+  Messages of tasks still running after the drain timeout are not
+  acknowledged, so that Pub/Sub delivers them again to another instance.
 
   You can read more about this practice:
   https://cloud.google.com/blog/topics/developers-practitioners/graceful-shutdowns-cloud-run-deep-dive.
@@ -125,10 +151,17 @@ def shutdown_handler(sig: int, frame: types.FrameType) -> None:
   crmint_logging.log_global_message(
       'Signal received, safely shutting down.',
       log_level='WARNING')
+  if not _executor.drain(_DRAIN_TIMEOUT):
+    crmint_logging.log_global_message(
+        f'Tasks still running after {_DRAIN_TIMEOUT} seconds: '
+        f'{_executor.running_tasks}',
+        log_level='WARNING')
   message.shutdown()
   sys.exit(0)
 
 
+startup_profiler.finish()
+
 if __name__ == '__main__':
   signal.signal(signal.SIGINT, shutdown_handler)  # Handles Ctrl-C locally.
   app.run(host='0.0.0.0', port=8081, debug=True)
@@ -0,0 +1,63 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Create tracked operations.
+
+Revision ID: b7e3c1d9a402
+Revises: 420401efbf38
+Create Date: 2026-10-19 09:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c1d9a402'
+down_revision = '420401efbf38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tracked_operations',
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=True),
+        sa.Column('task_name', sa.String(length=100), nullable=True),
+        sa.Column('worker_class', sa.String(length=255), nullable=True),
+        sa.Column('worker_params', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_check_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tracked_operations_job_id'), 'tracked_operations',
+                    ['job_id'], unique=False)
+    op.create_index(op.f('ix_tracked_operations_task_name'),
+                    'tracked_operations', ['task_name'], unique=True)
+    op.create_index(op.f('ix_tracked_operations_next_check_at'),
+                    'tracked_operations', ['next_check_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_tracked_operations_next_check_at'),
+                  table_name='tracked_operations')
+    op.drop_index(op.f('ix_tracked_operations_task_name'),
+                  table_name='tracked_operations')
+    op.drop_index(op.f('ix_tracked_operations_job_id'),
+                  table_name='tracked_operations')
+    op.drop_table('tracked_operations')
@@ -0,0 +1,44 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Add priority to pipelines.
+
+Revision ID: c4d2e8f1a7b3
+Revises: b7e3c1d9a402
+Create Date: 2026-10-19 14:37:05.218640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d2e8f1a7b3'
+down_revision = 'b7e3c1d9a402'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('pipelines',
+                  sa.Column('priority', sa.String(length=10), nullable=False,
+                            server_default='normal'))
+    op.add_column('pipelines',
+                  sa.Column('run_priority', sa.String(length=10),
+                            nullable=True))
+
+
+def downgrade():
+    op.drop_column('pipelines', 'run_priority')
+    op.drop_column('pipelines', 'priority')
@@ -0,0 +1,83 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Create held tasks.
+
+Revision ID: d9a1f3b6c2e4
+Revises: c4d2e8f1a7b3
+Create Date: 2026-10-19 16:02:48.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a1f3b6c2e4'
+down_revision = 'c4d2e8f1a7b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('pipelines',
+                  sa.Column('max_concurrent_tasks', sa.Integer(),
+                            nullable=True))
+    op.add_column('enqueued_tasks',
+                  sa.Column('pipeline_id', sa.Integer(), nullable=True))
+    op.add_column('enqueued_tasks',
+                  sa.Column('worker_class', sa.String(length=255),
+                            nullable=True))
+    op.create_index(op.f('ix_enqueued_tasks_pipeline_id'), 'enqueued_tasks',
+                    ['pipeline_id'], unique=False)
+    op.create_index(op.f('ix_enqueued_tasks_worker_class'), 'enqueued_tasks',
+                    ['worker_class'], unique=False)
+    op.create_table(
+        'held_tasks',
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=True),
+        sa.Column('pipeline_id', sa.Integer(), nullable=True),
+        sa.Column('task_name', sa.String(length=100), nullable=True),
+        sa.Column('worker_class', sa.String(length=255), nullable=True),
+        sa.Column('worker_params', sa.Text(), nullable=True),
+        sa.Column('priority', sa.String(length=10), nullable=True),
+        sa.Column('not_before', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_held_tasks_job_id'), 'held_tasks',
+                    ['job_id'], unique=False)
+    op.create_index(op.f('ix_held_tasks_pipeline_id'), 'held_tasks',
+                    ['pipeline_id'], unique=False)
+    op.create_index(op.f('ix_held_tasks_task_name'), 'held_tasks',
+                    ['task_name'], unique=True)
+    op.create_index(op.f('ix_held_tasks_worker_class'), 'held_tasks',
+                    ['worker_class'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_held_tasks_worker_class'), table_name='held_tasks')
+    op.drop_index(op.f('ix_held_tasks_task_name'), table_name='held_tasks')
+    op.drop_index(op.f('ix_held_tasks_pipeline_id'), table_name='held_tasks')
+    op.drop_index(op.f('ix_held_tasks_job_id'), table_name='held_tasks')
+    op.drop_table('held_tasks')
+    op.drop_index(op.f('ix_enqueued_tasks_worker_class'),
+                  table_name='enqueued_tasks')
+    op.drop_index(op.f('ix_enqueued_tasks_pipeline_id'),
+                  table_name='enqueued_tasks')
+    op.drop_column('enqueued_tasks', 'worker_class')
+    op.drop_column('enqueued_tasks', 'pipeline_id')
+    op.drop_column('pipelines', 'max_concurrent_tasks')
@@ -19,12 +19,23 @@ from google.cloud import pubsub_v1
 
 def setup_pubsub():  # pylint: disable=too-many-locals
   """Create CRMint's PubSub topics and subscriptions."""
+  # Tasks are delivered in priority lanes, see `task.Priority`.
   crmint_subscriptions = {
+      'crmint-3-start-task-high': {
+          'push_endpoint': 'http://jobs:8081/push/start-task',
+          'ack_deadline_seconds': 600,
+          'minimum_backoff': 10,  # seconds
+      },
       'crmint-3-start-task': {
           'push_endpoint': 'http://jobs:8081/push/start-task',
           'ack_deadline_seconds': 600,
           'minimum_backoff': 60,  # seconds
       },
+      'crmint-3-start-task-low': {
+          'push_endpoint': 'http://jobs:8081/push/start-task',
+          'ack_deadline_seconds': 600,
+          'minimum_backoff': 60,  # seconds
+      },
       'crmint-3-task-finished': {
           'push_endpoint': 'http://controller:8080/push/task-finished',
           'ack_deadline_seconds': 60,
@@ -37,6 +48,12 @@ def setup_pubsub():  # pylint: disable=too-many-locals
       },
       'crmint-3-pipeline-finished': None,
   }
+  # Tasks can be pulled by `jobs.pull_runner` instead of pushed to jobs.
+  if os.getenv('START_TASK_DELIVERY', 'push') == 'pull':
+    for topic_id in ('crmint-3-start-task-high',
+                     'crmint-3-start-task',
+                     'crmint-3-start-task-low'):
+      crmint_subscriptions[topic_id]['push_endpoint'] = None
   project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
   publisher = pubsub_v1.PublisherClient()
   subscriber = pubsub_v1.SubscriberClient()
@@ -56,9 +73,18 @@ def setup_pubsub():  # pylint: disable=too-many-locals
         subscription_id = f'{topic_id}-subscription'
         subscription_path = subscriber.subscription_path(
             project_id, subscription_id)
-        if subscription_path not in subscription_paths:
+        if subscription['push_endpoint']:
           push_config = pubsub_v1.types.PushConfig(
               push_endpoint=subscription['push_endpoint'])
+        else:
+          push_config = pubsub_v1.types.PushConfig()
+        if subscription_path in subscription_paths:
+          # Converts existing subscriptions between push and pull delivery.
+          subscriber.modify_push_config(request={
+              'subscription': subscription_path,
+              'push_config': push_config,
+          })
+        else:
           minimum_backoff = pubsub_v1.types.Duration(
               seconds=subscription['minimum_backoff'])
           retry_policy = pubsub_v1.types.RetryPolicy(
@@ -35,6 +35,62 @@ class CommonMessageTest(absltest.TestCase):
     with self.assertRaises(TimeoutError):
       message.send(data={'foo': 'bar'}, topic='TOPIC', delay=1)
 
+  def test_send_many_publishes_all_messages_before_waiting(self):
+    published_futures = []
+
+    def _publish(*unused_args, **unused_kwargs):
+      # Futures are resolved only after all messages are published.
+      self.assertEmpty([f for f in published_futures if f.done()])
+      future = pubsub_v1.publisher.futures.Future()
+      published_futures.append(future)
+      return future
+
+    patched_publish = self.enter_context(
+        mock.patch.object(
+            pubsub_v1.PublisherClient,
+            'publish',
+            autospec=True,
+            side_effect=_publish))
+    self.enter_context(
+        mock.patch.object(
+            message.futures,
+            'wait',
+            autospec=True,
+            side_effect=lambda fs, timeout: [f.set_result('ID') for f in fs]))
+    self.enter_context(
+        mock.patch.object(
+            auth,
+            'default',
+            autospec=True,
+            return_value=[_make_credentials, 'PROJECT']))
+    message.send_many([({'foo': i}, 'TOPIC', 0) for i in range(3)])
+    self.assertEqual(patched_publish.call_count, 3)
+
+  def test_send_many_aggregates_errors(self):
+    ok_future = pubsub_v1.publisher.futures.Future()
+    ok_future.set_result('ID')
+    failed_future = pubsub_v1.publisher.futures.Future()
+    failed_future.set_exception(ValueError('Failed'))
+    pending_future = pubsub_v1.publisher.futures.Future()
+    self.enter_context(
+        mock.patch.object(
+            pubsub_v1.PublisherClient,
+            'publish',
+            autospec=True,
+            side_effect=[ok_future, failed_future, pending_future]))
+    self.enter_context(mock.patch.object(message, '_PUBSUB_TIMEOUT', 0.01))
+    self.enter_context(
+        mock.patch.object(
+            auth,
+            'default',
+            autospec=True,
+            return_value=[_make_credentials, 'PROJECT']))
+    with self.assertRaises(message.PublishError) as cm:
+      message.send_many([({'foo': i}, 'TOPIC', 0) for i in range(3)])
+    self.assertCountEqual(cm.exception.errors, [1, 2])
+    self.assertIsInstance(cm.exception.errors[1], ValueError)
+    self.assertIsInstance(cm.exception.errors[2], TimeoutError)
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,196 @@
+"""Tests for common.payload_store."""
+
+import collections
+import json
+import time
+from unittest import mock
+import zlib
+
+from absl.testing import absltest
+from google.api_core import exceptions
+
+from common import payload_store
+from common import result
+from common import task
+
+
+class _FakeBlob:
+
+  def __init__(self, objects, name):
+    self._objects = objects
+    self.name = name
+    self.custom_time = None
+    self.patch = mock.Mock()
+
+  def upload_from_string(self, data, content_type, if_generation_match):
+    del content_type  # Unused
+    if if_generation_match == 0 and self.name in self._objects:
+      raise exceptions.PreconditionFailed('Object exists')
+    self._objects[self.name] = data
+
+  def download_as_bytes(self):
+    return self._objects[self.name]
+
+
+class _FakeBucket:
+
+  def __init__(self):
+    self.objects = {}
+    self.blobs = []
+
+  def blob(self, name):
+    blob = _FakeBlob(self.objects, name)
+    self.blobs.append(blob)
+    return blob
+
+
+class PayloadStoreTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.bucket = _FakeBucket()
+    self.enter_context(
+        mock.patch.object(payload_store, '_BUCKET', 'payloads-bucket'))
+    self.enter_context(
+        mock.patch.object(
+            payload_store, '_get_bucket', return_value=self.bucket))
+    self.enter_context(mock.patch.object(
+            payload_store, '_refreshed_at', collections.OrderedDict()))
+    payload_store._load.cache_clear()
+    self.addCleanup(payload_store._load.cache_clear)
+
+  def test_stores_equal_values_once(self):
+    ref = payload_store.put({'a': 1, 'b': [1, 2]})
+    self.assertEqual(ref, payload_store.put({'b': [1, 2], 'a': 1}))
+    self.assertLen(self.bucket.objects, 1)
+    self.assertEqual(payload_store.get(ref), {'a': 1, 'b': [1, 2]})
+
+  def test_refreshes_existing_payloads(self):
+    ref = payload_store.put('value')
+    payload_store._refreshed_at.clear()
+    self.assertEqual(payload_store.put('value'), ref)
+    self.bucket.blobs[-1].patch.assert_called_once()
+    self.assertIsNotNone(self.bucket.blobs[-1].custom_time)
+
+  def test_prunes_refresh_times(self):
+    patched_monotonic = self.enter_context(
+        mock.patch.object(time, 'monotonic', autospec=True, return_value=0))
+    self.enter_context(
+        mock.patch.object(payload_store, '_MAX_REFRESHED_PAYLOADS', 2))
+    for value in ('a', 'b', 'c'):
+      payload_store.put(value)
+    self.assertLen(payload_store._refreshed_at, 2)
+    patched_monotonic.return_value = payload_store._REFRESH_INTERVAL
+    payload_store.put('d')
+    self.assertLen(payload_store._refreshed_at, 1)
+
+  def test_get_returns_a_new_value_on_each_call(self):
+    ref = payload_store.put({'a': [1]})
+    payload_store.get(ref)['a'].append(2)
+    self.assertEqual(payload_store.get(ref), {'a': [1]})
+    self.assertLen(self.bucket.blobs, 2)  # One upload and one download
+
+  def test_get_raises_on_corrupted_payload(self):
+    ref = payload_store.put('value')
+    self.bucket.objects[self.bucket.blobs[0].name] = zlib.compress(b'"other"')
+    with self.assertRaises(payload_store.CorruptedPayloadError):
+      payload_store.get(ref)
+
+  def test_offload_keeps_small_values_inline(self):
+    self.assertEqual(payload_store.offload({'a': 1}), {'a': 1})
+    self.assertEmpty(self.bucket.objects)
+
+  def test_offload_stores_large_values(self):
+    value = {'template': 'x' * payload_store.INLINE_LIMIT_BYTES}
+    ref = payload_store.offload(value)
+    self.assertTrue(payload_store.is_ref(ref))
+    self.assertEqual(payload_store.resolve(ref), value)
+
+  def test_offload_inlines_values_if_disabled(self):
+    self.enter_context(mock.patch.object(payload_store, '_BUCKET', None))
+    value = {'template': 'x' * payload_store.INLINE_LIMIT_BYTES}
+    self.assertEqual(payload_store.offload(value), value)
+
+  def test_resolve_returns_inline_values(self):
+    self.assertEqual(payload_store.resolve({'a': 1}), {'a': 1})
+
+  def test_offload_fields_keeps_small_fields_inline(self):
+    params = {'template': 'x' * 2000, 'bq_page_token': 'token'}
+    offloaded_params = payload_store.offload_fields(params)
+    self.assertTrue(payload_store.is_ref(offloaded_params['template']))
+    self.assertEqual(offloaded_params['bq_page_token'], 'token')
+    self.assertEqual(payload_store.resolve_fields(offloaded_params), params)
+
+  def test_resolve_fields_resolves_params_offloaded_as_a_whole(self):
+    params = {'template': 'x' * 2000, 'bq_page_token': 'token'}
+    self.assertEqual(
+        payload_store.resolve_fields(payload_store.offload(params)), params)
+
+
+class MessageEnvelopeTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.bucket = _FakeBucket()
+    self.enter_context(
+        mock.patch.object(payload_store, '_BUCKET', 'payloads-bucket'))
+    self.enter_context(
+        mock.patch.object(
+            payload_store, '_get_bucket', return_value=self.bucket))
+    self.enter_context(mock.patch.object(
+            payload_store, '_refreshed_at', collections.OrderedDict()))
+    payload_store._load.cache_clear()
+    self.addCleanup(payload_store._load.cache_clear)
+    self.sent_data = []
+    self.enter_context(
+        mock.patch('common.message.send',
+                   side_effect=lambda data, *_, **__: self.sent_data.append(
+                       json.loads(json.dumps(data)))))
+    self.enter_context(
+        mock.patch('common.message.extract_data',
+                   side_effect=lambda request: request))
+
+  def test_task_round_trip(self):
+    general_settings = {
+        'google_ads_refresh_token': 'token',
+        'google_ads_service_account_file': 'x' * 2000,
+    }
+    worker_params = {'query': 'SELECT 1' * 1000, 'bq_page_token': 'token'}
+    task.Task('name', 1, 2, 'BQQueryLauncher', worker_params,
+              general_settings).enqueue()
+    self.assertEqual(self.sent_data[0]['general_settings'], general_settings)
+    self.assertTrue(
+        payload_store.is_ref(self.sent_data[0]['worker_params']['query']))
+    self.assertEqual(
+        self.sent_data[0]['worker_params']['bq_page_token'], 'token')
+    task_inst = task.Task.from_request(self.sent_data[0])
+    self.assertEqual(task_inst.general_settings, general_settings)
+    self.assertEqual(task_inst.worker_params, worker_params)
+
+  def test_result_stores_shared_sub_worker_params_once(self):
+    worker_params = {'template': 'x' * 2000}
+    workers_to_enqueue = [
+        ('GAAudiencesUpdater', worker_params.copy(), 0) for _ in range(10)]
+    result.Result('name', 2, True, workers_to_enqueue).report()
+    self.assertLen(self.bucket.objects, 1)
+    self.assertLess(
+        len(json.dumps(self.sent_data[0])), len(json.dumps(worker_params)))
+    res = result.Result.from_request(self.sent_data[0])
+    self.assertEqual(
+        res.workers_to_enqueue,
+        [('GAAudiencesUpdater', worker_params, 0)] * 10)
+
+  def test_result_stores_templates_of_pages_once(self):
+    workers_to_enqueue = [
+        ('BQToMeasurementProtocolGA4',
+         {'template': 'x' * 2000, 'bq_page_token': f'token-{i}'}, 0)
+        for i in range(10)
+    ]
+    result.Result('name', 2, True, workers_to_enqueue).report()
+    self.assertLen(self.bucket.objects, 1)
+    res = result.Result.from_request(self.sent_data[0])
+    self.assertEqual(res.workers_to_enqueue, workers_to_enqueue)
+
+
+if __name__ == '__main__':
+  absltest.main()
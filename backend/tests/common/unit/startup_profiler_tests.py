@@ -0,0 +1,146 @@
+"""Tests for common.startup_profiler."""
+
+import json
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import flask
+
+from common import startup_profiler
+from tests import utils
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(startup_profiler.__file__))
+
+
+class StartupProfileTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    # `create_tempfile` needs access to --test_tmpdir, however in the OSS world
+    # pytest doesn't run `absltest.main`, so we need to init flags ourselves.
+    utils.initialize_flags_with_defaults()
+    self.report_path = self.create_tempfile().full_path
+    self.profile = startup_profiler.StartupProfile('test', self.report_path)
+
+  def test_records_first_occurrence_of_phases_and_marks(self):
+    with self.profile.phase('create_app'):
+      pass
+    self.profile.mark('first_db_connection')
+    first_report = self.profile.report()
+    with self.profile.phase('create_app'):
+      pass
+    self.profile.mark('first_db_connection')
+    report = self.profile.report()
+    self.assertEqual(report['phases'], first_report['phases'])
+    self.assertEqual(report['marks'], first_report['marks'])
+    self.assertCountEqual(
+        report['phases']['create_app'], ['start_ms', 'duration_ms'])
+
+  def test_writes_report_once_ready(self):
+    os.remove(self.report_path)
+    self.profile.mark('before_ready')
+    self.assertFalse(os.path.exists(self.report_path))
+    self.profile.finish()
+    self.profile.mark('after_ready')
+    with open(self.report_path) as f:
+      report = json.load(f)
+    self.assertEqual(report['service'], 'test')
+    self.assertIsNotNone(report['ready_ms'])
+    self.assertCountEqual(report['marks'], ['before_ready', 'after_ready'])
+
+  def test_times_imported_modules(self):
+    module_dir = self.create_tempdir()
+    module_dir.create_file('startup_child.py', content='X = 1\n')
+    module_dir.create_file(
+        'startup_parent.py', content='import startup_child\n')
+    import_timer = startup_profiler._ImportTimer(self.profile)
+    self.enter_context(mock.patch.object(
+        sys, 'path', [module_dir.full_path, *sys.path]))
+    self.enter_context(mock.patch.object(
+        sys, 'meta_path', [import_timer, *sys.meta_path]))
+    self.enter_context(mock.patch.dict(sys.modules))
+    __import__('startup_parent')
+    imports = {x['module']: x for x in self.profile.report()['slowest_imports']}
+    self.assertCountEqual(imports, ['startup_parent', 'startup_child'])
+    self.assertGreaterEqual(
+        imports['startup_parent']['cumulative_ms'],
+        imports['startup_child']['cumulative_ms'])
+    self.assertLessEqual(
+        imports['startup_parent']['self_ms'],
+        imports['startup_parent']['cumulative_ms'])
+
+  def test_serves_report_on_debug_endpoint(self):
+    self.enter_context(
+        mock.patch.object(startup_profiler, '_profile', self.profile))
+    app = flask.Flask(__name__)
+    startup_profiler.add(app)
+    response = app.test_client().get('/debug/startup')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.get_json()['service'], 'test')
+
+
+# Modules slow to import, only needed by some workers or endpoints, which the
+# services should import lazily.
+_HEAVY_MODULES = (
+    'google.analytics.admin',
+    'google.cloud.aiplatform',
+    'googleapiclient',
+    'numpy',
+    'pandas',
+    'pyarrow',
+)
+
+# Wall-clock timings depend on the machine, the budget test only runs with
+# STARTUP_BUDGET_TESTS=1, e.g. on a dedicated CI job.
+_RUN_BUDGET_TESTS = bool(int(os.getenv('STARTUP_BUDGET_TESTS', '0')))
+
+
+def _import_in_fresh_interpreter(
+    app_module: str, **env: str) -> subprocess.CompletedProcess:
+  return subprocess.run(
+      [sys.executable, '-c',
+       f'import json, sys, {app_module}; print(json.dumps(list(sys.modules)))'],
+      cwd=_BACKEND_DIR, env=dict(os.environ, **env), check=True,
+      capture_output=True, text=True)
+
+
+class ColdStartTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('Jobs service', 'jobs_app', ('google.cloud.bigquery',)),
+      ('Controller service', 'controller_app', ()),
+  )
+  def test_heavy_modules_are_not_imported_on_startup(
+      self, app_module, other_heavy_modules):
+    process = _import_in_fresh_interpreter(app_module)
+    imported_modules = json.loads(process.stdout.splitlines()[-1])
+    self.assertEmpty([
+        module for module in imported_modules
+        for heavy_module in _HEAVY_MODULES + other_heavy_modules
+        if module == heavy_module or module.startswith(f'{heavy_module}.')
+    ])
+
+  @absltest.skipUnless(
+      _RUN_BUDGET_TESTS, 'Wall-clock budgets need STARTUP_BUDGET_TESTS=1.')
+  @parameterized.named_parameters(
+      ('Jobs service', 'jobs_app', 5000),
+      ('Controller service', 'controller_app', 8000),
+  )
+  def test_cold_start_is_within_budget(self, app_module, budget_ms):
+    utils.initialize_flags_with_defaults()
+    report_path = self.create_tempfile().full_path
+    _import_in_fresh_interpreter(
+        app_module, STARTUP_PROFILE='1', STARTUP_PROFILE_PATH=report_path)
+    with open(report_path) as f:
+      report = json.load(f)
+    self.assertLess(
+        report['ready_ms'], budget_ms,
+        msg=f'Slowest imports: {report["slowest_imports"][:10]}')
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,44 @@
+"""Tests for common.task."""
+
+from unittest import mock
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+from common import message
+from common import task
+
+
+class TaskTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('High priority', task.Priority.HIGH, 'crmint-3-start-task-high'),
+      ('Normal priority', task.Priority.NORMAL, 'crmint-3-start-task'),
+      ('Low priority', task.Priority.LOW, 'crmint-3-start-task-low'),
+  )
+  def test_enqueue_publishes_to_topic_of_priority(self, priority, topic):
+    patched_send = self.enter_context(
+        mock.patch.object(message, 'send', autospec=True))
+    task_inst = task.Task(
+        'NAME', 1, 2, 'Commenter', {}, {}, priority=priority)
+    task_inst.enqueue(10)
+    data, sent_topic, delay = patched_send.call_args.args
+    self.assertEqual(sent_topic, topic)
+    self.assertEqual(delay, 10)
+    self.assertEqual(data['priority'], priority)
+
+  def test_priority_defaults_to_normal_for_older_messages(self):
+    task_inst = task.Task._from_data({
+        'task_name': 'NAME',
+        'pipeline_id': 1,
+        'job_id': 2,
+        'worker_class': 'Commenter',
+        'worker_params': {},
+        'general_settings': {},
+        'attempts': 1,
+    })
+    self.assertEqual(task_inst.priority, task.Priority.NORMAL)
+
+
+if __name__ == '__main__':
+  absltest.main()
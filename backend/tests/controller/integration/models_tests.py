@@ -18,6 +18,7 @@ from absl.testing import absltest
 from absl.testing import parameterized
 
 from common import crmint_logging
+from common import message
 from common import task
 from controller import models
 from tests import controller_utils
@@ -29,6 +30,8 @@ class ModelTestCase(controller_utils.ModelTestCase):
     super().setUp()
     self.patched_task_enqueue = self.enter_context(
         mock.patch.object(task.Task, 'enqueue', autospec=True))
+    self.patched_task_enqueue_many = self.enter_context(
+        mock.patch.object(task.Task, 'enqueue_many', autospec=True))
     self.patched_log_message = self.enter_context(
         mock.patch.object(crmint_logging, 'log_message', autospec=True))
     self.patched_log_pipeline_status = self.enter_context(
@@ -727,8 +730,105 @@ class TestJobStartWithDependentJobs(ModelTestCase):
     self.assertEqual(job3.status, models.Job.STATUS.WAITING)
 
 
+class TestTaskPriority(ModelTestCase):
+
+  def test_tasks_use_pipeline_priority(self):
+    pipeline = models.Pipeline.create(priority=task.Priority.LOW)
+    models.Job.create(pipeline_id=pipeline.id)
+    self.assertTrue(pipeline.start())
+    self.assertEqual(pipeline.run_priority, task.Priority.LOW)
+    task_inst = self.patched_task_enqueue.call_args.args[0]
+    self.assertEqual(task_inst.priority, task.Priority.LOW)
+
+  def test_manual_run_uses_given_priority(self):
+    pipeline = models.Pipeline.create(priority=task.Priority.LOW)
+    job = models.Job.create(pipeline_id=pipeline.id)
+    pipeline.start_single_job(job, priority=task.Priority.HIGH)
+    self.assertEqual(pipeline.run_priority, task.Priority.HIGH)
+    task_inst = self.patched_task_enqueue.call_args.args[0]
+    self.assertEqual(task_inst.priority, task.Priority.HIGH)
+
+  def test_worker_priority_overrides_pipeline_priority(self):
+    pipeline = models.Pipeline.create()
+    job = models.Job.create(pipeline_id=pipeline.id)
+    self.assertTrue(pipeline.start())
+    job.enqueue_many([
+        ('BQWaiter', {}, 0, task.Priority.HIGH),
+        ('Commenter', {}, 0, None),
+        ('Commenter', {}, 0),
+    ])
+    tasks_with_delays = self.patched_task_enqueue_many.call_args.args[0]
+    self.assertEqual(
+        [t.priority for t, _ in tasks_with_delays],
+        [task.Priority.HIGH, task.Priority.NORMAL, task.Priority.NORMAL])
+
+  def test_rejects_invalid_priority(self):
+    pipeline = models.Pipeline.create()
+    with self.assertRaises(ValueError):
+      pipeline.assign_attributes({'priority': 'urgent'})
+
+
 class TestJobStartingMultipleTasks(ModelTestCase):
 
+  def test_enqueue_many_publishes_tasks_together(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    task1 = job.start()
+    enqueued_tasks = job.enqueue_many(
+        [('Commenter', {'comment': str(i)}, 0) for i in range(3)])
+    self.assertLen(enqueued_tasks, 3)
+    self.patched_task_enqueue_many.assert_called_once()
+    tasks_with_delays = self.patched_task_enqueue_many.call_args.args[0]
+    self.assertEqual(
+        [t.worker_params for t, _ in tasks_with_delays],
+        [{'comment': '0'}, {'comment': '1'}, {'comment': '2'}])
+    self.assertEqual(job._enqueued_task_count(), 4)
+    job.task_succeeded(task1.name)
+    for task_inst in enqueued_tasks:
+      job.task_succeeded(task_inst.name)
+    self.assertEqual(job.status, models.Job.STATUS.SUCCEEDED)
+
+  def test_enqueue_many_holds_tasks_failing_to_publish(self):
+    self.patched_task_enqueue_many.side_effect = message.PublishError(
+        {1: TimeoutError()})
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    job.start()
+    enqueued_tasks = job.enqueue_many([('Commenter', {}, 0)] * 3)
+    self.assertLen(enqueued_tasks, 3)
+    self.assertEqual(job._enqueued_task_count(), 4)
+    tasks_with_delays = self.patched_task_enqueue_many.call_args.args[0]
+    self.assertEqual(
+        [held_task.task_name for held_task in models.HeldTask.all()],
+        [tasks_with_delays[1][0].name])
+
+  def test_enqueue_many_skips_tasks_already_enqueued_by_parent(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    parent_task = job.start()
+    workers = [('Commenter', {'comment': str(i)}, 0) for i in range(3)]
+    first_tasks = job.enqueue_many(
+        workers, parent_task_name=parent_task.name)
+    self.assertEmpty(
+        job.enqueue_many(workers, parent_task_name=parent_task.name))
+    self.patched_task_enqueue_many.assert_called_once()
+    # Unless the first tasks are done, e.g. a redelivery after a crash.
+    job.task_succeeded(first_tasks[0].task_name)
+    self.assertEqual(
+        [t.task_name for t in job.enqueue_many(
+            workers, parent_task_name=parent_task.name)],
+        [first_tasks[0].task_name])
+
+  def test_enqueue_many_does_nothing_if_job_not_running(self):
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    self.assertEmpty(job.enqueue_many([('Commenter', {}, 0)]))
+    self.patched_task_enqueue_many.assert_not_called()
+
   def test_succeeds_completing_tasks_in_series(self):
     pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
     job = models.Job.create(
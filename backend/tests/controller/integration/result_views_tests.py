@@ -104,6 +104,45 @@ class TestResultViews(controller_utils.ControllerAppTest):
     self.assertEqual(job1.status, expected_job_status)
     self.assertEqual(job1._enqueued_task_count(), expected_enqueing_count)
 
+  def test_redelivered_result_is_processed_once(self):
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_pipeline_status', autospec=True))
+    pipeline = models.Pipeline.create(status=models.Pipeline.STATUS.RUNNING)
+    job1 = models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.WAITING)
+    task1 = job1.start()
+    payload = _create_pubsub_encoded_result_payload(
+        task_name=task1.name,
+        success=True,
+        workers_to_enqueue=[('WorkerA', {}, 0), ('WorkerB', {}, 0)])
+    for _ in range(2):
+      response = self.client.post('/push/task-finished', json=payload)
+      self.assertEqual(response.status_code, 200)
+    self.patched_task_enqueue_many.assert_called_once()
+    self.assertEqual(job1._enqueued_task_count(), 2)
+
+  def test_result_releases_held_tasks(self):
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_pipeline_status', autospec=True))
+    pipeline = models.Pipeline.create(
+        status=models.Pipeline.STATUS.RUNNING, max_concurrent_tasks=1)
+    job1 = models.Job.create(
+        pipeline_id=pipeline.id,
+        worker_class='WorkerA',
+        status=models.Job.STATUS.WAITING)
+    task1 = job1.start()
+    held_task = job1.enqueue('WorkerA', {})
+    self.assertLen(models.HeldTask.all(), 1)
+    payload = _create_pubsub_encoded_result_payload(
+        task_name=task1.name, success=True, workers_to_enqueue=[])
+    response = self.client.post('/push/task-finished', json=payload)
+    self.assertEqual(response.status_code, 200)
+    self.assertEmpty(models.HeldTask.all())
+    tasks_with_delays = self.patched_task_enqueue_many.call_args.args[0]
+    self.assertEqual(
+        [t.name for t, _ in tasks_with_delays], [held_task.task_name])
+    self.assertEqual(job1.status, models.Job.STATUS.RUNNING)
+
 
 if __name__ == '__main__':
   absltest.main()
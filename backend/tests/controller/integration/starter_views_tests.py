@@ -14,11 +14,15 @@
 
 import base64
 import json
+from unittest import mock
 
 from absl.testing import absltest
 from absl.testing import parameterized
 import freezegun
 
+from common import crmint_logging
+from common import message
+from controller import admission
 from controller import models
 from tests import controller_utils
 
@@ -71,6 +75,32 @@ class TestStarterViews(controller_utils.ControllerAppTest):
     self.assertEqual(response.status_code, 200)
     self.assertEqual(pipeline.status, pipeline_status)
 
+  @freezegun.freeze_time('2015-06-18T16:07:19')
+  def test_heartbeat_succeeds_if_held_tasks_fail_to_publish(self):
+    self.enter_context(
+        mock.patch.object(
+            admission, 'release', autospec=True,
+            side_effect=message.PublishError({0: TimeoutError()})))
+    patched_log_global_message = self.enter_context(
+        mock.patch.object(
+            crmint_logging, 'log_global_message', autospec=True))
+    data = {
+        'pipeline_ids': 'scheduled',
+    }
+    data_encoded = base64.b64encode(json.dumps(data).encode('utf8'))
+    payload = {
+        'message': {
+            'attributes': {
+                'start_time': 1434636430,  # 9 seconds ago
+            },
+            'data': data_encoded.decode('utf8'),
+        }
+    }
+    response = self.client.post('/push/start-pipeline', json=payload)
+    self.assertEqual(response.status_code, 200)
+    patched_log_global_message.assert_called_once_with(
+        'Failed releasing 1 held tasks', log_level='WARNING')
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,175 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for controller.admission."""
+
+import datetime
+import os
+from unittest import mock
+
+from absl.testing import absltest
+
+from common import crmint_logging
+from common import message
+from common import task
+from controller import admission
+from controller import models
+from tests import controller_utils
+
+
+class AdmissionTest(controller_utils.ModelTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_message', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_pipeline_status', autospec=True))
+    self.patched_task_enqueue = self.enter_context(
+        mock.patch.object(task.Task, 'enqueue', autospec=True))
+    self.patched_task_enqueue_many = self.enter_context(
+        mock.patch.object(task.Task, 'enqueue_many', autospec=True))
+
+  def _create_running_job(self, max_concurrent_tasks):
+    pipeline = models.Pipeline.create(
+        status=models.Pipeline.STATUS.RUNNING,
+        max_concurrent_tasks=max_concurrent_tasks)
+    return models.Job.create(
+        pipeline_id=pipeline.id, status=models.Job.STATUS.RUNNING)
+
+  def _released_tasks(self):
+    tasks_with_delays = self.patched_task_enqueue_many.call_args.args[0]
+    return [task_inst for task_inst, _ in tasks_with_delays]
+
+  def test_holds_tasks_above_pipeline_budget(self):
+    job = self._create_running_job(max_concurrent_tasks=2)
+    enqueued_tasks = job.enqueue_many(
+        [('Commenter', {'comment': str(i)}, 0) for i in range(5)])
+    self.assertLen(enqueued_tasks, 5)
+    self.assertLen(self._released_tasks(), 2)
+    self.assertLen(models.HeldTask.where(job_id=job.id).all(), 3)
+    self.assertEqual(job._enqueued_task_count(), 5)
+    self.assertEqual(
+        models.TaskEnqueued.count_in_flight(pipeline_id=job.pipeline_id), 2)
+
+  def test_holds_single_task_above_pipeline_budget(self):
+    job = self._create_running_job(max_concurrent_tasks=1)
+    job.enqueue('Commenter', {})
+    job.enqueue('Commenter', {})
+    self.patched_task_enqueue.assert_called_once()
+    self.assertLen(models.HeldTask.all(), 1)
+
+  def test_holds_following_tasks_once_tasks_are_held(self):
+    job = self._create_running_job(max_concurrent_tasks=1)
+    job.enqueue_many([('Commenter', {}, 0)] * 2)
+    job.task_succeeded(self._released_tasks()[0].name)
+    self.patched_task_enqueue_many.reset_mock()
+    job.enqueue_many([('Commenter', {}, 0)])
+    self.patched_task_enqueue_many.assert_not_called()
+    self.assertLen(models.HeldTask.all(), 2)
+
+  def test_release_sends_held_tasks_as_tasks_finish(self):
+    job = self._create_running_job(max_concurrent_tasks=2)
+    job.enqueue_many(
+        [('Commenter', {'comment': str(i)}, 60) for i in range(4)])
+    self.assertEqual(admission.release(), 0)
+    job.task_succeeded(self._released_tasks()[0].name)
+    now = datetime.datetime.utcnow()
+    self.assertEqual(admission.release(now=now), 1)
+    released_tasks = self.patched_task_enqueue_many.call_args.args[0]
+    self.assertEqual(
+        [(t.worker_params, t.name) for t, _ in released_tasks],
+        [({'comment': '2'}, released_tasks[0][0].name)])
+    self.assertBetween(released_tasks[0][1], 1, 60)
+    self.assertLen(models.HeldTask.all(), 1)
+    self.assertEqual(job.status, models.Job.STATUS.RUNNING)
+
+  def test_release_takes_turns_between_pipelines(self):
+    self.enter_context(
+        mock.patch.dict(
+            os.environ, {'WORKER_CLASS_MAX_CONCURRENT_TASKS': 'Commenter=2'}))
+    job1 = self._create_running_job(max_concurrent_tasks=0)
+    job2 = self._create_running_job(max_concurrent_tasks=0)
+    job1.enqueue_many([('Commenter', {}, 0)] * 4)
+    sent_tasks = self._released_tasks()
+    job2.enqueue_many([('Commenter', {}, 0)] * 3)
+    self.assertLen(models.HeldTask.all(), 5)
+    for task_inst in sent_tasks:
+      job1.task_succeeded(task_inst.name)
+    self.assertEqual(admission.release(), 2)
+    self.assertEqual(
+        [t.pipeline_id for t in self._released_tasks()],
+        [job1.pipeline_id, job2.pipeline_id])
+
+  def test_release_drops_tasks_of_stopped_jobs(self):
+    job = self._create_running_job(max_concurrent_tasks=1)
+    job.enqueue_many([('Commenter', {}, 0)] * 3)
+    self.assertTrue(job.stop())
+    self.assertEqual(admission.release(), 0)
+    self.assertEmpty(models.HeldTask.all())
+    self.assertEqual(job._enqueued_task_count(), 1)
+
+  def test_release_cancels_tasks_of_stopping_jobs(self):
+    job = self._create_running_job(max_concurrent_tasks=1)
+    job.enqueue_many([('Commenter', {}, 0)] * 3)
+    self.assertTrue(job.stop())
+    job.task_succeeded(self._released_tasks()[0].name)
+    self.assertEqual(job.status, models.Job.STATUS.STOPPING)
+    admission.release()
+    self.assertEqual(job._enqueued_task_count(), 0)
+    self.assertEqual(job.status, models.Job.STATUS.IDLE)
+
+  def test_pipelines_have_no_budget_by_default(self):
+    self.enter_context(mock.patch.dict(os.environ, clear=True))
+    pipeline = models.Pipeline.create()
+    self.assertIsNone(pipeline.get_task_budget())
+
+  def test_release_holds_again_tasks_not_published(self):
+    job = self._create_running_job(max_concurrent_tasks=2)
+    job.enqueue_many([('Commenter', {}, 0)] * 4)
+    for task_inst in self._released_tasks():
+      job.task_succeeded(task_inst.name)
+    self.patched_task_enqueue_many.side_effect = message.PublishError(
+        {1: TimeoutError()})
+    with self.assertRaises(message.PublishError):
+      admission.release()
+    held_tasks = models.HeldTask.all()
+    self.assertLen(held_tasks, 1)
+    self.assertEqual(held_tasks[0].task_name, self._released_tasks()[1].name)
+
+  def test_release_and_log_logs_tasks_not_published(self):
+    job = self._create_running_job(max_concurrent_tasks=1)
+    job.enqueue_many([('Commenter', {}, 0)] * 2)
+    job.task_succeeded(self._released_tasks()[0].name)
+    self.patched_task_enqueue_many.side_effect = message.PublishError(
+        {0: TimeoutError()})
+    patched_log_global_message = self.enter_context(
+        mock.patch.object(
+            crmint_logging, 'log_global_message', autospec=True))
+    admission.release_and_log()
+    self.assertLen(models.HeldTask.all(), 1)
+    patched_log_global_message.assert_called_once_with(
+        'Failed releasing 1 held tasks', log_level='WARNING')
+
+  def test_worker_class_budgets_are_read_from_environment(self):
+    self.enter_context(
+        mock.patch.dict(
+            os.environ,
+            {'WORKER_CLASS_MAX_CONCURRENT_TASKS': 'BQWorker=5, Commenter=2'}))
+    self.assertEqual(models.HeldTask.get_worker_class_budget('Commenter'), 2)
+    self.assertIsNone(models.HeldTask.get_worker_class_budget('GAWorker'))
+
+
+if __name__ == '__main__':
+  absltest.main()
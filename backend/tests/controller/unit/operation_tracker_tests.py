@@ -0,0 +1,207 @@
+# Copyright 2026 Google Inc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for controller.operation_tracker."""
+
+import datetime
+import os
+import threading
+from unittest import mock
+
+from absl.testing import absltest
+
+from common import crmint_logging
+from common import task
+from controller import models
+from controller import operation_tracker
+from tests import controller_utils
+
+
+class OperationTrackerTest(controller_utils.ModelTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_message', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_pipeline_status', autospec=True))
+    self.patched_task_enqueue = self.enter_context(
+        mock.patch.object(task.Task, 'enqueue', autospec=True))
+    self.patched_task_enqueue_many = self.enter_context(
+        mock.patch.object(task.Task, 'enqueue_many', autospec=True))
+    self.enter_context(
+        mock.patch.dict(os.environ, {'TRACK_EXTERNAL_OPERATIONS': '1'}))
+    self.pipeline = models.Pipeline.create(
+        status=models.Pipeline.STATUS.RUNNING)
+    self.job = models.Job.create(
+        pipeline_id=self.pipeline.id, status=models.Job.STATUS.RUNNING)
+
+  def _track_bigquery_job(self):
+    return self.job.enqueue('BQWaiter', {'job_id': 'JOBID', 'location': 'US'})
+
+  def test_waiter_is_tracked_instead_of_enqueued(self):
+    task_inst = self._track_bigquery_job()
+    self.patched_task_enqueue.assert_not_called()
+    self.assertEqual(self.job._enqueued_task_count(), 1)
+    operation = models.TrackedOperation.where(
+        task_name=task_inst.name).first()
+    self.assertEqual(operation.params, {'job_id': 'JOBID', 'location': 'US'})
+
+  def test_waiter_is_enqueued_if_tracking_disabled(self):
+    with mock.patch.dict(os.environ, {'TRACK_EXTERNAL_OPERATIONS': '0'}):
+      self._track_bigquery_job()
+    self.patched_task_enqueue.assert_called_once()
+    self.assertEmpty(models.TrackedOperation.all())
+
+  def test_sweep_hands_succeeded_operations_over_to_waiters(self):
+    task_inst = self._track_bigquery_job()
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_bigquery_job',
+            autospec=True,
+            return_value=(operation_tracker.OperationStatus.SUCCEEDED, None)))
+    completed_count = operation_tracker.sweep()
+    self.assertEqual(completed_count, 1)
+    self.assertEmpty(models.TrackedOperation.all())
+    # The waiter runs its completion logic and reports the task result.
+    sent_task = self.patched_task_enqueue.call_args.args[0]
+    self.assertEqual(sent_task.name, task_inst.name)
+    self.assertEqual(sent_task.worker_class, 'BQWaiter')
+    self.assertEqual(sent_task.worker_params,
+                     {'job_id': 'JOBID', 'location': 'US'})
+    self.assertEqual(self.job._enqueued_task_count(), 1)
+    self.assertEqual(self.job.status, models.Job.STATUS.RUNNING)
+
+  def test_sweep_fails_tasks_of_failed_operations(self):
+    self._track_bigquery_job()
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_bigquery_job',
+            autospec=True,
+            return_value=(operation_tracker.OperationStatus.FAILED, 'Error')))
+    self.assertEqual(operation_tracker.sweep(), 1)
+    self.assertEmpty(models.TrackedOperation.all())
+    self.patched_task_enqueue.assert_not_called()
+    self.assertEqual(self.job._enqueued_task_count(), 0)
+    self.assertEqual(self.job.status, models.Job.STATUS.FAILED)
+
+  def test_check_bigquery_job_waits_for_all_jobs(self):
+    patched_client = mock.create_autospec(
+        operation_tracker.bigquery.Client, instance=True)
+    patched_client.get_job.side_effect = [
+        mock.Mock(error_result=None, state='DONE'),
+        mock.Mock(error_result=None, state='RUNNING'),
+    ]
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker.bigquery, 'Client', return_value=patched_client))
+    status, _ = operation_tracker._Poller().check_bigquery_job(
+        {'job_ids': ['JOB1', 'JOB2'], 'location': 'US', 'manifest_uri': 'x'})
+    self.assertEqual(status, operation_tracker.OperationStatus.RUNNING)
+    self.assertEqual(patched_client.get_job.call_count, 2)
+
+  def test_sweep_postpones_running_operations(self):
+    self._track_bigquery_job()
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_bigquery_job',
+            autospec=True,
+            return_value=(operation_tracker.OperationStatus.RUNNING, None)))
+    now = datetime.datetime.utcnow()
+    completed_count = operation_tracker.sweep(now)
+    self.assertEqual(completed_count, 0)
+    operation = models.TrackedOperation.first()
+    self.assertEqual(operation.attempts, 1)
+    self.assertBetween(
+        (operation.next_check_at - now).total_seconds(), 48, 72)
+    self.assertEqual(self.job.status, models.Job.STATUS.RUNNING)
+
+  def test_sweep_skips_operations_not_due(self):
+    self.job.enqueue(
+        'BQWaiter', {'job_id': 'JOBID', 'location': 'US'}, delay=60)
+    patched_check = self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller, 'check_bigquery_job', autospec=True))
+    self.assertEqual(operation_tracker.sweep(), 0)
+    patched_check.assert_not_called()
+
+  def test_sweep_reschedules_on_polling_error(self):
+    self._track_bigquery_job()
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_bigquery_job',
+            autospec=True,
+            side_effect=RuntimeError('Boom')))
+    self.assertEqual(operation_tracker.sweep(), 0)
+    self.assertEqual(models.TrackedOperation.first().attempts, 1)
+    self.assertEqual(self.job._enqueued_task_count(), 1)
+
+  def test_sweep_leaves_operations_not_checked_in_time_due(self):
+    self._track_bigquery_job()
+    self.job.enqueue(
+        'VertexAIWaiter', {'id': 'projects/p/locations/us-central1/x/1'})
+    check_released = threading.Event()
+    self.addCleanup(check_released.set)
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_bigquery_job',
+            autospec=True,
+            side_effect=lambda *_: check_released.wait()))
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_vertexai_resource',
+            autospec=True,
+            return_value=(operation_tracker.OperationStatus.SUCCEEDED, None)))
+    self.assertEqual(operation_tracker.sweep(timeout=0.5), 1)
+    operation = models.TrackedOperation.first()
+    self.assertEqual(operation.worker_class, 'BQWaiter')
+    self.assertEqual(operation.attempts, 0)
+
+  def test_sweep_reschedules_unsupported_operations(self):
+    self.job.enqueue('BQWaiter', {'job_id': 'JOBID', 'location': 'US'})
+    models.TrackedOperation.first().update(worker_class='UnknownWaiter')
+    self.assertEqual(operation_tracker.sweep(), 0)
+    self.assertEqual(models.TrackedOperation.first().attempts, 1)
+
+  def test_sweep_fails_tasks_after_maximum_attempts(self):
+    self._track_bigquery_job()
+    models.TrackedOperation.first().update(
+        attempts=models.TrackedOperation.MAX_ATTEMPTS - 1)
+    self.enter_context(
+        mock.patch.object(
+            operation_tracker._Poller,
+            'check_bigquery_job',
+            autospec=True,
+            side_effect=KeyError('job_id')))
+    self.assertEqual(operation_tracker.sweep(), 0)
+    self.assertEmpty(models.TrackedOperation.all())
+    self.assertEqual(self.job._enqueued_task_count(), 0)
+    self.assertEqual(self.job.status, models.Job.STATUS.FAILED)
+
+  def test_stopping_job_deletes_tracked_operations(self):
+    self._track_bigquery_job()
+    self.assertTrue(self.job.stop())
+    self.assertEmpty(models.TrackedOperation.all())
+    self.assertEqual(self.job._enqueued_task_count(), 0)
+    self.assertEqual(self.job.status, models.Job.STATUS.IDLE)
+
+
+if __name__ == '__main__':
+  absltest.main()
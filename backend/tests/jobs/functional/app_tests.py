@@ -12,10 +12,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
+import json
+from unittest import mock
+
+from absl.testing import absltest
+
+from common import result
+from jobs import executor
+from jobs.workers import finder
+from jobs.workers import worker
+import jobs_app
 from jobs_app import app
 from tests import utils
 
 
+# Requests are authenticated, except on the development port.
+_DEV_BASE_URL = 'http://localhost:8081'
+
+
+def _make_task_payload(worker_class, worker_params, general_settings=None):
+  data = {
+      'task_name': 'TASK',
+      'pipeline_id': 1,
+      'job_id': 1,
+      'worker_class': worker_class,
+      'worker_params': worker_params,
+      'general_settings': general_settings or {},
+      'attempts': 1,
+  }
+  return {
+      'message': {
+          'attributes': {'start_time': 0},
+          'data': base64.b64encode(json.dumps(data).encode('utf8')).decode(),
+      }
+  }
+
+
 class TestJobsApp(utils.AppTestCase):
 
   def create_app(self):
@@ -27,3 +60,77 @@ class TestJobsApp(utils.AppTestCase):
   def test_root_accessible(self):
     response = self.client.get('/api/workers')
     self.assertEqual(response.status_code, 200)
+
+  def test_start_task_reports_result_once_executed(self):
+    patched_report = self.enter_context(
+        mock.patch.object(result.Result, 'report', autospec=True))
+    response = self.client.post(
+        '/push/start-task',
+        json=_make_task_payload('Commenter', {'success': True}),
+        base_url=_DEV_BASE_URL)
+    self.assertEqual(response.status_code, 200)
+    patched_report.assert_called_once()
+    self.assertTrue(patched_report.call_args.args[0].success)
+
+  def test_start_task_records_metrics(self):
+    self.enter_context(
+        mock.patch.object(result.Result, 'report', autospec=True))
+    self.client.post(
+        '/push/start-task',
+        json=_make_task_payload('Commenter', {'success': True}),
+        base_url=_DEV_BASE_URL)
+    metrics_log_levels = [
+        c.kwargs['log_level']
+        for c in self.patched_log_message.call_args_list
+        if (c.kwargs.get('extra_fields') or {}).get('log_type') ==
+        'TASK_METRICS'
+    ]
+    self.assertEqual(metrics_log_levels, ['DEBUG'])
+    response = self.client.get('/metrics')
+    self.assertEqual(response.status_code, 200)
+    self.assertIn(
+        'crmint_tasks_total{worker_class="Commenter",pipeline_id="1",'
+        'status="success"}',
+        response.get_data(as_text=True))
+
+  def test_start_task_strips_global_settings_from_sub_workers(self):
+
+    class RelayingWorker(worker.Worker):
+      GLOBAL_SETTINGS = ['client_secret']
+
+      def _execute(self):
+        self._enqueue('RelayingWorker', self._params.copy())
+
+    self.enter_context(
+        mock.patch.object(
+            finder, 'get_worker_class', autospec=True,
+            return_value=RelayingWorker))
+    patched_report = self.enter_context(
+        mock.patch.object(result.Result, 'report', autospec=True))
+    self.client.post(
+        '/push/start-task',
+        json=_make_task_payload(
+            'RelayingWorker', {'page': 1}, {'client_secret': 'secret'}),
+        base_url=_DEV_BASE_URL)
+    result_inst = patched_report.call_args.args[0]
+    self.assertEqual(
+        result_inst.workers_to_enqueue,
+        [('RelayingWorker', {'page': 1}, 0, RelayingWorker.PRIORITY)])
+
+  def test_start_task_rejected_by_executor_is_not_acknowledged(self):
+    patched_report = self.enter_context(
+        mock.patch.object(result.Result, 'report', autospec=True))
+    self.enter_context(
+        mock.patch.object(
+            jobs_app._executor, 'submit', autospec=True,
+            side_effect=executor.RejectedTaskError('Busy')))
+    response = self.client.post(
+        '/push/start-task',
+        json=_make_task_payload('Commenter', {'success': True}),
+        base_url=_DEV_BASE_URL)
+    self.assertEqual(response.status_code, 429)
+    patched_report.assert_not_called()
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,111 @@
+"""Tests for executor."""
+
+import threading
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+from common import task
+from jobs import executor
+from jobs.workers import worker
+
+
+class LightWorker(worker.Worker):
+  MEMORY_MB = 10
+
+
+class LimitedWorker(worker.Worker):
+  MAX_CONCURRENT_TASKS = 1
+  MEMORY_MB = 10
+
+
+class HeavyWorker(worker.Worker):
+  MEMORY_MB = 100
+
+
+class TaskExecutorTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.executor = executor.TaskExecutor(
+        max_concurrent_tasks=3, memory_budget_mb=120)
+    self.release_tasks = threading.Event()
+    self.addCleanup(self.release_tasks.set)
+
+  def _submit(self, worker_class):
+    return self.executor.submit(
+        worker_class, self.release_tasks.wait, 10)
+
+  def test_runs_tasks_and_returns_results(self):
+    future = self.executor.submit(LightWorker, lambda x: x * 2, 21)
+    self.assertEqual(future.result(), 42)
+
+  @parameterized.named_parameters(
+      ('Instance limit', [LightWorker] * 3, LightWorker, 429),
+      ('Worker class limit', [LimitedWorker], LimitedWorker, 429),
+      ('Memory budget', [HeavyWorker, LightWorker], HeavyWorker, 429),
+  )
+  def test_rejects_tasks_above_limits(self, running, rejected, code):
+    for worker_class in running:
+      self._submit(worker_class)
+    with self.assertRaises(executor.RejectedTaskError) as context:
+      self._submit(rejected)
+    self.assertEqual(context.exception.code, code)
+
+  def test_admits_other_worker_classes_below_limits(self):
+    self._submit(LimitedWorker)
+    self._submit(HeavyWorker)
+    self.assertEqual(
+        self.executor.running_tasks, {'LimitedWorker': 1, 'HeavyWorker': 1})
+    self.assertEqual(self.executor.reserved_memory_mb, 110)
+
+  def test_admits_single_task_above_memory_budget(self):
+    small_executor = executor.TaskExecutor(
+        max_concurrent_tasks=3, memory_budget_mb=50)
+    future = small_executor.submit(HeavyWorker, lambda: 'OK')
+    self.assertEqual(future.result(), 'OK')
+
+  def test_keeps_slots_for_tasks_of_higher_priority(self):
+    for _ in range(2):
+      self.executor.submit(
+          LightWorker, self.release_tasks.wait, 10,
+          priority=task.Priority.LOW)
+    with self.assertRaises(executor.RejectedTaskError) as context:
+      self.executor.submit(
+          LightWorker, self.release_tasks.wait, 10,
+          priority=task.Priority.LOW)
+    self.assertEqual(context.exception.code, 429)
+    self.executor.submit(
+        LightWorker, self.release_tasks.wait, 10,
+        priority=task.Priority.HIGH)
+    self.assertEqual(self.executor.running_tasks, {'LightWorker': 3})
+
+  def test_releases_slot_once_task_is_done(self):
+    future = self._submit(LimitedWorker)
+    self.release_tasks.set()
+    future.result()
+    self.assertEqual(self.executor.running_tasks, {})
+    self.assertEqual(self.executor.reserved_memory_mb, 0)
+    self._submit(LimitedWorker)
+
+  def test_releases_slot_once_task_failed(self):
+    def _fail():
+      raise ValueError('Failure')
+    future = self.executor.submit(LimitedWorker, _fail)
+    with self.assertRaises(ValueError):
+      future.result()
+    self.assertEqual(self.executor.running_tasks, {})
+
+  def test_drain_waits_for_running_tasks_and_rejects_new_ones(self):
+    future = self._submit(LightWorker)
+    self.assertFalse(self.executor.drain(timeout=0.01))
+    with self.assertRaises(executor.RejectedTaskError) as context:
+      self._submit(LightWorker)
+    self.assertEqual(context.exception.code, 503)
+    self.release_tasks.set()
+    self.assertTrue(self.executor.drain(timeout=10))
+    self.assertTrue(future.done())
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,129 @@
+"""Tests for jobs.pull_runner."""
+
+from concurrent import futures
+import json
+import threading
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from google.cloud import pubsub_v1
+
+from common import crmint_logging
+from common import result
+from jobs import executor
+from jobs import pull_runner
+from jobs import task_runner
+
+
+def _make_pulled_message(worker_class='Commenter', start_time=0, data=None):
+  if data is None:
+    data = json.dumps({
+        'task_name': 'TASK',
+        'pipeline_id': 1,
+        'job_id': 1,
+        'worker_class': worker_class,
+        'worker_params': {'success': True},
+        'general_settings': {},
+        'attempts': 1,
+    }).encode('utf-8')
+  pulled_message = mock.create_autospec(
+      pubsub_v1.subscriber.message.Message, instance=True)
+  pulled_message.message_id = 'MESSAGE_ID'
+  pulled_message.data = data
+  pulled_message.attributes = {'start_time': str(start_time)}
+  return pulled_message
+
+
+class PullRunnerTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.patched_report = self.enter_context(
+        mock.patch.object(result.Result, 'report', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_message', autospec=True))
+    self.enter_context(
+        mock.patch.object(crmint_logging, 'log_global_message', autospec=True))
+    self.task_executor = executor.TaskExecutor(max_concurrent_tasks=2)
+    self.runner = pull_runner.PullRunner(self.task_executor)
+
+  def test_executes_task_then_acknowledges_message(self):
+    pulled_message = _make_pulled_message()
+    self.runner.handle_message(pulled_message)
+    self.assertTrue(self.task_executor.drain(5))
+    self.patched_report.assert_called_once()
+    self.assertTrue(self.patched_report.call_args.args[0].success)
+    pulled_message.ack.assert_called_once()
+    pulled_message.nack.assert_not_called()
+
+  def test_does_not_acknowledge_scheduled_task(self):
+    pulled_message = _make_pulled_message(start_time=int(time.time()) + 3600)
+    self.runner.handle_message(pulled_message)
+    pulled_message.nack.assert_called_once()
+    self.assertEqual(self.task_executor.running_tasks, {})
+
+  def test_acknowledges_invalid_message(self):
+    pulled_message = _make_pulled_message(data=b'not json')
+    self.runner.handle_message(pulled_message)
+    pulled_message.ack.assert_called_once()
+    self.patched_report.assert_not_called()
+
+  def test_does_not_acknowledge_rejected_task(self):
+    self.enter_context(
+        mock.patch.object(
+            self.task_executor, 'submit',
+            side_effect=executor.RejectedTaskError('Busy')))
+    pulled_message = _make_pulled_message()
+    self.runner.handle_message(pulled_message)
+    pulled_message.nack.assert_called_once()
+    pulled_message.ack.assert_not_called()
+
+  def test_does_not_acknowledge_unexpected_failure(self):
+    self.enter_context(
+        mock.patch.object(
+            task_runner, 'execute_task', side_effect=RuntimeError()))
+    pulled_message = _make_pulled_message()
+    self.runner.handle_message(pulled_message)
+    self.task_executor.drain(5)
+    pulled_message.nack.assert_called_once()
+
+  def test_pulls_with_flow_control_until_stopped(self):
+    subscriber = mock.create_autospec(
+        pubsub_v1.SubscriberClient, instance=True)
+    subscriber.subscribe.side_effect = [futures.Future(), futures.Future()]
+    run_thread = threading.Thread(
+        target=self.runner.run,
+        args=(subscriber, ['HIGH_SUBSCRIPTION', 'LOW_SUBSCRIPTION']))
+    run_thread.start()
+    while not subscriber.subscribe.called:
+      time.sleep(0.01)
+    self.runner.stop(timeout=1)
+    run_thread.join(timeout=5)
+    self.assertFalse(run_thread.is_alive())
+    self.assertEqual(subscriber.subscribe.call_count, 2)
+    flow_controls = [
+        c.kwargs['flow_control'] for c in subscriber.subscribe.call_args_list]
+    self.assertEqual(
+        sum(fc.max_messages for fc in flow_controls),
+        pull_runner._MAX_OUTSTANDING_MESSAGES)
+    self.assertGreater(
+        flow_controls[0].max_messages, flow_controls[1].max_messages)
+    self.assertEqual(
+        flow_controls[0].max_lease_duration, pull_runner._MAX_LEASE_DURATION)
+
+  def test_split_budget_favors_higher_priority_lanes(self):
+    self.assertEqual(pull_runner._split_budget(16, 3), [9, 5, 2])
+    self.assertEqual(pull_runner._split_budget(12, 1), [12])
+    self.assertEqual(pull_runner._split_budget(2, 3), [1, 1, 1])
+
+  def test_does_not_pull_once_stopped(self):
+    subscriber = mock.create_autospec(
+        pubsub_v1.SubscriberClient, instance=True)
+    self.runner.stop(timeout=1)
+    self.runner.run(subscriber, ['SUBSCRIPTION'])
+    subscriber.subscribe.assert_not_called()
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -8,6 +8,7 @@ from google.auth import credentials
 from google.cloud import bigquery
 
 from jobs.workers.bigquery import bq_query_launcher
+from jobs.workers.bigquery import bq_worker
 
 
 def _make_credentials():
@@ -42,6 +43,7 @@ class BQQueryLauncherTest(parameterized.TestCase):
         bigquery.job.QueryJob, instance=True, spec_set=True)
     mock_job.error_result = None
     mock_job.state = 'RUNNING'
+    mock_job.total_bytes_processed = 1000
     patched_query = self.enter_context(
         mock.patch.object(
             bq_client, 'query', autospec=True, return_value=mock_job))
@@ -49,12 +51,18 @@ class BQQueryLauncherTest(parameterized.TestCase):
     self.enter_context(
         mock.patch.object(
             worker_inst, '_get_client', autospec=True, return_value=bq_client))
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
     worker_inst.execute()
     call_job_config = patched_query.call_args.kwargs['job_config']
     self.assertIsInstance(call_job_config, bigquery.QueryJobConfig)
+    with self.subTest('Ensures query is dry-run before running'):
+      self.assertEqual(patched_query.call_count, 2)
+      dry_run_job_config = patched_query.call_args_list[0].kwargs['job_config']
+      self.assertTrue(dry_run_job_config.dry_run)
     with self.subTest('Ensures query is passed with standard SQL config'):
-      patched_query.assert_called_once_with(
+      patched_query.assert_called_with(
           'SELECT * FROM mytable',
+          job_id=None,
           job_id_prefix='1_1_BQQueryLauncher',
           location='EU',
           job_config=mock.ANY)
@@ -6,7 +6,9 @@ from absl.testing import absltest
 from google.auth import credentials
 from google.cloud import bigquery
 
+from jobs.workers import worker
 from jobs.workers.bigquery import bq_script_executor
+from jobs.workers.bigquery import bq_worker
 
 
 def _make_credentials():
@@ -180,5 +182,128 @@ class BQScriptExecutorTest(absltest.TestCase):
     )
 
 
+class BQScriptExecutorParallelTest(absltest.TestCase):
+
+  _SCRIPT = """
+      CREATE OR REPLACE TABLE d.a AS SELECT 1 AS id;
+      CREATE OR REPLACE TABLE d.b AS SELECT 2 AS id;
+      CREATE OR REPLACE TABLE d.c AS SELECT * FROM d.a JOIN d.b USING (id);
+      """
+
+  def setUp(self):
+    super().setUp()
+    self.mock_client = mock.create_autospec(
+        bigquery.Client, instance=True, spec_set=True)
+    self.job_states = {}
+
+    def _query(statement, location, job_id_prefix, job_config=None,
+               job_id=None):
+      del statement, job_id_prefix, job_id  # Unused
+      job = mock.create_autospec(
+          bigquery.QueryJob, instance=True, spec_set=False)
+      job.total_bytes_processed = 1000
+      if job_config and job_config.dry_run:
+        return job
+      job.job_id = f'JOB{len(self.job_states)}'
+      job.location = location or 'US'
+      self.job_states[job.job_id] = 'RUNNING'
+      return job
+
+    def _get_job(job_id, location):
+      del location  # Unused
+      job = mock.create_autospec(
+          bigquery.QueryJob, instance=True, spec_set=False)
+      job.error_result = None
+      job.state = self.job_states[job_id]
+      return job
+
+    self.mock_client.query.side_effect = _query
+    self.mock_client.get_job.side_effect = _get_job
+    self.enter_context(
+        mock.patch.object(
+            bq_script_executor.BQScriptExecutor,
+            '_get_client',
+            autospec=True,
+            return_value=self.mock_client))
+    self.enter_context(
+        mock.patch.object(
+            bq_script_executor.BQScriptExecutor, '_log', autospec=True))
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
+
+  def test_starts_independent_statements_and_relays_to_waiter(self):
+    worker_inst = bq_script_executor.BQScriptExecutor(
+        {'script': self._SCRIPT, 'parallel': True}, 1, 1)
+    workers_to_enqueue = worker_inst.execute()
+    self.assertLen(self.job_states, 2)
+    self.assertLen(workers_to_enqueue, 1)
+    worker_class, state, _ = workers_to_enqueue[0]
+    self.assertEqual(worker_class, 'BQScriptWaiter')
+    self.assertEqual(state['done'], [False, False, False])
+    self.assertIsNone(state['jobs'][2])
+
+  def test_waiter_starts_dependent_statement_once_dependencies_are_done(self):
+    worker_inst = bq_script_executor.BQScriptExecutor(
+        {'script': self._SCRIPT, 'parallel': True}, 1, 1)
+    _, state, _ = worker_inst.execute()[0]
+    self.job_states['JOB0'] = 'DONE'
+    self.job_states['JOB1'] = 'DONE'
+    waiter_inst = bq_script_executor.BQScriptWaiter(state, 1, 1)
+    workers_to_enqueue = waiter_inst.execute()
+    self.assertLen(self.job_states, 3)
+    self.assertIn('JOIN d.b', self.mock_client.query.call_args.args[0])
+    self.job_states['JOB2'] = 'DONE'
+    waiter_inst = bq_script_executor.BQScriptWaiter(
+        workers_to_enqueue[0][1], 1, 1)
+    patched_logger = self.enter_context(
+        mock.patch.object(waiter_inst, 'log_info', autospec=True))
+    self.assertEmpty(waiter_inst.execute())
+    patched_logger.assert_any_call('Finished running 3 statements.')
+
+  def test_waiter_starts_statements_with_budget(self):
+    worker_inst = bq_script_executor.BQScriptExecutor(
+        {'script': self._SCRIPT, 'parallel': True,
+         'maximum_bytes_billed': 10**10}, 1, 1)
+    _, state, _ = worker_inst.execute()[0]
+    self.job_states['JOB0'] = 'DONE'
+    self.job_states['JOB1'] = 'DONE'
+    waiter_inst = bq_script_executor.BQScriptWaiter(state, 1, 1)
+    waiter_inst.execute()
+    self.assertIn('JOIN d.b', self.mock_client.query.call_args.args[0])
+    job_config = self.mock_client.query.call_args.kwargs['job_config']
+    self.assertEqual(job_config.maximum_bytes_billed, 10**10)
+
+  def test_waiter_raises_on_failed_statement(self):
+    worker_inst = bq_script_executor.BQScriptExecutor(
+        {'script': self._SCRIPT, 'parallel': True}, 1, 1)
+    _, state, _ = worker_inst.execute()[0]
+    failed_job = mock.create_autospec(
+        bigquery.QueryJob, instance=True, spec_set=False)
+    failed_job.error_result = {'message': 'Table not found'}
+    self.mock_client.get_job.side_effect = None
+    self.mock_client.get_job.return_value = failed_job
+    waiter_inst = bq_script_executor.BQScriptWaiter(state, 1, 1)
+    with self.assertRaisesRegex(worker.WorkerException, 'Table not found'):
+      waiter_inst.execute()
+
+  def test_skips_cached_statements(self):
+    worker_inst = bq_script_executor.BQScriptExecutor(
+        {'script': self._SCRIPT, 'parallel': True, 'use_cache': True}, 1, 1)
+    patched_cached_query = self.enter_context(
+        mock.patch.object(
+            worker_inst, '_cached_query', autospec=True, return_value=None))
+    self.assertEmpty(worker_inst.execute())
+    self.assertEqual(patched_cached_query.call_count, 3)
+    self.assertEmpty(self.job_states)
+
+  def test_falls_back_to_single_job_for_scripting(self):
+    worker_inst = bq_script_executor.BQScriptExecutor(
+        {'script': 'DECLARE x INT64; SELECT x;', 'parallel': True}, 1, 1)
+    patched_wait = self.enter_context(
+        mock.patch.object(worker_inst, '_wait', autospec=True))
+    worker_inst.execute()
+    self.assertLen(self.job_states, 1)
+    patched_wait.assert_called_once()
+
+
 if __name__ == '__main__':
   absltest.main()
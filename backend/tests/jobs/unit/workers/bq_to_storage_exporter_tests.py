@@ -7,7 +7,9 @@ from absl.testing import parameterized
 from google.auth import credentials
 from google.cloud import bigquery
 
+from jobs.workers import worker
 from jobs.workers.bigquery import bq_to_storage_exporter
+from jobs.workers.bigquery import bq_worker
 
 
 def _make_credentials():
@@ -68,5 +70,170 @@ class BQToStorageExporterTest(parameterized.TestCase):
     self.assertEqual(call_job_config.compression, compression)
 
 
+  def _make_worker(self, params):
+    worker_inst = bq_to_storage_exporter.BQToStorageExporter(
+        {
+            'bq_project_id': 'PROJECT',
+            'bq_dataset_id': 'DATASET',
+            'bq_table_id': 'TABLE',
+            **params,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    self.mock_client = mock.create_autospec(
+        bigquery.Client, instance=True, spec_set=True)
+    self.mock_client.extract_table.side_effect = self._make_job
+    self.enter_context(
+        mock.patch.object(
+            worker_inst,
+            '_get_client',
+            return_value=self.mock_client,
+            autospec=True,
+            spec_set=True))
+    self.patched_enqueue = self.enter_context(
+        mock.patch.object(worker_inst, '_enqueue', autospec=True))
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    self.enter_context(mock.patch('time.sleep', autospec=True))
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
+    return worker_inst
+
+  def _make_job(self, source, destination_uris, **unused_kwargs):
+    job = mock.create_autospec(
+        bigquery.job.ExtractJob, instance=True, spec_set=True)
+    job.job_id = f'JOB_{source.table_id}'
+    job.location = 'EU'
+    job.error_result = None
+    return job
+
+  def _make_table(self, partitioned):
+    table = bigquery.Table('PROJECT.DATASET.TABLE')
+    table._properties['numRows'] = '15'
+    if partitioned:
+      table.time_partitioning = bigquery.TimePartitioning()
+    return table
+
+  def test_extract_table_with_format_and_compression(self):
+    worker_inst = self._make_worker(
+        {'export_format': 'avro', 'compression': 'snappy'})
+    worker_inst._execute()
+    call_job_config = (
+        self.mock_client.extract_table.call_args.kwargs['job_config'])
+    self.assertEqual(call_job_config.destination_format, 'AVRO')
+    self.assertEqual(call_job_config.compression, 'SNAPPY')
+    self.assertIsNone(call_job_config.print_header)
+
+  @parameterized.parameters(
+      ({'export_format': 'ORC'}, 'Unsupported export format: ORC'),
+      ({'compression': 'SNAPPY'}, 'Unsupported compression for CSV format'),
+  )
+  def test_unsupported_format_raises_worker_exception(self, params, message):
+    worker_inst = self._make_worker(params)
+    with self.assertRaisesRegex(worker.WorkerException, message):
+      worker_inst._execute()
+    self.mock_client.extract_table.assert_not_called()
+
+  def test_exports_partitions_in_parallel_with_manifest(self):
+    worker_inst = self._make_worker({
+        'destination_uri': 'gs://bucket/data-*.avro',
+        'export_format': 'AVRO',
+        'split_by_partition': True,
+        'manifest_uri': 'gs://bucket/manifest.json',
+    })
+    self.mock_client.get_table.return_value = self._make_table(True)
+    self.mock_client.query.return_value.total_bytes_processed = 0
+    self.mock_client.query.return_value.referenced_tables = []
+    self.mock_client.query.return_value.result.return_value = [
+        {'partition_id': '20200101', 'total_rows': 10},
+        {'partition_id': '20200102', 'total_rows': 5},
+        {'partition_id': '__UNPARTITIONED__', 'total_rows': 3},
+    ]
+    worker_inst._execute()
+    self.assertCountEqual(
+        [
+            (call.args[0].table_id, call.kwargs['destination_uris'])
+            for call in self.mock_client.extract_table.call_args_list
+        ],
+        [
+            ('TABLE$20200101', 'gs://bucket/data-20200101-*.avro'),
+            ('TABLE$20200102', 'gs://bucket/data-20200102-*.avro'),
+        ])
+    self.patched_enqueue.assert_called_once_with(
+        'BQWaiter',
+        {
+            'job_ids': ['JOB_TABLE$20200101', 'JOB_TABLE$20200102'],
+            'location': 'EU',
+            'manifest_uri': 'gs://bucket/manifest.json',
+            'manifest_shards': [
+                {
+                    'partition_id': '20200101',
+                    'uri': 'gs://bucket/data-20200101-*.avro',
+                    'row_count': 10,
+                },
+                {
+                    'partition_id': '20200102',
+                    'uri': 'gs://bucket/data-20200102-*.avro',
+                    'row_count': 5,
+                },
+            ],
+            'manifest_fields': {
+                'source_table': 'PROJECT.DATASET.TABLE',
+                'destination_format': 'AVRO',
+                'compression': 'NONE',
+            },
+        },
+        30)
+
+  def test_caps_running_extract_jobs(self):
+    worker_inst = self._make_worker({
+        'destination_uri': 'gs://bucket/data-*.avro',
+        'export_format': 'AVRO',
+        'split_by_partition': True,
+    })
+    self.enter_context(
+        mock.patch.object(bq_worker, 'MAX_RUNNING_EXTRACT_JOBS', 2))
+    self.mock_client.get_table.return_value = self._make_table(True)
+    self.mock_client.query.return_value.total_bytes_processed = 0
+    self.mock_client.query.return_value.referenced_tables = []
+    self.mock_client.query.return_value.result.return_value = [
+        {'partition_id': f'2020010{i}', 'total_rows': 10} for i in range(1, 6)
+    ]
+    worker_inst._execute()
+    self.assertEqual(self.mock_client.extract_table.call_count, 2)
+    self.patched_enqueue.assert_called_once()
+    waiter_params = self.patched_enqueue.call_args.args[1]
+    self.assertEqual(
+        waiter_params['job_ids'], ['JOB_TABLE$20200101', 'JOB_TABLE$20200102'])
+    self.assertEqual(
+        [shard['partition_id'] for shard in waiter_params['extract_shards']],
+        ['20200103', '20200104', '20200105'])
+    self.assertEqual(waiter_params['extract_source'], 'PROJECT.DATASET.TABLE')
+    self.assertLen(waiter_params['manifest_shards'], 5)
+
+  def test_exports_unpartitioned_table_in_single_job(self):
+    worker_inst = self._make_worker({
+        'destination_uri': 'gs://bucket/data-*.csv',
+        'split_by_partition': True,
+    })
+    self.mock_client.get_table.return_value = self._make_table(False)
+    worker_inst._execute()
+    self.mock_client.query.assert_not_called()
+    self.mock_client.extract_table.assert_called_once_with(
+        mock.ANY,
+        destination_uris='gs://bucket/data-*.csv',
+        job_id_prefix='1_1_BQToStorageExporter',
+        job_config=mock.ANY)
+    self.patched_enqueue.assert_not_called()
+
+  def test_split_by_partition_requires_wildcard(self):
+    worker_inst = self._make_worker({
+        'destination_uri': 'gs://bucket/data.csv',
+        'split_by_partition': True,
+    })
+    self.mock_client.get_table.return_value = self._make_table(True)
+    with self.assertRaisesRegex(worker.WorkerException, 'needs a wildcard'):
+      worker_inst._execute()
+
 if __name__ == '__main__':
   absltest.main()
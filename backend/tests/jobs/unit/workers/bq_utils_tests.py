@@ -1,5 +1,7 @@
 """Tests for bq_utils."""
 
+from unittest import mock
+
 from absl.testing import absltest
 from absl.testing import parameterized
 from google.cloud import bigquery
@@ -54,6 +56,15 @@ class BigqueryUtilsTest(parameterized.TestCase):
             bigquery.SchemaField('bar', 'STRING', mode='NULLABLE'),
         ])
 
+  def test_parsed_json_schemas_are_cached(self):
+    schema_json_encoded = '[{"name": "cached", "type": "STRING"}]'
+    first_schema = bq_utils.parse_bigquery_json_schema(schema_json_encoded)
+    first_schema.append(bigquery.SchemaField('added', 'STRING'))
+    with mock.patch('json.loads', autospec=True) as patched_loads:
+      schema = bq_utils.parse_bigquery_json_schema(schema_json_encoded)
+    patched_loads.assert_not_called()
+    self.assertEqual(schema, [bigquery.SchemaField('cached', 'STRING')])
+
   def test_bytes_converter(self):
     processed_units = bq_utils.bytes_converter(10000)
     self.assertEqual(processed_units, '10.0 KB')
@@ -64,6 +75,50 @@ class BigqueryUtilsTest(parameterized.TestCase):
     processed_units = bq_utils.bytes_converter(10000000000000)
     self.assertEqual(processed_units, '10.0 TB')
 
+  def test_build_statements_graph_with_independent_statements(self):
+    script = """
+        -- Feature tables; built from the same source.
+        CREATE OR REPLACE TABLE `p.d.features_a` AS SELECT ';' FROM d.src;
+        CREATE OR REPLACE TABLE p.d.features_b AS SELECT 1 FROM d.src;
+        /* Joins both features. */
+        CREATE OR REPLACE TABLE d.training AS
+          SELECT * FROM d.features_a JOIN `p.d.features_b` USING (id);
+        """
+    statements, dependencies = bq_utils.build_statements_graph(script)
+    self.assertLen(statements, 3)
+    self.assertTrue(statements[0].endswith("SELECT ';' FROM d.src"))
+    self.assertEqual(dependencies, [[], [], [0, 1]])
+
+  def test_build_statements_graph_keeps_write_after_read_order(self):
+    script = """
+        CREATE OR REPLACE TABLE d.report AS SELECT * FROM d.events;
+        DELETE FROM d.events WHERE TRUE;
+        """
+    _, dependencies = bq_utils.build_statements_graph(script)
+    self.assertEqual(dependencies, [[], [0]])
+
+  @parameterized.parameters(
+      'DECLARE x INT64; CREATE TABLE d.t AS SELECT x;',
+      'CREATE TEMP TABLE t AS SELECT 1; CREATE TABLE d.t AS SELECT * FROM t;',
+      'CREATE TABLE d.t AS SELECT 1; SELECT * FROM d.t;',
+  )
+  def test_build_statements_graph_rejects_scripting(self, script):
+    self.assertIsNone(bq_utils.build_statements_graph(script))
+
+  def test_get_table_references(self):
+    script = """
+        WITH recent AS (SELECT * FROM `p.d.events` WHERE day > '2020')
+        SELECT EXTRACT(YEAR FROM day) FROM recent;
+        CREATE TEMP TABLE t AS SELECT * FROM d.users;
+        INSERT INTO d.report SELECT * FROM t JOIN d.users USING (id);
+        -- Reads from its own output: FROM d.ignored
+        MERGE p.d.profiles USING d.report ON FALSE
+          WHEN NOT MATCHED THEN INSERT ROW;
+        """
+    read_tables, written_tables = bq_utils.get_table_references(script)
+    self.assertEqual(read_tables, ['d.users', 'p.d.events'])
+    self.assertEqual(written_tables, ['d.report', 'p.d.profiles'])
+
 
 if __name__ == '__main__':
   absltest.main()
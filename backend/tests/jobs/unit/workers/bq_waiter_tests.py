@@ -9,6 +9,8 @@ from google.cloud import bigquery
 
 from jobs.workers import worker
 from jobs.workers.bigquery import bq_waiter
+from jobs.workers.bigquery import bq_worker
+from jobs.workers.storage import storage_utils
 
 
 def _make_credentials():
@@ -86,5 +88,144 @@ class BQWaiterTest(parameterized.TestCase):
       worker_inst._execute()
 
 
+  def _make_multi_job_waiter(self, done_job_ids):
+    worker_inst = bq_waiter.BQWaiter(
+        {
+            'job_ids': ['JOB1', 'JOB2'],
+            'location': 'EU',
+            'manifest_uri': 'gs://bucket/manifest.json',
+            'manifest_shards': [{'uri': 'gs://bucket/data-*.avro'}],
+            'manifest_fields': {'destination_format': 'AVRO'},
+        },
+        1, 1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+
+    def _get_job(job_id, location):
+      job = mock.create_autospec(
+          bigquery.job.ExtractJob, instance=True, spec_set=True)
+      job.job_id = job_id
+      job.location = location
+      job.error_result = None
+      job.state = 'DONE' if job_id in done_job_ids else 'RUNNING'
+      job.done.return_value = job_id in done_job_ids
+      return job
+
+    mock_client = mock.create_autospec(
+        bigquery.Client, instance=True, spec_set=True)
+    mock_client.get_job.side_effect = _get_job
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, '_get_client', autospec=True,
+            return_value=mock_client))
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    self.patched_enqueue = self.enter_context(
+        mock.patch.object(worker_inst, '_enqueue', autospec=True))
+    self.enter_context(mock.patch('google.cloud.storage.Client', autospec=True))
+    self.patched_write_manifest = self.enter_context(
+        mock.patch.object(storage_utils, 'write_manifest', autospec=True))
+    return worker_inst
+
+  def test_waits_for_pending_jobs_only(self):
+    worker_inst = self._make_multi_job_waiter(done_job_ids=['JOB1'])
+    worker_inst._execute()
+    self.patched_enqueue.assert_called_once()
+    self.assertEqual(
+        self.patched_enqueue.call_args.args[1]['job_ids'], ['JOB2'])
+    self.assertEqual(
+        self.patched_enqueue.call_args.args[1]['manifest_uri'],
+        'gs://bucket/manifest.json')
+    self.patched_write_manifest.assert_not_called()
+
+  def test_writes_manifest_once_all_jobs_are_done(self):
+    worker_inst = self._make_multi_job_waiter(done_job_ids=['JOB1', 'JOB2'])
+    worker_inst._execute()
+    self.patched_enqueue.assert_not_called()
+    self.patched_write_manifest.assert_called_once_with(
+        mock.ANY,
+        'gs://bucket/manifest.json',
+        [{'uri': 'gs://bucket/data-*.avro'}],
+        destination_format='AVRO')
+
+  def test_extracts_next_shards_once_jobs_are_done(self):
+    worker_inst = self._make_multi_job_waiter(done_job_ids=['JOB1', 'JOB2'])
+    worker_inst._params.update({
+        'extract_shards': [
+            {'partition_id': f'2020010{i}', 'uri': f'gs://bucket/{i}-*.avro'}
+            for i in range(3, 6)
+        ],
+        'extract_source': 'PROJECT.DATASET.TABLE',
+        'extract_job_config': {'extract': {'destinationFormat': 'AVRO'}},
+    })
+    self.enter_context(
+        mock.patch.object(bq_worker, 'MAX_RUNNING_EXTRACT_JOBS', 2))
+    mock_client = worker_inst._get_client()
+
+    def _extract_table(source, destination_uris, job_id_prefix, job_config):
+      del destination_uris, job_id_prefix  # Unused
+      self.assertEqual(job_config.destination_format, 'AVRO')
+      job = mock.create_autospec(
+          bigquery.job.ExtractJob, instance=True, spec_set=True)
+      job.job_id = f'JOB_{source.table_id}'
+      return job
+
+    mock_client.extract_table.side_effect = _extract_table
+    worker_inst._execute()
+    self.assertEqual(mock_client.extract_table.call_count, 2)
+    self.patched_write_manifest.assert_not_called()
+    self.patched_enqueue.assert_called_once()
+    waiter_params = self.patched_enqueue.call_args.args[1]
+    self.assertCountEqual(
+        waiter_params['job_ids'], ['JOB_TABLE$20200103', 'JOB_TABLE$20200104'])
+    self.assertEqual(
+        waiter_params['extract_shards'],
+        [{'partition_id': '20200105', 'uri': 'gs://bucket/5-*.avro'}])
+
+  def test_appends_batches_once_table_is_overwritten(self):
+    worker_inst = self._make_multi_job_waiter(done_job_ids=['JOB1', 'JOB2'])
+    worker_inst._params.update({
+        'append_uri_batches': [['gs://bucket/data-2.csv'],
+                               ['gs://bucket/data-3.csv']],
+        'destination_table': 'PROJECT.DATASET.TABLE',
+        'load_job_config': {'load': {'writeDisposition': 'WRITE_APPEND'}},
+    })
+    mock_client = worker_inst._get_client()
+
+    def _load_table_from_uri(uris, destination, job_id_prefix, job_config):
+      del destination, job_id_prefix  # Unused
+      self.assertEqual(job_config.write_disposition, 'WRITE_APPEND')
+      job = mock.create_autospec(
+          bigquery.job.LoadJob, instance=True, spec_set=True)
+      job.job_id = f'JOB_{uris[0]}'
+      return job
+
+    mock_client.load_table_from_uri.side_effect = _load_table_from_uri
+    worker_inst._execute()
+    self.assertEqual(mock_client.load_table_from_uri.call_count, 2)
+    self.patched_write_manifest.assert_not_called()
+    self.patched_enqueue.assert_called_once()
+    waiter_params = self.patched_enqueue.call_args.args[1]
+    self.assertEqual(
+        waiter_params['job_ids'],
+        ['JOB_gs://bucket/data-2.csv', 'JOB_gs://bucket/data-3.csv'])
+    self.assertNotIn('append_uri_batches', waiter_params)
+    self.assertEqual(
+        waiter_params['manifest_uri'], 'gs://bucket/manifest.json')
+
+  def test_deletes_tables_and_enqueues_next_worker_once_done(self):
+    worker_inst = self._make_multi_job_waiter(done_job_ids=['JOB1', 'JOB2'])
+    worker_inst._params.update({
+        'tables_to_delete': ['PROJECT.DATASET.TABLE_shards'],
+        'next_worker_class': 'VertexAIBatchPredictorToBQ',
+        'next_worker_params': {'shard_step': 'predict_shards'},
+    })
+    mock_client = worker_inst._get_client()
+    worker_inst._execute()
+    mock_client.delete_table.assert_called_once_with(
+        'PROJECT.DATASET.TABLE_shards', not_found_ok=True)
+    self.patched_enqueue.assert_called_once_with(
+        'VertexAIBatchPredictorToBQ', {'shard_step': 'predict_shards'})
+
+
 if __name__ == '__main__':
   absltest.main()
@@ -1,11 +1,13 @@
 """Tests for bq_worker."""
 
+import datetime
 from unittest import mock
 import os
 
 from absl.testing import absltest
 from absl.testing import parameterized
 
+from google.api_core import exceptions
 from google.auth import credentials
 from google.cloud import bigquery
 from google.api_core.client_info import ClientInfo
@@ -85,6 +87,213 @@ class BQWorkerTest(parameterized.TestCase):
     self.assertEqual('a_project.a_dataset_id.a_table_id',
                      worker._generate_qualified_bq_table_name())
 
+
+class BQWorkerQueryTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
+    self.mock_client = mock.create_autospec(
+        bigquery.Client, instance=True, spec_set=True)
+    self.mock_job = mock.create_autospec(
+        bigquery.job.QueryJob, instance=True, spec_set=True)
+    self.mock_job.total_bytes_processed = 5 * 10**9
+    self.mock_client.query.return_value = self.mock_job
+
+  def _make_worker(self, params):
+    worker_inst = bq_worker.BQWorker(params, 1, 1)
+    self.patched_log_info = self.enter_context(
+        mock.patch.object(worker_inst, 'log_info', autospec=True))
+    return worker_inst
+
+  def test_query_records_estimate_and_runs_without_budget(self):
+    worker_inst = self._make_worker({})
+    job = worker_inst._query(self.mock_client, 'SELECT 1', 'EU')
+    self.assertEqual(job, self.mock_job)
+    self.assertEqual(self.mock_client.query.call_count, 2)
+    self.assertIsNone(self.mock_client.query.call_args.kwargs['job_config'])
+    self.patched_log_info.assert_called_once_with(
+        'Query is estimated to process 5.0 GB.',
+        extra_fields={
+            'log_type': 'BIGQUERY_ESTIMATE',
+            'estimated_bytes': 5 * 10**9,
+        })
+
+  def test_query_enforces_budget_on_job(self):
+    worker_inst = self._make_worker({'maximum_bytes_billed': 10**10})
+    worker_inst._query(self.mock_client, 'SELECT 1', 'EU')
+    job_config = self.mock_client.query.call_args.kwargs['job_config']
+    self.assertEqual(job_config.maximum_bytes_billed, 10**10)
+
+  def test_query_over_budget_raises_worker_exception(self):
+    worker_inst = self._make_worker({'maximum_bytes_billed': 10**9})
+    with self.assertRaisesRegex(worker.WorkerException,
+                                '5.0 GB, above the budget of 1.0 GB'):
+      worker_inst._query(self.mock_client, 'SELECT 1', 'EU')
+    self.mock_client.query.assert_called_once()
+
+  def test_dry_run_estimates_are_cached_by_query(self):
+    worker_inst = self._make_worker({})
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 1', 'EU')
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 1', 'EU')
+    self.mock_client.query.assert_called_once()
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 2', 'EU')
+    self.assertEqual(self.mock_client.query.call_count, 2)
+
+  def test_dry_run_cache_evicts_least_recently_used_estimates(self):
+    self.enter_context(
+        mock.patch.object(bq_worker, '_DRY_RUN_CACHE_MAX_SIZE', 2))
+    worker_inst = self._make_worker({})
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 1', 'EU')
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 2', 'EU')
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 1', 'EU')
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 3', 'EU')
+    self.assertLen(bq_worker._dry_run_cache, 2)
+    self.assertEqual(self.mock_client.query.call_count, 3)
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 1', 'EU')
+    self.assertEqual(self.mock_client.query.call_count, 3)
+    worker_inst._estimate_query_bytes(self.mock_client, 'SELECT 2', 'EU')
+    self.assertEqual(self.mock_client.query.call_count, 4)
+
+  def test_query_runs_without_budget_if_dry_run_fails(self):
+    self.mock_client.query.side_effect = [
+        exceptions.NotFound('Table d.created_by_script'),
+        self.mock_job,
+    ]
+    worker_inst = self._make_worker({})
+    patched_log_warn = self.enter_context(
+        mock.patch.object(worker_inst, 'log_warn', autospec=True))
+    job = worker_inst._query(self.mock_client, 'SELECT 1', 'EU')
+    self.assertEqual(job, self.mock_job)
+    patched_log_warn.assert_called_once()
+    self.patched_log_info.assert_not_called()
+
+  def test_query_with_budget_raises_if_dry_run_fails(self):
+    self.mock_client.query.side_effect = exceptions.NotFound('Table')
+    worker_inst = self._make_worker({'maximum_bytes_billed': 10**10})
+    with self.assertRaisesRegex(worker.WorkerException,
+                                'maximum_bytes_billed budget.*Table'):
+      worker_inst._query(self.mock_client, 'SELECT 1', 'EU')
+    self.mock_client.query.assert_called_once()
+
+  def test_parameterized_query_with_budget_is_dry_run_with_parameters(self):
+    worker_inst = self._make_worker({'maximum_bytes_billed': 10**10})
+    query = 'SELECT * FROM INFORMATION_SCHEMA.PARTITIONS WHERE table_name = @t'
+    parameters = [bigquery.ScalarQueryParameter('t', 'STRING', 'table')]
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=parameters, default_dataset='p.d')
+    worker_inst._query(self.mock_client, query, 'EU', job_config=job_config)
+    dry_run_config = (
+        self.mock_client.query.call_args_list[0].kwargs['job_config'])
+    self.assertTrue(dry_run_config.dry_run)
+    self.assertEqual(dry_run_config.query_parameters, parameters)
+    self.assertEqual(str(dry_run_config.default_dataset), 'p.d')
+    job_config = self.mock_client.query.call_args.kwargs['job_config']
+    self.assertEqual(job_config.maximum_bytes_billed, 10**10)
+    with self.subTest('Dry runs are cached by parameters'):
+      other_config = bigquery.QueryJobConfig(query_parameters=[
+          bigquery.ScalarQueryParameter('t', 'STRING', 'other_table')])
+      worker_inst._query(self.mock_client, query, 'EU', job_config=other_config)
+      self.assertEqual(self.mock_client.query.call_count, 4)
+
+
+class BQWorkerCachedQueryTest(parameterized.TestCase):
+
+  _QUERY = 'CREATE OR REPLACE TABLE d.output AS SELECT * FROM d.source'
+  _SOURCE_MODIFIED = datetime.datetime(2020, 1, 1, 1)
+  _JOB_ENDED = datetime.datetime(2020, 1, 1, 2)
+
+  def setUp(self):
+    super().setUp()
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
+    self.mock_client = mock.create_autospec(
+        bigquery.Client, instance=True, spec_set=True)
+    dry_run_job = mock.create_autospec(
+        bigquery.job.QueryJob, instance=True, spec_set=True)
+    dry_run_job.total_bytes_processed = 1000
+    dry_run_job.referenced_tables = [
+        bigquery.TableReference.from_string('p.d.output'),
+    ]
+    self.mock_client.query.return_value = dry_run_job
+    self.tables = {
+        'd.source': self._make_table('p:d.source', self._SOURCE_MODIFIED),
+        'd.output': self._make_table('p:d.output', self._SOURCE_MODIFIED),
+    }
+    self.mock_client.get_table.side_effect = self.tables.__getitem__
+    self.mock_client.get_model.side_effect = exceptions.NotFound('Model')
+    self.previous_job = mock.create_autospec(
+        bigquery.job.QueryJob, instance=True, spec_set=True)
+    self.previous_job.state = 'DONE'
+    self.previous_job.error_result = None
+    self.previous_job.ended = self._JOB_ENDED
+    self.mock_client.get_job.return_value = self.previous_job
+    self.worker_inst = bq_worker.BQWorker({}, 1, 1)
+    self.patched_log_info = self.enter_context(
+        mock.patch.object(self.worker_inst, 'log_info', autospec=True))
+
+  def _make_table(self, full_table_id, modified):
+    table = mock.create_autospec(
+        bigquery.Table, instance=True, spec_set=True)
+    table.full_table_id = full_table_id
+    table.modified = modified
+    return table
+
+  def _assert_cache_logged(self, cache_hit):
+    self.patched_log_info.assert_any_call(
+        mock.ANY,
+        extra_fields={
+            'log_type': 'BIGQUERY_CACHE',
+            'cache_hit': cache_hit,
+            'fingerprint': mock.ANY,
+        })
+
+  def test_reuses_previous_job_on_unchanged_tables(self):
+    job = self.worker_inst._cached_query(self.mock_client, self._QUERY, 'EU')
+    self.assertIsNone(job)
+    self.mock_client.query.assert_called_once()  # Dry run only
+    job_id = self.mock_client.get_job.call_args.args[0]
+    self.assertStartsWith(job_id, '1_1_BQWorker_')
+    self._assert_cache_logged(True)
+
+  def test_runs_query_with_fingerprint_job_id_on_first_run(self):
+    self.mock_client.get_job.side_effect = exceptions.NotFound('Job')
+    self.worker_inst._cached_query(self.mock_client, self._QUERY, 'EU')
+    job_id = self.mock_client.get_job.call_args.args[0]
+    self.assertEqual(self.mock_client.query.call_args.kwargs['job_id'], job_id)
+    self._assert_cache_logged(False)
+
+  def test_fingerprint_changes_with_source_tables(self):
+    self.worker_inst._cached_query(self.mock_client, self._QUERY, 'EU')
+    first_job_id = self.mock_client.get_job.call_args.args[0]
+    self.tables['d.source'].modified = self._JOB_ENDED
+    self.worker_inst._cached_query(self.mock_client, self._QUERY, 'EU')
+    self.assertNotEqual(
+        self.mock_client.get_job.call_args.args[0], first_job_id)
+
+  @parameterized.named_parameters(
+      ('Failed job', 'error_result', {'message': 'Error'}),
+      ('Running job', 'state', 'RUNNING'),
+  )
+  def test_runs_query_if_previous_job_unusable(self, attribute, value):
+    setattr(self.previous_job, attribute, value)
+    self.worker_inst._cached_query(self.mock_client, self._QUERY, 'EU')
+    self.assertIsNone(self.mock_client.query.call_args.kwargs['job_id'])
+    self._assert_cache_logged(False)
+    logged_messages = [c.args[0] for c in self.patched_log_info.call_args_list]
+    self.assertTrue(any('random ID' in m for m in logged_messages))
+
+  def test_runs_query_if_output_changed_since_previous_job(self):
+    self.tables['d.output'].modified = datetime.datetime(2020, 1, 1, 3)
+    job = self.worker_inst._cached_query(self.mock_client, self._QUERY, 'EU')
+    self.assertIsNotNone(job)
+    self._assert_cache_logged(False)
+
+  def test_always_runs_query_without_outputs(self):
+    self.worker_inst._cached_query(self.mock_client, 'SELECT 1', 'EU')
+    self.mock_client.get_job.assert_not_called()
+    self.assertEqual(self.mock_client.query.call_count, 2)
+
+
 class BQWorkerGetClientTest(parameterized.TestCase):
 
   @parameterized.parameters(
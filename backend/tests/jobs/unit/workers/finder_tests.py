@@ -1,7 +1,13 @@
 """Tests for the find method in workers.__init__."""
 
+import json
+import os
+import subprocess
+import sys
+
 from absl.testing import absltest
 
+from jobs.workers import commenter
 from jobs.workers import finder
 from jobs.workers.bigquery import bq_query_launcher
 from jobs.workers.bigquery import bq_to_measurement_protocol_ga4
@@ -23,6 +29,55 @@ class FindWorkerClassTest(absltest.TestCase):
     with self.assertRaises(ModuleNotFoundError):
       finder.get_worker_class('UnknownWorkerClass')
 
+  def test_can_find_private_worker_class(self):
+    worker_class = finder.get_worker_class(
+        'BQToMeasurementProtocolProcessorGA4')
+    self.assertEqual(
+        worker_class,
+        bq_to_measurement_protocol_ga4.BQToMeasurementProtocolProcessorGA4)
+
+  def test_imports_worker_modules_on_first_use(self):
+    # Runs in a new interpreter, since tests already imported all workers.
+    backend_dir = os.path.dirname(
+        os.path.dirname(os.path.dirname(finder.__file__)))
+    script = '\n'.join([
+        'import json, sys',
+        'from jobs.workers import finder',
+        'finder.get_worker_class("Commenter")',
+        'finder.get_worker_params("VertexAITabularTrainer")',
+        'print(json.dumps(sorted(sys.modules)))',
+    ])
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=backend_dir, check=True, capture_output=True, text=True).stdout
+    imported_modules = json.loads(output)
+    self.assertIn('jobs.workers.commenter', imported_modules)
+    self.assertNotIn('google.cloud.aiplatform', imported_modules)
+    self.assertNotIn('google.ads.googleads', imported_modules)
+    self.assertNotIn('googleapiclient.discovery', imported_modules)
+
+
+class WorkerParamsTest(absltest.TestCase):
+
+  def test_params_manifest_is_up_to_date(self):
+    # JSON round trip, since the manifest stores tuples as lists.
+    params_manifest = json.loads(json.dumps(finder.build_params_manifest()))
+    self.assertEqual(
+        finder._load_params_manifest(), params_manifest,
+        msg='Regenerate the manifest with: python -m jobs.workers.finder')
+
+  def test_gets_worker_params_case_insensitively(self):
+    self.assertEqual(
+        finder.get_worker_params('commenter'),
+        finder.build_worker_params(commenter.Commenter))
+
+  def test_gets_private_worker_params(self):
+    self.assertEqual(finder.get_worker_params('BQWaiter'), [])
+
+  def test_get_params_raises_on_unknown_worker(self):
+    with self.assertRaises(ModuleNotFoundError):
+      finder.get_worker_params('UnknownWorkerClass')
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -6,6 +6,7 @@ from typing import Any, Dict, Iterable, Sequence
 from unittest import mock
 
 from absl.testing import absltest
+from google.api_core import exceptions
 from google.auth import credentials
 from google.cloud import bigquery
 from googleapiclient import http
@@ -116,6 +117,29 @@ def _read_datafile(filename):
   return content
 
 
+class _FakeBlob:
+  """Blob kept in a dictionary of contents by name."""
+
+  def __init__(self, objects, name):
+    self._objects = objects
+    self.name = name
+    self.custom_time = None
+
+  def download_as_bytes(self):
+    if self.name not in self._objects:
+      raise exceptions.NotFound(self.name)
+    return self._objects[self.name]
+
+  def upload_from_string(self, data, content_type):
+    del content_type  # Unused
+    self._objects[self.name] = data.encode('utf-8')
+
+  def delete(self):
+    if self.name not in self._objects:
+      raise exceptions.NotFound(self.name)
+    del self._objects[self.name]
+
+
 def _make_credentials():
   return mock.create_autospec(
       credentials.Credentials, instance=True, spec_set=True)
@@ -163,6 +187,9 @@ class GA4AudiencesUpdaterTests(absltest.TestCase):
     self.enter_context(
         mock.patch.object(
             ga_utils, 'get_client', autospec=True, return_value=ga_client))
+    # Mocked requests cannot be sent in batch requests.
+    self.enter_context(
+        mock.patch.object(ga_utils, '_execute_in_batches', autospec=True))
     worker_inst = ga_audiences_updater_ga4.GA4AudiencesUpdater(
         {
             'ga_property_id': '123456',
@@ -237,5 +264,46 @@ class GA4AudiencesUpdaterTests(absltest.TestCase):
     )
 
 
+  def test_skips_audiences_unchanged_since_last_run(self):
+    patched_get_client = self.enter_context(
+        mock.patch.object(ga_utils, 'get_client', autospec=True))
+    snapshots = {}
+    self.enter_context(
+        mock.patch.object(
+            ga_utils,
+            '_get_snapshot_blob',
+            autospec=True,
+            side_effect=lambda key: _FakeBlob(snapshots, key)))
+    worker_inst = ga_audiences_updater_ga4.GA4AudiencesUpdater(
+        {
+            'ga_property_id': '123456',
+            'bq_project_id': 'PROJECT',
+            'bq_dataset_id': 'DATASET',
+            'bq_table_id': 'TABLE',
+            'template': '{"displayName": "${display_name}"}',
+            'snapshot_ttl_hours': 24,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    ga_utils.save_audience_snapshot(
+        'ga4/123456/1', [{'displayName': 'All Users'}], 'displayName')
+    bq_client = bigquery.Client(
+        project='PROJECT', credentials=_make_credentials())
+    _use_query_results(
+        bq_client,
+        [bigquery.SchemaField('display_name', 'STRING')],
+        [{'totalRows': 1, 'rows': [{'f': [{'v': 'All Users'}]}]}])
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, '_get_client', autospec=True, return_value=bq_client))
+    patched_logger = self.enter_context(
+        mock.patch.object(worker_inst, 'log_info', autospec=True))
+    worker_inst.execute()
+    patched_get_client.assert_not_called()
+    patched_logger.assert_any_call(
+        'Skipped #1 audience configs unchanged since the last run')
+
 if __name__ == '__main__':
   absltest.main()
@@ -76,6 +76,9 @@ class GAAudiencesUpdaterTests(absltest.TestCase):
     self.enter_context(
         mock.patch.object(
             ga_utils, 'get_client', autospec=True, return_value=ga_client))
+    # Mocked requests cannot be sent in batch requests.
+    self.enter_context(
+        mock.patch.object(ga_utils, '_execute_in_batches', autospec=True))
     worker_inst = ga_audiences_updater.GAAudiencesUpdater(
         {
             'account_id': '123456',
@@ -10,6 +10,7 @@ from google.cloud import storage
 from googleapiclient import discovery
 from googleapiclient import http
 
+from jobs.workers import worker
 from jobs.workers.ga import ga_data_importer
 from jobs.workers.ga import ga_utils
 
@@ -36,10 +37,24 @@ class GADataImporterTest(absltest.TestCase):
             storage, 'Client', autospec=True, return_value=gcs_client))
     self.enter_context(
         mock.patch.object(storage.Blob, 'reload', autospec=True))
+    self.blob_contents = {'foo/bar.csv': b'UserId,Score\n123,0.5\n'}
+    self.enter_context(
+        mock.patch.object(
+            storage.Blob,
+            'size',
+            new=property(lambda blob: len(self.blob_contents[blob.name]))))
+
+    def _list_blobs(bucket, prefix=None):
+      return [
+          storage.Blob(name, bucket)
+          for name in self.blob_contents if name.startswith(prefix)
+      ]
 
-    def _write_content(unused_blob, file_obj, *unused_args, **unused_kwargs):
-      file_obj.write(b'hello world!')
+    def _write_content(blob, file_obj, *unused_args, **unused_kwargs):
+      file_obj.write(self.blob_contents[blob.name])
 
+    self.enter_context(
+        mock.patch.object(gcs_client, 'list_blobs', side_effect=_list_blobs))
     self.enter_context(
         mock.patch.object(
             gcs_client, 'download_blob_to_file', side_effect=_write_content))
@@ -88,10 +103,9 @@ class GADataImporterTest(absltest.TestCase):
         [
             mock.call(mock.ANY),
             mock.call('Kept all uploads'),
-            mock.call('Downloaded file from Cloud Storage to App Engine'),
+            mock.call('Streaming file from Cloud Storage to Google Analytics'),
             mock.call('Uploaded 100%'),
             mock.call('Successfully uploaded data import to Google Analytics'),
-            mock.call('Cleaned up the downloaded file'),
             mock.call('Finished successfully'),
         ],
         patched_logger.mock_calls
@@ -163,10 +177,9 @@ class GADataImporterTest(absltest.TestCase):
             mock.call(mock.ANY),
             mock.call('Deleted oldest upload(s) '
                       'for ids: [\'5qan4As6S7WgAaQDTK25bg\']'),
-            mock.call('Downloaded file from Cloud Storage to App Engine'),
+            mock.call('Streaming file from Cloud Storage to Google Analytics'),
             mock.call('Uploaded 100%'),
             mock.call('Successfully uploaded data import to Google Analytics'),
-            mock.call('Cleaned up the downloaded file'),
             mock.call('Finished successfully'),
         ],
         patched_logger.mock_calls
@@ -239,15 +252,121 @@ class GADataImporterTest(absltest.TestCase):
             mock.call('Deleted all existing uploads for ids: '
                       '[\'5qan4As6S7WgAaQDTK25bg\', '
                       '\'qmcaotljicrpdwafcwiukh\']'),
-            mock.call('Downloaded file from Cloud Storage to App Engine'),
+            mock.call('Streaming file from Cloud Storage to Google Analytics'),
             mock.call('Uploaded 100%'),
             mock.call('Successfully uploaded data import to Google Analytics'),
-            mock.call('Cleaned up the downloaded file'),
             mock.call('Finished successfully'),
         ],
         patched_logger.mock_calls
     )
 
 
+  def _make_worker(self, csv_uri, max_uploads=None):
+    worker_inst = ga_data_importer.GADataImporter(
+        {
+            'csv_uri': csv_uri,
+            'account_id': '123456',
+            'property_id': 'UA-123456-7',
+            'dataset_id': 'sLj2CuBTDFy6CedBJwahFt',
+            'max_uploads': max_uploads,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    self.enter_context(
+        mock.patch.object(worker_inst, 'log_info', autospec=True))
+    return worker_inst
+
+  def test_uploads_shards_and_waits_for_all_uploads(self):
+    self.blob_contents = {
+        'foo/part-0.csv': b'UserId,Score\n123,0.5\n',
+        'foo/part-1.csv': b'UserId,Score\n',
+        'foo/part-2.csv': b'UserId,Score\n456,0.8\n',
+    }
+    self.enter_context(
+        mock.patch.object(ga_utils, 'get_client', autospec=True))
+    patched_delete = self.enter_context(
+        mock.patch.object(
+            ga_utils, 'delete_oldest_uploads', autospec=True, return_value=[]))
+    patched_upload = self.enter_context(
+        mock.patch.object(
+            ga_utils,
+            'upload_dataimport_stream',
+            autospec=True,
+            side_effect=[{'id': 'ID0'}, {'id': 'ID1'}]))
+    worker_inst = self._make_worker('gs://mybucket/foo/part-*.csv',
+                                    max_uploads=5)
+    workers_to_enqueue = worker_inst.execute()
+    with self.subTest('Skips shards without data'):
+      self.assertEqual(patched_upload.call_count, 2)
+    with self.subTest('Counts all shards towards the maximum uploads'):
+      patched_delete.assert_called_once_with(
+          mock.ANY, mock.ANY, max_to_keep=3)
+    with self.subTest('Enqueues a single waiter for all uploads'):
+      self.assertLen(workers_to_enqueue, 1)
+      worker_class, waiter_params, _ = workers_to_enqueue[0]
+      self.assertEqual(worker_class, 'GADataImportUploadWaiter')
+      self.assertEqual(waiter_params['dataset_id'], 'sLj2CuBTDFy6CedBJwahFt')
+      self.assertCountEqual(waiter_params['upload_ids'], ['ID0', 'ID1'])
+
+  def test_more_shards_than_max_uploads_raise_worker_exception(self):
+    self.blob_contents = {
+        'foo/part-0.csv': b'UserId,Score\n123,0.5\n',
+        'foo/part-1.csv': b'UserId,Score\n456,0.8\n',
+    }
+    self.enter_context(
+        mock.patch.object(ga_utils, 'get_client', autospec=True))
+    patched_delete = self.enter_context(
+        mock.patch.object(ga_utils, 'delete_oldest_uploads', autospec=True))
+    worker_inst = self._make_worker('gs://mybucket/foo/part-*.csv',
+                                    max_uploads=1)
+    with self.assertRaisesRegex(worker.WorkerException,
+                                'Cannot upload 2 files'):
+      worker_inst._execute()
+    patched_delete.assert_not_called()
+
+  def test_failed_shard_deletes_uploaded_shards(self):
+    self.blob_contents = {
+        'foo/part-0.csv': b'UserId,Score\n123,0.5\n',
+        'foo/part-1.csv': b'UserId,Score\n456,0.8\n',
+    }
+    self.enter_context(
+        mock.patch.object(ga_utils, 'get_client', autospec=True))
+    patched_delete = self.enter_context(
+        mock.patch.object(ga_utils, 'delete_uploads', autospec=True))
+
+    def _upload(unused_client, unused_dataimport_ref, reader, *unused_args,
+                **unused_kwargs):
+      if b'456' in reader.read():
+        raise ValueError('Upload failed')
+      return {'id': 'ID0'}
+
+    self.enter_context(
+        mock.patch.object(
+            ga_utils,
+            'upload_dataimport_stream',
+            autospec=True,
+            side_effect=_upload))
+    worker_inst = self._make_worker('gs://mybucket/foo/part-*.csv')
+    with self.assertRaisesRegex(ValueError, 'Upload failed'):
+      worker_inst._execute()
+    patched_delete.assert_called_once_with(mock.ANY, mock.ANY, ['ID0'])
+
+  def test_shards_with_different_headers_raise_worker_exception(self):
+    self.blob_contents = {
+        'foo/part-0.csv': b'UserId,Score\n123,0.5\n',
+        'foo/part-1.csv': b'ClientId,Score\n456,0.8\n',
+    }
+    worker_inst = self._make_worker('gs://mybucket/foo/part-*.csv')
+    with self.assertRaisesRegex(worker.WorkerException, 'part-1.csv differs'):
+      worker_inst._execute()
+
+  def test_no_matching_file_raises_worker_exception(self):
+    worker_inst = self._make_worker('gs://mybucket/bar/*.csv')
+    with self.assertRaisesRegex(worker.WorkerException, 'No file found'):
+      worker_inst._execute()
+
+
 if __name__ == '__main__':
   absltest.main()
@@ -1,16 +1,21 @@
 """Tests for ga_utils."""
 
+import io
+import itertools
 import json
 import os
 import textwrap
+import time
 from unittest import mock
 
 from absl.testing import absltest
 from absl.testing import parameterized
 from google import auth
+from google.api_core import exceptions
 from google.auth import credentials
 from google.cloud import bigquery
 from googleapiclient import discovery
+from googleapiclient import errors
 from googleapiclient import http
 
 from common import crmint_logging
@@ -26,6 +31,29 @@ _SAMPLE_TEMPLATE_v3 = textwrap.dedent("""\
     }""")
 
 
+class _FakeBlob:
+  """Blob kept in a dictionary of contents by name."""
+
+  def __init__(self, objects, name):
+    self._objects = objects
+    self.name = name
+    self.custom_time = None
+
+  def download_as_bytes(self):
+    if self.name not in self._objects:
+      raise exceptions.NotFound(self.name)
+    return self._objects[self.name]
+
+  def upload_from_string(self, data, content_type):
+    del content_type  # Unused
+    self._objects[self.name] = data.encode('utf-8')
+
+  def delete(self):
+    if self.name not in self._objects:
+      raise exceptions.NotFound(self.name)
+    del self._objects[self.name]
+
+
 def _datafile(filename):
   return os.path.join(DATA_DIR, filename)
 
@@ -36,6 +64,28 @@ def _read_datafile(filename):
   return content
 
 
+def _batch_response(*statuses, request_ids=None):
+  """Returns a mocked batch response with a sub-response per given status."""
+  parts = []
+  for request_id, status in zip(request_ids or itertools.count(), statuses):
+    parts.append('\r\n'.join([
+        '--batch_boundary',
+        'Content-Type: application/http',
+        f'Content-ID: <response-id + {request_id}>',
+        '',
+        f'HTTP/1.1 {status} Status',
+        'Content-Type: application/json',
+        '',
+        '{}',
+        '',
+    ]))
+  headers = {
+      'status': '200',
+      'content-type': 'multipart/mixed; boundary="batch_boundary"',
+  }
+  return headers, ''.join(parts) + '--batch_boundary--'
+
+
 class GoogleAnalyticsUtilsTest(parameterized.TestCase):
 
   def setUp(self):
@@ -48,6 +98,13 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
         headers={'status': '200'})
     self.patched_log_message = self.enter_context(
         mock.patch.object(crmint_logging, 'log_global_message', autospec=True))
+    self.snapshots = {}
+    self.enter_context(
+        mock.patch.object(
+            ga_utils,
+            '_get_snapshot_blob',
+            autospec=True,
+            side_effect=lambda key: _FakeBlob(self.snapshots, key)))
 
   @parameterized.parameters(
       ('analytics', 'v3',
@@ -119,6 +176,34 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
     upload_status = ga_utils.get_dataimport_upload_status(client, dataimport)
     self.assertEqual(upload_status, ga_utils.UploadStatus.COMPLETED)
 
+  @parameterized.named_parameters(
+      ('Pending', ['ID1', 'ID2'], ga_utils.UploadStatus.PENDING),
+      ('Completed', ['ID1'], ga_utils.UploadStatus.COMPLETED),
+      ('Failed', ['ID1', 'ID3'], ga_utils.UploadStatus.FAILED),
+      ('Deleted', ['ID1', 'ID4'], ga_utils.UploadStatus.FAILED),
+  )
+  def test_get_dataimport_upload_status_of_given_uploads(self, upload_ids,
+                                                         expected_status):
+    response = {
+        'kind': 'analytics#uploads',
+        'items': [
+            {'id': 'ID1', 'status': 'COMPLETED'},
+            {'id': 'ID2', 'status': 'PENDING'},
+            {'id': 'ID3', 'status': 'FAILED'},
+        ],
+    }
+    request_builder = http.RequestMockBuilder(
+        {'analytics.management.uploads.list': (None, json.dumps(response))})
+    client = ga_utils.get_client(
+        'analytics', 'v3', http=self.http_v3, request_builder=request_builder)
+    dataimport = ga_utils.DataImportReference(
+        account_id='123',
+        property_id='UA-456-7',
+        dataset_id='elD5IH29Toqgc1vzzHFUrw')
+    upload_status = ga_utils.get_dataimport_upload_status(
+        client, dataimport, upload_ids=upload_ids)
+    self.assertEqual(upload_status, expected_status)
+
   @parameterized.named_parameters(
       ('Deleted All', None, ['5qan4As6S7WgAa', 'qmcaotljicrpdw']),
       ('Keep most recent upload', 1, ['5qan4As6S7WgAa']),
@@ -259,6 +344,47 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
         mock_progress_callback.mock_calls,
     )
 
+  def test_upload_dataimport_stream_grows_chunks_on_fast_uploads(self):
+    ga_api_discovery_file = _datafile('google_analytics_v3.json')
+    with open(ga_api_discovery_file, 'rb') as f:
+      ga_api_discovery_content = f.read()
+    http_seq = http.HttpMockSequence(
+        [
+            # Location response, since it's a resumable upload
+            ({'status': '200',
+              'location': 'http://upload.example.com/1'}, b'{}'),
+            # Upload by chunk responses, the second chunk is twice as large
+            ({'status': '308', 'range': 'bytes 0-9'}, b'{}'),
+            ({'status': '200'}, b'{}'),
+        ]
+    )
+    client = discovery.build_from_document(
+        service=ga_api_discovery_content, http=http_seq)
+    dataimport = ga_utils.DataImportReference(
+        account_id='123',
+        property_id='UA-456-7',
+        dataset_id='elD5IH29Toqgc1vzzHFUrw')
+    content = b'UserId,Score\n123,0.5\n456,0.8'
+    mock_progress_callback = mock.Mock()
+    ga_utils.upload_dataimport_stream(
+        client,
+        dataimport,
+        io.BytesIO(content),
+        len(content),
+        chunksize=10,
+        max_chunksize=20,
+        progress_callback=mock_progress_callback)
+    self.assertEmpty(http_seq._iterable,
+                     msg='The sequence of HttpMock should be empty, indicating '
+                         'that we handled all the chunks as expected.')
+    self.assertSequenceEqual(
+        (
+            mock.call(0.3571),
+            mock.call(1.0),
+        ),
+        mock_progress_callback.mock_calls,
+    )
+
   def test_fetch_audiences_with_two_pages_result(self):
     ga_api_discovery_file = _datafile('google_analytics_v3.json')
     with open(ga_api_discovery_file, 'rb') as f:
@@ -286,6 +412,7 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
     patches = [
         ga_utils.AudiencePatch({'name': 'abc', 'a': 1, 'b': 2}),
         ga_utils.AudiencePatch({'name': 'def', 'a': 1}),
+        ga_utils.AudiencePatch({'name': 'foo', 'd': 4}),
     ]
     audiences = {
         'foo': ga_utils.Audience({'id': '123', 'name': 'foo', 'd': 4}),
@@ -302,14 +429,62 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
         )
     )
 
+  def test_get_changed_audience_patches_skips_unchanged_patches(self):
+    patches = [
+        ga_utils.AudiencePatch({'name': 'abc', 'a': 1}),
+        ga_utils.AudiencePatch({'name': 'def', 'a': 1}),
+    ]
+    self.assertEqual(
+        ga_utils.get_changed_audience_patches('123', patches, 'name', 3600),
+        patches)
+    ga_utils.save_audience_snapshot('123', patches, 'name')
+    changed_patch = ga_utils.AudiencePatch({'name': 'def', 'a': 2})
+    new_patch = ga_utils.AudiencePatch({'name': 'ghi', 'a': 1})
+    self.assertEqual(
+        ga_utils.get_changed_audience_patches(
+            '123', [patches[0], changed_patch, new_patch], 'name', 3600),
+        [changed_patch, new_patch])
+    with self.subTest('Snapshots are kept per key'):
+      self.assertEqual(
+          ga_utils.get_changed_audience_patches('456', patches, 'name', 3600),
+          patches)
+
+  def test_get_changed_audience_patches_ignores_expired_snapshot(self):
+    patches = [ga_utils.AudiencePatch({'name': 'abc', 'a': 1})]
+    patched_time = self.enter_context(
+        mock.patch.object(time, 'time', autospec=True, return_value=1000))
+    ga_utils.save_audience_snapshot('123', patches, 'name')
+    patched_time.return_value = 1500
+    # Saving again keeps the timestamp of the first full comparison.
+    ga_utils.save_audience_snapshot('123', patches, 'name')
+    patched_time.return_value = 4600
+    self.assertEqual(
+        ga_utils.get_changed_audience_patches('123', patches, 'name', 3600),
+        patches)
+
+  def test_expired_snapshot_is_deleted(self):
+    patches = [ga_utils.AudiencePatch({'name': 'abc', 'a': 1})]
+    patched_time = self.enter_context(
+        mock.patch.object(time, 'time', autospec=True, return_value=1000))
+    ga_utils.save_audience_snapshot('123', patches, 'name')
+    self.assertLen(self.snapshots, 1)
+    patched_time.return_value = 4600
+    ga_utils.get_changed_audience_patches('123', patches, 'name', 3600)
+    self.assertEmpty(self.snapshots)
+
+  def test_audience_snapshots_are_skipped_without_bucket(self):
+    self.enter_context(
+        mock.patch.object(ga_utils, '_get_snapshot_blob', return_value=None))
+    patches = [ga_utils.AudiencePatch({'name': 'abc', 'a': 1})]
+    ga_utils.save_audience_snapshot('123', patches, 'name')
+    self.assertEqual(
+        ga_utils.get_changed_audience_patches('123', patches, 'name', 3600),
+        patches)
+
   def test_run_audience_operations(self):
-    request_builder = http.RequestMockBuilder(
-        {
-            'analytics.management.remarketingAudience.insert': (None, b'{}'),
-            'analytics.management.remarketingAudience.patch': (None, b'{}'),
-        })
-    client = ga_utils.get_client(
-        'analytics', 'v3', http=self.http_v3, request_builder=request_builder)
+    http_seq = http.HttpMockSequence([_batch_response(200, 200)])
+    client = discovery.build_from_document(
+        service=_read_datafile('google_analytics_v3.json'), http=http_seq)
     operations = [
         ga_utils.AudienceOperationUpdate(
             id='456',
@@ -320,6 +495,8 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
     logger = mock.Mock()
     ga_utils.run_audience_operations(
         client, '123456', 'UA-123456-2', operations, logger)
+    self.assertEmpty(http_seq._iterable,
+                     msg='All operations should be sent in a single batch.')
     self.assertSequenceEqual(
         [
             mock.call('Updating existing audience for id: 456'),
@@ -450,16 +627,10 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
         mock.ANY, log_level='WARNING')
 
   def test_run_audience_operations_ga4(self):
-    request_builder = http.RequestMockBuilder(
-        {
-            'analytics.management.remarketingAudience.insert': (None, b'{}'),
-            'analytics.management.remarketingAudience.patch': (None, b'{}'),
-        })
-    client = ga_utils.get_client(
-        'analyticsadmin',
-        'v1alpha',
-        http=self.http_v1alpha,
-        request_builder=request_builder)
+    http_seq = http.HttpMockSequence([_batch_response(200, 200)])
+    client = discovery.build_from_document(
+        service=_read_datafile('google_analytics_admin_v1alpha.json'),
+        http=http_seq)
     operations = [
         ga_utils.AudienceOperationUpdate(
             id='properties/123456/audiences/abc',
@@ -475,6 +646,8 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
     ]
     logger = mock.Mock()
     ga_utils.run_audience_operations_ga4(client, '123456', operations, logger)
+    self.assertEmpty(http_seq._iterable,
+                     msg='All operations should be sent in a single batch.')
     self.assertSequenceEqual(
         [
             mock.call('Updating existing audience for name: ABC and '
@@ -484,6 +657,76 @@ class GoogleAnalyticsUtilsTest(parameterized.TestCase):
         logger.mock_calls,
     )
 
+  def test_run_audience_operations_ga4_retries_failed_operations_only(self):
+    http_seq = http.HttpMockSequence([
+        _batch_response(200, 429, 200),
+        # Only the failed operation is sent again.
+        _batch_response(200, request_ids=[1]),
+    ])
+    client = discovery.build_from_document(
+        service=_read_datafile('google_analytics_admin_v1alpha.json'),
+        http=http_seq)
+    operations = [
+        ga_utils.AudienceOperationInsert(
+            data=ga_utils.AudiencePatch({'displayName': name}))
+        for name in ('A', 'B', 'C')
+    ]
+    patched_sleep = self.enter_context(
+        mock.patch.object(time, 'sleep', autospec=True))
+    ga_utils.run_audience_operations_ga4(client, '123456', operations)
+    self.assertEmpty(http_seq._iterable)
+    # Backs off before the retry only, operations fit within the rate.
+    self.assertEqual([mock.call(1)], patched_sleep.mock_calls)
+
+  def _patch_clock(self):
+    """Patches time to advance on sleep only, returns the patched sleep."""
+    clock = [0.0]
+
+    def _sleep(seconds):
+      clock[0] += seconds
+
+    self.enter_context(
+        mock.patch.object(
+            time, 'monotonic', autospec=True, side_effect=lambda: clock[0]))
+    return self.enter_context(
+        mock.patch.object(time, 'sleep', autospec=True, side_effect=_sleep))
+
+  def test_run_audience_operations_ga4_paces_operations(self):
+    http_seq = http.HttpMockSequence([
+        _batch_response(*[200] * 50, request_ids=range(i, i + 50))
+        for i in range(0, 150, 50)
+    ] + [_batch_response(*[200] * 10, request_ids=range(150, 160))])
+    client = discovery.build_from_document(
+        service=_read_datafile('google_analytics_admin_v1alpha.json'),
+        http=http_seq)
+    operations = [
+        ga_utils.AudienceOperationInsert(
+            data=ga_utils.AudiencePatch({'displayName': str(i)}))
+        for i in range(160)
+    ]
+    patched_sleep = self._patch_clock()
+    self.enter_context(
+        mock.patch.object(ga_utils, '_GA4_ADMIN_MAX_REQUESTS_PER_SECOND', 10))
+    ga_utils.run_audience_operations_ga4(client, '123456', operations)
+    self.assertEmpty(http_seq._iterable)
+    # A first batch goes through at once, the 110 operations left are paced at
+    # 10 operations per second.
+    total_sleep = sum(c.args[0] for c in patched_sleep.call_args_list)
+    self.assertAlmostEqual(total_sleep, 11)
+
+  def test_run_audience_operations_ga4_raises_non_retryable_error(self):
+    http_seq = http.HttpMockSequence([_batch_response(200, 400)])
+    client = discovery.build_from_document(
+        service=_read_datafile('google_analytics_admin_v1alpha.json'),
+        http=http_seq)
+    operations = [
+        ga_utils.AudienceOperationInsert(
+            data=ga_utils.AudiencePatch({'displayName': name}))
+        for name in ('A', 'B')
+    ]
+    with self.assertRaises(errors.HttpError):
+      ga_utils.run_audience_operations_ga4(client, '123456', operations)
+
   def test_run_audience_operations_ga4_raises_error(self):
     """Raises a ValueError on a new unsupported operation type."""
 
@@ -6,6 +6,7 @@ from absl.testing import absltest
 from absl.testing import parameterized
 from google.auth import credentials
 
+from jobs.workers import worker
 from jobs.workers.ga import ga_utils
 from jobs.workers.ga import ga_waiter
 
@@ -52,5 +53,27 @@ class GADataImportUploadWaiterTest(parameterized.TestCase):
       patched_enqueue.assert_not_called()
 
 
+  def test_failed_upload_raises_worker_exception(self):
+    worker_inst = ga_waiter.GADataImportUploadWaiter(
+        {'job_id': 'JOBID', 'upload_ids': ['ID1', 'ID2']},
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    self.enter_context(
+        mock.patch.object(ga_utils, 'get_client', autospec=True, spec_set=True))
+    patched_status = self.enter_context(
+        mock.patch.object(
+            ga_utils,
+            'get_dataimport_upload_status',
+            return_value=ga_utils.UploadStatus.FAILED,
+            autospec=True,
+            spec_set=True))
+    with self.assertRaisesRegex(worker.WorkerException, 'ID1'):
+      worker_inst._execute()
+    patched_status.assert_called_once_with(
+        mock.ANY, mock.ANY, upload_ids=['ID1', 'ID2'])
+
+
 if __name__ == '__main__':
   absltest.main()
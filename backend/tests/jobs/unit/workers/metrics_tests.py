@@ -0,0 +1,101 @@
+"""Tests for metrics."""
+
+from concurrent import futures
+from unittest import mock
+
+from absl.testing import absltest
+
+from jobs.workers import metrics
+from jobs.workers import worker
+
+
+class TaskMetricsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.registry = metrics.Registry()
+    self.enter_context(mock.patch.object(metrics, 'registry', self.registry))
+
+  def test_records_counters_of_current_task(self):
+    task_metrics = metrics.TaskMetrics('BQWaiter', 1, 2)
+    with metrics.record_task(task_metrics):
+      metrics.increment(metrics.API_CALLS)
+      metrics.increment(metrics.BYTES_IN, 1000)
+    metrics.increment(metrics.API_CALLS)  # Outside of the task
+    summary = task_metrics.summary()
+    self.assertEqual(summary['log_type'], 'TASK_METRICS')
+    self.assertEqual(summary[metrics.API_CALLS], 1)
+    self.assertEqual(summary[metrics.BYTES_IN], 1000)
+    self.assertEqual(summary[metrics.RETRIES], 0)
+    self.assertGreaterEqual(summary['wall_seconds'], 0)
+
+  def test_propagates_current_task_to_other_threads(self):
+    task_metrics = metrics.TaskMetrics('GADataImporter', 1, 2)
+    with metrics.record_task(task_metrics):
+      with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(
+            metrics.propagate(
+                lambda size: metrics.increment(metrics.BYTES_OUT, size)),
+            [10, 20, 30]))
+        # Not propagated, the increment is lost.
+        executor.submit(metrics.increment, metrics.BYTES_OUT, 40).result()
+    self.assertEqual(task_metrics.counters[metrics.BYTES_OUT], 60)
+
+  def test_enqueued_workers_are_counted(self):
+    worker_inst = worker.Worker({}, 1, 2)
+    task_metrics = metrics.TaskMetrics('Worker', 1, 2)
+    with metrics.record_task(task_metrics):
+      worker_inst._enqueue('BQWaiter', {})
+      worker_inst._enqueue('BQWaiter', {})
+    self.assertEqual(task_metrics.counters[metrics.ENQUEUED_WORKERS], 2)
+
+  def test_registers_failed_tasks(self):
+    task_metrics = metrics.TaskMetrics('Commenter', 1, 2)
+    with self.assertRaises(ValueError):
+      with metrics.record_task(task_metrics):
+        raise ValueError()
+    self.assertIn(
+        'crmint_tasks_total{worker_class="Commenter",pipeline_id="1",'
+        'status="failure"} 1',
+        self.registry.export())
+
+
+class RegistryTest(absltest.TestCase):
+
+  def _record(self, registry, worker_class, api_calls, wall_seconds,
+              job_id=2):
+    task_metrics = metrics.TaskMetrics(worker_class, 1, job_id)
+    task_metrics.increment(metrics.API_CALLS, api_calls)
+    task_metrics.wall_seconds = wall_seconds
+    task_metrics.success = True
+    registry.record(task_metrics)
+
+  def test_exports_totals_by_worker_class_and_pipeline(self):
+    registry = metrics.Registry()
+    self._record(registry, 'BQWaiter', 1, 0.5)
+    self._record(registry, 'BQWaiter', 2, 1.5, job_id=3)
+    self._record(registry, 'Commenter', 0, 0.25)
+    exported_lines = registry.export().splitlines()
+    self.assertContainsSubsequence(exported_lines, [
+        '# HELP crmint_tasks_total Number of executed tasks.',
+        '# TYPE crmint_tasks_total counter',
+        'crmint_tasks_total{worker_class="BQWaiter",pipeline_id="1",'
+        'status="success"} 2',
+        'crmint_tasks_total{worker_class="Commenter",pipeline_id="1",'
+        'status="success"} 1',
+    ])
+    self.assertIn(
+        'crmint_task_wall_seconds_total{worker_class="BQWaiter",'
+        'pipeline_id="1"} 2',
+        exported_lines)
+    self.assertIn(
+        'crmint_task_api_calls_total{worker_class="BQWaiter",'
+        'pipeline_id="1"} 3',
+        exported_lines)
+    self.assertIn('# TYPE crmint_task_peak_rss_delta_bytes gauge',
+                  exported_lines)
+    self.assertNotIn('job_id', registry.export())
+
+
+if __name__ == '__main__':
+  absltest.main()
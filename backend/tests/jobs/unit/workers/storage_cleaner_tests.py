@@ -29,9 +29,9 @@ class StorageCleanerTests(parameterized.TestCase):
             new_callable=mock.PropertyMock,
             return_value=fixed_last_update))
 
-    def _list_blobs(bucket):
+    def _list_blobs(bucket, prefix=None):
       if bucket.name == 'bucket1':
-        return [
+        blobs = [
             storage.Blob(
                 'foo/file1.csv', storage.Bucket(mock_client, name='bucket1')),
             storage.Blob(
@@ -40,12 +40,13 @@ class StorageCleanerTests(parameterized.TestCase):
                 'bar/file3.csv', storage.Bucket(mock_client, name='bucket1')),
         ]
       elif bucket.name == 'bucket2':
-        return [
+        blobs = [
             storage.Blob(
                 'foo/file1.csv', storage.Bucket(mock_client, name='bucket2')),
         ]
       else:
         raise ValueError(f'Unknown bucket: {bucket.name}')
+      return [b for b in blobs if b.name.startswith(prefix or '')]
 
     mock_client.list_blobs.side_effect = _list_blobs
     self.client = mock_client
@@ -1,5 +1,6 @@
 """Tests for storage_to_bq_importer."""
 
+import datetime
 from unittest import mock
 
 from absl.testing import absltest
@@ -8,7 +9,9 @@ from google.auth import credentials
 from google.cloud import bigquery
 from google.cloud import storage
 
+from jobs.workers import worker
 from jobs.workers.bigquery import storage_to_bq_importer
+from jobs.workers.storage import storage_utils
 
 
 def _make_credentials():
@@ -124,5 +127,151 @@ class StorageToBQImporterTest(parameterized.TestCase):
                      job_config_create_disposition)
 
 
+  def _make_worker(self, params, blob_updates):
+    worker_inst = storage_to_bq_importer.StorageToBQImporter(
+        {
+            'source_uris': ['gs://bucket/data-*.csv'],
+            'bq_dataset_id': 'DATASET',
+            'bq_table_id': 'TABLE',
+            **params,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project='PROJECT',
+        logger_credentials=_make_credentials())
+    self.enter_context(
+        mock.patch.object(storage, 'Client', autospec=True, spec_set=True))
+    blobs = []
+    for i, updated in enumerate(blob_updates):
+      blob = mock.create_autospec(storage.Blob, instance=True)
+      blob.bucket.name = 'bucket'
+      blob.name = f'data-{i}.csv'
+      blob.updated = updated
+      blobs.append(blob)
+    self.enter_context(
+        mock.patch.object(
+            storage_utils, 'get_matching_blobs', autospec=True,
+            return_value=blobs))
+    self.patched_read_manifest = self.enter_context(
+        mock.patch.object(storage_utils, 'read_manifest', autospec=True))
+    self.mock_bq_client = mock.create_autospec(
+        bigquery.Client, instance=True, spec_set=True)
+
+    def _load_table_from_uri(uris, destination, job_id_prefix, job_config):
+      del destination, job_id_prefix  # Unused
+      job = mock.create_autospec(
+          bigquery.job.LoadJob, instance=True, spec_set=True)
+      job.job_id = f'JOB_{uris[0]}'
+      job.location = 'EU'
+      job.error_result = None
+      job.write_disposition = job_config.write_disposition
+      return job
+
+    self.mock_bq_client.load_table_from_uri.side_effect = _load_table_from_uri
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, '_get_client', autospec=True,
+            return_value=self.mock_bq_client))
+    self.patched_enqueue = self.enter_context(
+        mock.patch.object(worker_inst, '_enqueue', autospec=True))
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    return worker_inst
+
+  def test_splits_large_loads_in_concurrent_jobs(self):
+    self.enter_context(
+        mock.patch.object(storage_to_bq_importer, '_MAX_URIS_PER_LOAD_JOB', 2))
+    worker_inst = self._make_worker({}, [None] * 5)
+    worker_inst._execute()
+    load_calls = self.mock_bq_client.load_table_from_uri.call_args_list
+    self.assertCountEqual(
+        [(call.args[0], call.kwargs['job_config'].write_disposition)
+         for call in load_calls],
+        [
+            (['gs://bucket/data-0.csv', 'gs://bucket/data-1.csv'],
+             'WRITE_APPEND'),
+            (['gs://bucket/data-2.csv', 'gs://bucket/data-3.csv'],
+             'WRITE_APPEND'),
+            (['gs://bucket/data-4.csv'], 'WRITE_APPEND'),
+        ])
+    self.patched_enqueue.assert_called_once_with(
+        'BQWaiter',
+        {
+            'job_ids': [
+                'JOB_gs://bucket/data-0.csv',
+                'JOB_gs://bucket/data-2.csv',
+                'JOB_gs://bucket/data-4.csv',
+            ],
+            'location': 'EU',
+            'manifest_uri': '',
+            'manifest_fields': {},
+        },
+        30)
+
+  def test_overwrites_table_then_appends_batches_in_waiter(self):
+    self.enter_context(
+        mock.patch.object(storage_to_bq_importer, '_MAX_URIS_PER_LOAD_JOB', 2))
+    worker_inst = self._make_worker(
+        {'bq_project_id': 'PROJECT', 'overwrite': True}, [None] * 5)
+    worker_inst._execute()
+    self.mock_bq_client.load_table_from_uri.assert_called_once()
+    load_call = self.mock_bq_client.load_table_from_uri.call_args
+    self.assertEqual(
+        load_call.args[0], ['gs://bucket/data-0.csv', 'gs://bucket/data-1.csv'])
+    self.assertEqual(
+        load_call.kwargs['job_config'].write_disposition, 'WRITE_TRUNCATE')
+    self.patched_enqueue.assert_called_once()
+    worker_class, waiter_params, _ = self.patched_enqueue.call_args.args
+    self.assertEqual(worker_class, 'BQWaiter')
+    self.assertEqual(waiter_params['job_ids'], ['JOB_gs://bucket/data-0.csv'])
+    self.assertEqual(
+        waiter_params['append_uri_batches'],
+        [['gs://bucket/data-2.csv', 'gs://bucket/data-3.csv'],
+         ['gs://bucket/data-4.csv']])
+    self.assertEqual(
+        waiter_params['destination_table'], 'PROJECT.DATASET.TABLE')
+    self.assertEqual(
+        waiter_params['load_job_config']['load']['writeDisposition'],
+        'WRITE_APPEND')
+
+  def test_loads_files_updated_since_last_run(self):
+    day1 = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    day2 = datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc)
+    day3 = datetime.datetime(2020, 1, 3, tzinfo=datetime.timezone.utc)
+    worker_inst = self._make_worker(
+        {'manifest_uri': 'gs://bucket/manifest.json'}, [day1, day3, day2])
+    self.patched_read_manifest.return_value = {
+        'last_updated': day1.isoformat()}
+    worker_inst._execute()
+    self.mock_bq_client.load_table_from_uri.assert_called_once_with(
+        ['gs://bucket/data-1.csv', 'gs://bucket/data-2.csv'],
+        mock.ANY,
+        job_id_prefix='1_1_StorageToBQImporter',
+        job_config=mock.ANY)
+    self.patched_enqueue.assert_called_once_with(
+        'BQWaiter',
+        {
+            'job_ids': ['JOB_gs://bucket/data-1.csv'],
+            'location': 'EU',
+            'manifest_uri': 'gs://bucket/manifest.json',
+            'manifest_fields': {'last_updated': day3.isoformat()},
+        },
+        30)
+
+  def test_skips_load_without_new_files(self):
+    day1 = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    worker_inst = self._make_worker(
+        {'manifest_uri': 'gs://bucket/manifest.json'}, [day1])
+    self.patched_read_manifest.return_value = {
+        'last_updated': day1.isoformat()}
+    worker_inst._execute()
+    self.mock_bq_client.load_table_from_uri.assert_not_called()
+    self.patched_enqueue.assert_not_called()
+
+  def test_loading_new_files_cannot_overwrite_table(self):
+    worker_inst = self._make_worker(
+        {'manifest_uri': 'gs://bucket/manifest.json', 'overwrite': True}, [])
+    with self.assertRaisesRegex(worker.WorkerException, 'Cannot overwrite'):
+      worker_inst._execute()
+
 if __name__ == '__main__':
   absltest.main()
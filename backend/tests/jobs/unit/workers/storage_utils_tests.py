@@ -1,9 +1,11 @@
 """Tests for storage_utils."""
 
+import json
 from unittest import mock
 
 from absl.testing import absltest
 from absl.testing import parameterized
+from google.api_core import exceptions
 from google.auth import credentials
 from google.cloud import storage
 
@@ -23,9 +25,9 @@ class StorageUtilsTest(parameterized.TestCase):
     mock_client = mock.create_autospec(
         storage.Client, instance=True, spec_set=True)
 
-    def _list_blobs(bucket):
+    def _list_blobs(bucket, prefix=None):
       if bucket.name == 'bucket1':
-        return [
+        blobs = [
             storage.Blob(
                 'foo/file1.csv', storage.Bucket(mock_client, name='bucket1')),
             storage.Blob(
@@ -34,12 +36,13 @@ class StorageUtilsTest(parameterized.TestCase):
                 'bar/file3.csv', storage.Bucket(mock_client, name='bucket1')),
         ]
       elif bucket.name == 'bucket2':
-        return [
+        blobs = [
             storage.Blob(
                 'foo/file1.csv', storage.Bucket(mock_client, name='bucket2')),
         ]
       else:
         raise ValueError(f'Unknown bucket: {bucket.name}')
+      return [b for b in blobs if b.name.startswith(prefix or '')]
 
     mock_client.list_blobs.side_effect = _list_blobs
     self.client = mock_client
@@ -71,6 +74,105 @@ class StorageUtilsTest(parameterized.TestCase):
     matched_uris = storage_utils.get_matched_uris(self.client, uri_patterns)
     self.assertCountEqual(matched_uris, expected_matched_uris)
 
+  @parameterized.named_parameters(
+      ('Literal names', ['foo/a.csv', 'bar/b.csv'], ['bar/b.csv', 'foo/a.csv']),
+      ('Wildcards', ['foo/file*.csv', 'foo/data_?.csv'],
+       ['foo/data_', 'foo/file']),
+      ('Covered prefixes', ['foo/*.csv', 'foo/bar/*.csv', 'foobar'],
+       ['foo/', 'foobar']),
+      ('Leading wildcard', ['*.csv', 'foo/a.csv'], ['']),
+  )
+  def test_get_listing_prefixes(self, patterns, expected_prefixes):
+    self.assertEqual(
+        storage_utils._get_listing_prefixes(patterns), expected_prefixes)
+
+  def test_lists_blobs_by_prefix(self):
+    storage_utils.get_matched_uris(
+        self.client,
+        ['gs://bucket1/foo/file*.csv', 'gs://bucket1/foo/file1.csv'])
+    self.client.list_blobs.assert_called_once_with(mock.ANY, prefix='foo/file')
+
+  def test_delete_blobs_in_batches(self):
+    bucket = storage.Bucket(self.client, name='bucket1')
+    blobs = [storage.Blob(f'file{i}.csv', bucket) for i in range(250)]
+    self.enter_context(
+        mock.patch.object(storage.Blob, 'delete', autospec=True))
+    storage_utils.delete_blobs(self.client, blobs)
+    self.assertEqual(self.client.batch.call_count, 3)
+    self.assertEqual(storage.Blob.delete.call_count, 250)
+
+  def _delete_failed_batch(self, *errors):
+    bucket = storage.Bucket(self.client, name='bucket1')
+    blobs = [storage.Blob(f'file{i}.csv', bucket) for i in range(len(errors))]
+    self.client.batch.return_value.__exit__.side_effect = (
+        exceptions.NotFound('file0.csv'))
+    self.enter_context(
+        mock.patch.object(
+            storage.Blob,
+            'delete',
+            autospec=True,
+            side_effect=[None] * len(errors) + list(errors)))
+    storage_utils.delete_blobs(self.client, blobs)
+
+  def test_delete_blobs_ignores_deleted_blobs(self):
+    self._delete_failed_batch(exceptions.NotFound('file0.csv'), None)
+    self.assertEqual(storage.Blob.delete.call_count, 4)
+
+  def test_delete_blobs_raises_errors_hidden_by_deleted_blobs(self):
+    with self.assertRaises(exceptions.Forbidden):
+      self._delete_failed_batch(
+          exceptions.NotFound('file0.csv'), exceptions.Forbidden('file1.csv'))
+
+  def test_write_manifest_lists_files_of_each_shard(self):
+    storage_utils.write_manifest(
+        self.client,
+        'gs://bucket2/manifest.json',
+        [
+            {'uri': 'gs://bucket1/foo/file*.csv', 'row_count': 2},
+            {'uri': 'gs://bucket1/bar/file*.csv', 'row_count': 1},
+        ],
+        destination_format='CSV')
+    self.client.bucket.assert_called_once_with('bucket2')
+    blob = self.client.bucket.return_value.blob
+    blob.assert_called_once_with('manifest.json')
+    content = blob.return_value.upload_from_string.call_args.args[0]
+    self.assertEqual(
+        json.loads(content),
+        {
+            'destination_format': 'CSV',
+            'shards': [
+                {
+                    'uri': 'gs://bucket1/foo/file*.csv',
+                    'row_count': 2,
+                    'files': [
+                        'gs://bucket1/foo/file1.csv',
+                        'gs://bucket1/foo/file2.csv',
+                    ],
+                },
+                {
+                    'uri': 'gs://bucket1/bar/file*.csv',
+                    'row_count': 1,
+                    'files': ['gs://bucket1/bar/file3.csv'],
+                },
+            ],
+        })
+
+  @parameterized.named_parameters(
+      ('Existing manifest', b'{"last_updated": "2020-01-01"}',
+       {'last_updated': '2020-01-01'}),
+      ('Missing manifest', None, None),
+  )
+  def test_read_manifest(self, content, expected_manifest):
+    get_blob = self.client.bucket.return_value.get_blob
+    if content is None:
+      get_blob.return_value = None
+    else:
+      get_blob.return_value.download_as_bytes.return_value = content
+    self.assertEqual(
+        storage_utils.read_manifest(self.client, 'gs://bucket1/manifest.json'),
+        expected_manifest)
+    get_blob.assert_called_once_with('manifest.json')
+
   def test_download_file(self):
     client = storage.Client(project='PROJECT', credentials=_make_credentials())
     self.enter_context(mock.patch.object(storage.Blob, 'reload', autospec=True))
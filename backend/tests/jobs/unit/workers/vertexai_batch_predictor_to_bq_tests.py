@@ -7,6 +7,7 @@ from absl.testing import parameterized
 from google.auth import credentials
 
 from google.cloud import aiplatform
+from google.cloud import bigquery
 
 from google.cloud.aiplatform import models
 from google.cloud.aiplatform_v1.types import (
@@ -14,6 +15,8 @@ from google.cloud.aiplatform_v1.types import (
     job_state as gca_job_state,
 )
 
+from jobs.workers import worker
+from jobs.workers.bigquery import bq_worker
 from jobs.workers.vertexai import vertexai_batch_predictor_to_bq
 
 _TEST_PROJECT = 'test-project'
@@ -111,9 +114,12 @@ class VertexAIBatchPredictorToBQTest(parameterized.TestCase):
             autospec=True,
             spec_set=True))
 
+    mock_job_client.create_batch_prediction_job.return_value = (
+        mock_batch_prediction_job)
+
     # mock model
     mock_model = mock.Mock(models.Model)
-    mock_model.batch_predict.return_result = mock_batch_prediction_job
+    mock_model.resource_name = 'projects/p/locations/l/models/MODEL'
 
     self.enter_context(
         mock.patch.object(
@@ -132,8 +138,7 @@ class VertexAIBatchPredictorToBQTest(parameterized.TestCase):
             spec_set=True))
 
     # mock wait
-    # mock logger
-    self.enter_context(
+    patched_wait_for_job = self.enter_context(
         mock.patch.object(
             worker_inst,
             '_wait_for_job',
@@ -151,8 +156,190 @@ class VertexAIBatchPredictorToBQTest(parameterized.TestCase):
               autospec=True,
               spec_set=True))
 
-    mock_model.batch_predict.assert_called_once()
+    mock_job_client.create_batch_prediction_job.assert_called_once()
+    batch_prediction_job = (
+        mock_job_client.create_batch_prediction_job.call_args.kwargs[
+            'batch_prediction_job'])
+    self.assertEqual(batch_prediction_job['model'],
+                     'projects/p/locations/l/models/MODEL')
+    self.assertNotIn('dedicated_resources', batch_prediction_job)
+    with self.subTest('Returns right away with the job handle'):
+      patched_wait_for_job.assert_called_once_with(mock_batch_prediction_job)
+
+  def _make_sharded_worker(self, params):
+    worker_inst = vertexai_batch_predictor_to_bq.VertexAIBatchPredictorToBQ(
+        {
+            'vertexai_model_name': 'MODEL',
+            'vertexai_batch_prediction_name': 'PREDICTION',
+            'vertexai_region': 'us-central1',
+            'bq_project_id': 'PROJECT',
+            'bq_dataset_id': 'DATASET',
+            'bq_table_id': 'TABLE',
+            'clean_up': False,
+            **params,
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project=_TEST_PROJECT,
+        logger_credentials=_make_credentials())
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, '_get_project_id', autospec=True,
+            return_value=_TEST_PROJECT))
+    self.enter_context(
+        mock.patch.object(worker_inst, '_get_vertexai_model_client',
+                          autospec=True))
+    self.mock_job_client = mock.create_autospec(
+        aiplatform.gapic.JobServiceClient, instance=True, spec_set=True)
+
+    def _create_batch_prediction_job(parent, batch_prediction_job):
+      return gca_batch_prediction_job.BatchPredictionJob(
+          name=f'{parent}/jobs/{batch_prediction_job["display_name"]}')
+
+    self.mock_job_client.create_batch_prediction_job.side_effect = (
+        _create_batch_prediction_job)
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, '_get_vertexai_job_client', autospec=True,
+            return_value=self.mock_job_client))
+    self.enter_context(mock.patch.object(aiplatform, 'init', autospec=True))
+    self.mock_model = mock.Mock(models.Model)
+    self.mock_model.resource_name = 'projects/p/locations/l/models/MODEL'
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, '_get_model', autospec=True,
+            return_value=self.mock_model))
+    self.mock_bq_client = self.enter_context(
+        mock.patch.object(bigquery, 'Client', autospec=True)).return_value
+    self.mock_bq_client.query.return_value.total_bytes_processed = 0
+    self.mock_bq_client.query.return_value.referenced_tables = []
+    self.mock_bq_client.query.return_value.job_id = 'QUERY_JOB'
+    self.mock_bq_client.query.return_value.location = 'US'
+
+    def _copy_table(source, destination, job_id_prefix, job_config):
+      del source, job_id_prefix, job_config  # Unused
+      job = mock.create_autospec(
+          bigquery.job.CopyJob, instance=True, spec_set=True)
+      job.job_id = f'COPY_{destination}'
+      job.location = 'US'
+      return job
+
+    self.mock_bq_client.copy_table.side_effect = _copy_table
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
+    self.patched_enqueue = self.enter_context(
+        mock.patch.object(worker_inst, '_enqueue', autospec=True))
+    self.enter_context(mock.patch.object(worker_inst, '_log', autospec=True))
+    return worker_inst
+
+  def test_splits_table_in_shards_then_copies_them(self):
+    params = {'shard_count': 2, 'shard_id_column': 'user_id'}
+    worker_inst = self._make_sharded_worker(params)
+    worker_inst._execute()
+    query = self.mock_bq_client.query.call_args.args[0]
+    self.assertIn('FROM `PROJECT.DATASET.TABLE`', query)
+    self.assertIn('CAST(`user_id` AS STRING))), 2) AS crmint_shard', query)
+    self.assertIn('INTERVAL 24 HOUR', query)
+    self.mock_bq_client.copy_table.assert_not_called()
+    self.mock_job_client.create_batch_prediction_job.assert_not_called()
+    self.patched_enqueue.assert_called_once()
+    worker_class, waiter_params, _ = self.patched_enqueue.call_args.args
+    self.assertEqual(worker_class, 'BQWaiter')
+    self.assertEqual(waiter_params['job_ids'], ['QUERY_JOB'])
+    self.assertEqual(
+        waiter_params['next_worker_class'], 'VertexAIBatchPredictorToBQ')
+    self.assertEqual(
+        waiter_params['next_worker_params']['shard_step'], 'copy_shards')
+
+  def test_copies_shards_then_scores_them(self):
+    worker_inst = self._make_sharded_worker({
+        'shard_count': 2,
+        'shard_id_column': 'user_id',
+        'shard_step': 'copy_shards',
+    })
+    worker_inst._execute()
+    self.mock_bq_client.query.assert_not_called()
+    copy_calls = self.mock_bq_client.copy_table.call_args_list
+    self.assertEqual(
+        [call.args for call in copy_calls],
+        [
+            ('PROJECT.DATASET.TABLE_crmint_shards$0',
+             'PROJECT.DATASET.TABLE_shard_0'),
+            ('PROJECT.DATASET.TABLE_crmint_shards$1',
+             'PROJECT.DATASET.TABLE_shard_1'),
+        ])
+    with self.subTest('Shard tables expire'):
+      self.assertIsNotNone(
+          copy_calls[0].kwargs['job_config'].destination_expiration_time)
+    self.mock_job_client.create_batch_prediction_job.assert_not_called()
+    worker_class, waiter_params, _ = self.patched_enqueue.call_args.args
+    self.assertEqual(worker_class, 'BQWaiter')
+    self.assertEqual(
+        waiter_params['job_ids'],
+        ['COPY_PROJECT.DATASET.TABLE_shard_0',
+         'COPY_PROJECT.DATASET.TABLE_shard_1'])
+    self.assertEqual(waiter_params['tables_to_delete'],
+                     ['PROJECT.DATASET.TABLE_crmint_shards'])
+    next_params = waiter_params['next_worker_params']
+    self.assertEqual(next_params['shard_step'], 'predict_shards')
+    self.assertEqual(
+        next_params['shard_table_names'],
+        ['PROJECT.DATASET.TABLE_shard_0', 'PROJECT.DATASET.TABLE_shard_1'])
+
+  def test_scores_shards_with_concurrent_jobs(self):
+    worker_inst = self._make_sharded_worker({
+        'shard_count': 2,
+        'shard_id_column': 'user_id',
+        'machine_type': 'n1-standard-4',
+        'max_replica_count': 4,
+        'shard_step': 'predict_shards',
+        'shard_table_names': [
+            'PROJECT.DATASET.TABLE_shard_0',
+            'PROJECT.DATASET.TABLE_shard_1',
+        ],
+    })
+    worker_inst._execute()
+    self.mock_bq_client.query.assert_not_called()
+    self.mock_bq_client.copy_table.assert_not_called()
+    self.assertCountEqual(
+        [
+            (job['display_name'],
+             job['input_config']['bigquery_source']['input_uri'],
+             job['dedicated_resources'])
+            for job in (
+                call.kwargs['batch_prediction_job'] for call in
+                self.mock_job_client.create_batch_prediction_job.call_args_list)
+        ],
+        [
+            ('PREDICTION-shard-0', 'bq://PROJECT.DATASET.TABLE_shard_0',
+             {'machine_spec': {'machine_type': 'n1-standard-4'},
+              'max_replica_count': 4}),
+            ('PREDICTION-shard-1', 'bq://PROJECT.DATASET.TABLE_shard_1',
+             {'machine_spec': {'machine_type': 'n1-standard-4'},
+              'max_replica_count': 4}),
+        ])
+    self.patched_enqueue.assert_called_once_with(
+        'VertexAIWaiter',
+        {
+            'ids': [
+                f'projects/{_TEST_PROJECT}/locations/us-central1/jobs/'
+                f'PREDICTION-shard-0',
+                f'projects/{_TEST_PROJECT}/locations/us-central1/jobs/'
+                f'PREDICTION-shard-1',
+            ],
+            'worker_class': 'VertexAIBatchPredictorToBQ',
+            'destination_table': 'PROJECT.DATASET.TABLE_predictions',
+            'tables_to_delete': [
+                'PROJECT.DATASET.TABLE_shard_0',
+                'PROJECT.DATASET.TABLE_shard_1',
+            ],
+        },
+        60)
 
+  def test_sharding_requires_id_column(self):
+    worker_inst = self._make_sharded_worker({'shard_count': 2})
+    with self.assertRaisesRegex(worker.WorkerException, 'unique ID column'):
+      worker_inst._execute()
+    self.mock_job_client.create_batch_prediction_job.assert_not_called()
 
 if __name__ == '__main__':
   absltest.main()
@@ -20,7 +20,7 @@ _TEST_PROJECT = 'test-project'
 _TEST_DATASET_DISPLAY_NAME = 'my_dataset_1234'
 _TEST_DATASET_METADATA_SCHEMA_URI_TABULAR = schema.dataset.metadata.tabular
 
-_TEST_AUTOML_JOB_RESOURCE_NAME = 'test-automl-job'
+_TEST_DATASET_ID = '1234'
 _TEST_VERETXAI_MODEL_NAME = 'test-model'
 _TEST_BUDGET_HOURS = 1
 _TEST_PIPELINE_RESOURCE_NAME = (
@@ -51,6 +51,8 @@ class VertexAITabularTrainerTest(parameterized.TestCase):
         {
             'clean_up': cfg_clean_up,
             'vertexai_model_name': cfg_vertexai_model_name,
+            'vertexai_region': 'us-central1',
+            'prediction_type': 'classification',
             'budget_hours': cfg_budget_hours,
             'target_column': cfg_target_column
         },
@@ -68,6 +70,8 @@ class VertexAITabularTrainerTest(parameterized.TestCase):
         display_name=_TEST_DATASET_DISPLAY_NAME,
         metadata_schema_uri=_TEST_DATASET_METADATA_SCHEMA_URI_TABULAR,
     ))
+    mock_dataset.name = _TEST_DATASET_ID
+    mock_dataset.column_names = [cfg_target_column, 'feature']
 
     self.enter_context(
         mock.patch.object(
@@ -135,41 +139,42 @@ class VertexAITabularTrainerTest(parameterized.TestCase):
             autospec=True,
             spec_set=True))
 
-    # mock AutoMLTabularTrainingJob and then inject as result of
-    # _create_automl_tabular_training_job
-    mock_automl_job = mock.create_autospec(
-        aiplatform.AutoMLTabularTrainingJob, instance=True, spec_set=True)
-
-    mock_automl_job.run.return_value = None
-    mock_automl_job.wait_for_resource_creation.return_value = None
-    mock_automl_job.resource_name = _TEST_AUTOML_JOB_RESOURCE_NAME
-
-    self.enter_context(
-        mock.patch.object(
-            worker_inst,
-            '_create_automl_tabular_training_job',
-            return_value=mock_automl_job,
-            autospec=True,
-            spec_set=True))
-
-    self.enter_context(
-        mock.patch.object(
-            worker_inst,
-            '_wait_for_pipeline',
-            return_value=None,
-            autospec=True,
-            spec_set=True))
+    mock_pipeline_client.create_training_pipeline.return_value = (
+        mock_training_pipeline)
+    self.enter_context(mock.patch.object(worker_inst, 'log_info',
+                                         autospec=True))
 
+    patched_wait_for_pipeline = self.enter_context(
+        mock.patch.object(worker_inst, '_wait_for_pipeline', autospec=True))
     worker_inst._execute()
-    mock_automl_job.run.assert_called_once_with(
-        dataset=mock_dataset,
-        target_column=cfg_target_column,
-        budget_milli_node_hours=cfg_budget_hours * 1000,
-        model_display_name=cfg_vertexai_model_name,
-        is_default_version=True,
-        disable_early_stopping=False,
-        sync=False
-    )
+    mock_pipeline_client.create_training_pipeline.assert_called_once_with(
+        parent=f'projects/{_TEST_PROJECT}/locations/us-central1',
+        training_pipeline=mock.ANY)
+    training_pipeline = (
+        mock_pipeline_client.create_training_pipeline.call_args.kwargs[
+            'training_pipeline'])
+    self.assertEqual(training_pipeline['display_name'],
+                     cfg_vertexai_model_name)
+    self.assertEqual(
+        training_pipeline['training_task_inputs'],
+        {
+            'targetColumn': cfg_target_column,
+            'predictionType': 'classification',
+            'transformations': [{'auto': {'column_name': 'feature'}}],
+            'trainBudgetMilliNodeHours': cfg_budget_hours * 1000,
+            'disableEarlyStopping': False,
+        })
+    self.assertEqual(training_pipeline['input_data_config'],
+                     {'dataset_id': _TEST_DATASET_ID})
+    with self.subTest('Uploads the model as the default version'):
+      self.assertEqual(
+          training_pipeline['model_to_upload'],
+          {
+              'display_name': cfg_vertexai_model_name,
+              'version_aliases': ['default'],
+          })
+    with self.subTest('Returns right away with the pipeline handle'):
+      patched_wait_for_pipeline.assert_called_once_with(mock_training_pipeline)
 
 if __name__ == '__main__':
   absltest.main()
@@ -7,6 +7,7 @@ from absl.testing import absltest
 from absl.testing import parameterized
 from google.auth import credentials
 from google.cloud import aiplatform
+from google.cloud import bigquery
 from google.cloud.aiplatform_v1.types import (
     pipeline_state as gca_pipeline_state,
     training_pipeline as gca_training_pipeline,
@@ -15,6 +16,7 @@ from google.cloud.aiplatform_v1.types import (
 )
 
 from jobs.workers import worker
+from jobs.workers.bigquery import bq_worker
 from jobs.workers.vertexai import vertexai_waiter
 
 _TEST_PROJECT = "test-project"
@@ -208,5 +210,83 @@ class VertexAIWaiterTests(parameterized.TestCase):
       patched_enqueue.assert_called_once()
 
 
+  def _make_sharded_waiter(self, job_states):
+    worker_inst = vertexai_waiter.VertexAIWaiter(
+        {
+            "ids": [f"projects/p/locations/{_TEST_LOCATION}/jobs/{i}"
+                    for i in range(len(job_states))],
+            "worker_class": "VertexAIBatchPredictorToBQ",
+            "destination_table": "p.d.predictions",
+            "tables_to_delete": ["p.d.table_shard_0", "p.d.table_shard_1"],
+        },
+        pipeline_id=1,
+        job_id=1,
+        logger_project=_TEST_PROJECT,
+        logger_credentials=_make_credentials())
+    mock_job_client = mock.create_autospec(
+        aiplatform.gapic.JobServiceClient, instance=True, spec_set=True)
+    mock_job_client.get_batch_prediction_job.side_effect = [
+        gca_batch_prediction_job.BatchPredictionJob(
+            name=f"projects/p/locations/{_TEST_LOCATION}/jobs/{i}",
+            state=state,
+            output_info=gca_batch_prediction_job.BatchPredictionJob.OutputInfo(
+                bigquery_output_dataset="bq://p.d",
+                bigquery_output_table=f"predictions_{i}"))
+        for i, state in enumerate(job_states)
+    ]
+    self.enter_context(
+        mock.patch.object(
+            worker_inst, "_get_vertexai_job_client", autospec=True,
+            return_value=mock_job_client))
+    self.mock_bq_client = self.enter_context(
+        mock.patch.object(bigquery, "Client", autospec=True)).return_value
+    self.mock_bq_client.query.return_value.total_bytes_processed = 0
+    self.mock_bq_client.query.return_value.referenced_tables = []
+    self.mock_bq_client.query.return_value.job_id = "MERGE_JOB"
+    self.mock_bq_client.query.return_value.location = "US"
+    self.enter_context(mock.patch.dict(bq_worker._dry_run_cache, clear=True))
+    self.patched_enqueue = self.enter_context(
+        mock.patch.object(worker_inst, "_enqueue", autospec=True))
+    self.enter_context(mock.patch.object(worker_inst, "_log", autospec=True))
+    return worker_inst
+
+  def test_merges_predictions_once_all_shards_succeeded(self):
+    worker_inst = self._make_sharded_waiter([
+        gca_job_state.JobState.JOB_STATE_SUCCEEDED,
+        gca_job_state.JobState.JOB_STATE_SUCCEEDED,
+    ])
+    worker_inst._execute()
+    self.mock_bq_client.query.assert_called_with(
+        "CREATE OR REPLACE TABLE `p.d.predictions` AS "
+        "SELECT * EXCEPT (crmint_shard) FROM `p.d.predictions_0` UNION ALL "
+        "SELECT * EXCEPT (crmint_shard) FROM `p.d.predictions_1`",
+        location=None,
+        job_id=None,
+        job_id_prefix="1_1_VertexAIWaiter",
+        job_config=None)
+    with self.subTest("Deletes tables once the merge is done"):
+      self.mock_bq_client.delete_table.assert_not_called()
+      self.patched_enqueue.assert_called_once_with(
+          "BQWaiter",
+          {
+              "job_id": "MERGE_JOB",
+              "location": "US",
+              "tables_to_delete": [
+                  "p.d.predictions_0", "p.d.predictions_1",
+                  "p.d.table_shard_0", "p.d.table_shard_1",
+              ],
+          },
+          30)
+
+  def test_waits_for_all_shards(self):
+    worker_inst = self._make_sharded_waiter([
+        gca_job_state.JobState.JOB_STATE_SUCCEEDED,
+        gca_job_state.JobState.JOB_STATE_RUNNING,
+    ])
+    worker_inst._execute()
+    self.patched_enqueue.assert_called_once_with(
+        "VertexAIWaiter", worker_inst._params, 60)
+    self.mock_bq_client.query.assert_not_called()
+
 if __name__ == "__main__":
   absltest.main()
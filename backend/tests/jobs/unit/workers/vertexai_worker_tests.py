@@ -1,9 +1,11 @@
 """Tests for ga_waiter."""
 
+import datetime
 from unittest import mock
 from unittest.mock import patch
 from absl.testing import absltest
 from absl.testing import parameterized
+from google.api_core import exceptions
 from google.auth import credentials
 
 from google.cloud import aiplatform
@@ -33,6 +35,8 @@ _TEST_PIPELINE_NAME = "pipeline1234"
 
 _TEST_BATCH_PREDICTION_JOB_NAME = "batchjob-123456"
 
+_TEST_CREATE_TIME = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
 def _make_credentials():
   return mock.create_autospec(
       credentials.Credentials, instance=True, spec_set=True)
@@ -356,7 +360,8 @@ class VertexAIWorkerTests(parameterized.TestCase):
         gca_batch_prediction_job.BatchPredictionJob(
             name=_TEST_BATCH_PREDICTION_JOB_NAME,
             display_name=_TEST_BATCH_PREDICTION_JOB_NAME,
-            state=cfg_job_state))
+            state=cfg_job_state,
+            create_time=_TEST_CREATE_TIME))
 
     mock_job = mock_job_client.get_batch_prediction_job()
 
@@ -411,7 +416,8 @@ class VertexAIWorkerTests(parameterized.TestCase):
       mock_pipeline_client.get_training_pipeline.return_value = (
           gca_training_pipeline.TrainingPipeline(
               name=_TEST_PIPELINE_RESOURCE_NAME,
-              state=cfg_pipeline_state))
+              state=cfg_pipeline_state,
+              create_time=_TEST_CREATE_TIME))
 
       mock_pipeline = mock_pipeline_client.get_training_pipeline()
       # build list of pipelines. Put two items because
@@ -432,7 +438,8 @@ class VertexAIWorkerTests(parameterized.TestCase):
       mock_pipeline_client.get_training_pipeline.return_value = (
           gca_training_pipeline.TrainingPipeline(
               name=_TEST_PIPELINE_RESOURCE_NAME,
-              state=cfg_pipeline_state))
+              state=cfg_pipeline_state,
+              create_time=_TEST_CREATE_TIME))
 
       mock_pipeline = mock_pipeline_client.get_training_pipeline()
       # build list of pipelines. Put two items because
@@ -481,7 +488,8 @@ class VertexAIWorkerTests(parameterized.TestCase):
         gca_batch_prediction_job.BatchPredictionJob(
             name=_TEST_BATCH_PREDICTION_JOB_NAME,
             display_name=_TEST_BATCH_PREDICTION_JOB_NAME,
-            state=cfg_job_state))
+            state=cfg_job_state,
+            create_time=_TEST_CREATE_TIME))
 
     mock_job = mock_job_client.get_batch_prediction_job()
     # build list of pipelines. Put two items because
@@ -555,9 +563,138 @@ class VertexAIWorkerTests(parameterized.TestCase):
     )
     # asserts
     mock_log.assert_called_once()
-    mock_dataset_client.list_datasets.assert_called_once()
+    mock_dataset_client.list_datasets.assert_called_once_with({
+        "parent": f"projects/{_TEST_PROJECT}/locations/{_TEST_LOCATION}",
+        "filter": f'display_name="{_TEST_DATASET_DISPLAY_NAME}"',
+        "page_size": 100,
+        "order_by": "create_time desc",
+    })
     mock_dataset_client.delete_dataset.assert_called_once()
 
+  def test_clean_up_datasets_logs_deletion_errors(self):
+    worker_inst = vertexai_worker.VertexAIWorker(
+        {}, pipeline_id=1, job_id=1, logger_project=_TEST_PROJECT,
+        logger_credentials=_make_credentials())
+    mock_log = self.enter_context(
+        mock.patch.object(worker_inst, "log_info", autospec=True))
+    mock_dataset_client = mock.create_autospec(
+        aiplatform.gapic.DatasetServiceClient, instance=True, spec_set=True)
+    mock_dataset_client.list_datasets.return_value = [
+        gca_dataset.Dataset(name="dataset_2"),
+        gca_dataset.Dataset(name="dataset_1"),
+    ]
+    mock_dataset_client.delete_dataset.side_effect = (
+        exceptions.PermissionDenied("Denied"))
+    worker_inst._clean_up_datasets(
+        mock_dataset_client, _TEST_PROJECT, _TEST_LOCATION,
+        _TEST_DATASET_DISPLAY_NAME)
+    mock_dataset_client.delete_dataset.assert_called_once_with(
+        {"name": "dataset_1"})
+    mock_log.assert_called_once_with("Exception: 403 Denied")
+
+  def test_clean_up_training_pipelines_logs_deletion_errors(self):
+    worker_inst = vertexai_worker.VertexAIWorker(
+        {}, pipeline_id=1, job_id=1, logger_project=_TEST_PROJECT,
+        logger_credentials=_make_credentials())
+    mock_log = self.enter_context(
+        mock.patch.object(worker_inst, "log_info", autospec=True))
+    mock_pipeline_client = mock.create_autospec(
+        aiplatform.gapic.PipelineServiceClient, instance=True, spec_set=True)
+    mock_pipeline_client.list_training_pipelines.return_value = [
+        gca_training_pipeline.TrainingPipeline(
+            name=f"pipeline_{i}",
+            state=gca_pipeline_state.PipelineState.PIPELINE_STATE_RUNNING,
+            create_time=_TEST_CREATE_TIME + datetime.timedelta(minutes=i))
+        for i in range(3)
+    ]
+    mock_pipeline_client.cancel_training_pipeline.side_effect = [
+        exceptions.FailedPrecondition("Already cancelling"), None]
+    worker_inst._clean_up_training_pipelines(
+        mock_pipeline_client, _TEST_PROJECT, _TEST_LOCATION,
+        _TEST_PIPELINE_RESOURCE_NAME)
+    self.assertEqual(
+        mock_pipeline_client.cancel_training_pipeline.call_count, 2)
+    mock_pipeline_client.delete_training_pipeline.assert_called_once()
+    mock_log.assert_any_call("Exception: 400 Already cancelling")
+
+  def test_clean_up_batch_predictions_logs_deletion_errors(self):
+    worker_inst = vertexai_worker.VertexAIWorker(
+        {}, pipeline_id=1, job_id=1, logger_project=_TEST_PROJECT,
+        logger_credentials=_make_credentials())
+    mock_log = self.enter_context(
+        mock.patch.object(worker_inst, "log_info", autospec=True))
+    mock_job_client = mock.create_autospec(
+        aiplatform.gapic.JobServiceClient, instance=True, spec_set=True)
+    mock_job_client.list_batch_prediction_jobs.return_value = [
+        gca_batch_prediction_job.BatchPredictionJob(
+            name=f"job_{i}",
+            state=gca_job_state.JobState.JOB_STATE_SUCCEEDED,
+            create_time=_TEST_CREATE_TIME + datetime.timedelta(minutes=i))
+        for i in range(3)
+    ]
+    mock_job_client.delete_batch_prediction_job.side_effect = [
+        exceptions.PermissionDenied("Denied"), None]
+    worker_inst._clean_up_batch_predictions(
+        mock_job_client, _TEST_PROJECT, _TEST_LOCATION,
+        _TEST_BATCH_PREDICTION_JOB_NAME)
+    self.assertEqual(
+        mock_job_client.delete_batch_prediction_job.call_count, 2)
+    mock_log.assert_any_call("Exception: 403 Denied")
+
+  def test_clean_up_datasets_logs_listing_errors(self):
+    worker_inst = vertexai_worker.VertexAIWorker(
+        {}, pipeline_id=1, job_id=1, logger_project=_TEST_PROJECT,
+        logger_credentials=_make_credentials())
+    mock_log = self.enter_context(
+        mock.patch.object(worker_inst, "log_info", autospec=True))
+    mock_dataset_client = mock.create_autospec(
+        aiplatform.gapic.DatasetServiceClient, instance=True, spec_set=True)
+    mock_dataset_client.list_datasets.side_effect = (
+        exceptions.ServiceUnavailable("Unavailable"))
+    worker_inst._clean_up_datasets(
+        mock_dataset_client, _TEST_PROJECT, _TEST_LOCATION,
+        _TEST_DATASET_DISPLAY_NAME)
+    mock_dataset_client.delete_dataset.assert_not_called()
+    mock_log.assert_called_once_with("Exception: 503 Unavailable")
+
+  def test_list_resources_is_memoized_by_display_name(self):
+    worker_inst = vertexai_worker.VertexAIWorker({}, 1, 1)
+    mock_dataset_client = mock.create_autospec(
+        aiplatform.gapic.DatasetServiceClient, instance=True, spec_set=True)
+    mock_dataset_client.list_datasets.side_effect = lambda request: [
+        gca_dataset.Dataset(name=f"{request['filter']}/1"),
+        gca_dataset.Dataset(name=f"{request['filter']}/2"),
+    ]
+    for _ in range(2):
+      datasets = worker_inst._list_resources(
+          mock_dataset_client.list_datasets, "parent", "dataset")
+      self.assertEqual(
+          [dataset.name for dataset in datasets],
+          ['display_name="dataset"/1', 'display_name="dataset"/2'])
+    mock_dataset_client.list_datasets.assert_called_once()
+    worker_inst._list_resources(
+        mock_dataset_client.list_datasets, "parent", "other_dataset")
+    self.assertEqual(mock_dataset_client.list_datasets.call_count, 2)
+
+  def test_list_resources_fetches_pages_lazily(self):
+    worker_inst = vertexai_worker.VertexAIWorker({}, 1, 1)
+    fetched_pages = []
+
+    def _pager():
+      for page in range(3):
+        fetched_pages.append(page)
+        yield gca_dataset.Dataset(name=f"dataset/{page}")
+
+    mock_list_datasets = mock.Mock(return_value=_pager())
+    mock_list_datasets.__name__ = "list_datasets"
+    datasets = worker_inst._list_resources(
+        mock_list_datasets, "parent", "dataset", order_by="create_time desc")
+    self.assertEqual(next(iter(datasets)).name, "dataset/0")
+    self.assertEqual(fetched_pages, [0])
+    self.assertLen(list(datasets), 3)
+    self.assertLen(list(datasets), 3)
+    self.assertEqual(fetched_pages, [0, 1, 2])
+
 
 if __name__ == "__main__":
   absltest.main()
@@ -59,6 +59,8 @@ class AppTestCase(parameterized.TestCase):
     self.client = test_app.test_client()
     self.patched_task_enqueue = self.enter_context(
         mock.patch.object(task.Task, 'enqueue', autospec=True))
+    self.patched_task_enqueue_many = self.enter_context(
+        mock.patch.object(task.Task, 'enqueue_many', autospec=True))
     self.patched_log_message = self.enter_context(
         mock.patch.object(crmint_logging, 'log_message', autospec=True))
     self.patched_task_enqueue = self.enter_context(
@@ -23,6 +23,39 @@ resource "google_logging_metric" "pipeline_status_failed" {
   }
 }
 
+resource "google_logging_metric" "bigquery_estimated_bytes" {
+  name   = "crmint/bigquery_estimated_bytes"
+  filter = "resource.type=cloud_run_revision AND jsonPayload.log_type=BIGQUERY_ESTIMATE"
+  metric_descriptor {
+    metric_kind = "DELTA"
+    value_type  = "DISTRIBUTION"
+    unit        = "By"
+    labels {
+      key         = "pipeline_id"
+      value_type  = "STRING"
+      description = "Pipeline ID"
+    }
+    labels {
+      key         = "job_id"
+      value_type  = "STRING"
+      description = "Job ID"
+    }
+    display_name = "BigQuery Estimated Bytes Metric"
+  }
+  value_extractor = "EXTRACT(jsonPayload.estimated_bytes)"
+  label_extractors = {
+    "pipeline_id" = "EXTRACT(jsonPayload.labels.pipeline_id)"
+    "job_id"      = "EXTRACT(jsonPayload.labels.job_id)"
+  }
+  bucket_options {
+    exponential_buckets {
+      num_finite_buckets = 40
+      growth_factor      = 2
+      scale              = 1000000
+    }
+  }
+}
+
 resource "google_monitoring_notification_channel" "email" {
   display_name = "Email Notification Channel"
   type         = "email"
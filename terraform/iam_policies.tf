@@ -58,6 +58,19 @@ resource "google_project_iam_member" "controller_sa--bigquery-dataviewer" {
   role    = "roles/bigquery.dataViewer"
 }
 
+# Needed to poll jobs tracked by the controller operation tracker.
+resource "google_project_iam_member" "controller_sa--bigquery-resource-viewer" {
+  member  = "serviceAccount:${google_service_account.controller_sa.email}"
+  project = var.project_id
+  role    = "roles/bigquery.resourceViewer"
+}
+
+resource "google_project_iam_member" "controller_sa--aiplatform-viewer" {
+  member  = "serviceAccount:${google_service_account.controller_sa.email}"
+  project = var.project_id
+  role    = "roles/aiplatform.viewer"
+}
+
 resource "google_project_iam_member" "controller_sa--pubsub-publisher" {
   member  = "serviceAccount:${google_service_account.controller_sa.email}"
   project = var.project_id
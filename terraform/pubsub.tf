@@ -1,11 +1,24 @@
 locals {
   subscriptions = {
+    # Tasks are delivered in priority lanes, see `task.Priority`.
+    "crmint-3-start-task-high" = {
+      "endpoint" = "${google_cloud_run_service.jobs_run.status[0].url}/push/start-task",
+      "ack_deadline_seconds" = 600,
+      "minimum_backoff" = 10,  # seconds
+    }
+
     "crmint-3-start-task" = {
       "endpoint" = "${google_cloud_run_service.jobs_run.status[0].url}/push/start-task",
       "ack_deadline_seconds" = 600,
       "minimum_backoff" = 60,  # seconds
     }
 
+    "crmint-3-start-task-low" = {
+      "endpoint" = "${google_cloud_run_service.jobs_run.status[0].url}/push/start-task",
+      "ack_deadline_seconds" = 600,
+      "minimum_backoff" = 60,  # seconds
+    }
+
     "crmint-3-task-finished" = {
       "endpoint" = "${google_cloud_run_service.controller_run.status[0].url}/push/task-finished",
       "ack_deadline_seconds" = 60,
@@ -139,6 +139,14 @@ resource "google_cloud_run_service" "controller_run" {
           name  = "PUBSUB_VERIFICATION_TOKEN"
           value = random_id.pubsub_verification_token.b64_url
         }
+        env {
+          name  = "PAYLOAD_BUCKET"
+          value = google_storage_bucket.payloads.name
+        }
+        env {
+          name  = "TRACK_EXTERNAL_OPERATIONS"
+          value = "1"
+        }
         env {
           name  = "DATABASE_URI"
           value_from {
@@ -213,8 +221,15 @@ resource "google_cloud_run_service" "jobs_run" {
           name  = "REPORT_USAGE_ID"
           value = var.report_usage_id
         }
+        env {
+          name  = "PAYLOAD_BUCKET"
+          value = google_storage_bucket.payloads.name
+        }
       }
 
+      # Matches the request threads of the jobs service, tasks beyond its
+      # own concurrency limits are rejected and delivered again later.
+      container_concurrency = 24
       timeout_seconds = 900  # 15min
     }
   }
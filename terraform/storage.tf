@@ -0,0 +1,34 @@
+# Content-addressed store of the task payloads shared by Pub/Sub messages
+# (e.g. large worker parameters such as templates, never credentials),
+# referenced by hash. Also keeps the snapshots of audiences updated by the GA
+# workers.
+resource "google_storage_bucket" "payloads" {
+  name     = "${var.project_id}-crmint-payloads"
+  location = var.region
+  project  = var.project_id
+
+  uniform_bucket_level_access = true
+
+  # Payloads are refreshed when referenced again, outlives Pub/Sub retention.
+  # Snapshots are refreshed when saved again.
+  lifecycle_rule {
+    condition {
+      days_since_custom_time = 14
+    }
+    action {
+      type = "Delete"
+    }
+  }
+}
+
+resource "google_storage_bucket_iam_member" "controller_sa--payloads-object-admin" {
+  bucket = google_storage_bucket.payloads.name
+  member = "serviceAccount:${google_service_account.controller_sa.email}"
+  role   = "roles/storage.objectAdmin"
+}
+
+resource "google_storage_bucket_iam_member" "jobs_sa--payloads-object-admin" {
+  bucket = google_storage_bucket.payloads.name
+  member = "serviceAccount:${google_service_account.jobs_sa.email}"
+  role   = "roles/storage.objectAdmin"
+}